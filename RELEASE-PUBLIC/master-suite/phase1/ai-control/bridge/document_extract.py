@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Iterator
+
+EPUB_MEMBER_SUFFIXES = (".xhtml", ".html", ".htm", ".xml")
+PDF_FALLBACK_SEGMENT_CHARS = 6000
+# One parsed reader per process (pool worker or the inline caller), keyed by path + stat so a batch
+# of the same document reuses it instead of re-parsing the whole file.
+PDF_READER_CACHE: dict[str, Any] = {"key": None, "reader": None}
+
+
+def strip_html_tags(value: str) -> str:
+    text = re.sub(r"<script[^>]*>.*?</script>", " ", value, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r"<style[^>]*>.*?</style>", " ", text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r"<[^>]+>", " ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+
+def detect_document_kind(content_type: str, file_url: str) -> str:
+    ctype = str(content_type or "").lower()
+    lower_url = str(file_url or "").lower().split("?", 1)[0]
+    if "application/pdf" in ctype or lower_url.endswith(".pdf"):
+        return "pdf"
+    if "application/epub+zip" in ctype or lower_url.endswith(".epub"):
+        return "epub"
+    if "html" in ctype or lower_url.endswith((".html", ".htm")):
+        return "html"
+    text_like = any(token in ctype for token in {"text/", "json", "xml", "yaml", "markdown"})
+    if text_like or lower_url.endswith((".txt", ".md", ".markdown", ".json", ".csv")):
+        return "text"
+    return ""
+
+
+def cached_pdf_reader(path: str) -> Any:
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if PDF_READER_CACHE["key"] != key:
+        from pypdf import PdfReader  # type: ignore
+
+        release_pdf_reader()
+        PDF_READER_CACHE["reader"] = PdfReader(path)
+        PDF_READER_CACHE["key"] = key
+    return PDF_READER_CACHE["reader"]
+
+
+def release_pdf_reader() -> None:
+    PDF_READER_CACHE["key"] = None
+    PDF_READER_CACHE["reader"] = None
+
+
+def pdf_page_count(path: str) -> int:
+    try:
+        return len(cached_pdf_reader(path).pages)
+    except Exception:
+        return 0
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> list[str]:
+    reader = cached_pdf_reader(path)
+    pages: list[str] = []
+    for index in range(start, min(end, len(reader.pages))):
+        try:
+            pages.append(str(reader.pages[index].extract_text() or "").strip())
+        except Exception:
+            pages.append("")
+    return pages
+
+
+def scan_pdf_literal_strings(path: str) -> Iterator[str]:
+    # Safe fallback when dedicated PDF parser is unavailable: scan literal strings without loading the file.
+    pending: list[str] = []
+    pending_chars = 0
+    try:
+        with open(path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for match in re.finditer(rb"\(([^\)]{4,})\)", mapped):
+                value = match.group(1).decode("latin-1", errors="ignore")
+                value = re.sub(r"\\[nrt]", " ", value)
+                value = re.sub(r"\\\d{1,3}", "", value)
+                value = re.sub(r"\s+", " ", value).strip()
+                if len(value) < 4:
+                    continue
+                pending.append(value)
+                pending_chars += len(value)
+                if pending_chars >= PDF_FALLBACK_SEGMENT_CHARS:
+                    yield " ".join(pending)
+                    pending = []
+                    pending_chars = 0
+    except (OSError, ValueError):
+        pass
+    if pending:
+        yield " ".join(pending)
+
+
+def epub_member_names(path: str) -> list[str]:
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return sorted(name for name in archive.namelist() if name.lower().endswith(EPUB_MEMBER_SUFFIXES))
+    except Exception:
+        return []
+
+
+def extract_epub_members(path: str, names: list[str]) -> list[str]:
+    texts: list[str] = []
+    with zipfile.ZipFile(path) as archive:
+        for name in names:
+            try:
+                texts.append(strip_html_tags(archive.read(name).decode("utf-8", errors="ignore")))
+            except Exception:
+                texts.append("")
+    return texts
+
+
+def html_block_boundary(text: str) -> int:
+    # Cut after the last complete tag, but never inside an unterminated <script>/<style> element.
+    cut = text.rfind(">") + 1
+    lower = text[:cut].lower()
+    for tag in ("script", "style"):
+        opened = lower.rfind(f"<{tag}")
+        if opened >= 0 and lower.find(f"</{tag}", opened) < 0:
+            cut = min(cut, opened)
+    return cut
+
+
+def iter_text_segments(path: str, is_html: bool, block_chars: int = 65536) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="ignore") as handle:
+        pending = ""
+        while True:
+            block = handle.read(block_chars)
+            if not is_html:
+                if not block:
+                    return
+                yield block
+                continue
+            pending += block
+            cut = html_block_boundary(pending) if block else len(pending)
+            if cut <= 0 and len(pending) > block_chars * 16:
+                cut = len(pending)
+            if cut > 0:
+                text = strip_html_tags(pending[:cut])
+                pending = pending[cut:]
+                if text:
+                    yield text
+            if not block:
+                return
+
+
+class ExtractWorkerProcess(multiprocessing.context.SpawnProcess):
+    """Spawn worker whose child re-imports this module as __main__ instead of the caller's entry script.
+
+    A spawned child runs the parent's __main__ before it unpickles work. For the bridge that is
+    telegram_to_n8n.py, whose top level parses env, loads state and can write the user registry; the
+    pool tasks only need the functions defined here.
+    """
+
+    def start(self) -> None:
+        main_module = sys.modules.get("__main__")
+        sys.modules["__main__"] = sys.modules[__name__]
+        try:
+            super().start()
+        finally:
+            if main_module is not None:
+                sys.modules["__main__"] = main_module
+
+
+class ExtractSpawnContext(multiprocessing.context.SpawnContext):
+    Process = ExtractWorkerProcess
+
+
+class DocumentExtractor:
+    """Page-parallel PDF/EPUB extraction on a process pool with a content-hash result cache."""
+
+    def __init__(
+        self,
+        workers: int,
+        pages_per_task: int,
+        timeout_seconds: float,
+        cache_dir: Path | None,
+        cache_max_entries: int,
+    ) -> None:
+        self.workers = max(0, int(workers))
+        self.pages_per_task = max(1, int(pages_per_task))
+        self.timeout_seconds = max(1.0, float(timeout_seconds))
+        self.cache_dir = cache_dir
+        self.cache_max_entries = max(0, int(cache_max_entries))
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics: dict[str, float] = {
+            "documents": 0,
+            "pages": 0,
+            "parallel": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "timeouts": 0,
+            "pool_failures": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+        }
+
+    def _bump(self, **deltas: float) -> None:
+        with self._metrics_lock:
+            for key, value in deltas.items():
+                self._metrics[key] = self._metrics.get(key, 0) + value
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        documents = int(metrics["documents"])
+        lookups = int(metrics["cache_hits"] + metrics["cache_misses"])
+        return {
+            "workers": self.workers,
+            "documents": documents,
+            "pages": int(metrics["pages"]),
+            "parallel": int(metrics["parallel"]),
+            "cache_hits": int(metrics["cache_hits"]),
+            "cache_hit_rate": round(metrics["cache_hits"] / lookups, 3) if lookups else 0.0,
+            "timeouts": int(metrics["timeouts"]),
+            "pool_failures": int(metrics["pool_failures"]),
+            "avg_seconds": round(metrics["total_seconds"] / documents, 3) if documents else 0.0,
+            "max_seconds": round(metrics["max_seconds"], 3),
+        }
+
+    def _cache_path(self, content_sha256: str) -> Path | None:
+        if self.cache_dir is None or self.cache_max_entries <= 0:
+            return None
+        if not re.fullmatch(r"[a-f0-9]{64}", str(content_sha256 or "")):
+            return None
+        return self.cache_dir / f"{content_sha256}.jsonl"
+
+    def _cache_get(self, content_sha256: str) -> Iterator[str] | None:
+        cache_path = self._cache_path(content_sha256)
+        if cache_path is None:
+            return None
+        try:
+            handle = cache_path.open("r", encoding="utf-8")
+            os.utime(cache_path)
+        except OSError:
+            self._bump(cache_misses=1)
+            return None
+        self._bump(cache_hits=1)
+        return self._iter_cached(handle)
+
+    @staticmethod
+    def _iter_cached(handle: Any) -> Iterator[str]:
+        # One JSON string per line, so a cached document streams back without being loaded whole.
+        with handle:
+            for line in handle:
+                if line.strip():
+                    yield str(json.loads(line))
+
+    def _cache_open(self, content_sha256: str) -> tuple[Path, Path, Any] | None:
+        cache_path = self._cache_path(content_sha256)
+        if cache_path is None or self.cache_dir is None:
+            return None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            return cache_path, temp_path, temp_path.open("w", encoding="utf-8")
+        except OSError:
+            return None
+
+    def _cache_close(self, entry: tuple[Path, Path, Any], commit: bool) -> None:
+        cache_path, temp_path, handle = entry
+        try:
+            handle.close()
+            if not commit:
+                temp_path.unlink(missing_ok=True)
+                return
+            os.replace(temp_path, cache_path)
+            entries = sorted(self.cache_dir.glob("*.jsonl"), key=lambda item: item.stat().st_mtime)
+            for stale in entries[: max(0, len(entries) - self.cache_max_entries)]:
+                stale.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: the bridge runs several threads, and forking a threaded process can deadlock the child.
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ExtractSpawnContext())
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        # ProcessPoolExecutor cannot cancel a running task, so stuck workers are terminated directly.
+        for process in list(getattr(pool, "_processes", {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_batches(self, func: Any, path: str, batches: list[Any], clock: dict[str, float]) -> Iterator[list[str]]:
+        # Results come back in batch order with at most two batches per worker in flight, so memory stays
+        # bounded by the consumer. clock["spent"] counts only time spent waiting on extraction, not time
+        # the consumer holds a segment. A pool failure finishes the remaining batches inline.
+        index = 0
+        if self.workers > 0 and len(batches) > 1:
+            pool = self._get_pool()
+            in_flight: deque[Any] = deque()
+            try:
+                while index < len(batches):
+                    started = time.monotonic()
+                    try:
+                        while len(in_flight) < self.workers * 2 and index + len(in_flight) < len(batches):
+                            in_flight.append(pool.submit(func, path, *batches[index + len(in_flight)]))
+                        texts = in_flight[0].result(timeout=max(0.0, self.timeout_seconds - clock["spent"]))
+                    except FutureTimeoutError:
+                        self._reset_pool(pool)
+                        self._bump(timeouts=1)
+                        raise TimeoutError(f"extraction exceeded {self.timeout_seconds:.0f}s") from None
+                    except Exception as exc:
+                        self._bump(pool_failures=1)
+                        if isinstance(exc, (BrokenProcessPool, RuntimeError)):
+                            self._reset_pool(pool)
+                        break
+                    finally:
+                        clock["spent"] += time.monotonic() - started
+                    in_flight.popleft()
+                    index += 1
+                    yield texts
+                else:
+                    self._bump(parallel=1)
+            finally:
+                for future in in_flight:
+                    future.cancel()
+        for batch in batches[index:]:
+            if clock["spent"] > self.timeout_seconds:
+                self._bump(timeouts=1)
+                raise TimeoutError(f"extraction exceeded {self.timeout_seconds:.0f}s")
+            started = time.monotonic()
+            texts = func(path, *batch)
+            clock["spent"] += time.monotonic() - started
+            yield texts
+
+    def _iter_pdf(self, path: str, clock: dict[str, float]) -> Iterator[str]:
+        yielded = False
+        try:
+            started = time.monotonic()
+            page_count = pdf_page_count(path)
+            clock["spent"] += time.monotonic() - started
+            batches = [(start, start + self.pages_per_task) for start in range(0, page_count, self.pages_per_task)]
+            if self.workers > 0 and len(batches) > 1:
+                # Pool workers open their own reader; an inline fallback reopens it here.
+                release_pdf_reader()
+            for pages in self._iter_batches(extract_pdf_pages, path, batches, clock):
+                self._bump(pages=len(pages))
+                for page in pages:
+                    if page:
+                        yielded = True
+                        yield page
+        finally:
+            release_pdf_reader()
+        if not yielded:
+            yield from scan_pdf_literal_strings(path)
+
+    def _iter_epub(self, path: str, clock: dict[str, float]) -> Iterator[str]:
+        names = epub_member_names(path)
+        batches = [(names[start : start + self.pages_per_task],) for start in range(0, len(names), self.pages_per_task)]
+        for texts in self._iter_batches(extract_epub_members, path, batches, clock):
+            self._bump(pages=len(texts))
+            for text in texts:
+                if text:
+                    yield text
+
+    def _iter_extracted(self, path: str, kind: str, content_sha256: str) -> Iterator[str]:
+        clock = {"spent": 0.0}
+        cache_entry = self._cache_open(content_sha256)
+        completed = False
+        wrote = False
+        try:
+            segments = self._iter_pdf(path, clock) if kind == "pdf" else self._iter_epub(path, clock)
+            for segment in segments:
+                if cache_entry is not None:
+                    cache_entry[2].write(json.dumps(segment, ensure_ascii=False) + "\n")
+                    wrote = True
+                yield segment
+            completed = True
+        finally:
+            if cache_entry is not None:
+                self._cache_close(cache_entry, commit=completed and wrote)
+            with self._metrics_lock:
+                self._metrics["documents"] += 1
+                self._metrics["total_seconds"] += clock["spent"]
+                self._metrics["max_seconds"] = max(self._metrics["max_seconds"], clock["spent"])
+
+    def extract(self, path: Path, content_type: str, file_url: str, content_sha256: str = "") -> Iterator[str]:
+        """Yields text segments lazily; a timeout or worker failure surfaces while iterating."""
+        kind = detect_document_kind(content_type, file_url)
+        if kind in {"text", "html"}:
+            return iter_text_segments(str(path), is_html=kind == "html")
+        if kind not in {"pdf", "epub"}:
+            return iter(())
+        cached = self._cache_get(content_sha256)
+        if cached is not None:
+            return cached
+        return self._iter_extracted(str(path), kind, content_sha256)
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+CACHE_FORMAT_VERSION = 1
+
+
+def normalize_query_text(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text or "")).strip().casefold()
+
+
+def _vector_to_b64(vector: array) -> str:
+    # Persist little-endian float32 regardless of host byte order.
+    if sys.byteorder != "little":
+        vector = array("f", vector)
+        vector.byteswap()
+    return base64.b64encode(vector.tobytes()).decode("ascii")
+
+
+def _vector_from_b64(value: str) -> array:
+    vector = array("f")
+    vector.frombytes(base64.b64decode(value))
+    if sys.byteorder != "little":
+        vector.byteswap()
+    return vector
+
+
+class EmbeddingCache:
+    """Memory-bounded LRU of normalized query text -> float32 embedding, persisted as compact JSON."""
+
+    def __init__(self, path: Path | None, model: str, max_entries: int, max_bytes: int) -> None:
+        self.path = path
+        self.model = str(model or "")
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: OrderedDict[str, array] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{normalize_query_text(text)}".encode("utf-8")).hexdigest()
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, vector = self._entries.popitem(last=False)
+            self._bytes -= vector.itemsize * len(vector)
+            self._evictions += 1
+
+    def get(self, text: str) -> list[float] | None:
+        if self.max_entries <= 0:
+            return None
+        key = self.key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return vector.tolist()
+
+    def put(self, text: str, vector: list[float]) -> None:
+        if self.max_entries <= 0 or not vector:
+            return
+        packed = array("f", vector)
+        key = self.key(text)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.itemsize * len(previous)
+            self._entries[key] = packed
+            self._bytes += packed.itemsize * len(packed)
+            self._evict()
+            self._dirty = True
+
+    def load(self) -> int:
+        if self.path is None or not self.path.exists():
+            return 0
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            return 0
+        if not isinstance(data, dict) or data.get("version") != CACHE_FORMAT_VERSION or data.get("model") != self.model:
+            # A different embedding model produces incompatible vectors; start cold.
+            return 0
+        rows = data.get("entries") if isinstance(data.get("entries"), list) else []
+        with self._lock:
+            for row in rows:
+                if not isinstance(row, list) or len(row) != 2:
+                    continue
+                try:
+                    vector = _vector_from_b64(str(row[1]))
+                except Exception:
+                    continue
+                if vector:
+                    self._entries[str(row[0])] = vector
+                    self._bytes += vector.itemsize * len(vector)
+            self._evict()
+            self._dirty = False
+            return len(self._entries)
+
+    def flush(self, min_interval_seconds: float = 0.0) -> bool:
+        if self.path is None or not self._dirty:
+            return False
+        now = time.monotonic()
+        if now - self._last_save < min_interval_seconds:
+            return False
+        with self._lock:
+            # Oldest first so load() rebuilds the same LRU order.
+            rows = [[key, _vector_to_b64(vector)] for key, vector in self._entries.items()]
+            self._dirty = False
+        self._last_save = now
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_suffix(".tmp")
+            temp_path.write_text(
+                json.dumps({"version": CACHE_FORMAT_VERSION, "model": self.model, "entries": rows}, separators=(",", ":")),
+                encoding="utf-8",
+            )
+            os.replace(temp_path, self.path)
+        except OSError:
+            self._dirty = True
+            return False
+        return True
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
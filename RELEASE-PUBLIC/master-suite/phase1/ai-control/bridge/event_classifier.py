@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable
+
+# Matches nothing; stands in for an empty pattern list so classify() needs no special cases.
+NEVER_MATCH = re.compile(r"(?!x)x")
+
+READY_TITLE_PATTERNS = (
+    re.compile(r"^(.+?)\s+is\s+now\s+available\s+in\s+plex\b", re.IGNORECASE),
+    re.compile(r"^(.+?)\s+is\s+available\s+in\s+plex\b", re.IGNORECASE),
+    re.compile(r"^(.+?)\s+now\s+available\b", re.IGNORECASE),
+    re.compile(r"^ready[:\-]\s*(.+)$", re.IGNORECASE),
+)
+READY_TITLE_EXCLUDE_PATTERN = re.compile(
+    r"\b(media\s+ready|ready\s+test|service\s+status|service\s+recovered)\b", re.IGNORECASE
+)
+
+
+def literal_alternation(literals: Iterable[str], word_boundary: bool = False) -> re.Pattern[str]:
+    items = sorted({str(item).strip().lower() for item in literals if str(item).strip()}, key=len, reverse=True)
+    if not items:
+        return NEVER_MATCH
+    body = "|".join(re.escape(item) for item in items)
+    return re.compile(rf"\b(?:{body})\b" if word_boundary else body)
+
+
+def regex_alternation(patterns: Iterable[str]) -> re.Pattern[str]:
+    items = [str(item) for item in patterns if str(item)]
+    if not items:
+        return NEVER_MATCH
+    return re.compile("|".join(f"(?:{item})" for item in items))
+
+
+class EventClassifier:
+    """Fanout filter verdicts for one ntfy event from a single lowercase pass over title + message.
+
+    Each verdict family (drop patterns, media noise markers, critical keywords, negated-critical phrases,
+    media ready signals) is one precompiled alternation, so a check is one C-level scan instead of a
+    Python loop of `in` tests or per-keyword `re.search` calls.
+    """
+
+    def __init__(
+        self,
+        drop_patterns: Iterable[str],
+        noise_markers: Iterable[str],
+        critical_keywords: Iterable[str],
+        negated_critical_patterns: Iterable[str],
+        ready_signal_patterns: Iterable[str],
+    ) -> None:
+        self.drop = literal_alternation(drop_patterns)
+        self.noise = literal_alternation(noise_markers)
+        self.critical = literal_alternation(critical_keywords, word_boundary=True)
+        self.negated_critical = regex_alternation(negated_critical_patterns)
+        self.ready_signal = regex_alternation(ready_signal_patterns)
+
+    def classify(self, title: str, message: str) -> dict[str, bool]:
+        blob = f"{title} {message}".strip().lower()
+        negated = self.negated_critical.search(blob) is not None
+        return {
+            "drop": self.drop.search(blob) is not None,
+            "media_noise": self.noise.search(blob) is not None,
+            "critical_text": not negated and self.critical.search(blob) is not None,
+            "ready_signal": self.ready_signal.search(blob) is not None,
+        }
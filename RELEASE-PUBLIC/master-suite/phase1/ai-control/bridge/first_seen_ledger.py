@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable
+
+LEGACY_IMPORT_MARKER = "legacy_import_done"
+
+
+class BloomFilter:
+    """Fixed-size bloom filter: a miss means the key was definitely never added."""
+
+    def __init__(self, bits: int, hashes: int) -> None:
+        self.bits = max(8, int(bits))
+        self.hashes = max(1, int(hashes))
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, key: str) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class FirstSeenLedger:
+    """SQLite ledger of media first-seen keys: one indexed row per key, expiry by last_seen range delete."""
+
+    def __init__(
+        self,
+        path: str,
+        retention_seconds: int,
+        bloom_bits: int = 0,
+        bloom_hashes: int = 5,
+        purge_interval_seconds: int = 3600,
+    ) -> None:
+        self.path = str(path)
+        self.retention_seconds = max(0, int(retention_seconds))
+        self.bloom_bits = max(0, int(bloom_bits))
+        self.bloom_hashes = max(1, int(bloom_hashes))
+        self.purge_interval_seconds = max(0, int(purge_interval_seconds))
+        self._lock = threading.Lock()
+        self._last_purge = 0
+        self._bloom: BloomFilter | None = None
+        self._counters = {"lookups": 0, "bloom_new": 0, "new": 0, "repeat": 0, "purged": 0}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS media_first_seen (
+                key TEXT PRIMARY KEY,
+                first_seen INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL,
+                event_count INTEGER NOT NULL DEFAULT 1
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS media_first_seen_last_seen_idx ON media_first_seen(last_seen)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS media_first_seen_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._rebuild_bloom()
+
+    def _keep_after(self, now_ts: int) -> int:
+        return now_ts - self.retention_seconds if self.retention_seconds > 0 else 0
+
+    def _rebuild_bloom(self) -> None:
+        if self.bloom_bits <= 0:
+            self._bloom = None
+            return
+        bloom = BloomFilter(self.bloom_bits, self.bloom_hashes)
+        for (key,) in self._conn.execute("SELECT key FROM media_first_seen"):
+            bloom.add(str(key))
+        self._bloom = bloom
+
+    def import_legacy(self, items: dict[str, Any]) -> int:
+        """One-time copy of the old JSON/state_kv `items` map; later calls are no-ops even if the ledger is cleared."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM media_first_seen_meta WHERE key = ?", (LEGACY_IMPORT_MARKER,)
+            ).fetchone()
+            if row:
+                return 0
+            rows = []
+            for key, payload in (items or {}).items():
+                if not isinstance(key, str) or not isinstance(payload, dict):
+                    continue
+                try:
+                    first_seen = int(payload.get("first_seen", 0) or 0)
+                    last_seen = int(payload.get("last_seen", first_seen) or first_seen)
+                    event_count = int(payload.get("event_count", 1) or 1)
+                except (TypeError, ValueError):
+                    continue
+                rows.append((key, max(0, first_seen), max(0, first_seen, last_seen), max(1, event_count)))
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO media_first_seen(key, first_seen, last_seen, event_count) VALUES(?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO media_first_seen_meta(key, value) VALUES(?, ?)",
+                    (LEGACY_IMPORT_MARKER, str(int(time.time()))),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._rebuild_bloom()
+            return len(rows)
+
+    def observe(self, key: str, now_ts: int | None = None) -> tuple[bool, dict[str, int]]:
+        """Record a sighting; returns (is_new, record). Expired rows count as new and restart their history."""
+        ts = int(now_ts or time.time())
+        with self._lock:
+            self._counters["lookups"] += 1
+            self._maybe_purge(ts)
+            if self._bloom is not None and not self._bloom.might_contain(key):
+                # Definitely never stored by this process's view; a racing insert elsewhere falls through below.
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO media_first_seen(key, first_seen, last_seen, event_count) VALUES(?, ?, ?, 1)",
+                    (key, ts, ts),
+                )
+                if cursor.rowcount == 1:
+                    self._bloom.add(key)
+                    self._counters["bloom_new"] += 1
+                    self._counters["new"] += 1
+                    return True, {"first_seen": ts, "last_seen": ts, "event_count": 1}
+            row = self._conn.execute(
+                "SELECT first_seen, last_seen, event_count FROM media_first_seen WHERE key = ?", (key,)
+            ).fetchone()
+            if row and max(int(row[0]), int(row[1])) >= self._keep_after(ts):
+                event_count = int(row[2]) + 1
+                self._conn.execute(
+                    "UPDATE media_first_seen SET last_seen = ?, event_count = ? WHERE key = ?", (ts, event_count, key)
+                )
+                self._counters["repeat"] += 1
+                return False, {"first_seen": int(row[0]), "last_seen": ts, "event_count": event_count}
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media_first_seen(key, first_seen, last_seen, event_count) VALUES(?, ?, ?, 1)",
+                (key, ts, ts),
+            )
+            if self._bloom is not None:
+                self._bloom.add(key)
+            self._counters["new"] += 1
+            return True, {"first_seen": ts, "last_seen": ts, "event_count": 1}
+
+    def _maybe_purge(self, now_ts: int) -> None:
+        if self.retention_seconds <= 0 or now_ts - self._last_purge < self.purge_interval_seconds:
+            return
+        self._last_purge = now_ts
+        cursor = self._conn.execute("DELETE FROM media_first_seen WHERE last_seen < ?", (self._keep_after(now_ts),))
+        removed = max(0, cursor.rowcount)
+        if removed:
+            self._counters["purged"] += removed
+            self._rebuild_bloom()
+
+    def purge_expired(self, now_ts: int | None = None) -> int:
+        with self._lock:
+            before = self._counters["purged"]
+            self._last_purge = 0
+            self._maybe_purge(int(now_ts or time.time()))
+            return self._counters["purged"] - before
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM media_first_seen").fetchone()[0])
+
+    def recent(self, limit: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, first_seen, last_seen, event_count FROM media_first_seen ORDER BY last_seen DESC LIMIT ?",
+                (max(1, int(limit)),),
+            ).fetchall()
+        return [
+            {"key": str(key), "first_seen": int(first), "last_seen": int(last), "event_count": int(count)}
+            for key, first, last, count in rows
+        ]
+
+    def items(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, first_seen, last_seen, event_count FROM media_first_seen").fetchall()
+        return {
+            str(key): {"first_seen": int(first), "last_seen": int(last), "event_count": int(count)}
+            for key, first, last, count in rows
+        }
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return [str(row[0]) for row in self._conn.execute("SELECT key FROM media_first_seen")]
+
+    def delete(self, keys: list[str]) -> int:
+        if not keys:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = 0
+                for start in range(0, len(keys), 500):
+                    batch = keys[start : start + 500]
+                    cursor = self._conn.execute(
+                        f"DELETE FROM media_first_seen WHERE key IN ({','.join('?' for _ in batch)})", batch
+                    )
+                    removed += max(0, cursor.rowcount)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Bloom filters cannot forget keys; stale positives only cost a point lookup, so no rebuild needed.
+            return removed
+
+    def clear(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM media_first_seen")
+            self._rebuild_bloom()
+            return max(0, cursor.rowcount)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            entries = int(self._conn.execute("SELECT COUNT(*) FROM media_first_seen").fetchone()[0])
+            return {"entries": entries, "bloom_bits": self.bloom_bits if self._bloom is not None else 0, **self._counters}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+LEGACY_IMPORT_MARKER = "legacy_import_done"
+UPDATED_AT_KEY = "updated_at"
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _record_last_seen(record: dict[str, Any]) -> int:
+    try:
+        return int(record.get("last_seen", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class IncidentStore:
+    """SQLite incident records keyed by id with a last_seen index: point upserts, range expiry, paged listing."""
+
+    def __init__(self, path: str, retention_seconds: int, purge_interval_seconds: int = 300) -> None:
+        self.path = str(path)
+        self.retention_seconds = max(0, int(retention_seconds))
+        self.purge_interval_seconds = max(0, int(purge_interval_seconds))
+        self._lock = threading.Lock()
+        self._last_purge = 0
+        self._purged = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS incidents (
+                id TEXT PRIMARY KEY,
+                last_seen INTEGER NOT NULL,
+                payload TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS incidents_last_seen_idx ON incidents(last_seen)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS incident_store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _keep_after(self, now_ts: int) -> int:
+        return now_ts - self.retention_seconds if self.retention_seconds > 0 else 0
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO incident_store_meta(key, value) VALUES(?, ?)", (key, value))
+
+    def _maybe_purge(self, now_ts: int) -> None:
+        if self.retention_seconds <= 0 or now_ts - self._last_purge < self.purge_interval_seconds:
+            return
+        self._last_purge = now_ts
+        cursor = self._conn.execute("DELETE FROM incidents WHERE last_seen < ?", (self._keep_after(now_ts),))
+        self._purged += max(0, cursor.rowcount)
+
+    def import_legacy(self, incidents: dict[str, Any]) -> int:
+        """One-time copy of the old JSON/state_kv `incidents` map; a no-op once the marker is set."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM incident_store_meta WHERE key = ?", (LEGACY_IMPORT_MARKER,)
+            ).fetchone()
+            if row:
+                return 0
+            rows = [
+                (str(incident_id), _record_last_seen(record), json.dumps(record, ensure_ascii=False))
+                for incident_id, record in (incidents or {}).items()
+                if isinstance(record, dict)
+            ]
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR IGNORE INTO incidents(id, last_seen, payload) VALUES(?, ?, ?)", rows)
+                self._set_meta(LEGACY_IMPORT_MARKER, str(int(time.time())))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return len(rows)
+
+    def get(self, incident_id: str, now_ts: int | None = None) -> dict[str, Any] | None:
+        ts = int(now_ts or time.time())
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM incidents WHERE id = ? AND last_seen >= ?", (incident_id, self._keep_after(ts))
+            ).fetchone()
+        if not row:
+            return None
+        record = json.loads(str(row[0]))
+        return record if isinstance(record, dict) else None
+
+    def mutate(
+        self,
+        incident_id: str,
+        apply: Callable[[dict[str, Any] | None], dict[str, Any] | None],
+        now_ts: int | None = None,
+    ) -> dict[str, Any] | None:
+        """Read-modify-write one incident in a single transaction; `apply` gets None for missing/expired rows.
+
+        Returning None from `apply` leaves the row untouched. Both bridges write here, so each caller only
+        changes the fields it owns instead of saving back a stale full copy.
+        """
+        ts = int(now_ts or time.time())
+        with self._lock:
+            self._maybe_purge(ts)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT payload FROM incidents WHERE id = ? AND last_seen >= ?", (incident_id, self._keep_after(ts))
+                ).fetchone()
+                existing = json.loads(str(row[0])) if row else None
+                record = apply(existing if isinstance(existing, dict) else None)
+                if record is None:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO incidents(id, last_seen, payload) VALUES(?, ?, ?)",
+                    (incident_id, _record_last_seen(record), json.dumps(record, ensure_ascii=False)),
+                )
+                self._set_meta(UPDATED_AT_KEY, _utc_now())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return record
+
+    def page(self, offset: int, limit: int, now_ts: int | None = None) -> tuple[int, list[dict[str, Any]]]:
+        """Live incidents newest-first, walked off the last_seen index; returns (total, rows)."""
+        keep_after = self._keep_after(int(now_ts or time.time()))
+        with self._lock:
+            total = int(
+                self._conn.execute("SELECT COUNT(*) FROM incidents WHERE last_seen >= ?", (keep_after,)).fetchone()[0]
+            )
+            rows = self._conn.execute(
+                "SELECT payload FROM incidents WHERE last_seen >= ? ORDER BY last_seen DESC, id LIMIT ? OFFSET ?",
+                (keep_after, max(1, int(limit)), max(0, int(offset))),
+            ).fetchall()
+        records = [json.loads(str(row[0])) for row in rows]
+        return total, [record for record in records if isinstance(record, dict)]
+
+    def items(self, now_ts: int | None = None) -> dict[str, dict[str, Any]]:
+        keep_after = self._keep_after(int(now_ts or time.time()))
+        with self._lock:
+            rows = self._conn.execute("SELECT id, payload FROM incidents WHERE last_seen >= ?", (keep_after,)).fetchall()
+        return {str(incident_id): json.loads(str(payload)) for incident_id, payload in rows}
+
+    def updated_at(self) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM incident_store_meta WHERE key = ?", (UPDATED_AT_KEY,)).fetchone()
+        return str(row[0]) if row else ""
+
+    def purge_expired(self, now_ts: int | None = None) -> int:
+        with self._lock:
+            before = self._purged
+            self._last_purge = 0
+            self._maybe_purge(int(now_ts or time.time()))
+            return self._purged - before
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            entries = int(self._conn.execute("SELECT COUNT(*) FROM incidents").fetchone()[0])
+        return {"entries": entries, "purged": self._purged, "updated_at": self.updated_at()}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 import json
 import os
+import queue
 import re
+import signal
 import sqlite3
+import threading
 import traceback
 import time
+import functools
 import hashlib
+import heapq
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Any
 import urllib.error
@@ -13,14 +19,24 @@ import urllib.parse
 import urllib.request
 
 from policy_loader import load_policy_alert_settings
+from event_classifier import READY_TITLE_EXCLUDE_PATTERN, READY_TITLE_PATTERNS, EventClassifier
+from first_seen_ledger import FirstSeenLedger
+from incident_store import IncidentStore
+from telegram_outbox import TelegramOutbox
+from state_codec import dumps_state, write_state_file
 
 NTFY_BASE = os.getenv("NTFY_BASE", "http://ntfy")
 N8N_BASE = os.getenv("N8N_BASE", "http://n8n:5678")
 POLL_SECONDS = int(os.getenv("POLL_SECONDS", "5"))
 HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "65"))
 POLL_REQUEST_TIMEOUT_SECONDS = int(os.getenv("POLL_REQUEST_TIMEOUT_SECONDS", "4"))
+POLL_PAGE_EVENTS = int(os.getenv("POLL_PAGE_EVENTS", "500"))
+POLL_METRICS_LOG_SECONDS = int(os.getenv("POLL_METRICS_LOG_SECONDS", "300"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
 STATE_FILE = os.getenv("STATE_FILE", "/state/bridge_state.json")
+STATE_FSYNC = os.getenv("STATE_FSYNC", "false").strip().lower() in {"1", "true", "yes", "on"}
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").strip().rstrip("/")
 TELEGRAM_USER_REGISTRY = os.getenv("TELEGRAM_USER_REGISTRY", "/telegram-state/telegram_users.json")
 TELEGRAM_NOTIFICATIONS_ENABLED = os.getenv("TELEGRAM_NOTIFICATIONS_ENABLED", "true").strip().lower() in {
     "1",
@@ -69,6 +85,13 @@ TELEGRAM_MEDIA_FIRST_SEEN_ONLY_ENABLED = os.getenv("TELEGRAM_MEDIA_FIRST_SEEN_ON
 }
 TELEGRAM_MEDIA_FIRST_SEEN_STATE = os.getenv("TELEGRAM_MEDIA_FIRST_SEEN_STATE", "/state/telegram_media_first_seen.json")
 TELEGRAM_MEDIA_FIRST_SEEN_RETENTION_SECONDS = int(os.getenv("TELEGRAM_MEDIA_FIRST_SEEN_RETENTION_SECONDS", "31536000"))
+TELEGRAM_MEDIA_FIRST_SEEN_LEDGER_PATH = os.getenv(
+    "TELEGRAM_MEDIA_FIRST_SEEN_LEDGER_PATH", os.path.splitext(TELEGRAM_MEDIA_FIRST_SEEN_STATE)[0] + ".db"
+).strip()
+TELEGRAM_MEDIA_FIRST_SEEN_BLOOM_BITS = int(os.getenv("TELEGRAM_MEDIA_FIRST_SEEN_BLOOM_BITS", "1048576"))
+TELEGRAM_MEDIA_FIRST_SEEN_PURGE_INTERVAL_SECONDS = int(
+    os.getenv("TELEGRAM_MEDIA_FIRST_SEEN_PURGE_INTERVAL_SECONDS", "3600")
+)
 TELEGRAM_DEDUPE_STATE = os.getenv("TELEGRAM_DEDUPE_STATE", "/state/telegram_dedupe_state.json")
 TELEGRAM_DEDUPE_WINDOW_SECONDS = int(os.getenv("TELEGRAM_DEDUPE_WINDOW_SECONDS", "120"))
 TELEGRAM_DEDUPE_WINDOW_SECONDS_BY_TOPIC_RAW = os.getenv("TELEGRAM_DEDUPE_WINDOW_SECONDS_BY_TOPIC", "")
@@ -86,13 +109,33 @@ TELEGRAM_AUTO_QUARANTINE_ENABLED = os.getenv("TELEGRAM_AUTO_QUARANTINE_ENABLED",
 TELEGRAM_AUTO_QUARANTINE_THRESHOLD = int(os.getenv("TELEGRAM_AUTO_QUARANTINE_THRESHOLD", "3"))
 TELEGRAM_AUTO_QUARANTINE_SECONDS = int(os.getenv("TELEGRAM_AUTO_QUARANTINE_SECONDS", "86400"))
 TELEGRAM_DELIVERY_STATE = os.getenv("TELEGRAM_DELIVERY_STATE", "/state/telegram_delivery_state.json")
+TELEGRAM_OUTBOX_ENABLED = os.getenv("TELEGRAM_OUTBOX_ENABLED", "true").strip().lower() in {
+    "1",
+    "true",
+    "yes",
+    "on",
+}
+TELEGRAM_OUTBOX_PATH = os.getenv(
+    "TELEGRAM_OUTBOX_PATH",
+    os.path.join(os.path.dirname(TELEGRAM_DELIVERY_STATE) or ".", "telegram_outbox.db"),
+).strip()
+TELEGRAM_OUTBOX_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_OUTBOX_MAX_ATTEMPTS", "6"))
+TELEGRAM_OUTBOX_BACKOFF_SECONDS = float(os.getenv("TELEGRAM_OUTBOX_BACKOFF_SECONDS", "30"))
+TELEGRAM_OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("TELEGRAM_OUTBOX_BACKOFF_MAX_SECONDS", "1800"))
+TELEGRAM_OUTBOX_MAX_AGE_SECONDS = int(os.getenv("TELEGRAM_OUTBOX_MAX_AGE_SECONDS", "3600"))
+TELEGRAM_OUTBOX_DRAIN_BATCH = int(os.getenv("TELEGRAM_OUTBOX_DRAIN_BATCH", "50"))
 TELEGRAM_DIGEST_QUEUE_STATE = os.getenv("TELEGRAM_DIGEST_QUEUE_STATE", "/state/telegram_digest_queue.json")
 TELEGRAM_QUIET_HOURS_UTC_OFFSET_HOURS = int(os.getenv("TELEGRAM_QUIET_HOURS_UTC_OFFSET_HOURS", "0"))
 TELEGRAM_DIGEST_MAX_ITEMS_PER_USER = int(os.getenv("TELEGRAM_DIGEST_MAX_ITEMS_PER_USER", "50"))
 TELEGRAM_DIGEST_LINE_MAX_CHARS = int(os.getenv("TELEGRAM_DIGEST_LINE_MAX_CHARS", "120"))
+TELEGRAM_DIGEST_RETRY_SECONDS = int(os.getenv("TELEGRAM_DIGEST_RETRY_SECONDS", "300"))
 TELEGRAM_INCIDENT_STATE = os.getenv("TELEGRAM_INCIDENT_STATE", "/state/telegram_incidents.json")
 TELEGRAM_INCIDENT_ACK_TTL_SECONDS = int(os.getenv("TELEGRAM_INCIDENT_ACK_TTL_SECONDS", "21600"))
 TELEGRAM_INCIDENT_RETENTION_SECONDS = int(os.getenv("TELEGRAM_INCIDENT_RETENTION_SECONDS", "604800"))
+TELEGRAM_INCIDENT_STORE_PATH = os.getenv(
+    "TELEGRAM_INCIDENT_STORE_PATH", os.path.splitext(TELEGRAM_INCIDENT_STATE)[0] + ".db"
+).strip()
+TELEGRAM_INCIDENT_PURGE_INTERVAL_SECONDS = int(os.getenv("TELEGRAM_INCIDENT_PURGE_INTERVAL_SECONDS", "300"))
 TELEGRAM_INCIDENT_COLLAPSE_ENABLED = os.getenv("TELEGRAM_INCIDENT_COLLAPSE_ENABLED", "true").strip().lower() in {
     "1",
     "true",
@@ -100,6 +143,24 @@ TELEGRAM_INCIDENT_COLLAPSE_ENABLED = os.getenv("TELEGRAM_INCIDENT_COLLAPSE_ENABL
     "on",
 }
 TELEGRAM_INCIDENT_COLLAPSE_WINDOW_SECONDS = int(os.getenv("TELEGRAM_INCIDENT_COLLAPSE_WINDOW_SECONDS", "900"))
+TELEGRAM_COALESCE_ENABLED = os.getenv("TELEGRAM_COALESCE_ENABLED", "true").strip().lower() in {
+    "1",
+    "true",
+    "yes",
+    "on",
+}
+TELEGRAM_COALESCE_WINDOW_SECONDS = int(os.getenv("TELEGRAM_COALESCE_WINDOW_SECONDS", "30"))
+TELEGRAM_COALESCE_CATEGORIES = {
+    item.strip().lower()
+    for item in os.getenv("TELEGRAM_COALESCE_CATEGORIES", "ops,media,maintenance").split(",")
+    if item.strip()
+}
+TELEGRAM_COALESCE_MAX_LINES = int(os.getenv("TELEGRAM_COALESCE_MAX_LINES", "10"))
+TELEGRAM_COALESCE_SAVE_INTERVAL_SECONDS = int(os.getenv("TELEGRAM_COALESCE_SAVE_INTERVAL_SECONDS", "5"))
+TELEGRAM_COALESCE_STATE = os.getenv(
+    "TELEGRAM_COALESCE_STATE",
+    os.path.join(os.path.dirname(TELEGRAM_DIGEST_QUEUE_STATE), "telegram_coalesce_windows.json"),
+)
 TELEGRAM_STATE_BACKEND = os.getenv("TELEGRAM_STATE_BACKEND", "json").strip().lower()
 TELEGRAM_STATE_SQLITE_PATH = os.getenv("TELEGRAM_STATE_SQLITE_PATH", "/state/telegram_state.db").strip()
 OVERSEERR_URL = os.getenv("OVERSEERR_URL", "http://host.docker.internal:5055").strip().rstrip("/")
@@ -111,6 +172,9 @@ TELEGRAM_MEDIA_READY_GATE_ENABLED = os.getenv("TELEGRAM_MEDIA_READY_GATE_ENABLED
     "on",
 }
 TELEGRAM_MEDIA_READY_STATUS_REQUIRED = int(os.getenv("TELEGRAM_MEDIA_READY_STATUS_REQUIRED", "5"))
+TELEGRAM_MEDIA_READY_CACHE_TTL_SECONDS = int(os.getenv("TELEGRAM_MEDIA_READY_CACHE_TTL_SECONDS", "600"))
+TELEGRAM_MEDIA_READY_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("TELEGRAM_MEDIA_READY_CACHE_NEGATIVE_TTL_SECONDS", "90"))
+TELEGRAM_MEDIA_READY_CACHE_MAX_ENTRIES = int(os.getenv("TELEGRAM_MEDIA_READY_CACHE_MAX_ENTRIES", "512"))
 POLICY_FILE = os.getenv("POLICY_FILE", "/app/policy/policy.v1.yaml").strip()
 
 TOPICS = {
@@ -156,7 +220,6 @@ if POLICY_REQUIRED_TOPICS:
             flush=True,
         )
 
-ALL_WATCHED_TOPICS = sorted(set(TOPICS.keys()) | set(TELEGRAM_NOTIFICATION_TOPICS.keys()))
 
 CRITICAL_KEYWORDS = {
     "critical",
@@ -188,6 +251,33 @@ MEDIA_READY_SIGNAL_PATTERNS = (
     r"\bnow\s+available\b",
 )
 
+EVENT_CLASSIFIER: EventClassifier | None = None
+
+
+def build_event_classifier() -> EventClassifier:
+    """(Re)compile the fanout filter matcher from the current pattern settings; call again after changing them."""
+    global EVENT_CLASSIFIER
+    EVENT_CLASSIFIER = EventClassifier(
+        drop_patterns=TELEGRAM_NOTIFY_DROP_PATTERNS,
+        noise_markers=TELEGRAM_MEDIA_NOISE_MARKERS,
+        critical_keywords=CRITICAL_KEYWORDS,
+        negated_critical_patterns=NEGATED_CRITICAL_PATTERNS,
+        ready_signal_patterns=MEDIA_READY_SIGNAL_PATTERNS,
+    )
+    classify_event.cache_clear()
+    return EVENT_CLASSIFIER
+
+
+@functools.lru_cache(maxsize=256)
+def classify_event(title: str, message: str) -> dict[str, bool]:
+    # Fanout asks about the same title/message several times (drop, critical, noise, ready gate,
+    # first-seen key); the cache makes that one scan per event. Treat the result as read-only.
+    classifier = EVENT_CLASSIFIER if EVENT_CLASSIFIER is not None else build_event_classifier()
+    return classifier.classify(str(title or ""), str(message or ""))
+
+
+build_event_classifier()
+
 
 def parse_topic_window_overrides(raw: str) -> dict[str, int]:
     overrides: dict[str, int] = {}
@@ -281,7 +371,7 @@ def load_sqlite_state(key: str, default: dict) -> dict:
 
 def save_sqlite_state(key: str, state: dict) -> None:
     ensure_sqlite_state_table()
-    payload = json.dumps(state, ensure_ascii=False)
+    payload = dumps_state(state).decode("utf-8")
     conn = sqlite3.connect(TELEGRAM_STATE_SQLITE_PATH)
     try:
         conn.execute(
@@ -339,9 +429,7 @@ def save_delivery_state(state: dict) -> None:
     if use_sqlite_state_backend():
         save_sqlite_state("delivery", state)
         return
-    os.makedirs(os.path.dirname(TELEGRAM_DELIVERY_STATE), exist_ok=True)
-    with open(TELEGRAM_DELIVERY_STATE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    write_state_file(TELEGRAM_DELIVERY_STATE, state, fsync=STATE_FSYNC)
 
 
 def load_dedupe_state() -> dict:
@@ -370,12 +458,10 @@ def save_dedupe_state(state: dict):
     if use_sqlite_state_backend():
         save_sqlite_state("dedupe", state)
         return
-    os.makedirs(os.path.dirname(TELEGRAM_DEDUPE_STATE), exist_ok=True)
-    with open(TELEGRAM_DEDUPE_STATE, "w", encoding="utf-8") as f:
-        json.dump(state, f)
+    write_state_file(TELEGRAM_DEDUPE_STATE, state, fsync=STATE_FSYNC)
 
 
-def load_media_first_seen_state() -> dict:
+def load_legacy_media_first_seen_state() -> dict:
     if use_sqlite_state_backend():
         data = load_sqlite_state("media_first_seen", {"items": {}, "updated_at": utc_now()})
         items = data.get("items") if isinstance(data, dict) else None
@@ -397,13 +483,28 @@ def load_media_first_seen_state() -> dict:
         return {"items": {}, "updated_at": utc_now()}
 
 
-def save_media_first_seen_state(state: dict) -> None:
-    if use_sqlite_state_backend():
-        save_sqlite_state("media_first_seen", state)
-        return
-    os.makedirs(os.path.dirname(TELEGRAM_MEDIA_FIRST_SEEN_STATE), exist_ok=True)
-    with open(TELEGRAM_MEDIA_FIRST_SEEN_STATE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False)
+MEDIA_FIRST_SEEN_LEDGER: FirstSeenLedger | None = None
+
+
+def get_media_first_seen_ledger() -> FirstSeenLedger:
+    global MEDIA_FIRST_SEEN_LEDGER
+    if MEDIA_FIRST_SEEN_LEDGER is None:
+        ledger = FirstSeenLedger(
+            TELEGRAM_MEDIA_FIRST_SEEN_LEDGER_PATH,
+            retention_seconds=TELEGRAM_MEDIA_FIRST_SEEN_RETENTION_SECONDS,
+            bloom_bits=TELEGRAM_MEDIA_FIRST_SEEN_BLOOM_BITS,
+            purge_interval_seconds=TELEGRAM_MEDIA_FIRST_SEEN_PURGE_INTERVAL_SECONDS,
+        )
+        # The legacy JSON/state_kv blob is read exactly once to seed the ledger.
+        imported = ledger.import_legacy(load_legacy_media_first_seen_state().get("items") or {})
+        if imported:
+            print(f"[bridge] media first-seen ledger imported {imported} legacy entries", flush=True)
+        MEDIA_FIRST_SEEN_LEDGER = ledger
+    return MEDIA_FIRST_SEEN_LEDGER
+
+
+def load_media_first_seen_state() -> dict:
+    return {"items": get_media_first_seen_ledger().items(), "updated_at": utc_now()}
 
 
 def load_notify_stats_state() -> dict:
@@ -432,9 +533,7 @@ def save_notify_stats_state(state: dict):
     if use_sqlite_state_backend():
         save_sqlite_state("notify_stats", state)
         return
-    os.makedirs(os.path.dirname(TELEGRAM_NOTIFY_STATS_STATE), exist_ok=True)
-    with open(TELEGRAM_NOTIFY_STATS_STATE, "w", encoding="utf-8") as f:
-        json.dump(state, f)
+    write_state_file(TELEGRAM_NOTIFY_STATS_STATE, state, fsync=STATE_FSYNC)
 
 
 def load_digest_queue_state() -> dict:
@@ -463,12 +562,10 @@ def save_digest_queue_state(state: dict):
     if use_sqlite_state_backend():
         save_sqlite_state("digest_queue", state)
         return
-    os.makedirs(os.path.dirname(TELEGRAM_DIGEST_QUEUE_STATE), exist_ok=True)
-    with open(TELEGRAM_DIGEST_QUEUE_STATE, "w", encoding="utf-8") as f:
-        json.dump(state, f)
+    write_state_file(TELEGRAM_DIGEST_QUEUE_STATE, state, fsync=STATE_FSYNC)
 
 
-def load_incident_state() -> dict:
+def load_legacy_incident_state() -> dict:
     if use_sqlite_state_backend():
         data = load_sqlite_state("incidents", {"incidents": {}, "updated_at": utc_now()})
         incidents = data.get("incidents") if isinstance(data, dict) else None
@@ -490,13 +587,27 @@ def load_incident_state() -> dict:
         return {"incidents": {}, "updated_at": utc_now()}
 
 
-def save_incident_state(state: dict):
-    if use_sqlite_state_backend():
-        save_sqlite_state("incidents", state)
-        return
-    os.makedirs(os.path.dirname(TELEGRAM_INCIDENT_STATE), exist_ok=True)
-    with open(TELEGRAM_INCIDENT_STATE, "w", encoding="utf-8") as f:
-        json.dump(state, f)
+INCIDENT_STORE: IncidentStore | None = None
+
+
+def get_incident_store() -> IncidentStore:
+    global INCIDENT_STORE
+    if INCIDENT_STORE is None:
+        store = IncidentStore(
+            TELEGRAM_INCIDENT_STORE_PATH,
+            retention_seconds=max(3600, TELEGRAM_INCIDENT_RETENTION_SECONDS),
+            purge_interval_seconds=TELEGRAM_INCIDENT_PURGE_INTERVAL_SECONDS,
+        )
+        imported = store.import_legacy(load_legacy_incident_state().get("incidents") or {})
+        if imported:
+            print(f"[bridge] incident store imported {imported} legacy incidents", flush=True)
+        INCIDENT_STORE = store
+    return INCIDENT_STORE
+
+
+def load_incident_state() -> dict:
+    store = get_incident_store()
+    return {"incidents": store.items(), "updated_at": store.updated_at()}
 
 
 def build_incident_id(topic: str, category: str, title: str, message: str) -> str:
@@ -513,7 +624,6 @@ def build_incident_id(topic: str, category: str, title: str, message: str) -> st
 
 
 def upsert_incident(
-    incident_state: dict,
     incident_id: str,
     topic: str,
     category: str,
@@ -523,56 +633,53 @@ def upsert_incident(
     critical: bool,
 ) -> dict[str, Any]:
     now_ts = int(time.time())
-    retention = max(3600, TELEGRAM_INCIDENT_RETENTION_SECONDS)
-    threshold = now_ts - retention
 
-    incidents_raw = incident_state.get("incidents")
-    if not isinstance(incidents_raw, dict):
-        incidents_raw = {}
+    def _apply(entry: dict[str, Any] | None) -> dict[str, Any]:
+        if not isinstance(entry, dict):
+            entry = {
+                "id": incident_id,
+                "topic": str(topic),
+                "category": str(category),
+                "title": str(title),
+                "message": str(message),
+                "priority": int(priority),
+                "critical": bool(critical),
+                "first_seen": now_ts,
+                "event_count": 0,
+                "message_targets": {},
+            }
+        else:
+            entry["topic"] = str(topic)
+            entry["category"] = str(category)
+            entry["title"] = str(title)
+            entry["message"] = str(message)
+            entry["priority"] = int(priority)
+            entry["critical"] = bool(critical)
+
+        entry["last_seen"] = now_ts
+        entry["event_count"] = int(entry.get("event_count", 0)) + 1
+        targets = entry.get("message_targets")
+        if not isinstance(targets, dict):
+            entry["message_targets"] = {}
+        return entry
+
+    return get_incident_store().mutate(incident_id, _apply, now_ts=now_ts) or {}
+
+
+def save_incident_delivery(incident: dict[str, Any]) -> None:
+    # Only write back the fields fanout owns; ack/snooze may have landed from the telegram bridge meanwhile.
+    incident_id = str(incident.get("id", "") or "")
+    if not incident_id:
+        return
 
-    incidents: dict[str, dict[str, Any]] = {}
-    for key, item in incidents_raw.items():
-        if not isinstance(item, dict):
-            continue
-        try:
-            last_seen = int(item.get("last_seen", 0))
-        except (TypeError, ValueError):
-            continue
-        if last_seen >= threshold:
-            incidents[str(key)] = item
-
-    entry = incidents.get(incident_id)
-    if not isinstance(entry, dict):
-        entry = {
-            "id": incident_id,
-            "topic": str(topic),
-            "category": str(category),
-            "title": str(title),
-            "message": str(message),
-            "priority": int(priority),
-            "critical": bool(critical),
-            "first_seen": now_ts,
-            "event_count": 0,
-            "message_targets": {},
-        }
-    else:
-        entry["topic"] = str(topic)
-        entry["category"] = str(category)
-        entry["title"] = str(title)
-        entry["message"] = str(message)
-        entry["priority"] = int(priority)
-        entry["critical"] = bool(critical)
-
-    entry["last_seen"] = now_ts
-    entry["event_count"] = int(entry.get("event_count", 0)) + 1
-    targets = entry.get("message_targets")
-    if not isinstance(targets, dict):
-        entry["message_targets"] = {}
-    incidents[incident_id] = entry
+    def _apply(entry: dict[str, Any] | None) -> dict[str, Any]:
+        record = entry if isinstance(entry, dict) else dict(incident)
+        record["message_targets"] = incident.get("message_targets") or {}
+        if "last_notified_at" in incident:
+            record["last_notified_at"] = incident["last_notified_at"]
+        return record
 
-    incident_state["incidents"] = incidents
-    incident_state["updated_at"] = utc_now()
-    return entry
+    get_incident_store().mutate(incident_id, _apply)
 
 
 def incident_suppression_reason(incident: dict[str, Any], now_ts: int) -> str:
@@ -639,6 +746,8 @@ def record_notify_event(
     kept.append(event)
 
     state["events"] = kept[-5000:]
+    state["media_ready_cache"] = media_ready_cache_snapshot()
+    state["telegram_outbox"] = telegram_outbox_snapshot()
     state["updated_at"] = utc_now()
     save_notify_stats_state(state)
 
@@ -721,7 +830,7 @@ def should_skip_dedup(topic: str, key: str) -> tuple[bool, int]:
 def telegram_request(method: str, payload: dict):
     if not TELEGRAM_BOT_TOKEN:
         return {}
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/{method}"
+    url = f"{TELEGRAM_API_BASE}/bot{TELEGRAM_BOT_TOKEN}/{method}"
     data = json.dumps(payload).encode("utf-8")
     req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
     with urllib.request.urlopen(req, timeout=15) as response:
@@ -757,6 +866,11 @@ def classify_telegram_send_error(exc: Exception) -> tuple[str, bool]:
     return "send_error", False
 
 
+def is_retryable_send_reason(reason: str) -> bool:
+    normalized = str(reason or "").strip().lower()
+    return normalized in {"rate_limited", "network_error", "timeout"} or normalized.startswith("telegram_http_5")
+
+
 def review_outbound_telegram_fanout_text(text: str) -> str:
     candidate = str(text or "").replace("\r\n", "\n").replace("\r", "\n")
     lines: list[str] = []
@@ -992,14 +1106,7 @@ def consume_media_quarantine_bypass_once(delivery_state: dict[str, Any], now_ts:
 def is_critical_event(priority: int, title: str, message: str) -> bool:
     if int(priority or 0) >= 5:
         return True
-    blob = f"{title} {message}".strip().lower()
-    for pattern in NEGATED_CRITICAL_PATTERNS:
-        if re.search(pattern, blob):
-            return False
-    for keyword in CRITICAL_KEYWORDS:
-        if re.search(rf"\b{re.escape(keyword)}\b", blob):
-            return True
-    return False
+    return classify_event(title, message)["critical_text"]
 
 
 def normalize_topics(raw_topics) -> set[str]:
@@ -1106,10 +1213,7 @@ def should_skip_deferred_digest_item(item: dict[str, Any]) -> bool:
     category = str(item.get("category", "")).strip().lower()
     if category != "media":
         return False
-    blob = f"{item.get('title', '')} {item.get('message', '')}".strip().lower()
-    if not blob:
-        return False
-    return any(marker in blob for marker in TELEGRAM_MEDIA_NOISE_MARKERS)
+    return classify_event(str(item.get("title", "")), str(item.get("message", "")))["media_noise"]
 
 
 def deferred_digest_item_key(item: dict[str, Any]) -> str:
@@ -1129,61 +1233,192 @@ def deferred_digest_item_key(item: dict[str, Any]) -> str:
     return ""
 
 
-def queue_deferred_digest_item(user_id: int, topic: str, category: str, title: str, message: str, priority: int, incident_id: str):
+# Due-time index over the digest queue: a min-heap of (flush_at, user_id) where flush_at is when the first
+# queued item leaves its quiet-hours window. Housekeeping only loads the queue, registry and delivery state
+# once the heap top is due, or when the telegram bridge changed the queue/registry (the signature) and the
+# index has to be rebuilt. Entries superseded by an earlier flush time stay in the heap until the next
+# rebuild; they are later than the live entry so they never move the top.
+DIGEST_INDEX: dict[str, Any] = {"heap": [], "due_at": {}, "signature": None}
+
+
+def _file_signature(path: str) -> tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def digest_index_signature() -> tuple[Any, ...]:
+    if use_sqlite_state_backend():
+        try:
+            ensure_sqlite_state_table()
+            conn = sqlite3.connect(TELEGRAM_STATE_SQLITE_PATH)
+            try:
+                row = conn.execute("SELECT updated_at FROM state_kv WHERE key = ?", ("digest_queue",)).fetchone()
+            finally:
+                conn.close()
+            queue_signature: Any = str(row[0]) if row else ""
+        except Exception:
+            queue_signature = None
+    else:
+        queue_signature = _file_signature(TELEGRAM_DIGEST_QUEUE_STATE)
+    return (queue_signature, _file_signature(TELEGRAM_USER_REGISTRY))
+
+
+def is_digest_recipient(record: Any) -> bool:
+    if not isinstance(record, dict):
+        return False
+    return str(record.get("status", "active")) == "active" and str(record.get("role", "user")) == "admin"
+
+
+def quiet_window_end_ts(start_hour: int, end_hour: int, now_ts: int) -> int:
+    if not is_quiet_now(start_hour=start_hour, end_hour=end_hour, now_ts=now_ts):
+        return now_ts
+    # The offset is whole hours, so quiet windows end on an hour boundary within a day.
+    ts = now_ts - now_ts % 3600
+    for _ in range(25):
+        ts += 3600
+        if not is_quiet_now(start_hour=start_hour, end_hour=end_hour, now_ts=ts):
+            break
+    return ts
+
+
+def digest_due_ts(record: dict, items: list, now_ts: int) -> int:
+    due: int | None = None
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_category = str(item.get("category", "")).strip().lower()
+        enabled, start_hour, end_hour = parse_quiet_hours_for_category(record, category=item_category)
+        item_due = quiet_window_end_ts(start_hour, end_hour, now_ts) if enabled else now_ts
+        due = item_due if due is None else min(due, item_due)
+    return now_ts if due is None else due
+
+
+def schedule_digest_flush(user_id: int, due_ts: int) -> None:
+    current = DIGEST_INDEX["due_at"].get(user_id)
+    if current is not None and current <= due_ts:
+        return
+    DIGEST_INDEX["due_at"][user_id] = due_ts
+    heapq.heappush(DIGEST_INDEX["heap"], (due_ts, user_id))
+
+
+def rebuild_digest_index(users: dict, user_entries: dict, now_ts: int, retry_at: dict[int, int] | None = None) -> None:
+    heap: list[tuple[int, int]] = []
+    due_at: dict[int, int] = {}
+    for user_id_raw, queue_entry in user_entries.items():
+        record = users.get(str(user_id_raw))
+        items = queue_entry.get("items") if isinstance(queue_entry, dict) else None
+        if not is_digest_recipient(record) or not isinstance(items, list) or not items:
+            continue
+        try:
+            user_id = int(user_id_raw)
+        except (TypeError, ValueError):
+            continue
+        due = max(digest_due_ts(record, items, now_ts=now_ts), (retry_at or {}).get(user_id, 0))
+        due_at[user_id] = due
+        heap.append((due, user_id))
+    heapq.heapify(heap)
+    DIGEST_INDEX["heap"] = heap
+    DIGEST_INDEX["due_at"] = due_at
+
+
+def next_digest_flush_ts() -> int | None:
+    heap = DIGEST_INDEX["heap"]
+    return int(heap[0][0]) if heap else None
+
+
+def flush_due_deferred_digests(now_ts: int | None = None) -> bool:
+    """Run a digest flush cycle only when a user's quiet window has ended or the queue changed elsewhere."""
+    now = int(now_ts or time.time())
+    next_due = next_digest_flush_ts()
+    if DIGEST_INDEX["signature"] == digest_index_signature() and (next_due is None or next_due > now):
+        return False
+    flush_deferred_digests(load_user_registry(), now_ts=now)
+    return True
+
+
+def queue_deferred_digest_items(
+    user_ids: list[int],
+    records: dict,
+    topic: str,
+    category: str,
+    title: str,
+    message: str,
+    priority: int,
+    incident_id: str,
+):
+    # One queue load/save for every deferred recipient of an event; each user's flush time goes into the
+    # due index so housekeeping wakes when the first quiet window ends.
+    if not user_ids:
+        return
+    signature_before = digest_index_signature()
     state = load_digest_queue_state()
     users = state.get("users")
     if not isinstance(users, dict):
         users = {}
 
-    key = str(user_id)
-    entry = users.get(key)
-    if not isinstance(entry, dict):
-        entry = {"items": [], "updated_at": utc_now()}
-
-    items = entry.get("items")
-    if not isinstance(items, list):
-        items = []
-
-    items.append(
-        {
-            "ts": int(time.time()),
-            "topic": str(topic),
-            "category": str(category),
-            "title": str(title),
-            "message": str(message),
-            "priority": int(priority),
-            "incident_id": str(incident_id),
-        }
-    )
+    now = int(time.time())
     max_items = max(10, TELEGRAM_DIGEST_MAX_ITEMS_PER_USER)
-    entry["items"] = items[-max_items:]
-    entry["updated_at"] = utc_now()
-    users[key] = entry
+    item = {
+        "ts": now,
+        "topic": str(topic),
+        "category": str(category),
+        "title": str(title),
+        "message": str(message),
+        "priority": int(priority),
+        "incident_id": str(incident_id),
+    }
+    for user_id in user_ids:
+        key = str(user_id)
+        entry = users.get(key)
+        if not isinstance(entry, dict):
+            entry = {"items": [], "updated_at": utc_now()}
+
+        items = entry.get("items")
+        if not isinstance(items, list):
+            items = []
+
+        items.append(dict(item))
+        entry["items"] = items[-max_items:]
+        entry["updated_at"] = utc_now()
+        users[key] = entry
 
     state["users"] = users
     state["updated_at"] = utc_now()
     save_digest_queue_state(state)
-
-
-def flush_deferred_digests(registry: dict):
+    for user_id in user_ids:
+        record = records.get(str(user_id))
+        if is_digest_recipient(record):
+            schedule_digest_flush(int(user_id), digest_due_ts(record, [item], now_ts=now))
+    if DIGEST_INDEX["signature"] == signature_before:
+        # Our own write; a change made elsewhere since the last rebuild keeps the stale signature.
+        DIGEST_INDEX["signature"] = digest_index_signature()
+
+
+def flush_deferred_digests(registry: dict, now_ts: int | None = None):
+    now = int(now_ts or time.time())
+    signature = digest_index_signature()
     users_raw = registry.get("users") if isinstance(registry, dict) else {}
     if not isinstance(users_raw, dict) or not users_raw:
+        rebuild_digest_index({}, {}, now_ts=now)
+        DIGEST_INDEX["signature"] = signature
         return
 
     state = load_digest_queue_state()
     user_entries = state.get("users")
     if not isinstance(user_entries, dict) or not user_entries:
+        rebuild_digest_index(users_raw, {}, now_ts=now)
+        DIGEST_INDEX["signature"] = signature
         return
 
     changed = False
-    delivery_state = load_delivery_state()
+    delivery_state = None
     delivery_changed = False
+    retry_at: dict[int, int] = {}
     for user_id_raw, rec in users_raw.items():
-        if not isinstance(rec, dict):
-            continue
-        if str(rec.get("status", "active")) != "active":
-            continue
-        if str(rec.get("role", "user")) != "admin":
+        if not is_digest_recipient(rec):
             continue
 
         try:
@@ -1205,7 +1440,7 @@ def flush_deferred_digests(registry: dict):
                 continue
             item_category = str(item.get("category", "")).strip().lower()
             enabled, start_hour, end_hour = parse_quiet_hours_for_category(rec, category=item_category)
-            if enabled and is_quiet_now(start_hour=start_hour, end_hour=end_hour):
+            if enabled and is_quiet_now(start_hour=start_hour, end_hour=end_hour, now_ts=now):
                 keep_items.append(item)
             else:
                 send_items.append(item)
@@ -1260,6 +1495,8 @@ def flush_deferred_digests(registry: dict):
             lines.append(f"- hidden low-signal updates: {skipped_noise}")
 
         sent, reason = send_telegram_message(user_id, "\n".join(lines))
+        if delivery_state is None:
+            delivery_state = load_delivery_state()
         if update_delivery_state(delivery_state=delivery_state, user_id=user_id, sent=sent, reason=reason):
             delivery_changed = True
         if sent:
@@ -1271,15 +1508,20 @@ def flush_deferred_digests(registry: dict):
                 user_entries.pop(str(user_id), None)
             changed = True
         else:
+            retry_at[user_id] = now + max(1, TELEGRAM_DIGEST_RETRY_SECONDS)
             print(f"telegram digest flush failed user_id={user_id} reason={reason}", flush=True)
 
-    if delivery_changed:
+    # Every digest sent this cycle shares one delivery-state and one queue-state write.
+    if delivery_changed and delivery_state is not None:
         save_delivery_state(delivery_state)
 
     if changed:
         state["users"] = user_entries
         state["updated_at"] = utc_now()
         save_digest_queue_state(state)
+        signature = digest_index_signature()
+    rebuild_digest_index(users_raw, user_entries, now_ts=now, retry_at=retry_at)
+    DIGEST_INDEX["signature"] = signature
 
 
 def strip_markdown_noise(text: str) -> str:
@@ -1294,20 +1536,13 @@ def normalize_media_name(text: str) -> str:
 
 
 def is_ready_signal_message(title: str, message: str) -> bool:
-    blob = f"{title} {message}".strip().lower()
-    return any(re.search(pattern, blob) for pattern in MEDIA_READY_SIGNAL_PATTERNS)
+    return classify_event(title, message)["ready_signal"]
 
 
 def extract_media_title_for_ready_check(title: str, message: str) -> str:
     body = strip_markdown_noise(message)
-    patterns = (
-        r"^(.+?)\s+is\s+now\s+available\s+in\s+plex\b",
-        r"^(.+?)\s+is\s+available\s+in\s+plex\b",
-        r"^(.+?)\s+now\s+available\b",
-        r"^ready[:\-]\s*(.+)$",
-    )
-    for pattern in patterns:
-        match = re.search(pattern, body, flags=re.IGNORECASE)
+    for pattern in READY_TITLE_PATTERNS:
+        match = pattern.search(body)
         if not match:
             continue
         candidate = strip_markdown_noise(match.group(1))
@@ -1315,7 +1550,7 @@ def extract_media_title_for_ready_check(title: str, message: str) -> str:
             return candidate
 
     title_clean = strip_markdown_noise(title)
-    if title_clean and not re.search(r"\b(media\s+ready|ready\s+test|service\s+status|service\s+recovered)\b", title_clean, flags=re.IGNORECASE):
+    if title_clean and not READY_TITLE_EXCLUDE_PATTERN.search(title_clean):
         return title_clean
     return ""
 
@@ -1361,50 +1596,9 @@ def media_first_seen_decision(topic: str, title: str, message: str) -> tuple[boo
     if not key:
         return True, "media_first_seen_no_key"
 
-    now_ts = int(time.time())
-    retention = max(0, TELEGRAM_MEDIA_FIRST_SEEN_RETENTION_SECONDS)
-    keep_after = now_ts - retention if retention > 0 else 0
-
-    state = load_media_first_seen_state()
-    items_raw = state.get("items") if isinstance(state, dict) else None
-    items = items_raw if isinstance(items_raw, dict) else {}
-
-    cleaned: dict[str, dict[str, Any]] = {}
-    for item_key, payload in items.items():
-        if not isinstance(item_key, str) or not isinstance(payload, dict):
-            continue
-        try:
-            first_seen = int(payload.get("first_seen", 0) or 0)
-            last_seen = int(payload.get("last_seen", first_seen) or first_seen)
-            event_count = int(payload.get("event_count", 1) or 1)
-        except (TypeError, ValueError):
-            continue
-        if retention > 0 and max(first_seen, last_seen) < keep_after:
-            continue
-        cleaned[item_key] = {
-            "first_seen": max(0, first_seen),
-            "last_seen": max(0, last_seen),
-            "event_count": max(1, event_count),
-        }
-
-    existing = cleaned.get(key)
-    if isinstance(existing, dict):
-        existing["last_seen"] = now_ts
-        existing["event_count"] = int(existing.get("event_count", 1) or 1) + 1
-        cleaned[key] = existing
-        state["items"] = cleaned
-        state["updated_at"] = utc_now()
-        save_media_first_seen_state(state)
+    is_new, _ = get_media_first_seen_ledger().observe(key, int(time.time()))
+    if not is_new:
         return False, "media_first_seen_repeat"
-
-    cleaned[key] = {
-        "first_seen": now_ts,
-        "last_seen": now_ts,
-        "event_count": 1,
-    }
-    state["items"] = cleaned
-    state["updated_at"] = utc_now()
-    save_media_first_seen_state(state)
     return True, "media_first_seen_new"
 
 
@@ -1488,6 +1682,75 @@ def overseerr_ready_match(query_title: str) -> tuple[bool, str]:
     return False, f"ready_not_confirmed:{matched_title}:status={best_status}"
 
 
+MEDIA_READY_CACHE_LOCK = threading.Lock()
+MEDIA_READY_CACHE: OrderedDict[str, tuple[float, bool, str]] = OrderedDict()
+MEDIA_READY_INFLIGHT: dict[str, dict[str, Any]] = {}
+MEDIA_READY_CACHE_METRICS = {"hits": 0, "negative_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+
+def cached_overseerr_ready_match(query_title: str) -> tuple[bool, str]:
+    # Sonarr fires one ready event per episode; keyed on the normalized title, a burst costs one search.
+    key = normalize_media_name(query_title)
+    if not key or TELEGRAM_MEDIA_READY_CACHE_MAX_ENTRIES <= 0:
+        return overseerr_ready_match(query_title=query_title)
+
+    with MEDIA_READY_CACHE_LOCK:
+        cached = MEDIA_READY_CACHE.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            MEDIA_READY_CACHE.move_to_end(key)
+            MEDIA_READY_CACHE_METRICS["hits" if cached[1] else "negative_hits"] += 1
+            return cached[1], cached[2]
+        inflight = MEDIA_READY_INFLIGHT.get(key)
+        leader = inflight is None
+        if leader:
+            inflight = {"done": threading.Event(), "result": None, "error": None}
+            MEDIA_READY_INFLIGHT[key] = inflight
+            MEDIA_READY_CACHE_METRICS["misses"] += 1
+        else:
+            MEDIA_READY_CACHE_METRICS["coalesced"] += 1
+
+    if not leader:
+        inflight["done"].wait(timeout=30)
+        if inflight["result"] is not None:
+            return inflight["result"]
+        raise RuntimeError(inflight["error"] or "ready lookup timed out")
+
+    try:
+        allowed, reason = overseerr_ready_match(query_title=query_title)
+    except Exception as exc:
+        with MEDIA_READY_CACHE_LOCK:
+            MEDIA_READY_CACHE_METRICS["errors"] += 1
+            MEDIA_READY_INFLIGHT.pop(key, None)
+        inflight["error"] = str(exc)
+        inflight["done"].set()
+        raise
+
+    ttl = TELEGRAM_MEDIA_READY_CACHE_TTL_SECONDS if allowed else TELEGRAM_MEDIA_READY_CACHE_NEGATIVE_TTL_SECONDS
+    with MEDIA_READY_CACHE_LOCK:
+        if ttl > 0:
+            MEDIA_READY_CACHE[key] = (time.monotonic() + ttl, allowed, reason)
+            MEDIA_READY_CACHE.move_to_end(key)
+            while len(MEDIA_READY_CACHE) > TELEGRAM_MEDIA_READY_CACHE_MAX_ENTRIES:
+                MEDIA_READY_CACHE.popitem(last=False)
+        MEDIA_READY_INFLIGHT.pop(key, None)
+    inflight["result"] = (allowed, reason)
+    inflight["done"].set()
+    return allowed, reason
+
+
+def media_ready_cache_snapshot() -> dict[str, Any]:
+    with MEDIA_READY_CACHE_LOCK:
+        metrics = dict(MEDIA_READY_CACHE_METRICS)
+        entries = len(MEDIA_READY_CACHE)
+    lookups = metrics["hits"] + metrics["negative_hits"] + metrics["misses"] + metrics["coalesced"]
+    served = lookups - metrics["misses"]
+    return {
+        "entries": entries,
+        **metrics,
+        "hit_rate": round(served / lookups, 3) if lookups else 0.0,
+    }
+
+
 def media_ready_gate_decision(topic: str, title: str, message: str) -> tuple[bool, str]:
     if topic != "media-alerts":
         return True, "not_media_topic"
@@ -1503,7 +1766,7 @@ def media_ready_gate_decision(topic: str, title: str, message: str) -> tuple[boo
         return False, "ready_gate_no_title"
 
     try:
-        return overseerr_ready_match(query_title=query_title)
+        return cached_overseerr_ready_match(query_title=query_title)
     except Exception as exc:
         return False, f"ready_gate_lookup_error:{exc}"
 
@@ -1513,10 +1776,7 @@ def should_skip_media_noise_event(title: str, message: str, critical: bool) -> b
         return False
     if not TELEGRAM_MEDIA_NOISE_FILTER_ENABLED:
         return False
-    blob = f"{title} {message}".strip().lower()
-    if not blob:
-        return False
-    return any(marker in blob for marker in TELEGRAM_MEDIA_NOISE_MARKERS)
+    return classify_event(title, message)["media_noise"]
 
 
 def extract_target_user_ids_from_message(message: str) -> tuple[set[int], str]:
@@ -1759,7 +2019,7 @@ def update_incident_message_target(incident: dict[str, Any], chat_id: int, messa
     incident["message_targets"] = targets
 
 
-def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
+def fanout_to_telegram(topic: str, title: str, message: str, priority: int, allow_coalesce: bool = False):
     target_user_ids, cleaned_message = extract_target_user_ids_from_message(message)
     message = cleaned_message
 
@@ -1794,8 +2054,7 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
         return
 
     title_snippet = " ".join(str(title or "").split())[:40]
-    blob = f"{title} {message}".strip().lower()
-    if any(pattern in blob for pattern in TELEGRAM_NOTIFY_DROP_PATTERNS):
+    if classify_event(title, message)["drop"]:
         print(
             f"telegram fanout skipped topic={topic} category={category} priority={priority} reason=drop_pattern title='{title_snippet}'",
             flush=True,
@@ -1865,9 +2124,7 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
 
     incident_id = build_incident_id(topic=topic, category=category, title=title, message=message)
 
-    incident_state = load_incident_state()
     incident = upsert_incident(
-        incident_state=incident_state,
         incident_id=incident_id,
         topic=topic,
         category=category,
@@ -1878,7 +2135,6 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
     )
     suppression_reason = incident_suppression_reason(incident=incident, now_ts=int(time.time()))
     if suppression_reason:
-        save_incident_state(incident_state)
         print(
             f"telegram fanout skipped topic={topic} incident_id={incident_id} category={category} priority={priority} reason={suppression_reason} title='{title_snippet}'",
             flush=True,
@@ -1895,7 +2151,6 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
         return
 
     if TELEGRAM_NOTIFY_CRITICAL_ONLY and not critical and not media_category:
-        save_incident_state(incident_state)
         print(
             f"telegram fanout skipped topic={topic} category={category} priority={priority} reason=critical_only title='{title_snippet}'",
             flush=True,
@@ -1912,7 +2167,6 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
         return
 
     if priority < TELEGRAM_NOTIFY_MIN_PRIORITY and not critical and not media_category:
-        save_incident_state(incident_state)
         print(
             f"telegram fanout skipped topic={topic} category={category} priority={priority} reason=min_priority<{TELEGRAM_NOTIFY_MIN_PRIORITY} title='{title_snippet}'",
             flush=True,
@@ -1936,9 +2190,75 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
         priority=priority,
         critical=critical,
     )
+    if allow_coalesce and not target_user_ids and not probe_id:
+        if coalesce_fanout_event(
+            topic=topic,
+            category=category,
+            title=title,
+            message=message,
+            priority=priority,
+            critical=critical,
+            incident_id=incident_id,
+            dedupe_key=dedupe_key,
+            now_ts=int(time.time()),
+        ):
+            return
+
+    event_count_value = int(incident.get("event_count", 1) or 1)
+    deliver_telegram_fanout(
+        topic=topic,
+        category=category,
+        title=title,
+        message=message,
+        priority=priority,
+        critical=critical,
+        incident=incident,
+        alert_text=format_telegram_alert(
+            topic=topic,
+            category=category,
+            title=title,
+            message=message,
+            priority=priority,
+            critical=critical,
+            incident_id=incident_id,
+            event_count=event_count_value,
+            collapsed_update=False,
+        ),
+        update_alert_text=format_telegram_alert(
+            topic=topic,
+            category=category,
+            title=title,
+            message=message,
+            priority=priority,
+            critical=critical,
+            incident_id=incident_id,
+            event_count=event_count_value,
+            collapsed_update=True,
+        ),
+        dedupe_key=dedupe_key,
+        target_user_ids=target_user_ids,
+        probe_id=probe_id,
+    )
+
+
+def deliver_telegram_fanout(
+    topic: str,
+    category: str,
+    title: str,
+    message: str,
+    priority: int,
+    critical: bool,
+    incident: dict[str, Any],
+    alert_text: str,
+    update_alert_text: str,
+    dedupe_key: str,
+    target_user_ids: set[int],
+    probe_id: str = "",
+) -> None:
+    incident_id = str(incident.get("id", "") or "")
+    title_snippet = " ".join(str(title or "").split())[:40]
     deduped, remaining = should_skip_dedup(topic=topic, key=dedupe_key)
     if deduped:
-        save_incident_state(incident_state)
         print(
             f"telegram fanout skipped topic={topic} category={category} priority={priority} reason=dedupe ttl={remaining}s title='{title_snippet}'",
             flush=True,
@@ -1983,33 +2303,8 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
             recipients=0,
             probe_id=probe_id,
         )
-        save_incident_state(incident_state)
         return
 
-    event_count_value = int(incident.get("event_count", 1) or 1)
-    alert_text = format_telegram_alert(
-        topic=topic,
-        category=category,
-        title=title,
-        message=message,
-        priority=priority,
-        critical=critical,
-        incident_id=incident_id,
-        event_count=event_count_value,
-        collapsed_update=False,
-    )
-    update_alert_text = format_telegram_alert(
-        topic=topic,
-        category=category,
-        title=title,
-        message=message,
-        priority=priority,
-        critical=critical,
-        incident_id=incident_id,
-        event_count=event_count_value,
-        collapsed_update=True,
-    )
-
     immediate_recipients: list[int] = []
     deferred_recipients: list[int] = []
     users_raw = registry.get("users") if isinstance(registry, dict) else {}
@@ -2022,25 +2317,26 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
         else:
             immediate_recipients.append(chat_id)
 
-    for chat_id in deferred_recipients:
-        queue_deferred_digest_item(
-            user_id=chat_id,
-            topic=topic,
-            category=category,
-            title=title,
-            message=message,
-            priority=priority,
-            incident_id=incident_id,
-        )
+    queue_deferred_digest_items(
+        user_ids=deferred_recipients,
+        records=users,
+        topic=topic,
+        category=category,
+        title=title,
+        message=message,
+        priority=priority,
+        incident_id=incident_id,
+    )
 
     sent_count = 0
+    queued_count = 0
     failure_reasons: dict[str, int] = {}
     delivery_changed = False
     now_ts = int(time.time())
     for chat_id in immediate_recipients:
         edit_message_id = incident_message_target(incident=incident, chat_id=chat_id, now_ts=now_ts)
         message_text = update_alert_text if edit_message_id else alert_text
-        sent, failure_reason, message_id, _used_edit = send_or_edit_telegram_message(
+        sent, failure_reason, message_id, used_edit = send_or_edit_telegram_message(
             chat_id=chat_id,
             text=message_text,
             edit_message_id=edit_message_id,
@@ -2051,8 +2347,30 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
             sent_count += 1
             if message_id is not None:
                 update_incident_message_target(incident=incident, chat_id=chat_id, message_id=message_id, now_ts=now_ts)
+            if TELEGRAM_OUTBOX_ENABLED:
+                # A queued retry for this incident now carries older text; delivering it would post a stale
+                # message and move the incident's edit target onto it.
+                try:
+                    get_telegram_outbox().supersede(chat_id=chat_id, incident_id=incident_id, now_ts=now_ts)
+                except sqlite3.Error as exc:
+                    print(f"telegram outbox supersede failed chat_id={chat_id} incident_id={incident_id}: {exc}", flush=True)
             continue
         failure_reasons[failure_reason] = failure_reasons.get(failure_reason, 0) + 1
+        if TELEGRAM_OUTBOX_ENABLED and is_retryable_send_reason(failure_reason):
+            try:
+                get_telegram_outbox().enqueue(
+                    chat_id=chat_id,
+                    text=message_text,
+                    topic=topic,
+                    incident_id=incident_id,
+                    priority=priority,
+                    critical=critical,
+                    reason=failure_reason,
+                    edit_message_id=edit_message_id if used_edit else None,
+                )
+                queued_count += 1
+            except sqlite3.Error as exc:
+                print(f"telegram outbox enqueue failed chat_id={chat_id} incident_id={incident_id}: {exc}", flush=True)
 
     if delivery_changed:
         save_delivery_state(delivery_state)
@@ -2109,32 +2427,487 @@ def fanout_to_telegram(topic: str, title: str, message: str, priority: int):
         )
         incident["last_notified_at"] = int(time.time())
 
-    save_incident_state(incident_state)
+    save_incident_delivery(incident)
 
     print(
-        f"telegram fanout topic={topic} incident_id={incident_id} category={category} priority={priority} critical={critical} recipients={sent_count} deferred={len(deferred_recipients)} quarantined={quarantined_count} title='{title_snippet}'",
+        f"telegram fanout topic={topic} incident_id={incident_id} category={category} priority={priority} critical={critical} recipients={sent_count} deferred={len(deferred_recipients)} queued_retry={queued_count} quarantined={quarantined_count} title='{title_snippet}'",
         flush=True,
     )
 
-def http_get(url: str, max_lines: int = 80):
-    lines: list[str] = []
-    with urllib.request.urlopen(url, timeout=HTTP_TIMEOUT) as response:
-        for _ in range(max(1, max_lines)):
-            raw = response.readline()
-            if not raw:
-                break
-            line = raw.decode("utf-8", errors="ignore").strip()
-            if not line:
-                continue
-            lines.append(line)
+
+TELEGRAM_OUTBOX: TelegramOutbox | None = None
+
+
+def get_telegram_outbox() -> TelegramOutbox:
+    global TELEGRAM_OUTBOX
+    if TELEGRAM_OUTBOX is None:
+        TELEGRAM_OUTBOX = TelegramOutbox(
+            TELEGRAM_OUTBOX_PATH,
+            max_attempts=TELEGRAM_OUTBOX_MAX_ATTEMPTS,
+            backoff_seconds=TELEGRAM_OUTBOX_BACKOFF_SECONDS,
+            backoff_max_seconds=TELEGRAM_OUTBOX_BACKOFF_MAX_SECONDS,
+            max_age_seconds=TELEGRAM_OUTBOX_MAX_AGE_SECONDS,
+        )
+    return TELEGRAM_OUTBOX
+
+
+def telegram_outbox_snapshot() -> dict[str, Any]:
+    if TELEGRAM_OUTBOX is None:
+        return {}
+    try:
+        return TELEGRAM_OUTBOX.snapshot()
+    except sqlite3.Error:
+        return {}
+
+
+def save_incident_message_target(incident_id: str, chat_id: int, message_id: int, now_ts: int) -> None:
+    def _apply(entry: dict[str, Any] | None) -> dict[str, Any] | None:
+        if not isinstance(entry, dict):
+            return None
+        update_incident_message_target(incident=entry, chat_id=chat_id, message_id=message_id, now_ts=now_ts)
+        entry["last_notified_at"] = now_ts
+        return entry
+
+    get_incident_store().mutate(incident_id, _apply, now_ts=now_ts)
+
+
+def drain_telegram_outbox(now_ts: int | None = None) -> int:
+    """Retry due outbox sends; returns how many were delivered."""
+    if not TELEGRAM_OUTBOX_ENABLED or not TELEGRAM_BOT_TOKEN:
+        return 0
+    outbox = get_telegram_outbox()
+    ts = int(now_ts or time.time())
+    items = outbox.due(limit=max(1, TELEGRAM_OUTBOX_DRAIN_BATCH), now_ts=ts)
+    if not items:
+        return 0
+
+    delivery_state = load_delivery_state()
+    delivery_users = delivery_state.get("users") if isinstance(delivery_state.get("users"), dict) else {}
+    delivery_changed = False
+    delivered = 0
+    for item in items:
+        chat_id = int(item["chat_id"])
+        topic = str(item["topic"])
+        delivery_record = delivery_users.get(str(chat_id))
+        if isinstance(delivery_record, dict) and is_user_quarantined(delivery_record, now_ts=ts):
+            outbox.mark_dead(int(item["id"]), "quarantined", now_ts=ts)
+            continue
+        if outbox.is_expired(item, now_ts=ts):
+            outbox.mark_dead(int(item["id"]), "expired", now_ts=ts)
+            record_notify_event(
+                topic=topic,
+                result="failed",
+                reason="outbox_expired",
+                priority=int(item["priority"]),
+                critical=bool(item["critical"]),
+                recipients=0,
+            )
+            continue
+
+        sent, failure_reason, message_id, _used_edit = send_or_edit_telegram_message(
+            chat_id=chat_id,
+            text=str(item["text"]),
+            edit_message_id=int(item["edit_message_id"]) if item.get("edit_message_id") else None,
+        )
+        if update_delivery_state(delivery_state=delivery_state, user_id=chat_id, sent=sent, reason=failure_reason):
+            delivery_changed = True
+        if sent:
+            delivered += 1
+            outbox.mark_sent(int(item["id"]), now_ts=ts)
+            if message_id is not None and item.get("incident_id"):
+                save_incident_message_target(str(item["incident_id"]), chat_id, int(message_id), ts)
+            record_notify_event(
+                topic=topic,
+                result="sent",
+                reason="outbox_retry",
+                priority=int(item["priority"]),
+                critical=bool(item["critical"]),
+                recipients=1,
+            )
+            continue
+
+        outcome = outbox.mark_failed(item, failure_reason, retryable=is_retryable_send_reason(failure_reason), now_ts=ts)
+        print(
+            f"telegram outbox retry failed id={item['id']} chat_id={chat_id} attempt={int(item['attempts']) + 1} reason={failure_reason} outcome={outcome}",
+            flush=True,
+        )
+        if outcome == "dead":
+            record_notify_event(
+                topic=topic,
+                result="failed",
+                reason="outbox_exhausted",
+                priority=int(item["priority"]),
+                critical=bool(item["critical"]),
+                recipients=0,
+            )
+
+    if delivery_changed:
+        save_delivery_state(delivery_state)
+    return delivered
+
+
+COALESCE_WINDOWS: dict[str, dict[str, Any]] = {}
+COALESCE_SAVE = {"dirty": False, "saved_at": 0.0}
+
+
+def load_coalesce_state() -> dict[str, dict[str, Any]]:
+    if use_sqlite_state_backend():
+        data = load_sqlite_state("coalesce_windows", {"windows": {}})
+    elif os.path.exists(TELEGRAM_COALESCE_STATE):
+        try:
+            with open(TELEGRAM_COALESCE_STATE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+    else:
+        data = {}
+    windows = data.get("windows") if isinstance(data, dict) else None
+    if not isinstance(windows, dict):
+        return {}
+    return {
+        str(category): window
+        for category, window in windows.items()
+        if isinstance(window, dict) and isinstance(window.get("events"), dict) and "flush_at" in window
+    }
+
+
+def save_coalesce_state() -> None:
+    # Held alerts are already past the telegram cursor, so the open windows are their only durable record.
+    COALESCE_SAVE["dirty"] = False
+    COALESCE_SAVE["saved_at"] = time.time()
+    state = {"windows": COALESCE_WINDOWS, "updated_at": utc_now()}
+    try:
+        if use_sqlite_state_backend():
+            save_sqlite_state("coalesce_windows", state)
+            return
+        # Always fsynced: unlike the cursor and stats files, a lost window cannot be rebuilt by re-polling ntfy.
+        write_state_file(TELEGRAM_COALESCE_STATE, state, fsync=True)
+    except Exception as exc:
+        print(f"bridge coalesce state save error: {exc}", flush=True)
+
+
+def coalesce_fanout_event(
+    topic: str,
+    category: str,
+    title: str,
+    message: str,
+    priority: int,
+    critical: bool,
+    incident_id: str,
+    dedupe_key: str,
+    now_ts: int,
+) -> bool:
+    """Buffer an event that lands inside its category's open window; False means deliver it now.
+
+    The first event of a quiet category opens the window and goes out immediately, so isolated
+    alerts see no added latency. Everything after it is held until the window closes and then
+    delivered as one summary message per category. Critical events are never held; they go out
+    on their own incident like targeted and probe events.
+    """
+    if not TELEGRAM_COALESCE_ENABLED or TELEGRAM_COALESCE_WINDOW_SECONDS <= 0 or critical:
+        return False
+    if category not in TELEGRAM_COALESCE_CATEGORIES:
+        return False
+
+    window = COALESCE_WINDOWS.get(category)
+    if window is not None and now_ts >= int(window["flush_at"]):
+        flush_coalesced_fanout(category)
+        window = None
+    if window is None:
+        COALESCE_WINDOWS[category] = {
+            "topic": topic,
+            "opened_at": now_ts,
+            "flush_at": now_ts + TELEGRAM_COALESCE_WINDOW_SECONDS,
+            "events": {},
+            "total": 0,
+            "overflow": 0,
+        }
+        save_coalesce_state()
+        return False
+
+    window["total"] += 1
+    events = window["events"]
+    entry = events.get(dedupe_key)
+    if entry is not None:
+        entry["count"] += 1
+    elif len(events) >= max(1, TELEGRAM_COALESCE_MAX_LINES):
+        window["overflow"] += 1
+    else:
+        events[dedupe_key] = {
+            "topic": topic,
+            "title": title,
+            "message": message,
+            "priority": int(priority),
+            "critical": bool(critical),
+            "incident_id": incident_id,
+            "count": 1,
+        }
+    # Held events only mark the window dirty; flush_due_coalesced_fanouts writes it at most once per
+    # TELEGRAM_COALESCE_SAVE_INTERVAL_SECONDS instead of rewriting the state file for every alert in a storm.
+    COALESCE_SAVE["dirty"] = True
+    return True
+
+
+def format_coalesced_telegram_alert(
+    category: str,
+    events: list[dict[str, Any]],
+    total: int,
+    overflow: int,
+    window_seconds: int,
+    priority: int,
+    critical: bool,
+    incident_id: str,
+    collapsed_update: bool,
+) -> str:
+    importance = importance_from_event(priority=priority, critical=critical)
+    if collapsed_update:
+        header = f"🔁 Alert storm update: {total} more {category} alerts in the last {window_seconds}s:"
+    elif importance == "urgent":
+        header = f"🚨 {total} {category} alerts in the last {window_seconds}s need attention:"
+    elif importance == "important":
+        header = f"⚠️ {total} {category} alerts in the last {window_seconds}s:"
+    else:
+        header = f"ℹ️ {total} {category} updates in the last {window_seconds}s:"
+
+    lines = [header]
+    for event in events:
+        line = f"- {digest_line(topic=event['topic'], title=event['title'], message=event['message'])}"
+        if int(event["count"]) > 1:
+            line += f" (x{int(event['count'])})"
+        lines.append(line)
+    if overflow > 0:
+        lines.append(f"…and {overflow} more")
+    lines.append(f"Incident ID: {incident_id}")
     return "\n".join(lines)
 
+
+def flush_coalesced_fanout(category: str) -> None:
+    window = COALESCE_WINDOWS.pop(category, None)
+    if not window or not window["events"]:
+        return
+
+    topic = str(window["topic"])
+    events = list(window["events"].values())
+    total = int(window["total"])
+    overflow = int(window["overflow"])
+    now_ts = int(time.time())
+
+    if total == 1:
+        # A lone follower gains nothing from a summary; send it exactly as it would have gone out.
+        event = events[0]
+        incident = get_incident_store().get(str(event["incident_id"]), now_ts=now_ts) or {}
+        if not incident or incident_suppression_reason(incident=incident, now_ts=now_ts):
+            return
+        event_count_value = int(incident.get("event_count", 1) or 1)
+        formatted = {
+            collapsed: format_telegram_alert(
+                topic=event["topic"],
+                category=category,
+                title=event["title"],
+                message=event["message"],
+                priority=event["priority"],
+                critical=event["critical"],
+                incident_id=str(event["incident_id"]),
+                event_count=event_count_value,
+                collapsed_update=collapsed,
+            )
+            for collapsed in (False, True)
+        }
+        deliver_telegram_fanout(
+            topic=event["topic"],
+            category=category,
+            title=event["title"],
+            message=event["message"],
+            priority=event["priority"],
+            critical=event["critical"],
+            incident=incident,
+            alert_text=formatted[False],
+            update_alert_text=formatted[True],
+            dedupe_key=build_dedupe_key(
+                topic=event["topic"],
+                category=category,
+                title=event["title"],
+                message=event["message"],
+                priority=event["priority"],
+                critical=event["critical"],
+            ),
+            target_user_ids=set(),
+        )
+        return
+
+    priority = max(int(event["priority"]) for event in events)
+    critical = False
+    window_seconds = max(1, TELEGRAM_COALESCE_WINDOW_SECONDS)
+    title = f"{total} {category} alerts"
+    message = "\n".join(
+        digest_line(topic=event["topic"], title=event["title"], message=event["message"]) for event in events
+    )
+    # One storm incident per window: /ack or /snooze on it covers only this batch, never a later storm.
+    # Held events are never critical, so a storm incident cannot suppress or edit over a critical alert.
+    incident_id = build_incident_id(
+        topic="coalesced", category=category, title="alert storm", message=str(window["opened_at"])
+    )
+    incident = upsert_incident(
+        incident_id=incident_id,
+        topic=topic,
+        category=category,
+        title=title,
+        message=message,
+        priority=priority,
+        critical=critical,
+    )
+    suppression_reason = incident_suppression_reason(incident=incident, now_ts=now_ts)
+    if suppression_reason:
+        print(
+            f"telegram fanout skipped topic={topic} incident_id={incident_id} category={category} coalesced={total} reason={suppression_reason}",
+            flush=True,
+        )
+        record_notify_event(
+            topic=topic,
+            result="skipped",
+            reason=suppression_reason,
+            priority=priority,
+            critical=critical,
+            recipients=0,
+        )
+        return
+
+    formatted = {
+        collapsed: format_coalesced_telegram_alert(
+            category=category,
+            events=events,
+            total=total,
+            overflow=overflow,
+            window_seconds=window_seconds,
+            priority=priority,
+            critical=critical,
+            incident_id=incident_id,
+            collapsed_update=collapsed,
+        )
+        for collapsed in (False, True)
+    }
+    print(f"telegram fanout coalesced topic={topic} category={category} events={total} distinct={len(events)}", flush=True)
+    deliver_telegram_fanout(
+        topic=topic,
+        category=category,
+        title=title,
+        message=message,
+        priority=priority,
+        critical=critical,
+        incident=incident,
+        alert_text=formatted[False],
+        update_alert_text=formatted[True],
+        dedupe_key=build_dedupe_key(
+            topic="coalesced",
+            category=category,
+            title=title,
+            message="\n".join(sorted(window["events"].keys())),
+            priority=priority,
+            critical=critical,
+        ),
+        target_user_ids=set(),
+    )
+
+
+def flush_due_coalesced_fanouts(now_ts: int | None = None, force: bool = False) -> None:
+    ts = int(now_ts or time.time())
+    flushed = False
+    for category in list(COALESCE_WINDOWS.keys()):
+        window = COALESCE_WINDOWS.get(category)
+        if window is None or (not force and ts < int(window["flush_at"])):
+            continue
+        flushed = True
+        try:
+            flush_coalesced_fanout(category)
+        except Exception as exc:
+            print(f"bridge coalesced fanout error category={category}: {exc}", flush=True)
+            traceback.print_exc()
+    if flushed or (
+        COALESCE_SAVE["dirty"] and (force or ts - COALESCE_SAVE["saved_at"] >= TELEGRAM_COALESCE_SAVE_INTERVAL_SECONDS)
+    ):
+        save_coalesce_state()
+
+
+POLL_METRICS = {"polls": 0, "events": 0, "bytes": 0, "bad_lines": 0, "parse_seconds": 0.0, "started_at": time.time()}
+POLL_METRICS_LOCK = threading.Lock()
+
+
+def iter_ntfy_events(url: str):
+    """Yield ntfy `message` events line by line as the NDJSON poll response streams in; no line cap."""
+    counts = {"events": 0, "bytes": 0, "bad_lines": 0, "parse_seconds": 0.0}
+    try:
+        with urllib.request.urlopen(url, timeout=HTTP_TIMEOUT) as response:
+            for raw in response:
+                started = time.perf_counter()
+                counts["bytes"] += len(raw)
+                line = raw.strip()
+                parsed = None
+                if line:
+                    try:
+                        parsed = json.loads(line)
+                    except json.JSONDecodeError:
+                        counts["bad_lines"] += 1
+                counts["parse_seconds"] += time.perf_counter() - started
+                if isinstance(parsed, dict) and parsed.get("event") == "message":
+                    counts["events"] += 1
+                    yield parsed
+    finally:
+        # Both stage pollers stream concurrently; fold each response's counts in once.
+        with POLL_METRICS_LOCK:
+            POLL_METRICS["polls"] += 1
+            for key, value in counts.items():
+                POLL_METRICS[key] += value
+
+
+def maybe_log_poll_metrics(now: float | None = None) -> None:
+    current = float(now or time.time())
+    with POLL_METRICS_LOCK:
+        elapsed = current - float(POLL_METRICS["started_at"])
+        if POLL_METRICS_LOG_SECONDS <= 0 or elapsed < POLL_METRICS_LOG_SECONDS:
+            return
+        metrics = dict(POLL_METRICS)
+        POLL_METRICS.update({"polls": 0, "events": 0, "bytes": 0, "bad_lines": 0, "parse_seconds": 0.0, "started_at": current})
+    parse_seconds = float(metrics["parse_seconds"])
+    events_per_sec = metrics["events"] / parse_seconds if parse_seconds > 0 else 0.0
+    mib_per_sec = metrics["bytes"] / parse_seconds / 1048576 if parse_seconds > 0 else 0.0
+    print(
+        f"bridge poll metrics window={int(elapsed)}s polls={metrics['polls']} events={metrics['events']} "
+        f"bytes={metrics['bytes']} bad_lines={metrics['bad_lines']} parse_ms={parse_seconds * 1000:.1f} "
+        f"parse_events_per_sec={events_per_sec:.0f} parse_mib_per_sec={mib_per_sec:.1f}",
+        flush=True,
+    )
+    for stage, snapshot in pipeline_snapshot().items():
+        print(
+            f"bridge pipeline stage={stage} queued={snapshot['queued']} processed={snapshot['processed']} "
+            f"failed_attempts={snapshot['failed_attempts']} lag_seconds={snapshot['lag_seconds']}",
+            flush=True,
+        )
+
+
+def build_poll_url(topic: str, topic_state: dict[str, Any], poll_timeout: int) -> str:
+    # Resume from the last processed message id so a backlog is paged through exactly; the
+    # timestamp cursor only covers the first poll after upgrading from older state files.
+    last_id = str(topic_state.get("last_id", "") or "").strip()
+    try:
+        last_time = int(topic_state.get("last_time", 0) or 0)
+    except (TypeError, ValueError):
+        last_time = 0
+    if last_id:
+        since = f"since={urllib.parse.quote(last_id, safe='')}&"
+    elif last_time > 0:
+        since = f"since={last_time}&"
+    else:
+        since = ""
+    return f"{NTFY_BASE}/{topic}/json?{since}poll=1&timeout={poll_timeout}s"
+
+
 def http_post_json(url: str, payload: dict):
     data = json.dumps(payload).encode("utf-8")
     req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
     with urllib.request.urlopen(req, timeout=15) as response:
         response.read()
 
+
 def load_state():
     if os.path.exists(STATE_FILE):
         with open(STATE_FILE, "r", encoding="utf-8") as f:
@@ -2142,124 +2915,164 @@ def load_state():
     else:
         state = {}
 
+    stages = state.get("stages") if isinstance(state.get("stages"), dict) else {}
     now_ts = int(time.time())
-    for topic in ALL_WATCHED_TOPICS:
-        if topic not in state:
-            state[topic] = {"last_time": now_ts, "last_id": ""}
+    for stage, spec in PIPELINE_STAGES.items():
+        cursors = stages.get(stage) if isinstance(stages.get(stage), dict) else {}
+        for topic in spec["topics"]:
+            if isinstance(cursors.get(topic), dict):
+                continue
+            # Pre-pipeline state files kept one cursor per topic shared by both sinks; each stage starts there.
+            legacy = state.get(topic)
+            cursors[topic] = dict(legacy) if isinstance(legacy, dict) else {"last_time": now_ts, "last_id": ""}
+        stages[stage] = cursors
 
-    return state
+    return {"stages": stages}
 
 def save_state(state):
-    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f)
-
-
-def parse_events(text: str):
-    events: list[dict[str, Any]] = []
-    blob = str(text or "").strip()
-    if not blob:
-        return events
-
-    decoder = json.JSONDecoder()
-    index = 0
-    length = len(blob)
-    while index < length:
-        while index < length and blob[index].isspace():
-            index += 1
-        if index >= length:
-            break
-        try:
-            parsed, next_index = decoder.raw_decode(blob, index)
-        except json.JSONDecodeError:
-            newline_index = blob.find("\n", index)
-            if newline_index == -1:
+    write_state_file(STATE_FILE, state, fsync=STATE_FSYNC)
+
+
+def forward_event_to_n8n(event: dict[str, Any]) -> None:
+    topic = str(event["topic"])
+    payload = {
+        "topic": topic,
+        "id": event["id"],
+        "time": event["time"],
+        "title": event["title"],
+        "message": event["message"],
+        "priority": event["priority"],
+    }
+    http_post_json(f"{N8N_BASE}{TOPICS[topic]}", payload)
+
+
+def fanout_event_to_telegram(event: dict[str, Any]) -> None:
+    fanout_to_telegram(
+        topic=str(event["topic"]),
+        title=event["title"],
+        message=event["message"],
+        priority=event["priority"],
+        allow_coalesce=True,
+    )
+
+
+TELEGRAM_HOUSEKEEPING = {"digest_flushed_at": 0.0, "outbox_purged_at": 0.0}
+
+
+def run_telegram_housekeeping() -> None:
+    # Runs on the telegram stage worker between events so digest, outbox and coalesced-window state keep a
+    # single writer.
+    flush_due_coalesced_fanouts()
+    now = time.time()
+    if now - TELEGRAM_HOUSEKEEPING["digest_flushed_at"] < max(1, POLL_SECONDS):
+        return
+    TELEGRAM_HOUSEKEEPING["digest_flushed_at"] = now
+    try:
+        flush_due_deferred_digests()
+    except Exception as exc:
+        print(f"bridge digest flush error: {exc}", flush=True)
+    try:
+        drain_telegram_outbox()
+        if TELEGRAM_OUTBOX is not None and now - TELEGRAM_HOUSEKEEPING["outbox_purged_at"] >= 3600:
+            TELEGRAM_HOUSEKEEPING["outbox_purged_at"] = now
+            TELEGRAM_OUTBOX.purge_finished()
+    except Exception as exc:
+        print(f"bridge outbox drain error: {exc}", flush=True)
+        traceback.print_exc()
+
+
+def run_telegram_shutdown() -> None:
+    # Send held storm summaries now instead of leaving them in the persisted windows until the next start.
+    flush_due_coalesced_fanouts(force=True)
+
+
+# ntfy events feed two independent sinks. Each stage has its own poller thread, bounded queue, worker thread
+# and durable cursor in STATE_FILE, so a slow n8n webhook never delays Telegram alerts (or the reverse); a
+# full queue only pauses that stage's poller. Cursors advance after the sink returns, so a restart
+# re-delivers at most the events that were in flight.
+PIPELINE_STAGES: dict[str, dict[str, Any]] = {
+    "n8n": {
+        "topics": sorted(TOPICS.keys()),
+        "handler": forward_event_to_n8n,
+        "idle": None,
+        "shutdown": None,
+    },
+    "telegram": {
+        "topics": sorted(TELEGRAM_NOTIFICATION_TOPICS.keys()),
+        "handler": fanout_event_to_telegram,
+        "idle": run_telegram_housekeeping,
+        "shutdown": run_telegram_shutdown,
+    },
+}
+for _stage_spec in PIPELINE_STAGES.values():
+    _stage_spec["queue"] = queue.Queue(maxsize=max(1, PIPELINE_QUEUE_SIZE))
+    _stage_spec["metrics"] = {"processed": 0, "failed_attempts": 0, "last_event_time": 0}
+STATE: dict[str, Any] = {}
+STATE_LOCK = threading.Lock()
+PIPELINE_STOP = threading.Event()
+
+
+def stage_cursor(stage: str, topic: str) -> dict[str, Any]:
+    with STATE_LOCK:
+        cursor = STATE.get("stages", {}).get(stage, {}).get(topic)
+        return dict(cursor) if isinstance(cursor, dict) else {"last_time": 0, "last_id": ""}
+
+
+def advance_stage_cursor(stage: str, topic: str, ev_time: int, ev_id: str) -> None:
+    with STATE_LOCK:
+        STATE.setdefault("stages", {}).setdefault(stage, {})[topic] = {"last_time": ev_time, "last_id": ev_id}
+        save_state(STATE)
+
+
+def poll_stage_topic(stage: str, topic: str, cursor: dict[str, Any], poll_timeout: int) -> None:
+    """Stream new events for one topic into the stage queue, advancing the in-memory `cursor` as they are queued."""
+    stage_queue = PIPELINE_STAGES[stage]["queue"]
+    while True:
+        poll_url = build_poll_url(topic, cursor, poll_timeout)
+        last_time = int(cursor.get("last_time", 0) or 0)
+        last_id = str(cursor.get("last_id", "") or "")
+        cursor_before = (last_time, last_id)
+        page_events = 0
+        page_full = False
+
+        for ev in iter_ntfy_events(poll_url):
+            if POLL_PAGE_EVENTS > 0 and page_events >= POLL_PAGE_EVENTS:
+                page_full = True
                 break
-            line = blob[index:newline_index].strip()
-            index = newline_index + 1
-            if not line:
-                continue
-            try:
-                parsed = json.loads(line)
-            except json.JSONDecodeError:
+            page_events += 1
+            ev_time = int(ev.get("time", 0))
+            ev_id = ev.get("id", "")
+            if ev_time < last_time or (ev_time == last_time and ev_id == last_id):
                 continue
-            if isinstance(parsed, dict) and parsed.get("event") == "message":
-                events.append(parsed)
-            continue
 
-        index = next_index
-        if isinstance(parsed, dict) and parsed.get("event") == "message":
-            events.append(parsed)
-    return events
+            stage_queue.put(
+                {
+                    "topic": topic,
+                    "id": ev_id,
+                    "time": ev_time,
+                    "title": str(ev.get("title", "")).strip(),
+                    "message": str(ev.get("message", "")),
+                    "priority": int(ev.get("priority", 3) or 3),
+                }
+            )
+            last_time = ev_time
+            last_id = ev_id
+            cursor["last_time"] = ev_time
+            cursor["last_id"] = ev_id
 
+        # A full page means more backlog is queued behind last_id; keep paging only while the
+        # cursor advances so an unknown/expired id cannot spin on the same page.
+        if not page_full or (last_time, last_id) == cursor_before:
+            return
 
-def main():
-    state = load_state()
+
+def _run_stage_poller(stage: str) -> None:
     poll_timeout = max(2, min(30, POLL_REQUEST_TIMEOUT_SECONDS))
+    cursors = {topic: stage_cursor(stage, topic) for topic in PIPELINE_STAGES[stage]["topics"]}
     while True:
-        try:
-            flush_deferred_digests(load_user_registry())
-        except Exception as exc:
-            print(f"bridge digest flush error: {exc}", flush=True)
-
-        for topic in ALL_WATCHED_TOPICS:
+        for topic, cursor in cursors.items():
             try:
-                topic_state = state.get(topic, {}) if isinstance(state.get(topic, {}), dict) else {}
-                try:
-                    last_time = int(topic_state.get("last_time", 0) or 0)
-                except (TypeError, ValueError):
-                    last_time = 0
-
-                if last_time > 0:
-                    poll_url = f"{NTFY_BASE}/{topic}/json?since={last_time}&poll=1&timeout={poll_timeout}s"
-                else:
-                    poll_url = f"{NTFY_BASE}/{topic}/json?poll=1&timeout={poll_timeout}s"
-
-                text = http_get(poll_url)
-                events = parse_events(text)
-                last_time = state.get(topic, {}).get("last_time", 0)
-                last_id = state.get(topic, {}).get("last_id", "")
-
-                for ev in events:
-                    ev_time = int(ev.get("time", 0))
-                    ev_id = ev.get("id", "")
-                    if ev_time < last_time or (ev_time == last_time and ev_id == last_id):
-                        continue
-
-                    title = str(ev.get("title", "")).strip()
-                    message = str(ev.get("message", ""))
-                    if topic == "ai-replies" and should_ignore_reply_event(title, message):
-                        state[topic] = {"last_time": ev_time, "last_id": ev_id}
-                        save_state(state)
-                        last_time = ev_time
-                        last_id = ev_id
-                        continue
-
-                    priority = int(ev.get("priority", 3) or 3)
-
-                    webhook_path = TOPICS.get(topic)
-                    if webhook_path:
-                        payload = {
-                            "topic": topic,
-                            "id": ev_id,
-                            "time": ev_time,
-                            "title": title,
-                            "message": message,
-                            "priority": priority,
-                        }
-                        http_post_json(f"{N8N_BASE}{webhook_path}", payload)
-
-                    fanout_to_telegram(
-                        topic=topic,
-                        title=title,
-                        message=message,
-                        priority=priority,
-                    )
-
-                    state[topic] = {"last_time": ev_time, "last_id": ev_id}
-                    save_state(state)
-                    last_time = ev_time
-                    last_id = ev_id
+                poll_stage_topic(stage, topic, cursor, poll_timeout)
             except Exception as exc:
                 if isinstance(exc, TimeoutError):
                     continue
@@ -2268,10 +3081,87 @@ def main():
                 if isinstance(exc, urllib.error.HTTPError) and exc.code == 429:
                     time.sleep(1)
                     continue
-                print(f"bridge error topic={topic}: {exc}", flush=True)
+                print(f"bridge error stage={stage} topic={topic}: {exc}", flush=True)
                 traceback.print_exc()
-
         time.sleep(POLL_SECONDS)
 
+
+def process_stage_event(stage: str, event: dict[str, Any]) -> bool:
+    spec = PIPELINE_STAGES[stage]
+    topic = str(event["topic"])
+    try:
+        if not (topic == "ai-replies" and should_ignore_reply_event(event["title"], event["message"])):
+            spec["handler"](event)
+    except Exception as exc:
+        spec["metrics"]["failed_attempts"] += 1
+        print(f"bridge error stage={stage} topic={topic} id={event.get('id', '')}: {exc}", flush=True)
+        traceback.print_exc()
+        return False
+    advance_stage_cursor(stage, topic, int(event["time"]), str(event["id"]))
+    spec["metrics"]["processed"] += 1
+    spec["metrics"]["last_event_time"] = int(event["time"])
+    return True
+
+
+def _run_stage_worker(stage: str) -> None:
+    spec = PIPELINE_STAGES[stage]
+    stage_queue = spec["queue"]
+    idle = spec["idle"]
+    while not PIPELINE_STOP.is_set():
+        try:
+            event = stage_queue.get(timeout=1)
+        except queue.Empty:
+            event = None
+        # A failing sink keeps its event (and its cursor) and retries; only this stage waits on it.
+        while event is not None and not process_stage_event(stage, event):
+            if PIPELINE_STOP.wait(max(1, POLL_SECONDS)):
+                break
+        if idle is not None:
+            idle()
+    if spec["shutdown"] is not None:
+        spec["shutdown"]()
+
+
+def pipeline_snapshot() -> dict[str, dict[str, Any]]:
+    now_ts = int(time.time())
+    snapshot: dict[str, dict[str, Any]] = {}
+    for stage, spec in PIPELINE_STAGES.items():
+        metrics = spec["metrics"]
+        last_event_time = int(metrics["last_event_time"])
+        snapshot[stage] = {
+            "queued": spec["queue"].qsize(),
+            "processed": int(metrics["processed"]),
+            "failed_attempts": int(metrics["failed_attempts"]),
+            "lag_seconds": now_ts - last_event_time if last_event_time > 0 else 0,
+        }
+    return snapshot
+
+
+def main():
+    STATE.update(load_state())
+    with STATE_LOCK:
+        save_state(STATE)
+    restored = load_coalesce_state()
+    if restored:
+        COALESCE_WINDOWS.update(restored)
+        print(f"bridge restored {len(restored)} coalesce window(s)", flush=True)
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: PIPELINE_STOP.set())
+    workers = []
+    for stage in PIPELINE_STAGES:
+        worker = threading.Thread(target=_run_stage_worker, args=(stage,), name=f"{stage}-worker", daemon=True)
+        worker.start()
+        workers.append(worker)
+        threading.Thread(target=_run_stage_poller, args=(stage,), name=f"{stage}-poller", daemon=True).start()
+    try:
+        while not PIPELINE_STOP.is_set():
+            maybe_log_poll_metrics()
+            PIPELINE_STOP.wait(POLL_SECONDS)
+    except KeyboardInterrupt:
+        PIPELINE_STOP.set()
+    # Workers finish their current event and run their shutdown hook; stay inside docker's 10s stop grace.
+    deadline = time.monotonic() + 8
+    for worker in workers:
+        worker.join(timeout=max(0.0, deadline - time.monotonic()))
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import http.client
+import json
+import queue
+import threading
+import time
+import urllib.parse
+from typing import Any, Iterator
+
+RETRYABLE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError, http.client.CannotSendRequest)
+
+
+class QdrantError(Exception):
+    def __init__(self, status: int, detail: str) -> None:
+        super().__init__(f"qdrant http_{status}: {detail}" if status else f"qdrant error: {detail}")
+        self.status = status
+        self.detail = detail
+
+
+class QdrantClient:
+    """Minimal Qdrant REST client with keep-alive connection pooling and per-operation timings."""
+
+    def __init__(self, base_url: str, timeout: float = 10.0, pool_size: int = 4, api_key: str = "") -> None:
+        parsed = urllib.parse.urlsplit(str(base_url or "http://qdrant:6333").rstrip("/"))
+        self.scheme = parsed.scheme or "http"
+        self.host = parsed.hostname or "qdrant"
+        self.port = parsed.port or (443 if self.scheme == "https" else 6333)
+        self.base_path = parsed.path.rstrip("/")
+        self.timeout = max(1.0, float(timeout))
+        self.api_key = str(api_key or "")
+        self._pool: queue.LifoQueue[http.client.HTTPConnection] = queue.LifoQueue(maxsize=max(1, int(pool_size)))
+        self._metrics_lock = threading.Lock()
+        self._metrics: dict[str, dict[str, float]] = {}
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _release(self, connection: http.client.HTTPConnection) -> None:
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _record(self, operation: str, elapsed_ms: float, error: bool) -> None:
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(operation, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            metrics["calls"] += 1
+            metrics["errors"] += 1 if error else 0
+            metrics["total_ms"] += elapsed_ms
+            metrics["max_ms"] = max(metrics["max_ms"], elapsed_ms)
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        with self._metrics_lock:
+            return {
+                operation: {
+                    "calls": int(metrics["calls"]),
+                    "errors": int(metrics["errors"]),
+                    "avg_ms": int(metrics["total_ms"] / metrics["calls"]) if metrics["calls"] else 0,
+                    "max_ms": int(metrics["max_ms"]),
+                }
+                for operation, metrics in self._metrics.items()
+            }
+
+    def request(self, operation: str, method: str, path: str, payload: dict[str, Any] | None = None) -> dict[str, Any]:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        if self.api_key:
+            headers["api-key"] = self.api_key
+        started = time.monotonic()
+        failed = True
+        try:
+            for attempt in range(2):
+                connection = self._acquire()
+                try:
+                    connection.request(method, f"{self.base_path}{path}", body=body, headers=headers)
+                    response = connection.getresponse()
+                    raw = response.read()
+                except RETRYABLE_CONNECTION_ERRORS:
+                    # Pooled keep-alive socket was closed by the server; retry once on a fresh connection.
+                    connection.close()
+                    if attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    connection.close()
+                    raise
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._release(connection)
+                text = raw.decode("utf-8", errors="ignore")
+                if response.status >= 400:
+                    raise QdrantError(response.status, text[:300])
+                parsed = json.loads(text) if text else {}
+                failed = False
+                return parsed if isinstance(parsed, dict) else {}
+            raise QdrantError(0, "unreachable")
+        finally:
+            self._record(operation, (time.monotonic() - started) * 1000.0, failed)
+
+    def get_collection(self, collection: str) -> dict[str, Any] | None:
+        try:
+            parsed = self.request("get_collection", "GET", f"/collections/{urllib.parse.quote(collection)}")
+        except QdrantError as exc:
+            if exc.status == 404:
+                return None
+            raise
+        result = parsed.get("result")
+        return result if isinstance(result, dict) else {}
+
+    def upsert_points(self, collection: str, points: list[dict[str, Any]], wait: bool = False, batch_size: int = 256) -> int:
+        sent = 0
+        size = max(1, int(batch_size))
+        for start in range(0, len(points), size):
+            batch = points[start : start + size]
+            self.request(
+                "upsert",
+                "PUT",
+                f"/collections/{urllib.parse.quote(collection)}/points?wait={'true' if wait else 'false'}",
+                {"points": batch},
+            )
+            sent += len(batch)
+        return sent
+
+    def delete_points(self, collection: str, points_filter: dict[str, Any], wait: bool = False) -> str:
+        parsed = self.request(
+            "delete",
+            "POST",
+            f"/collections/{urllib.parse.quote(collection)}/points/delete?wait={'true' if wait else 'false'}",
+            {"filter": points_filter},
+        )
+        return str(((parsed.get("result") or {}).get("status") or "ok")).strip().lower()
+
+    def count_points(self, collection: str, points_filter: dict[str, Any] | None = None, exact: bool = True) -> int:
+        payload: dict[str, Any] = {"exact": bool(exact)}
+        if points_filter:
+            payload["filter"] = points_filter
+        parsed = self.request("count", "POST", f"/collections/{urllib.parse.quote(collection)}/points/count", payload)
+        return int((parsed.get("result") or {}).get("count") or 0)
+
+    def scroll_points(
+        self,
+        collection: str,
+        points_filter: dict[str, Any] | None = None,
+        limit: int = 256,
+        with_payload: bool | list[str] = True,
+    ) -> Iterator[dict[str, Any]]:
+        offset: Any = None
+        while True:
+            payload: dict[str, Any] = {"limit": max(1, int(limit)), "with_payload": with_payload, "with_vector": False}
+            if points_filter:
+                payload["filter"] = points_filter
+            if offset is not None:
+                payload["offset"] = offset
+            parsed = self.request("scroll", "POST", f"/collections/{urllib.parse.quote(collection)}/points/scroll", payload)
+            result = parsed.get("result") or {}
+            for point in result.get("points") or []:
+                if isinstance(point, dict):
+                    yield point
+            offset = result.get("next_page_offset")
+            if offset is None:
+                return
+
+    def search_points(
+        self,
+        collection: str,
+        vector: list[float],
+        limit: int = 5,
+        points_filter: dict[str, Any] | None = None,
+        score_threshold: float | None = None,
+    ) -> list[dict[str, Any]]:
+        payload: dict[str, Any] = {"vector": vector, "limit": max(1, int(limit)), "with_payload": True}
+        if points_filter:
+            payload["filter"] = points_filter
+        if score_threshold is not None:
+            payload["score_threshold"] = float(score_threshold)
+        parsed = self.request("search", "POST", f"/collections/{urllib.parse.quote(collection)}/points/search", payload)
+        result = parsed.get("result")
+        return [item for item in result if isinstance(item, dict)] if isinstance(result, list) else []
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
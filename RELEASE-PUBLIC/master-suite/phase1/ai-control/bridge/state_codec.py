@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # optional accelerator; stdlib json output is byte-compatible for readers
+    orjson = None
+
+STATE_CODEC_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_state(state: Any, pretty: bool = False) -> bytes:
+    if orjson is not None:
+        try:
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+            return orjson.dumps(state, default=_default, option=option)
+        except TypeError:
+            # orjson rejects a few things stdlib accepts (e.g. ints beyond 64 bits); fall through.
+            pass
+    if pretty:
+        return json.dumps(state, ensure_ascii=False, indent=2, default=_default).encode("utf-8")
+    return json.dumps(state, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads_state(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_state_file(path: str | Path) -> Any:
+    with open(path, "rb") as handle:
+        return loads_state(handle.read())
+
+
+def write_state_file(path: str | Path, state: Any, pretty: bool = False, fsync: bool = True) -> int:
+    """Serialize state and atomically replace path; returns bytes written.
+
+    Writes go to a temp file in the same directory and are swapped in with os.replace, so a crash or a
+    concurrent reader (the ntfy and telegram bridges share several state files) never sees a torn file.
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    data = dumps_state(state, pretty=pretty)
+    try:
+        mode = target.stat().st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    fd, temp_name = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=str(target.parent))
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+            if fsync:
+                handle.flush()
+                os.fsync(handle.fileno())
+        os.replace(temp_name, target)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+    return len(data)
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+OUTBOX_COLUMNS = (
+    "id",
+    "chat_id",
+    "text",
+    "edit_message_id",
+    "topic",
+    "incident_id",
+    "priority",
+    "critical",
+    "attempts",
+    "next_attempt_at",
+    "created_at",
+    "last_error",
+)
+
+
+class TelegramOutbox:
+    """SQLite outbox of Telegram sends awaiting retry, drained in next_attempt_at order with exponential backoff."""
+
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 6,
+        backoff_seconds: float = 30.0,
+        backoff_max_seconds: float = 1800.0,
+        max_age_seconds: int = 3600,
+        retention_seconds: int = 86400,
+    ) -> None:
+        self.path = str(path)
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_seconds = max(1.0, float(backoff_seconds))
+        self.backoff_max_seconds = max(self.backoff_seconds, float(backoff_max_seconds))
+        self.max_age_seconds = max(60, int(max_age_seconds))
+        self.retention_seconds = max(0, int(retention_seconds))
+        self._lock = threading.Lock()
+        # Status counts and oldest pending created_at, rebuilt only after a write changes them.
+        self._snapshot_cache: tuple[dict[str, int], float] | None = None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS telegram_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                edit_message_id INTEGER,
+                topic TEXT NOT NULL DEFAULT '',
+                incident_id TEXT NOT NULL DEFAULT '',
+                priority INTEGER NOT NULL DEFAULT 3,
+                critical INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS telegram_outbox_due_idx ON telegram_outbox(status, next_attempt_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS telegram_outbox_target_idx ON telegram_outbox(chat_id, incident_id, status)"
+        )
+
+    def backoff_for(self, attempts: int) -> float:
+        return min(self.backoff_max_seconds, self.backoff_seconds * (2 ** max(0, int(attempts) - 1)))
+
+    def enqueue(
+        self,
+        chat_id: int,
+        text: str,
+        topic: str,
+        incident_id: str,
+        priority: int,
+        critical: bool,
+        reason: str,
+        edit_message_id: int | None = None,
+        attempts: int = 1,
+        now_ts: float | None = None,
+    ) -> int:
+        """Queue a failed send for retry; a newer alert for the same chat/incident replaces the pending text."""
+        now = float(now_ts or time.time())
+        next_attempt_at = now + self.backoff_for(attempts)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM telegram_outbox WHERE chat_id = ? AND incident_id = ? AND status = 'pending'",
+                    (int(chat_id), str(incident_id)),
+                ).fetchone()
+                if row and incident_id:
+                    outbox_id = int(row[0])
+                    self._conn.execute(
+                        """
+                        UPDATE telegram_outbox
+                        SET text = ?, edit_message_id = ?, topic = ?, priority = ?, critical = ?, last_error = ?,
+                            next_attempt_at = MIN(next_attempt_at, ?)
+                        WHERE id = ?
+                        """,
+                        (
+                            str(text),
+                            int(edit_message_id) if edit_message_id else None,
+                            str(topic),
+                            int(priority),
+                            1 if critical else 0,
+                            str(reason),
+                            next_attempt_at,
+                            outbox_id,
+                        ),
+                    )
+                else:
+                    cursor = self._conn.execute(
+                        """
+                        INSERT INTO telegram_outbox(
+                            chat_id, text, edit_message_id, topic, incident_id, priority, critical,
+                            attempts, next_attempt_at, created_at, last_error
+                        ) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            int(chat_id),
+                            str(text),
+                            int(edit_message_id) if edit_message_id else None,
+                            str(topic),
+                            str(incident_id),
+                            int(priority),
+                            1 if critical else 0,
+                            max(1, int(attempts)),
+                            next_attempt_at,
+                            now,
+                            str(reason),
+                        ),
+                    )
+                    outbox_id = int(cursor.lastrowid or 0)
+                self._conn.execute("COMMIT")
+                self._snapshot_cache = None
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return outbox_id
+
+    def due(self, limit: int = 50, now_ts: float | None = None) -> list[dict[str, Any]]:
+        """Pending sends whose retry time has come, critical alerts first, then oldest schedule first."""
+        now = float(now_ts or time.time())
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT {', '.join(OUTBOX_COLUMNS)} FROM telegram_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY critical DESC, next_attempt_at ASC
+                LIMIT ?
+                """,
+                (now, max(1, int(limit))),
+            ).fetchall()
+        items = [dict(zip(OUTBOX_COLUMNS, row)) for row in rows]
+        for item in items:
+            item["critical"] = bool(item["critical"])
+        return items
+
+    def _finish(self, outbox_id: int, status: str, reason: str, now: float) -> None:
+        self._conn.execute(
+            "UPDATE telegram_outbox SET status = ?, last_error = ?, finished_at = ? WHERE id = ?",
+            (status, str(reason), now, int(outbox_id)),
+        )
+        self._snapshot_cache = None
+
+    def mark_sent(self, outbox_id: int, now_ts: float | None = None) -> None:
+        with self._lock:
+            self._finish(outbox_id, "sent", "", float(now_ts or time.time()))
+
+    def mark_dead(self, outbox_id: int, reason: str, now_ts: float | None = None) -> None:
+        with self._lock:
+            self._finish(outbox_id, "dead", reason, float(now_ts or time.time()))
+
+    def supersede(self, chat_id: int, incident_id: str, now_ts: float | None = None) -> int:
+        """Retire pending retries for a chat/incident once a newer alert for it was delivered inline."""
+        if not incident_id:
+            return 0
+        now = float(now_ts or time.time())
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                UPDATE telegram_outbox SET status = 'dead', last_error = 'superseded', finished_at = ?
+                WHERE chat_id = ? AND incident_id = ? AND status = 'pending'
+                """,
+                (now, int(chat_id), str(incident_id)),
+            )
+            if cursor.rowcount > 0:
+                self._snapshot_cache = None
+            return max(0, cursor.rowcount)
+
+    def mark_failed(self, item: dict[str, Any], reason: str, retryable: bool, now_ts: float | None = None) -> str:
+        """Record a failed retry; returns "retry" with the next attempt scheduled, or "dead" once exhausted."""
+        now = float(now_ts or time.time())
+        attempts = int(item.get("attempts", 0) or 0) + 1
+        expired = now - float(item.get("created_at", now) or now) >= self.max_age_seconds
+        with self._lock:
+            if not retryable or attempts >= self.max_attempts or expired:
+                self._conn.execute("UPDATE telegram_outbox SET attempts = ? WHERE id = ?", (attempts, int(item["id"])))
+                self._finish(int(item["id"]), "dead", reason, now)
+                return "dead"
+            self._conn.execute(
+                "UPDATE telegram_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (attempts, now + self.backoff_for(attempts), str(reason), int(item["id"])),
+            )
+        return "retry"
+
+    def is_expired(self, item: dict[str, Any], now_ts: float | None = None) -> bool:
+        now = float(now_ts or time.time())
+        return now - float(item.get("created_at", now) or now) >= self.max_age_seconds
+
+    def purge_finished(self, now_ts: float | None = None) -> int:
+        if self.retention_seconds <= 0:
+            return 0
+        cutoff = float(now_ts or time.time()) - self.retention_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM telegram_outbox WHERE status IN ('sent', 'dead') AND finished_at < ?", (cutoff,)
+            )
+            if cursor.rowcount > 0:
+                self._snapshot_cache = None
+            return max(0, cursor.rowcount)
+
+    def snapshot(self, now_ts: float | None = None) -> dict[str, Any]:
+        now = float(now_ts or time.time())
+        with self._lock:
+            if self._snapshot_cache is None:
+                counts = dict(
+                    self._conn.execute("SELECT status, COUNT(*) FROM telegram_outbox GROUP BY status").fetchall()
+                )
+                oldest = self._conn.execute(
+                    "SELECT MIN(created_at) FROM telegram_outbox WHERE status = 'pending'"
+                ).fetchone()[0]
+                self._snapshot_cache = (counts, float(oldest or 0))
+            counts, oldest = self._snapshot_cache
+        return {
+            "pending": int(counts.get("pending", 0)),
+            "sent": int(counts.get("sent", 0)),
+            "dead": int(counts.get("dead", 0)),
+            "oldest_pending_seconds": int(now - float(oldest)) if oldest else 0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,32 +1,46 @@
 #!/usr/bin/env python3
 import json
-import io
 import hashlib
 import mimetypes
 import os
 import pathlib
+import queue
 import re
 import sqlite3
 import smtplib
 import threading
 import sys
+import tempfile
 import time
-import zipfile
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from email.message import EmailMessage
 from datetime import datetime, timezone
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import urllib.error
 import urllib.parse
 import urllib.request
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
 
 try:
+    from document_extract import DocumentExtractor
+    from embedding_cache import EmbeddingCache
+    from first_seen_ledger import FirstSeenLedger
+    from incident_store import IncidentStore
     from policy_loader import load_policy_telegram_settings
+    from qdrant_http import QdrantClient, QdrantError
+    from state_codec import STATE_CODEC_BACKEND, write_state_file
 except ModuleNotFoundError:
     bridge_dir = pathlib.Path(__file__).resolve().parent
     if str(bridge_dir) not in sys.path:
         sys.path.insert(0, str(bridge_dir))
+    from document_extract import DocumentExtractor
+    from embedding_cache import EmbeddingCache
+    from first_seen_ledger import FirstSeenLedger
+    from incident_store import IncidentStore
     from policy_loader import load_policy_telegram_settings
+    from qdrant_http import QdrantClient, QdrantError
+    from state_codec import STATE_CODEC_BACKEND, write_state_file
 
 
 def env(name: str, default: str = "") -> str:
@@ -51,6 +65,34 @@ TOKEN = env("TELEGRAM_BOT_TOKEN")
 ALLOWED_IDS_RAW = env("TELEGRAM_ALLOWED_USER_IDS")
 POLL_TIMEOUT = parse_int(env("TELEGRAM_POLL_TIMEOUT", "50"), 50)
 N8N_BASE = env("N8N_BASE", "http://n8n:5678")
+QDRANT_URL = env("QDRANT_URL", "http://qdrant:6333")
+QDRANT_API_KEY = env("QDRANT_API_KEY", "")
+QDRANT_TIMEOUT_SECONDS = max(1, parse_int(env("QDRANT_TIMEOUT_SECONDS", "10"), 10))
+QDRANT_POOL_SIZE = max(1, parse_int(env("QDRANT_POOL_SIZE", "4"), 4))
+DIRECT_RETRIEVAL_ENABLED = env("TELEGRAM_DIRECT_RETRIEVAL_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+DIRECT_RETRIEVAL_TOP_K = max(1, parse_int(env("TELEGRAM_DIRECT_RETRIEVAL_TOP_K", "3"), 3))
+DIRECT_RETRIEVAL_TIMEOUT_SECONDS = max(1, parse_int(env("TELEGRAM_DIRECT_RETRIEVAL_TIMEOUT_SECONDS", "20"), 20))
+OLLAMA_EMBED_URL = env("OLLAMA_EMBED_URL", "http://host.docker.internal:11435/api/embed")
+RAG_EMBED_MODEL = env("RAG_EMBED_MODEL", "qwen2.5-coder:7b")
+EMBED_CACHE_ENABLED = env("TELEGRAM_EMBED_CACHE_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+EMBED_CACHE_PATH = pathlib.Path(env("TELEGRAM_EMBED_CACHE_STATE", "/state/telegram_embedding_cache.json"))
+EMBED_CACHE_MAX_ENTRIES = max(0, parse_int(env("TELEGRAM_EMBED_CACHE_MAX_ENTRIES", "2000"), 2000))
+EMBED_CACHE_MAX_MB = max(1, parse_int(env("TELEGRAM_EMBED_CACHE_MAX_MB", "64"), 64))
+EMBED_CACHE_SAVE_INTERVAL_SECONDS = max(5, parse_int(env("TELEGRAM_EMBED_CACHE_SAVE_INTERVAL_SECONDS", "60"), 60))
+EMBED_FAILURE_BACKOFF_SECONDS = max(0, parse_int(env("TELEGRAM_EMBED_FAILURE_BACKOFF_SECONDS", "60"), 60))
+REPLY_CACHE_ENABLED = env("TELEGRAM_REPLY_CACHE_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+REPLY_CACHE_TTL_SECONDS = max(10, parse_int(env("TELEGRAM_REPLY_CACHE_TTL_SECONDS", "600"), 600))
+REPLY_CACHE_MAX_ENTRIES = max(1, parse_int(env("TELEGRAM_REPLY_CACHE_MAX_ENTRIES", "500"), 500))
+REPLY_CACHE_MAX_CHARS = max(1000, parse_int(env("TELEGRAM_REPLY_CACHE_MAX_CHARS", "2000000"), 2000000))
+REPLY_CACHE_ROUTES = {
+    item.strip().lower()
+    for item in env("TELEGRAM_REPLY_CACHE_ROUTES", "rag,workspace").split(",")
+    if item.strip()
+}
+REPLY_CACHE_BYPASS_PATTERN = env(
+    "TELEGRAM_REPLY_CACHE_BYPASS_PATTERN",
+    r"\b(weather|forecast|today|tonight|tomorrow|yesterday|now|current|currently|latest|news|time|date|price|score|remind)\b",
+)
 RAG_WEBHOOK = env("N8N_RAG_WEBHOOK", "/webhook/rag-query")
 RAG_INGEST_WEBHOOK = env("N8N_RAG_INGEST_WEBHOOK", "/webhook/rag-ingest")
 OPS_WEBHOOK = env("N8N_OPS_WEBHOOK", "/webhook/ops-commands-ingest")
@@ -74,6 +116,22 @@ TEXTBOOK_SEARCH_PROVIDERS_RAW = env(
     "TEXTBOOK_SEARCH_PROVIDERS",
     "googlebooks,openlibrary,internetarchive,gutendex",
 )
+TEXTBOOK_SEARCH_DEADLINE_SECONDS = parse_float(env("TEXTBOOK_SEARCH_DEADLINE_SECONDS", "12"), 12.0)
+TEXTBOOK_SEARCH_PROVIDER_TIMEOUT_SECONDS = parse_float(env("TEXTBOOK_SEARCH_PROVIDER_TIMEOUT_SECONDS", "10"), 10.0)
+TEXTBOOK_SEARCH_EARLY_RETURN_SCORE = parse_int(env("TEXTBOOK_SEARCH_EARLY_RETURN_SCORE", "120"), 120)
+TEXTBOOK_GOOGLEBOOKS_API_BASE = env("TEXTBOOK_GOOGLEBOOKS_API_BASE", "https://www.googleapis.com/books/v1").rstrip("/")
+TEXTBOOK_OPENLIBRARY_API_BASE = env("TEXTBOOK_OPENLIBRARY_API_BASE", "https://openlibrary.org").rstrip("/")
+TEXTBOOK_INTERNETARCHIVE_API_BASE = env("TEXTBOOK_INTERNETARCHIVE_API_BASE", "https://archive.org").rstrip("/")
+TEXTBOOK_GUTENDEX_API_BASE = env("TEXTBOOK_GUTENDEX_API_BASE", "https://gutendex.com").rstrip("/")
+TEXTBOOK_SEARCH_CACHE_ENABLED = env("TEXTBOOK_SEARCH_CACHE_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+TEXTBOOK_SEARCH_CACHE_TTL_SECONDS = parse_int(env("TEXTBOOK_SEARCH_CACHE_TTL_SECONDS", "21600"), 21600)
+TEXTBOOK_SEARCH_CACHE_MAX_ENTRIES = parse_int(env("TEXTBOOK_SEARCH_CACHE_MAX_ENTRIES", "500"), 500)
+TEXTBOOK_SEARCH_CACHE_SAVE_INTERVAL_SECONDS = max(
+    5, parse_int(env("TEXTBOOK_SEARCH_CACHE_SAVE_INTERVAL_SECONDS", "60"), 60)
+)
+TEXTBOOK_SEARCH_CACHE_PATH = pathlib.Path(
+    env("TELEGRAM_TEXTBOOK_SEARCH_CACHE_STATE", "/state/telegram_textbook_search_cache.json")
+)
 TEXTBOOK_DOWNLOAD_LINK_ENABLED = env("TEXTBOOK_DOWNLOAD_LINK_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
 TEXTBOOK_DOWNLOAD_PUBLIC_BASE_URL = env("TEXTBOOK_DOWNLOAD_PUBLIC_BASE_URL", "").rstrip("/")
 TEXTBOOK_DOWNLOAD_BIND_HOST = env("TEXTBOOK_DOWNLOAD_BIND_HOST", "0.0.0.0")
@@ -81,12 +139,29 @@ TEXTBOOK_DOWNLOAD_PORT = parse_int(env("TEXTBOOK_DOWNLOAD_PORT", "8113"), 8113)
 TEXTBOOK_DOWNLOAD_TTL_SECONDS = parse_int(env("TEXTBOOK_DOWNLOAD_TTL_SECONDS", "86400"), 86400)
 TEXTBOOK_DOWNLOAD_MAX_BYTES = parse_int(env("TEXTBOOK_DOWNLOAD_MAX_BYTES", "52428800"), 52428800)
 TEXTBOOK_DOWNLOAD_CLEANUP_INTERVAL_SECONDS = parse_int(env("TEXTBOOK_DOWNLOAD_CLEANUP_INTERVAL_SECONDS", "300"), 300)
+TEXTBOOK_DOWNLOAD_CHUNK_BYTES = max(16384, parse_int(env("TEXTBOOK_DOWNLOAD_CHUNK_BYTES", "262144"), 262144))
 TEXTBOOK_DOWNLOAD_STATE_PATH = pathlib.Path(env("TELEGRAM_TEXTBOOK_DOWNLOAD_STATE", "/state/telegram_textbook_downloads.json"))
 TEXTBOOK_DOWNLOAD_FILES_DIR = pathlib.Path(env("TELEGRAM_TEXTBOOK_DOWNLOAD_DIR", "/state/textbook-downloads"))
+TEXTBOOK_DOWNLOAD_BLOBS_DIR = TEXTBOOK_DOWNLOAD_FILES_DIR / "blobs"
+TEXTBOOK_DOWNLOAD_SOURCE_REUSE_SECONDS = parse_int(env("TEXTBOOK_DOWNLOAD_SOURCE_REUSE_SECONDS", "3600"), 3600)
 WORKSPACE_STATE_PATH = pathlib.Path(env("TELEGRAM_WORKSPACE_STATE", "/state/telegram_workspace_state.json"))
 WORKSPACE_TTL_SECONDS = parse_int(env("TELEGRAM_WORKSPACE_TTL_SECONDS", "86400"), 86400)
 WORKSPACE_CLEANUP_INTERVAL_SECONDS = parse_int(env("TELEGRAM_WORKSPACE_CLEANUP_INTERVAL_SECONDS", "300"), 300)
+WORKSPACE_DELETE_VERIFY_SECONDS = max(5, parse_int(env("TELEGRAM_WORKSPACE_DELETE_VERIFY_SECONDS", "30"), 30))
+WORKSPACE_DELETE_RETRY_BASE_SECONDS = max(5, parse_int(env("TELEGRAM_WORKSPACE_DELETE_RETRY_BASE_SECONDS", "30"), 30))
+WORKSPACE_DELETE_MAX_ATTEMPTS = max(1, parse_int(env("TELEGRAM_WORKSPACE_DELETE_MAX_ATTEMPTS", "8"), 8))
 WORKSPACE_MAX_DOCS = parse_int(env("TELEGRAM_WORKSPACE_MAX_DOCS", "8"), 8)
+INGEST_CHUNK_CHARS = max(200, parse_int(env("TELEGRAM_INGEST_CHUNK_CHARS", "1400"), 1400))
+INGEST_CHUNK_OVERLAP_CHARS = max(0, parse_int(env("TELEGRAM_INGEST_CHUNK_OVERLAP_CHARS", "200"), 200))
+INGEST_MAX_BYTES = parse_int(env("TELEGRAM_INGEST_MAX_BYTES", str(TEXTBOOK_DOWNLOAD_MAX_BYTES)), TEXTBOOK_DOWNLOAD_MAX_BYTES)
+INGEST_MAX_CHUNKS = max(1, parse_int(env("TELEGRAM_INGEST_MAX_CHUNKS", "1500"), 1500))
+INGEST_CONCURRENCY = max(1, parse_int(env("TELEGRAM_INGEST_CONCURRENCY", "3"), 3))
+INGEST_PROGRESS_EVERY_CHUNKS = max(1, parse_int(env("TELEGRAM_INGEST_PROGRESS_EVERY_CHUNKS", "100"), 100))
+EXTRACT_WORKERS = max(0, parse_int(env("TELEGRAM_EXTRACT_WORKERS", "2"), 2))
+EXTRACT_PAGES_PER_TASK = max(1, parse_int(env("TELEGRAM_EXTRACT_PAGES_PER_TASK", "16"), 16))
+EXTRACT_TIMEOUT_SECONDS = max(5, parse_int(env("TELEGRAM_EXTRACT_TIMEOUT_SECONDS", "180"), 180))
+EXTRACT_CACHE_DIR = pathlib.Path(env("TELEGRAM_EXTRACT_CACHE_DIR", "/state/telegram-extract-cache"))
+EXTRACT_CACHE_MAX_ENTRIES = max(0, parse_int(env("TELEGRAM_EXTRACT_CACHE_MAX_ENTRIES", "200"), 200))
 OVERSEERR_URL = env("OVERSEERR_URL", "http://host.docker.internal:5055").rstrip("/")
 OVERSEERR_API_KEY = env("OVERSEERR_API_KEY")
 MEDIA_SELECTION_PATH = pathlib.Path(env("TELEGRAM_MEDIA_SELECTION_STATE", "/state/telegram_media_selection.json"))
@@ -101,8 +176,14 @@ RESEARCH_NEXTCLOUD_BASE_URL = env("RESEARCH_NEXTCLOUD_BASE_URL", "http://nextclo
 RESEARCH_NEXTCLOUD_USER = env("RESEARCH_NEXTCLOUD_USER", "")
 RESEARCH_NEXTCLOUD_PASSWORD = env("RESEARCH_NEXTCLOUD_PASSWORD", "")
 RESEARCH_NEXTCLOUD_FOLDER = env("RESEARCH_NEXTCLOUD_FOLDER", "research-reports")
+BACKGROUND_JOB_WORKERS = max(0, parse_int(env("TELEGRAM_BACKGROUND_JOB_WORKERS", "2"), 2))
+BACKGROUND_JOB_MAX_ATTEMPTS = max(1, parse_int(env("TELEGRAM_BACKGROUND_JOB_MAX_ATTEMPTS", "3"), 3))
+BACKGROUND_JOB_RETENTION_SECONDS = max(3600, parse_int(env("TELEGRAM_BACKGROUND_JOB_RETENTION_SECONDS", "604800"), 604800))
+BACKGROUND_JOB_POLL_TIMEOUT = max(1, parse_int(env("TELEGRAM_BACKGROUND_JOB_POLL_TIMEOUT", "5"), 5))
 DEFAULT_MODE = env("TELEGRAM_DEFAULT_MODE", "rag").lower()
 STATE_PATH = pathlib.Path(env("TELEGRAM_BRIDGE_STATE", "/state/telegram_bridge_state.json"))
+STATE_JSON_PRETTY = env("TELEGRAM_STATE_JSON_PRETTY", "false").lower() in {"1", "true", "yes", "on"}
+STATE_FSYNC = env("TELEGRAM_STATE_FSYNC", "false").lower() in {"1", "true", "yes", "on"}
 APPROVALS_PATH = pathlib.Path(env("TELEGRAM_APPROVALS_STATE", "/state/telegram_approvals.json"))
 CODING_ACCESS_AUDIT_PATH = pathlib.Path(env("TELEGRAM_CODING_ACCESS_AUDIT", "/state/telegram_coding_access_audit.jsonl"))
 APPROVAL_TTL_SECONDS = parse_int(env("TELEGRAM_APPROVAL_TTL_SECONDS", "300"), 300)
@@ -259,8 +340,14 @@ MEDIA_FIRST_SEEN_STATE_PATH = pathlib.Path(
 MEDIA_FIRST_SEEN_SQLITE_PATH = pathlib.Path(
     env("TELEGRAM_MEDIA_FIRST_SEEN_SQLITE_PATH", str(NOTIFY_STATS_SQLITE_PATH))
 )
+MEDIA_FIRST_SEEN_LEDGER_PATH = pathlib.Path(
+    env("TELEGRAM_MEDIA_FIRST_SEEN_LEDGER_PATH", str(MEDIA_FIRST_SEEN_STATE_PATH.with_suffix(".db")))
+)
+MEDIA_FIRST_SEEN_RETENTION_SECONDS = parse_int(env("TELEGRAM_MEDIA_FIRST_SEEN_RETENTION_SECONDS", "31536000"), 31536000)
 INCIDENT_ACK_TTL_SECONDS = parse_int(env("TELEGRAM_INCIDENT_ACK_TTL_SECONDS", "21600"), 21600)
 INCIDENT_LIST_LIMIT = parse_int(env("TELEGRAM_INCIDENT_LIST_LIMIT", "8"), 8)
+INCIDENT_STORE_PATH = pathlib.Path(env("TELEGRAM_INCIDENT_STORE_PATH", str(INCIDENT_STATE_PATH.with_suffix(".db"))))
+INCIDENT_RETENTION_SECONDS = parse_int(env("TELEGRAM_INCIDENT_RETENTION_SECONDS", "604800"), 604800)
 REQTRACK_INCIDENT_LIST_LIMIT = parse_int(env("TELEGRAM_REQTRACK_INCIDENT_LIST_LIMIT", "8"), 8)
 REQTRACK_DEFAULT_SNOOZE_MINUTES = parse_int(env("TELEGRAM_REQTRACK_SNOOZE_MINUTES", "120"), 120)
 REQTRACK_DEFAULT_KPI_WINDOW_HOURS = parse_int(env("TELEGRAM_REQTRACK_KPI_WINDOW_HOURS", "24"), 24)
@@ -303,6 +390,9 @@ CHILD_MEDIA_BLOCKED_KEYWORDS_RAW = env(
     "TELEGRAM_CHILD_MEDIA_BLOCKED_KEYWORDS",
     "nudity,sexual content,explicit sex,rape,gore,graphic violence,torture,profanity,blasphemy,drug use,substance abuse,self-harm,suicide,disturbing scenes",
 )
+PAYLOAD_POLICY_MODE = env("TELEGRAM_PAYLOAD_POLICY_MODE", "version").strip().lower()
+if PAYLOAD_POLICY_MODE not in {"version", "full"}:
+    PAYLOAD_POLICY_MODE = "version"
 NOTIFY_POLICY_LOADED_AT = datetime.now(timezone.utc).isoformat()
 
 
@@ -548,7 +638,7 @@ def load_delivery_state() -> dict[str, Any]:
     return json_state
 
 
-def load_media_first_seen_state() -> dict[str, Any]:
+def load_legacy_media_first_seen_state() -> dict[str, Any]:
     def _empty_state() -> dict[str, Any]:
         return {"items": {}, "updated_at": ""}
 
@@ -612,47 +702,21 @@ def load_media_first_seen_state() -> dict[str, Any]:
     return json_state
 
 
-def save_media_first_seen_state(state: dict[str, Any]) -> bool:
-    if not isinstance(state, dict):
-        state = {"items": {}, "updated_at": utc_now()}
-    if "updated_at" not in state:
-        state["updated_at"] = utc_now()
+MEDIA_FIRST_SEEN_LEDGER: FirstSeenLedger | None = None
 
-    try:
-        if MEDIA_FIRST_SEEN_SQLITE_PATH.exists():
-            conn = sqlite3.connect(str(MEDIA_FIRST_SEEN_SQLITE_PATH))
-            try:
-                conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS state_kv (
-                        key TEXT PRIMARY KEY,
-                        payload TEXT NOT NULL,
-                        updated_at TEXT NOT NULL
-                    )
-                    """
-                )
-                conn.execute(
-                    """
-                    INSERT INTO state_kv(key, payload, updated_at)
-                    VALUES(?, ?, ?)
-                    ON CONFLICT(key) DO UPDATE SET payload=excluded.payload, updated_at=excluded.updated_at
-                    """,
-                    ("media_first_seen", json.dumps(state, ensure_ascii=False), utc_now()),
-                )
-                conn.commit()
-                return True
-            finally:
-                conn.close()
-    except Exception as exc:
-        print(f"[telegram-bridge] failed to save media-first-seen sqlite state: {exc}", flush=True)
 
-    try:
-        MEDIA_FIRST_SEEN_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        MEDIA_FIRST_SEEN_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
-        return True
-    except Exception as exc:
-        print(f"[telegram-bridge] failed to save media-first-seen json state: {exc}", flush=True)
-        return False
+def get_media_first_seen_ledger() -> FirstSeenLedger:
+    # The ntfy bridge owns the ledger; this side only lists and clears it, so no bloom filter is kept.
+    global MEDIA_FIRST_SEEN_LEDGER
+    if MEDIA_FIRST_SEEN_LEDGER is None:
+        ledger = FirstSeenLedger(str(MEDIA_FIRST_SEEN_LEDGER_PATH), retention_seconds=MEDIA_FIRST_SEEN_RETENTION_SECONDS)
+        ledger.import_legacy(load_legacy_media_first_seen_state().get("items") or {})
+        MEDIA_FIRST_SEEN_LEDGER = ledger
+    return MEDIA_FIRST_SEEN_LEDGER
+
+
+def load_media_first_seen_state() -> dict[str, Any]:
+    return {"items": get_media_first_seen_ledger().items(), "updated_at": utc_now()}
 
 
 def normalize_media_first_seen_lookup_text(raw: str) -> str:
@@ -670,38 +734,22 @@ def media_first_seen_title_key_part(key: str) -> str:
 
 
 def clear_media_first_seen_entries(clear_all: bool, title_query: str) -> tuple[int, int]:
-    state = load_media_first_seen_state()
-    items_raw = state.get("items") if isinstance(state, dict) else {}
-    items = items_raw if isinstance(items_raw, dict) else {}
-    total = len(items)
+    ledger = get_media_first_seen_ledger()
+    total = ledger.count()
     if total <= 0:
         return 0, 0
+    if clear_all:
+        return ledger.clear(), total
 
     target_norm = normalize_media_first_seen_lookup_text(title_query)
-    updated: dict[str, Any] = {}
-    removed = 0
-    for key, value in items.items():
-        if not isinstance(key, str):
-            continue
-        should_remove = False
-        if clear_all:
-            should_remove = True
-        else:
-            key_title = media_first_seen_title_key_part(key)
-            if key_title and target_norm and (target_norm in key_title or key_title in target_norm):
-                should_remove = True
-        if should_remove:
-            removed += 1
-            continue
-        updated[key] = value
-
-    if removed <= 0:
+    doomed: list[str] = []
+    for key in ledger.keys():
+        key_title = media_first_seen_title_key_part(key)
+        if key_title and target_norm and (target_norm in key_title or key_title in target_norm):
+            doomed.append(key)
+    if not doomed:
         return 0, total
-
-    state["items"] = updated
-    state["updated_at"] = utc_now()
-    save_media_first_seen_state(state)
-    return removed, total
+    return ledger.delete(doomed), total
 
 
 def save_delivery_state(state: dict[str, Any]) -> bool:
@@ -739,8 +787,7 @@ def save_delivery_state(state: dict[str, Any]) -> bool:
         print(f"[telegram-bridge] failed to save delivery sqlite state: {exc}", flush=True)
 
     try:
-        DELIVERY_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        DELIVERY_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        write_json_state(DELIVERY_STATE_PATH, state)
         return True
     except Exception as exc:
         print(f"[telegram-bridge] failed to save delivery state: {exc}", flush=True)
@@ -749,8 +796,7 @@ def save_delivery_state(state: dict[str, Any]) -> bool:
 
 def save_digest_queue_state(state: dict[str, Any]) -> bool:
     try:
-        DIGEST_QUEUE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        DIGEST_QUEUE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        write_json_state(DIGEST_QUEUE_PATH, state)
         return True
     except Exception as exc:
         print(f"[telegram-bridge] failed to save digest queue state: {exc}", flush=True)
@@ -940,6 +986,23 @@ def build_notify_stats_report() -> str:
         f"- updated_at: {updated_at}",
     ]
 
+    ready_cache = data.get("media_ready_cache")
+    if isinstance(ready_cache, dict) and ready_cache:
+        lines.append(
+            "- media_ready_cache: "
+            f"entries={ready_cache.get('entries', 0)} hit_rate={ready_cache.get('hit_rate', 0.0)} "
+            f"hits={ready_cache.get('hits', 0)} negative_hits={ready_cache.get('negative_hits', 0)} "
+            f"coalesced={ready_cache.get('coalesced', 0)} misses={ready_cache.get('misses', 0)} errors={ready_cache.get('errors', 0)}"
+        )
+
+    outbox = data.get("telegram_outbox")
+    if isinstance(outbox, dict) and outbox:
+        lines.append(
+            "- retry_outbox: "
+            f"pending={outbox.get('pending', 0)} oldest_pending={outbox.get('oldest_pending_seconds', 0)}s "
+            f"sent={outbox.get('sent', 0)} dead={outbox.get('dead', 0)}"
+        )
+
     if by_reason:
         lines.append("- top skip/fail reasons:")
         for reason, count in sorted(by_reason.items(), key=lambda item: (-item[1], item[0]))[:6]:
@@ -1096,38 +1159,24 @@ def build_notify_health_report() -> str:
 
 
 def build_media_first_seen_report(limit: int = 10) -> str:
-    state = load_media_first_seen_state()
-    items_raw = state.get("items") if isinstance(state, dict) else {}
-    items = items_raw if isinstance(items_raw, dict) else {}
-    now_ts = int(time.time())
-    rows: list[tuple[int, int, int, str]] = []
-    for key, value in items.items():
-        if not isinstance(key, str) or not isinstance(value, dict):
-            continue
-        try:
-            first_seen = int(value.get("first_seen", 0) or 0)
-            last_seen = int(value.get("last_seen", first_seen) or first_seen)
-            event_count = int(value.get("event_count", 1) or 1)
-        except (TypeError, ValueError):
-            continue
-        rows.append((last_seen, first_seen, max(1, event_count), key))
-
-    if not rows:
+    ledger = get_media_first_seen_ledger()
+    total = ledger.count()
+    if total <= 0:
         return "Media first-seen cache: no tracked Plex availability titles yet."
 
-    rows.sort(key=lambda row: row[0], reverse=True)
+    now_ts = int(time.time())
     cap = max(1, min(50, int(limit)))
     lines = [
         "Media first-seen cache:",
-        f"- entries: {len(rows)}",
-        f"- state_updated_at: {str(state.get('updated_at', '') or '(unknown)')}",
+        f"- entries: {total}",
+        f"- ledger: {MEDIA_FIRST_SEEN_LEDGER_PATH}",
     ]
-    for last_seen, first_seen, event_count, key in rows[:cap]:
+    for row in ledger.recent(cap):
         lines.append(
-            f"- key={key} seen={event_count} first_age={format_age_from_unix_ts(first_seen, now_ts=now_ts)} last_age={format_age_from_unix_ts(last_seen, now_ts=now_ts)}"
+            f"- key={row['key']} seen={row['event_count']} first_age={format_age_from_unix_ts(row['first_seen'], now_ts=now_ts)} last_age={format_age_from_unix_ts(row['last_seen'], now_ts=now_ts)}"
         )
-    if len(rows) > cap:
-        lines.append(f"- ...and {len(rows) - cap} more")
+    if total > cap:
+        lines.append(f"- ...and {total - cap} more")
     return "\n".join(lines)
 
 
@@ -1337,8 +1386,7 @@ def build_status_snapshot() -> dict[str, Any]:
 
     notify_stats = load_notify_stats_state()
     notify_updated_at = str(notify_stats.get("updated_at", "") or "")
-    incident_state = load_incident_state()
-    incident_updated_at = str(incident_state.get("updated_at", "") or "")
+    incident_updated_at = get_incident_store().updated_at()
     digest_state = load_digest_queue_state()
     digest_updated_at = str(digest_state.get("updated_at", "") or "")
     digest_users, digest_items = digest_queue_counts(digest_state)
@@ -1410,6 +1458,19 @@ def build_status_snapshot() -> dict[str, Any]:
         "memory_canary_percent": int(MEMORY_CANARY_PERCENT),
         "memory_canary_include_users": int(len(MEMORY_CANARY_INCLUDE_USER_IDS)),
         "memory_canary_exclude_users": int(len(MEMORY_CANARY_EXCLUDE_USER_IDS)),
+        "textbook_providers": textbook_provider_metrics_snapshot(),
+        "textbook_search_cache": textbook_search_cache_snapshot(),
+        "textbook_download_serving": textbook_download_serve_metrics_snapshot(),
+        "textbook_download_store": textbook_download_store_snapshot(),
+        "background_jobs": background_jobs_snapshot(),
+        "document_extract": DOCUMENT_EXTRACTOR.snapshot(),
+        "workspace_pending_deletes": workspace_pending_deletes_snapshot(),
+        "qdrant": QDRANT.snapshot(),
+        "direct_retrieval": direct_retrieval_snapshot(),
+        "reply_cache": reply_cache_snapshot(),
+        "payload_policy": {"version": POLICY_PAYLOAD_VERSION, "mode": PAYLOAD_POLICY_MODE},
+        "state_files": {"codec": STATE_CODEC_BACKEND, "pretty": STATE_JSON_PRETTY, "fsync": STATE_FSYNC},
+        "embedding_cache": EMBED_CACHE.snapshot() if EMBED_CACHE_ENABLED else {},
     }
 
 
@@ -1443,6 +1504,113 @@ def build_status_report() -> str:
         f"  - deferred: {int(outcomes.get('deferred', 0))}",
         f"  - skipped: {int(outcomes.get('skipped', 0))}",
     ]
+    search_cache = snapshot.get("textbook_search_cache") if isinstance(snapshot, dict) else {}
+    if isinstance(search_cache, dict):
+        lines.append(
+            f"- textbook_search_cache: {'on' if search_cache.get('enabled') else 'off'}, "
+            f"entries={int(search_cache.get('entries', 0))}, hits={int(search_cache.get('hits', 0))}, "
+            f"misses={int(search_cache.get('misses', 0))}, hit_rate={float(search_cache.get('hit_rate', 0.0)):.2f}"
+        )
+    store = snapshot.get("textbook_download_store") if isinstance(snapshot, dict) else {}
+    if isinstance(store, dict) and int(store.get("entries", 0)) > 0:
+        lines.append(
+            f"- textbook_download_store: entries={int(store.get('entries', 0))}, blobs={int(store.get('blobs', 0))}, "
+            f"bytes={int(store.get('blob_bytes', 0))}, fetches={int(store.get('fetches', 0))}, "
+            f"source_reuse={int(store.get('source_reuse', 0))}, content_dedupe={int(store.get('content_dedupe', 0))}"
+        )
+    serving = snapshot.get("textbook_download_serving") if isinstance(snapshot, dict) else {}
+    if isinstance(serving, dict) and int(serving.get("requests", 0)) > 0:
+        lines.append(
+            f"- textbook_downloads_served: requests={int(serving.get('requests', 0))}, full={int(serving.get('full', 0))}, "
+            f"partial={int(serving.get('partial', 0))}, not_modified={int(serving.get('not_modified', 0))}, "
+            f"range_unsatisfiable={int(serving.get('range_unsatisfiable', 0))}, errors={int(serving.get('errors', 0))}, bytes={int(serving.get('bytes_sent', 0))}, "
+            f"avg_bps={int(serving.get('avg_throughput_bps', 0))}"
+        )
+    pending_deletes = snapshot.get("workspace_pending_deletes") if isinstance(snapshot, dict) else {}
+    if isinstance(pending_deletes, dict) and int(pending_deletes.get("tenants", 0)) > 0:
+        lines.append(
+            f"- workspace_pending_deletes: tenants={int(pending_deletes.get('tenants', 0))}, docs={int(pending_deletes.get('docs', 0))}, "
+            f"verifying={int(pending_deletes.get('verifying', 0))}, retrying={int(pending_deletes.get('retrying', 0))}"
+        )
+    extract = snapshot.get("document_extract") if isinstance(snapshot, dict) else {}
+    if isinstance(extract, dict) and int(extract.get("documents", 0)) + int(extract.get("cache_hits", 0)) > 0:
+        lines.append(
+            f"- document_extract: workers={int(extract.get('workers', 0))}, documents={int(extract.get('documents', 0))}, "
+            f"pages={int(extract.get('pages', 0))}, parallel={int(extract.get('parallel', 0))}, "
+            f"cache_hits={int(extract.get('cache_hits', 0))}, timeouts={int(extract.get('timeouts', 0))}, "
+            f"avg_s={float(extract.get('avg_seconds', 0.0)):.2f}, max_s={float(extract.get('max_seconds', 0.0)):.2f}"
+        )
+    background = snapshot.get("background_jobs") if isinstance(snapshot, dict) else {}
+    if isinstance(background, dict):
+        lines.append(
+            f"- background_jobs: workers={int(background.get('workers', 0))}, queued={int(background.get('queued', 0))}, "
+            f"running={int(background.get('running', 0))}"
+        )
+        kinds = background.get("kinds")
+        for kind, metrics in sorted((kinds if isinstance(kinds, dict) else {}).items()):
+            if not isinstance(metrics, dict):
+                continue
+            lines.append(
+                f"  - {kind}: done={int(metrics.get('done', 0))}, failed={int(metrics.get('failed', 0))}, "
+                f"avg_run_s={float(metrics.get('avg_run_seconds', 0.0)):.1f}, max_run_s={float(metrics.get('max_run_seconds', 0.0)):.1f}, "
+                f"avg_wait_s={float(metrics.get('avg_wait_seconds', 0.0)):.1f}"
+            )
+    qdrant_ops = snapshot.get("qdrant") if isinstance(snapshot, dict) else {}
+    if isinstance(qdrant_ops, dict) and qdrant_ops:
+        lines.append("- qdrant:")
+        for operation, metrics in sorted(qdrant_ops.items()):
+            if not isinstance(metrics, dict):
+                continue
+            lines.append(
+                f"  - {operation}: calls={int(metrics.get('calls', 0))}, errors={int(metrics.get('errors', 0))}, "
+                f"avg_ms={int(metrics.get('avg_ms', 0))}, max_ms={int(metrics.get('max_ms', 0))}"
+            )
+    embedding_cache = snapshot.get("embedding_cache") if isinstance(snapshot, dict) else {}
+    if isinstance(embedding_cache, dict) and embedding_cache:
+        lines.append(
+            f"- embedding_cache: entries={int(embedding_cache.get('entries', 0))}, "
+            f"mb={int(embedding_cache.get('bytes', 0)) / (1024 * 1024):.1f}, "
+            f"hits={int(embedding_cache.get('hits', 0))}, misses={int(embedding_cache.get('misses', 0))}, "
+            f"hit_rate={float(embedding_cache.get('hit_rate', 0.0)):.3f}, "
+            f"evictions={int(embedding_cache.get('evictions', 0))}"
+        )
+    payload_policy = snapshot.get("payload_policy") if isinstance(snapshot, dict) else {}
+    if isinstance(payload_policy, dict) and payload_policy:
+        lines.append(f"- payload_policy: version={payload_policy.get('version', '')}, mode={payload_policy.get('mode', '')}")
+    state_files = snapshot.get("state_files") if isinstance(snapshot, dict) else {}
+    if isinstance(state_files, dict) and state_files:
+        lines.append(
+            f"- state_files: codec={state_files.get('codec', 'json')}, "
+            f"pretty={'on' if state_files.get('pretty') else 'off'}, fsync={'on' if state_files.get('fsync') else 'off'}"
+        )
+    reply_cache = snapshot.get("reply_cache") if isinstance(snapshot, dict) else {}
+    if isinstance(reply_cache, dict) and reply_cache.get("enabled"):
+        lines.append(
+            f"- reply_cache: entries={int(reply_cache.get('entries', 0))}, chars={int(reply_cache.get('chars', 0))}, "
+            f"hits={int(reply_cache.get('hits', 0))}, misses={int(reply_cache.get('misses', 0))}, "
+            f"bypassed={int(reply_cache.get('bypassed', 0))}, hit_rate={float(reply_cache.get('hit_rate', 0.0)):.3f}, "
+            f"evictions={int(reply_cache.get('evictions', 0))}"
+        )
+    direct_retrieval = snapshot.get("direct_retrieval") if isinstance(snapshot, dict) else {}
+    if isinstance(direct_retrieval, dict) and direct_retrieval.get("enabled"):
+        lines.append(
+            f"- direct_retrieval: queries={int(direct_retrieval.get('queries', 0))}, "
+            f"fallbacks={int(direct_retrieval.get('fallbacks', 0))}, "
+            f"avg_hits={float(direct_retrieval.get('avg_hits', 0.0)):.2f}, "
+            f"avg_embed_ms={int(direct_retrieval.get('avg_embed_ms', 0))}, "
+            f"avg_search_ms={int(direct_retrieval.get('avg_search_ms', 0))}"
+        )
+    providers = snapshot.get("textbook_providers") if isinstance(snapshot, dict) else {}
+    if isinstance(providers, dict) and providers:
+        lines.append("- textbook_providers:")
+        for provider, metrics in sorted(providers.items()):
+            if not isinstance(metrics, dict):
+                continue
+            lines.append(
+                f"  - {provider}: calls={int(metrics.get('calls', 0))}, errors={int(metrics.get('errors', 0))}, "
+                f"abandoned={int(metrics.get('abandoned', 0))}, late={int(metrics.get('late', 0))}, avg_ms={int(metrics.get('avg_latency_ms', 0))}, "
+                f"max_ms={int(metrics.get('max_latency_ms', 0))}"
+            )
     return "\n".join(lines)
 
 
@@ -1588,7 +1756,7 @@ def build_health_json_report(request_user_id: int, include_validate_probe: bool
     )
 
 
-def load_incident_state() -> dict[str, Any]:
+def load_legacy_incident_state() -> dict[str, Any]:
     if not INCIDENT_STATE_PATH.exists():
         return {"incidents": {}, "updated_at": ""}
     try:
@@ -1603,14 +1771,40 @@ def load_incident_state() -> dict[str, Any]:
         return {"incidents": {}, "updated_at": ""}
 
 
-def save_incident_state(state: dict[str, Any]) -> bool:
+INCIDENT_STORE: IncidentStore | None = None
+
+
+def get_incident_store() -> IncidentStore:
+    # Shared with the ntfy bridge, which records incidents; this side lists them and applies ack/snooze.
+    global INCIDENT_STORE
+    if INCIDENT_STORE is None:
+        store = IncidentStore(str(INCIDENT_STORE_PATH), retention_seconds=max(3600, INCIDENT_RETENTION_SECONDS))
+        store.import_legacy(load_legacy_incident_state().get("incidents") or {})
+        INCIDENT_STORE = store
+    return INCIDENT_STORE
+
+
+def load_incident_state() -> dict[str, Any]:
+    store = get_incident_store()
+    return {"incidents": store.items(), "updated_at": store.updated_at()}
+
+
+def update_incident(incident_id: str, fields: dict[str, Any]) -> str:
+    """Apply fields to one stored incident; returns "ok", "not_found" or "error"."""
+
+    def _apply(incident: dict[str, Any] | None) -> dict[str, Any] | None:
+        if incident is None:
+            return None
+        incident.update(fields)
+        incident["updated_at"] = utc_now()
+        return incident
+
     try:
-        INCIDENT_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        INCIDENT_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
-        return True
+        updated = get_incident_store().mutate(incident_id, _apply)
     except Exception as exc:
-        print(f"[telegram-bridge] failed to save incident state: {exc}", flush=True)
-        return False
+        print(f"[telegram-bridge] failed to update incident {incident_id}: {exc}", flush=True)
+        return "error"
+    return "ok" if updated is not None else "not_found"
 
 
 def load_reqtrack_state() -> dict[str, Any]:
@@ -1634,9 +1828,8 @@ def load_reqtrack_state() -> dict[str, Any]:
 
 def save_reqtrack_state(state: dict[str, Any]) -> bool:
     try:
-        REQTRACK_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
         state["updated_at"] = int(time.time())
-        REQTRACK_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        write_json_state(REQTRACK_STATE_PATH, state)
         return True
     except Exception as exc:
         print(f"[telegram-bridge] failed to save reqtrack state: {exc}", flush=True)
@@ -2062,6 +2255,8 @@ TEXTBOOK_SEARCH_PROVIDERS = {
 }
 if not TEXTBOOK_SEARCH_PROVIDERS:
     TEXTBOOK_SEARCH_PROVIDERS = {"googlebooks", "openlibrary"}
+TEXTBOOK_PROVIDER_METRICS: dict[str, dict[str, Any]] = {}
+TEXTBOOK_PROVIDER_METRICS_LOCK = threading.Lock()
 
 
 def normalize_content_rating(value: str) -> str:
@@ -2217,6 +2412,37 @@ if isinstance(policy_role_allowlist, dict):
             ROLE_COMMAND_ALLOWLIST[role_key] = parsed_allowlist
 
 
+def build_static_policy_payload() -> tuple[dict[str, Any], dict[str, Any], str]:
+    # Policy is loaded once at startup (a change needs a restart), so these sections are built once, not per chat message.
+    policy_rate_limit_rpm = POLICY_TELEGRAM_SETTINGS.get("rate_limit_requests_per_minute")
+    policy_rate_limit_burst = POLICY_TELEGRAM_SETTINGS.get("rate_limit_burst")
+    per_message = {
+        "role_command_allowlists": {role: sorted(tokens) for role, tokens in ROLE_COMMAND_ALLOWLIST.items()},
+        "policy_rate_limit_window_seconds": int(RATE_LIMIT_WINDOW_SECONDS),
+        "policy_rate_limit_max_requests": int(RATE_LIMIT_MAX_REQUESTS),
+        "policy_rate_limit_requests_per_minute": int(policy_rate_limit_rpm) if isinstance(policy_rate_limit_rpm, int) and policy_rate_limit_rpm > 0 else None,
+        "policy_rate_limit_burst": int(policy_rate_limit_burst) if isinstance(policy_rate_limit_burst, int) and policy_rate_limit_burst >= 0 else None,
+    }
+    child_media = {
+        "child_media_allowed_ratings": sorted(CHILD_MEDIA_ALLOWED_RATINGS),
+        "child_media_allowed_ratings_under_13": sorted(CHILD_MEDIA_ALLOWED_RATINGS_UNDER_13),
+        "child_media_allowed_ratings_13_15": sorted(CHILD_MEDIA_ALLOWED_RATINGS_13_15),
+        "child_media_allowed_ratings_16_17": sorted(CHILD_MEDIA_ALLOWED_RATINGS_16_17),
+        "child_media_block_if_adult_flag": bool(CHILD_MEDIA_BLOCK_IF_ADULT_FLAG),
+        "child_media_blocked_genre_ids": sorted(CHILD_MEDIA_BLOCKED_GENRE_IDS),
+        "child_media_blocked_keywords": sorted(CHILD_MEDIA_BLOCKED_KEYWORDS),
+    }
+    canonical = json.dumps({"per_message": per_message, "child_media": child_media}, sort_keys=True, separators=(",", ":"))
+    return per_message, child_media, hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+POLICY_PAYLOAD_PER_MESSAGE, POLICY_PAYLOAD_CHILD_MEDIA, POLICY_PAYLOAD_VERSION = build_static_policy_payload()
+
+
+def write_json_state(path: pathlib.Path, state: Any) -> None:
+    write_state_file(path, state, pretty=STATE_JSON_PRETTY, fsync=STATE_FSYNC)
+
+
 def utc_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
@@ -2329,8 +2555,7 @@ def load_user_registry() -> dict[str, Any]:
 
 
 def save_user_registry(registry: dict[str, Any]) -> None:
-    USER_REGISTRY_PATH.parent.mkdir(parents=True, exist_ok=True)
-    USER_REGISTRY_PATH.write_text(json.dumps(registry, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(USER_REGISTRY_PATH, registry)
 
 
 def get_user_record(registry: dict[str, Any], user_id: int) -> dict[str, Any] | None:
@@ -2398,8 +2623,7 @@ def load_approvals() -> dict[str, Any]:
 
 
 def save_approvals(state: dict[str, Any]) -> None:
-    APPROVALS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    APPROVALS_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(APPROVALS_PATH, state)
 
 
 APPROVALS_STATE = load_approvals()
@@ -2421,8 +2645,7 @@ def load_media_selection_state() -> dict[str, Any]:
 
 
 def save_media_selection_state(state: dict[str, Any]) -> None:
-    MEDIA_SELECTION_PATH.parent.mkdir(parents=True, exist_ok=True)
-    MEDIA_SELECTION_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(MEDIA_SELECTION_PATH, state)
 
 
 MEDIA_SELECTION_STATE = load_media_selection_state()
@@ -2450,8 +2673,7 @@ def load_textbook_state() -> dict[str, Any]:
 
 
 def save_textbook_state(state: dict[str, Any]) -> None:
-    TEXTBOOK_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    TEXTBOOK_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(TEXTBOOK_STATE_PATH, state)
 
 
 TEXTBOOK_STATE = load_textbook_state()
@@ -2462,27 +2684,137 @@ TEXTBOOK_DOWNLOAD_LAST_CLEANUP_TS = 0
 
 def load_textbook_download_state() -> dict[str, Any]:
     if not TEXTBOOK_DOWNLOAD_STATE_PATH.exists():
-        return {"entries": {}}
+        return {"entries": {}, "blobs": {}, "sources": {}}
     try:
         data = json.loads(TEXTBOOK_DOWNLOAD_STATE_PATH.read_text(encoding="utf-8"))
         if not isinstance(data, dict):
-            return {"entries": {}}
-        entries = data.get("entries")
-        if not isinstance(entries, dict):
-            data["entries"] = {}
+            return {"entries": {}, "blobs": {}, "sources": {}}
+        for key in ("entries", "blobs", "sources"):
+            if not isinstance(data.get(key), dict):
+                data[key] = {}
         return data
     except Exception:
-        return {"entries": {}}
+        return {"entries": {}, "blobs": {}, "sources": {}}
 
 
 def save_textbook_download_state(state: dict[str, Any]) -> None:
-    TEXTBOOK_DOWNLOAD_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    TEXTBOOK_DOWNLOAD_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(TEXTBOOK_DOWNLOAD_STATE_PATH, state)
 
 
 TEXTBOOK_DOWNLOAD_STATE = load_textbook_download_state()
 
 
+def load_textbook_search_cache() -> OrderedDict[str, dict[str, Any]]:
+    cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+    if not TEXTBOOK_SEARCH_CACHE_PATH.exists():
+        return cache
+    try:
+        data = json.loads(TEXTBOOK_SEARCH_CACHE_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        return cache
+    entries = data.get("entries") if isinstance(data, dict) else None
+    if not isinstance(entries, dict):
+        return cache
+    for key, entry in entries.items():
+        if isinstance(key, str) and isinstance(entry, dict) and isinstance(entry.get("results"), list):
+            cache[key] = entry
+    return cache
+
+
+def save_textbook_search_cache(cache: OrderedDict[str, dict[str, Any]]) -> None:
+    write_json_state(TEXTBOOK_SEARCH_CACHE_PATH, {"entries": dict(cache), "updated_at": utc_now()})
+
+
+TEXTBOOK_SEARCH_CACHE = load_textbook_search_cache()
+TEXTBOOK_SEARCH_CACHE_LOCK = threading.Lock()
+TEXTBOOK_SEARCH_CACHE_COUNTERS = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+TEXTBOOK_SEARCH_CACHE_PERSIST = {"dirty": False, "last_save": 0.0}
+
+
+def textbook_search_cache_key(provider: str, parsed_fields: dict[str, str], details: str, limit: int) -> str:
+    # Providers cap their result list at limit, so an entry stored for a smaller limit cannot answer a larger one.
+    prefix = f"{provider}|n:{max(1, int(limit))}"
+    isbn = re.sub(r"[^0-9X]", "", str(parsed_fields.get("isbn", "")).upper())
+    if isbn:
+        return f"{prefix}|isbn:{isbn}"
+    title = normalize_match_text(str(parsed_fields.get("title", "")))
+    author = normalize_match_text(str(parsed_fields.get("author", "")))
+    if title or author:
+        return f"{prefix}|ta:{title}|{author}"
+    return f"{prefix}|q:{normalize_match_text(details)[:200]}"
+
+
+def get_textbook_search_cache(key: str, now_ts: int | None = None) -> list[dict[str, str]] | None:
+    if not TEXTBOOK_SEARCH_CACHE_ENABLED:
+        return None
+    ts_now = int(now_ts or time.time())
+    with TEXTBOOK_SEARCH_CACHE_LOCK:
+        entry = TEXTBOOK_SEARCH_CACHE.get(key)
+        if not isinstance(entry, dict):
+            TEXTBOOK_SEARCH_CACHE_COUNTERS["misses"] += 1
+            return None
+        try:
+            cached_at = int(entry.get("cached_at", 0) or 0)
+        except (TypeError, ValueError):
+            cached_at = 0
+        if ts_now - cached_at > max(60, TEXTBOOK_SEARCH_CACHE_TTL_SECONDS):
+            TEXTBOOK_SEARCH_CACHE.pop(key, None)
+            TEXTBOOK_SEARCH_CACHE_COUNTERS["misses"] += 1
+            return None
+        TEXTBOOK_SEARCH_CACHE.move_to_end(key)
+        TEXTBOOK_SEARCH_CACHE_COUNTERS["hits"] += 1
+        return [dict(item) for item in entry.get("results", []) if isinstance(item, dict)]
+
+
+def put_textbook_search_cache(key: str, results: list[dict[str, str]], now_ts: int | None = None) -> None:
+    if not TEXTBOOK_SEARCH_CACHE_ENABLED:
+        return
+    with TEXTBOOK_SEARCH_CACHE_LOCK:
+        TEXTBOOK_SEARCH_CACHE[key] = {"cached_at": int(now_ts or time.time()), "results": [dict(item) for item in results]}
+        TEXTBOOK_SEARCH_CACHE.move_to_end(key)
+        TEXTBOOK_SEARCH_CACHE_COUNTERS["stores"] += 1
+        TEXTBOOK_SEARCH_CACHE_PERSIST["dirty"] = True
+        while len(TEXTBOOK_SEARCH_CACHE) > max(1, TEXTBOOK_SEARCH_CACHE_MAX_ENTRIES):
+            TEXTBOOK_SEARCH_CACHE.popitem(last=False)
+            TEXTBOOK_SEARCH_CACHE_COUNTERS["evictions"] += 1
+
+
+def flush_textbook_search_cache(min_interval_seconds: float = 0.0) -> bool:
+    # Stores only mark the cache dirty; the poll loop writes it at most once per interval, so a burst of
+    # provider misses costs one file rewrite instead of one per lookup.
+    if not TEXTBOOK_SEARCH_CACHE_ENABLED or not TEXTBOOK_SEARCH_CACHE_PERSIST["dirty"]:
+        return False
+    now = time.monotonic()
+    if now - float(TEXTBOOK_SEARCH_CACHE_PERSIST["last_save"]) < min_interval_seconds:
+        return False
+    with TEXTBOOK_SEARCH_CACHE_LOCK:
+        snapshot = OrderedDict(TEXTBOOK_SEARCH_CACHE)
+        TEXTBOOK_SEARCH_CACHE_PERSIST["dirty"] = False
+    TEXTBOOK_SEARCH_CACHE_PERSIST["last_save"] = now
+    try:
+        save_textbook_search_cache(snapshot)
+    except Exception as exc:
+        TEXTBOOK_SEARCH_CACHE_PERSIST["dirty"] = True
+        print(f"[telegram-bridge] textbook search cache save failed: {exc}", flush=True)
+        return False
+    return True
+
+
+def textbook_search_cache_snapshot() -> dict[str, Any]:
+    with TEXTBOOK_SEARCH_CACHE_LOCK:
+        hits = int(TEXTBOOK_SEARCH_CACHE_COUNTERS["hits"])
+        misses = int(TEXTBOOK_SEARCH_CACHE_COUNTERS["misses"])
+        return {
+            "enabled": bool(TEXTBOOK_SEARCH_CACHE_ENABLED),
+            "entries": len(TEXTBOOK_SEARCH_CACHE),
+            "hits": hits,
+            "misses": misses,
+            "stores": int(TEXTBOOK_SEARCH_CACHE_COUNTERS["stores"]),
+            "evictions": int(TEXTBOOK_SEARCH_CACHE_COUNTERS["evictions"]),
+            "hit_rate": round(hits / (hits + misses), 3) if (hits + misses) > 0 else 0.0,
+        }
+
+
 def textbook_download_base_url() -> str:
     if TEXTBOOK_DOWNLOAD_PUBLIC_BASE_URL:
         return TEXTBOOK_DOWNLOAD_PUBLIC_BASE_URL
@@ -2514,15 +2846,58 @@ def _safe_textbook_filename(title: str, source_url: str, content_type: str) -> s
     return base[:140]
 
 
+TEXTBOOK_DOWNLOAD_STORE_COUNTERS = {"fetches": 0, "source_reuse": 0, "content_dedupe": 0}
+
+
+def _textbook_download_state_section(key: str) -> dict[str, Any]:
+    section = TEXTBOOK_DOWNLOAD_STATE.setdefault(key, {})
+    if not isinstance(section, dict):
+        section = {}
+        TEXTBOOK_DOWNLOAD_STATE[key] = section
+    return section
+
+
+def _release_textbook_download_entry(entry: dict[str, Any]) -> int:
+    """Drop one reference to the entry's blob; caller holds TEXTBOOK_DOWNLOAD_STATE_LOCK."""
+    blobs = _textbook_download_state_section("blobs")
+    content_sha256 = str(entry.get("sha256", "")).strip()
+    blob = blobs.get(content_sha256) if content_sha256 else None
+    if not isinstance(blob, dict):
+        file_path = pathlib.Path(str(entry.get("file_path", "")).strip())
+        if file_path.is_file() and file_path.parent.resolve() != TEXTBOOK_DOWNLOAD_BLOBS_DIR.resolve():
+            try:
+                file_path.unlink()
+                return 1
+            except Exception:
+                return 0
+        return 0
+
+    refs = max(0, parse_int(str(blob.get("refs", "0")), 0) - 1)
+    if refs > 0:
+        blob["refs"] = refs
+        return 0
+
+    blobs.pop(content_sha256, None)
+    sources = _textbook_download_state_section("sources")
+    for source_key, source_entry in list(sources.items()):
+        if not isinstance(source_entry, dict) or source_entry.get("sha256") == content_sha256:
+            sources.pop(source_key, None)
+    blob_path = pathlib.Path(str(blob.get("path", "")).strip())
+    if blob_path.is_file():
+        try:
+            blob_path.unlink()
+            return 1
+        except Exception:
+            return 0
+    return 0
+
+
 def cleanup_expired_textbook_downloads(now_ts: int | None = None) -> tuple[int, int]:
     ts_now = int(now_ts or time.time())
     removed_entries = 0
     removed_files = 0
     with TEXTBOOK_DOWNLOAD_STATE_LOCK:
-        entries = TEXTBOOK_DOWNLOAD_STATE.setdefault("entries", {})
-        if not isinstance(entries, dict):
-            entries = {}
-            TEXTBOOK_DOWNLOAD_STATE["entries"] = entries
+        entries = _textbook_download_state_section("entries")
 
         for token, entry in list(entries.items()):
             if not isinstance(entry, dict):
@@ -2538,19 +2913,88 @@ def cleanup_expired_textbook_downloads(now_ts: int | None = None) -> tuple[int,
             missing = not file_path.exists()
             if not expired and not missing:
                 continue
-            if file_path.exists():
-                try:
-                    file_path.unlink()
-                    removed_files += 1
-                except Exception:
-                    pass
+            removed_files += _release_textbook_download_entry(entry)
             entries.pop(token, None)
             removed_entries += 1
 
+        known_blobs = set(_textbook_download_state_section("blobs"))
         save_textbook_download_state(TEXTBOOK_DOWNLOAD_STATE)
+
+    stale_globs = [(TEXTBOOK_DOWNLOAD_FILES_DIR, ".partial-*"), (TEXTBOOK_DOWNLOAD_BLOBS_DIR, "*")]
+    for directory, pattern in stale_globs:
+        if not directory.exists():
+            continue
+        for candidate in directory.glob(pattern):
+            if directory == TEXTBOOK_DOWNLOAD_BLOBS_DIR and candidate.name in known_blobs:
+                continue
+            try:
+                if candidate.is_file() and ts_now - int(candidate.stat().st_mtime) > 3600:
+                    candidate.unlink()
+                    removed_files += 1
+            except Exception:
+                pass
     return removed_entries, removed_files
 
 
+def textbook_download_store_snapshot() -> dict[str, int]:
+    with TEXTBOOK_DOWNLOAD_STATE_LOCK:
+        entries = _textbook_download_state_section("entries")
+        blobs = _textbook_download_state_section("blobs")
+        blob_bytes = sum(parse_int(str(blob.get("size_bytes", "0")), 0) for blob in blobs.values() if isinstance(blob, dict))
+        snapshot = {"entries": len(entries), "blobs": len(blobs), "blob_bytes": blob_bytes}
+        snapshot.update({key: int(value) for key, value in TEXTBOOK_DOWNLOAD_STORE_COUNTERS.items()})
+    return snapshot
+
+
+def stream_textbook_source_to_file(
+    source_url: str,
+    max_bytes: int,
+    timeout: int = 45,
+) -> tuple[pathlib.Path | None, int, str, str, str]:
+    request = urllib.request.Request(
+        url=source_url,
+        headers={"User-Agent": "servernoots-telegram-bridge/1.0"},
+        method="GET",
+    )
+    temp_path: pathlib.Path | None = None
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response_content_type = str(response.headers.get("Content-Type") or "").strip()
+            declared_length = parse_int(str(response.headers.get("Content-Length") or "-1"), -1)
+            if declared_length > max_bytes:
+                return None, 0, "", "", "file_too_large"
+            digest = hashlib.sha256()
+            size_bytes = 0
+            TEXTBOOK_DOWNLOAD_FILES_DIR.mkdir(parents=True, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(prefix=".partial-", dir=str(TEXTBOOK_DOWNLOAD_FILES_DIR))
+            temp_path = pathlib.Path(temp_name)
+            with os.fdopen(fd, "wb") as handle:
+                while True:
+                    chunk = response.read(TEXTBOOK_DOWNLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size_bytes += len(chunk)
+                    if size_bytes > max_bytes:
+                        raise OverflowError("file_too_large")
+                    digest.update(chunk)
+                    handle.write(chunk)
+                handle.flush()
+                os.fsync(handle.fileno())
+    except OverflowError:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+        return None, 0, "", "", "file_too_large"
+    except urllib.error.HTTPError as exc:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+        return None, 0, "", "", f"source_fetch_http_{exc.code}"
+    except Exception as exc:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+        return None, 0, "", "", f"source_fetch_error:{exc}"
+    return temp_path, size_bytes, digest.hexdigest(), response_content_type, "ok"
+
+
 def build_textbook_download_link(
     user_id: int,
     fulfillment_id: str,
@@ -2573,39 +3017,47 @@ def build_textbook_download_link(
         return "", 0, f"untrusted_source:{allowed_reason}"
 
     max_bytes = max(1_000_000, int(TEXTBOOK_DOWNLOAD_MAX_BYTES))
-    request = urllib.request.Request(
-        url=source,
-        headers={"User-Agent": "servernoots-telegram-bridge/1.0"},
-        method="GET",
-    )
+    now_ts = int(time.time())
+    source_key = hashlib.sha256(source.encode("utf-8", errors="ignore")).hexdigest()
+    content_sha256 = ""
+    size_bytes = 0
+    response_content_type = ""
+    temp_path: pathlib.Path | None = None
 
-    try:
-        with urllib.request.urlopen(request, timeout=45) as response:
-            raw = response.read(max_bytes + 1)
-            if len(raw) > max_bytes:
-                return "", 0, "file_too_large"
-            response_content_type = str(response.headers.get("Content-Type") or "").strip()
-    except urllib.error.HTTPError as exc:
-        return "", 0, f"source_fetch_http_{exc.code}"
-    except Exception as exc:
-        return "", 0, f"source_fetch_error:{exc}"
+    with TEXTBOOK_DOWNLOAD_STATE_LOCK:
+        source_entry = _textbook_download_state_section("sources").get(source_key)
+        if isinstance(source_entry, dict) and now_ts - parse_int(str(source_entry.get("fetched_at", "0")), 0) <= max(
+            0, TEXTBOOK_DOWNLOAD_SOURCE_REUSE_SECONDS
+        ):
+            blob = _textbook_download_state_section("blobs").get(str(source_entry.get("sha256", "")))
+            if isinstance(blob, dict) and pathlib.Path(str(blob.get("path", ""))).is_file():
+                # Reserve the reference now so cleanup cannot drop the blob before the entry lands.
+                blob["refs"] = parse_int(str(blob.get("refs", "0")), 0) + 1
+                content_sha256 = str(source_entry.get("sha256", ""))
+                size_bytes = parse_int(str(blob.get("size_bytes", "0")), 0)
+                response_content_type = str(source_entry.get("content_type", ""))
+                TEXTBOOK_DOWNLOAD_STORE_COUNTERS["source_reuse"] += 1
+
+    if not content_sha256:
+        TEXTBOOK_DOWNLOAD_BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+        temp_path, size_bytes, content_sha256, response_content_type, fetch_reason = stream_textbook_source_to_file(
+            source,
+            max_bytes=max_bytes,
+        )
+        if temp_path is None:
+            return "", 0, fetch_reason
 
     content_type = str(response_content_type or file_mime or "application/octet-stream").strip()
     ttl_seconds = max(300, int(TEXTBOOK_DOWNLOAD_TTL_SECONDS))
-    now_ts = int(time.time())
     expires_at = now_ts + ttl_seconds
-    source_hash = hashlib.sha256(source.encode("utf-8", errors="ignore")).hexdigest()[:16]
-    token_seed = f"{fulfillment_id}|{user_id}|{source_hash}|{now_ts}|{len(raw)}"
+    token_seed = f"{fulfillment_id}|{user_id}|{source_key[:16]}|{now_ts}|{size_bytes}|{content_sha256}"
     token = hashlib.sha256(token_seed.encode("utf-8", errors="ignore")).hexdigest()[:40]
 
     title = ""
     if isinstance(selected_candidate, dict):
         title = str(selected_candidate.get("title", "")).strip()
     file_name = _safe_textbook_filename(title=title, source_url=source, content_type=content_type)
-
-    TEXTBOOK_DOWNLOAD_FILES_DIR.mkdir(parents=True, exist_ok=True)
-    file_path = (TEXTBOOK_DOWNLOAD_FILES_DIR / token).resolve()
-    file_path.write_bytes(raw)
+    blob_path = (TEXTBOOK_DOWNLOAD_BLOBS_DIR / content_sha256).resolve()
 
     entry = {
         "token": token,
@@ -2614,18 +3066,46 @@ def build_textbook_download_link(
         "source_url": source,
         "content_type": content_type,
         "file_name": file_name,
-        "file_path": str(file_path),
-        "size_bytes": len(raw),
+        "file_path": str(blob_path),
+        "size_bytes": size_bytes,
+        "sha256": content_sha256,
         "created_at": now_ts,
         "expires_at": expires_at,
     }
 
     with TEXTBOOK_DOWNLOAD_STATE_LOCK:
-        entries = TEXTBOOK_DOWNLOAD_STATE.setdefault("entries", {})
-        if not isinstance(entries, dict):
-            entries = {}
-            TEXTBOOK_DOWNLOAD_STATE["entries"] = entries
-        entries[token] = entry
+        blobs = _textbook_download_state_section("blobs")
+        if temp_path is not None:
+            TEXTBOOK_DOWNLOAD_STORE_COUNTERS["fetches"] += 1
+            blob = blobs.get(content_sha256)
+            if isinstance(blob, dict) and blob_path.is_file():
+                temp_path.unlink(missing_ok=True)
+                blob["refs"] = parse_int(str(blob.get("refs", "0")), 0) + 1
+                TEXTBOOK_DOWNLOAD_STORE_COUNTERS["content_dedupe"] += 1
+            else:
+                try:
+                    os.replace(temp_path, blob_path)
+                except Exception as exc:
+                    temp_path.unlink(missing_ok=True)
+                    return "", 0, f"store_failed:{exc}"
+                if isinstance(blob, dict):
+                    # The record outlived its file: restore the file but keep the other entries' references.
+                    blob["path"] = str(blob_path)
+                    blob["size_bytes"] = size_bytes
+                    blob["refs"] = parse_int(str(blob.get("refs", "0")), 0) + 1
+                else:
+                    blobs[content_sha256] = {
+                        "path": str(blob_path),
+                        "size_bytes": size_bytes,
+                        "refs": 1,
+                        "created_at": now_ts,
+                    }
+            _textbook_download_state_section("sources")[source_key] = {
+                "sha256": content_sha256,
+                "content_type": str(response_content_type or ""),
+                "fetched_at": now_ts,
+            }
+        _textbook_download_state_section("entries")[token] = entry
         save_textbook_download_state(TEXTBOOK_DOWNLOAD_STATE)
 
     base = textbook_download_base_url().rstrip("/")
@@ -2650,22 +3130,82 @@ def get_textbook_download_entry(token: str) -> dict[str, Any] | None:
         except (TypeError, ValueError):
             expires_at = 0
         if expires_at <= 0 or int(time.time()) > expires_at:
-            file_path = pathlib.Path(str(entry.get("file_path", "")).strip())
-            if file_path.exists():
-                try:
-                    file_path.unlink()
-                except Exception:
-                    pass
+            _release_textbook_download_entry(entry)
             entries.pop(candidate, None)
             save_textbook_download_state(TEXTBOOK_DOWNLOAD_STATE)
             return None
         return dict(entry)
 
 
+TEXTBOOK_DOWNLOAD_SERVE_METRICS: dict[str, Any] = {
+    "requests": 0,
+    "full": 0,
+    "partial": 0,
+    "not_modified": 0,
+    "range_unsatisfiable": 0,
+    "errors": 0,
+    "bytes_sent": 0,
+    "total_seconds": 0.0,
+    "last_throughput_bps": 0,
+    "max_throughput_bps": 0,
+}
+TEXTBOOK_DOWNLOAD_SERVE_METRICS_LOCK = threading.Lock()
+
+
+def record_textbook_download_serve_metric(outcome: str, bytes_sent: int = 0, seconds: float = 0.0) -> None:
+    with TEXTBOOK_DOWNLOAD_SERVE_METRICS_LOCK:
+        TEXTBOOK_DOWNLOAD_SERVE_METRICS["requests"] += 1
+        if outcome in TEXTBOOK_DOWNLOAD_SERVE_METRICS:
+            TEXTBOOK_DOWNLOAD_SERVE_METRICS[outcome] += 1
+        if bytes_sent <= 0:
+            return
+        TEXTBOOK_DOWNLOAD_SERVE_METRICS["bytes_sent"] += int(bytes_sent)
+        TEXTBOOK_DOWNLOAD_SERVE_METRICS["total_seconds"] += max(0.0, seconds)
+        throughput = int(bytes_sent / max(seconds, 0.001))
+        TEXTBOOK_DOWNLOAD_SERVE_METRICS["last_throughput_bps"] = throughput
+        TEXTBOOK_DOWNLOAD_SERVE_METRICS["max_throughput_bps"] = max(
+            int(TEXTBOOK_DOWNLOAD_SERVE_METRICS["max_throughput_bps"]),
+            throughput,
+        )
+
+
+def textbook_download_serve_metrics_snapshot() -> dict[str, Any]:
+    with TEXTBOOK_DOWNLOAD_SERVE_METRICS_LOCK:
+        snapshot = dict(TEXTBOOK_DOWNLOAD_SERVE_METRICS)
+    total_seconds = float(snapshot.pop("total_seconds", 0.0))
+    snapshot["avg_throughput_bps"] = int(snapshot["bytes_sent"] / total_seconds) if total_seconds > 0 else 0
+    return snapshot
+
+
+def parse_http_byte_range(header_value: str, size_bytes: int) -> tuple[int, int] | None:
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", str(header_value or ""))
+    if not match or size_bytes <= 0:
+        return None
+    start_raw, end_raw = match.group(1), match.group(2)
+    if not start_raw and not end_raw:
+        return None
+    if not start_raw:
+        suffix = int(end_raw)
+        if suffix <= 0:
+            return None
+        return max(0, size_bytes - suffix), size_bytes - 1
+    start = int(start_raw)
+    end = int(end_raw) if end_raw else size_bytes - 1
+    if start >= size_bytes or end < start:
+        return None
+    return start, min(end, size_bytes - 1)
+
+
 class TextbookDownloadHandler(BaseHTTPRequestHandler):
     server_version = "TelegramTextbookDownload/1.0"
 
+    def do_HEAD(self) -> None:
+        self._serve(send_body=False)
+
     def do_GET(self) -> None:
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool) -> None:
         parsed = urllib.parse.urlparse(self.path)
         route = str(parsed.path or "").strip()
         prefix = "/textbook-download/"
@@ -2680,27 +3220,98 @@ class TextbookDownloadHandler(BaseHTTPRequestHandler):
             return
 
         file_path = pathlib.Path(str(entry.get("file_path", "")).strip())
-        if not file_path.exists():
+        try:
+            handle = file_path.open("rb")
+        except FileNotFoundError:
             self.send_error(410, "expired_or_missing")
             return
-
-        try:
-            content = file_path.read_bytes()
         except Exception:
+            record_textbook_download_serve_metric("errors")
             self.send_error(500, "file_read_failed")
             return
 
-        content_type = str(entry.get("content_type") or "application/octet-stream").strip() or "application/octet-stream"
-        file_name = str(entry.get("file_name") or "textbook-download.bin").strip() or "textbook-download.bin"
-        quoted = urllib.parse.quote(file_name)
+        with handle:
+            size_bytes = os.fstat(handle.fileno()).st_size
+            etag = f"\"{str(entry.get('sha256') or token).strip()}\""
+            content_type = str(entry.get("content_type") or "application/octet-stream").strip() or "application/octet-stream"
+            file_name = str(entry.get("file_name") or "textbook-download.bin").strip() or "textbook-download.bin"
+            quoted = urllib.parse.quote(file_name)
+
+            if_none_match = str(self.headers.get("If-None-Match") or "").strip()
+            if if_none_match and (if_none_match == "*" or etag in [item.strip() for item in if_none_match.split(",")]):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                record_textbook_download_serve_metric("not_modified")
+                return
+
+            start, end = 0, size_bytes - 1
+            status = 200
+            range_header = str(self.headers.get("Range") or "").strip()
+            if_range = str(self.headers.get("If-Range") or "").strip()
+            if range_header and (not if_range or if_range == etag):
+                byte_range = parse_http_byte_range(range_header, size_bytes)
+                if byte_range is None:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size_bytes}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    record_textbook_download_serve_metric("range_unsatisfiable")
+                    return
+                start, end = byte_range
+                status = 206
+            length = max(0, end - start + 1)
+
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size_bytes}")
+            self.send_header("Content-Disposition", f"attachment; filename=\"{file_name}\"; filename*=UTF-8''{quoted}")
+            self.send_header("Cache-Control", "private, no-cache")
+            self.end_headers()
+            if not send_body or length <= 0:
+                return
+
+            started = time.monotonic()
+            try:
+                sent = self._send_file_range(handle, start, length)
+            except (BrokenPipeError, ConnectionResetError):
+                record_textbook_download_serve_metric("errors")
+                return
+            record_textbook_download_serve_metric(
+                "partial" if status == 206 else "full",
+                bytes_sent=sent,
+                seconds=time.monotonic() - started,
+            )
 
-        self.send_response(200)
-        self.send_header("Content-Type", content_type)
-        self.send_header("Content-Length", str(len(content)))
-        self.send_header("Content-Disposition", f"attachment; filename=\"{file_name}\"; filename*=UTF-8''{quoted}")
-        self.send_header("Cache-Control", "private, no-store, max-age=0")
-        self.end_headers()
-        self.wfile.write(content)
+    def _send_file_range(self, handle: Any, start: int, length: int) -> int:
+        self.wfile.flush()
+        sent = 0
+        if hasattr(os, "sendfile"):
+            try:
+                socket_fd = self.connection.fileno()
+                while sent < length:
+                    count = os.sendfile(socket_fd, handle.fileno(), start + sent, min(length - sent, 1 << 20))
+                    if count <= 0:
+                        break
+                    sent += count
+                if sent >= length:
+                    return sent
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except (OSError, ValueError):
+                pass
+        handle.seek(start + sent)
+        while sent < length:
+            chunk = handle.read(min(TEXTBOOK_DOWNLOAD_CHUNK_BYTES, length - sent))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            sent += len(chunk)
+        return sent
 
     def log_message(self, _format: str, *_args: Any) -> None:
         return
@@ -2746,8 +3357,7 @@ def load_workspace_state() -> dict[str, Any]:
 
 
 def save_workspace_state(state: dict[str, Any]) -> None:
-    WORKSPACE_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    WORKSPACE_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(WORKSPACE_STATE_PATH, state)
 
 
 WORKSPACE_STATE = load_workspace_state()
@@ -2770,8 +3380,7 @@ def load_research_state() -> dict[str, Any]:
 
 
 def save_research_state(state: dict[str, Any]) -> None:
-    RESEARCH_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    RESEARCH_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(RESEARCH_STATE_PATH, state)
 
 
 RESEARCH_STATE = load_research_state()
@@ -2843,6 +3452,245 @@ def apply_research_webhook_result(run_id: str, result: dict[str, Any] | str | No
     return job
 
 
+# Long-running n8n calls (research, textbook fulfillment, ingest) run on worker threads. Job records live in
+# RESEARCH_STATE["background_jobs"] so queued/running work is resumed after a restart; finish handlers run on the
+# poll thread via BACKGROUND_JOB_COMPLETIONS because they touch the unlocked per-feature state dicts.
+BACKGROUND_JOB_HANDLERS: dict[str, tuple[Callable[[dict[str, Any]], dict[str, Any]], Callable[[dict[str, Any], dict[str, Any] | None, str], None]]] = {}
+BACKGROUND_JOB_QUEUE: queue.Queue[str] = queue.Queue()
+BACKGROUND_JOB_COMPLETIONS: queue.Queue[tuple[str, dict[str, Any] | None, str]] = queue.Queue()
+BACKGROUND_JOB_METRICS: dict[str, dict[str, float]] = {}
+BACKGROUND_JOB_METRICS_LOCK = threading.Lock()
+BACKGROUND_JOB_WORKERS_STARTED = False
+
+
+def _background_jobs() -> dict[str, Any]:
+    jobs = RESEARCH_STATE.get("background_jobs")
+    if not isinstance(jobs, dict):
+        jobs = {}
+        RESEARCH_STATE["background_jobs"] = jobs
+    return jobs
+
+
+def record_background_job_metric(kind: str, status: str, wait_seconds: float, run_seconds: float) -> None:
+    with BACKGROUND_JOB_METRICS_LOCK:
+        metrics = BACKGROUND_JOB_METRICS.setdefault(
+            kind,
+            {"done": 0, "failed": 0, "total_run_seconds": 0.0, "max_run_seconds": 0.0, "total_wait_seconds": 0.0},
+        )
+        metrics["failed" if status == "failed" else "done"] += 1
+        metrics["total_run_seconds"] += max(0.0, run_seconds)
+        metrics["max_run_seconds"] = max(metrics["max_run_seconds"], run_seconds)
+        metrics["total_wait_seconds"] += max(0.0, wait_seconds)
+
+
+def background_jobs_snapshot() -> dict[str, Any]:
+    with RESEARCH_STATE_LOCK:
+        jobs = list(_background_jobs().values())
+    queued = sum(1 for job in jobs if isinstance(job, dict) and job.get("status") == "queued")
+    running = sum(1 for job in jobs if isinstance(job, dict) and job.get("status") == "running")
+    kinds: dict[str, dict[str, Any]] = {}
+    with BACKGROUND_JOB_METRICS_LOCK:
+        for kind, metrics in BACKGROUND_JOB_METRICS.items():
+            finished = int(metrics["done"] + metrics["failed"])
+            kinds[kind] = {
+                "done": int(metrics["done"]),
+                "failed": int(metrics["failed"]),
+                "avg_run_seconds": round(metrics["total_run_seconds"] / finished, 2) if finished else 0.0,
+                "max_run_seconds": round(metrics["max_run_seconds"], 2),
+                "avg_wait_seconds": round(metrics["total_wait_seconds"] / finished, 2) if finished else 0.0,
+            }
+    return {"workers": BACKGROUND_JOB_WORKERS, "queued": queued, "running": running, "kinds": kinds}
+
+
+def enqueue_background_job(kind: str, user_id: int, chat_id: int, payload: dict[str, Any]) -> str:
+    now = time.time()
+    job_id = f"bg-{int(now)}-{hashlib.sha256(f'{kind}:{user_id}:{now}'.encode('utf-8')).hexdigest()[:10]}"
+    job = {
+        "job_id": job_id,
+        "kind": kind,
+        "user_id": int(user_id),
+        "chat_id": int(chat_id),
+        "status": "queued",
+        "payload": payload,
+        "attempts": 0,
+        "enqueued_at": now,
+        "started_at": 0,
+        "finished_at": 0,
+        "error": "",
+    }
+    with RESEARCH_STATE_LOCK:
+        _background_jobs()[job_id] = job
+        save_research_state(RESEARCH_STATE)
+    BACKGROUND_JOB_QUEUE.put(job_id)
+    if not BACKGROUND_JOB_WORKERS_STARTED or BACKGROUND_JOB_WORKERS <= 0:
+        run_background_jobs_inline()
+    return job_id
+
+
+def _execute_background_job(job_id: str) -> None:
+    with RESEARCH_STATE_LOCK:
+        job = _background_jobs().get(job_id)
+        if not isinstance(job, dict) or job.get("status") != "queued":
+            return
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        job["attempts"] = int(job.get("attempts", 0) or 0) + 1
+        save_research_state(RESEARCH_STATE)
+        snapshot = dict(job)
+
+    handlers = BACKGROUND_JOB_HANDLERS.get(str(snapshot.get("kind", "")))
+    outcome: dict[str, Any] | None = None
+    error = ""
+    if handlers is None:
+        error = f"unknown_job_kind:{snapshot.get('kind')}"
+    else:
+        try:
+            outcome = handlers[0](snapshot)
+        except urllib.error.HTTPError as exc:
+            error = f"HTTP {exc.code}"
+        except Exception as exc:
+            error = str(exc)[:400] or exc.__class__.__name__
+    BACKGROUND_JOB_COMPLETIONS.put((job_id, outcome, error))
+
+
+def _run_background_job_worker() -> None:
+    while True:
+        _execute_background_job(BACKGROUND_JOB_QUEUE.get())
+
+
+def run_background_jobs_inline() -> int:
+    # Without a worker pool (TELEGRAM_BACKGROUND_JOB_WORKERS=0, or the module driven directly rather than via
+    # main()) jobs run to completion on the calling thread, so handlers keep their synchronous contract.
+    ran = 0
+    while True:
+        try:
+            job_id = BACKGROUND_JOB_QUEUE.get_nowait()
+        except queue.Empty:
+            break
+        _execute_background_job(job_id)
+        ran += 1
+    if ran:
+        drain_background_job_completions()
+    return ran
+
+
+def start_background_job_workers() -> int:
+    global BACKGROUND_JOB_WORKERS_STARTED
+    if BACKGROUND_JOB_WORKERS_STARTED:
+        return 0
+    BACKGROUND_JOB_WORKERS_STARTED = True
+
+    resumed: list[dict[str, Any]] = []
+    abandoned: list[dict[str, Any]] = []
+    with RESEARCH_STATE_LOCK:
+        for job in _background_jobs().values():
+            if not isinstance(job, dict) or job.get("status") not in {"queued", "running"}:
+                continue
+            if int(job.get("attempts", 0) or 0) >= BACKGROUND_JOB_MAX_ATTEMPTS:
+                job["status"] = "failed"
+                job["error"] = "max_attempts_exceeded"
+                job["finished_at"] = time.time()
+                abandoned.append(dict(job))
+                continue
+            job["status"] = "queued"
+            resumed.append(job)
+        if resumed or abandoned:
+            save_research_state(RESEARCH_STATE)
+
+    for job in sorted(resumed, key=lambda item: float(item.get("enqueued_at", 0) or 0)):
+        BACKGROUND_JOB_QUEUE.put(str(job.get("job_id", "")))
+    for job in abandoned:
+        handlers = BACKGROUND_JOB_HANDLERS.get(str(job.get("kind", "")))
+        if handlers is not None:
+            try:
+                handlers[1](job, None, "max_attempts_exceeded")
+            except Exception as exc:
+                print(f"[telegram-bridge] background job finish failed job_id={job.get('job_id')}: {exc}", flush=True)
+
+    for index in range(BACKGROUND_JOB_WORKERS):
+        threading.Thread(target=_run_background_job_worker, name=f"background-job-{index}", daemon=True).start()
+    if BACKGROUND_JOB_WORKERS <= 0:
+        run_background_jobs_inline()
+    if resumed:
+        print(f"[telegram-bridge] resumed {len(resumed)} background job(s) after restart", flush=True)
+    return len(resumed)
+
+
+def count_active_background_jobs(kind: str, user_id: int) -> int:
+    with RESEARCH_STATE_LOCK:
+        return sum(
+            1
+            for job in _background_jobs().values()
+            if isinstance(job, dict)
+            and job.get("kind") == kind
+            and int(job.get("user_id", 0) or 0) == int(user_id)
+            and job.get("status") in {"queued", "running"}
+        )
+
+
+def background_job_poll_timeout(default: int) -> int:
+    # Completions are only posted when the poll loop comes round, so getUpdates returns at once while one is
+    # waiting and long-polls for at most BACKGROUND_JOB_POLL_TIMEOUT while a job is running.
+    if not BACKGROUND_JOB_COMPLETIONS.empty():
+        return 0
+    with RESEARCH_STATE_LOCK:
+        active = any(isinstance(job, dict) and job.get("status") in {"queued", "running"} for job in _background_jobs().values())
+    return min(default, BACKGROUND_JOB_POLL_TIMEOUT) if active else default
+
+
+def drain_background_job_completions() -> int:
+    drained = 0
+    while True:
+        try:
+            job_id, outcome, error = BACKGROUND_JOB_COMPLETIONS.get_nowait()
+        except queue.Empty:
+            break
+        drained += 1
+        now = time.time()
+        with RESEARCH_STATE_LOCK:
+            job = _background_jobs().get(job_id)
+            if not isinstance(job, dict):
+                continue
+            job["status"] = "failed" if error else "done"
+            job["error"] = error
+            job["finished_at"] = now
+            save_research_state(RESEARCH_STATE)
+            snapshot = dict(job)
+
+        started_at = float(snapshot.get("started_at", 0) or 0)
+        enqueued_at = float(snapshot.get("enqueued_at", 0) or 0)
+        kind = str(snapshot.get("kind", ""))
+        record_background_job_metric(kind, snapshot["status"], started_at - enqueued_at, now - started_at)
+        print(
+            f"[telegram-bridge] background job {snapshot['status']} kind={kind} job_id={job_id} "
+            f"run_s={now - started_at:.1f}{f' error={error}' if error else ''}",
+            flush=True,
+        )
+        handlers = BACKGROUND_JOB_HANDLERS.get(kind)
+        if handlers is None:
+            continue
+        try:
+            handlers[1](snapshot, outcome, error)
+        except Exception as exc:
+            print(f"[telegram-bridge] background job finish failed job_id={job_id}: {exc}", flush=True)
+
+    if drained:
+        cutoff = time.time() - BACKGROUND_JOB_RETENTION_SECONDS
+        with RESEARCH_STATE_LOCK:
+            jobs = _background_jobs()
+            stale = [
+                job_id
+                for job_id, job in jobs.items()
+                if not isinstance(job, dict)
+                or (job.get("status") in {"done", "failed"} and float(job.get("finished_at", 0) or 0) < cutoff)
+            ]
+            for job_id in stale:
+                jobs.pop(job_id, None)
+            if stale:
+                save_research_state(RESEARCH_STATE)
+    return drained
+
+
 def is_valid_email(value: str) -> bool:
     email = str(value or "").strip()
     if not email or len(email) > 254:
@@ -2949,41 +3797,139 @@ def set_workspace(user_id: int, entry: dict[str, Any]) -> None:
     save_workspace_state(WORKSPACE_STATE)
 
 
-def delete_workspace_doc_from_qdrant(tenant_id: str, doc_id: str) -> tuple[bool, str]:
-    collection = f"day4_rag_{tenant_id}"
-    url = f"http://qdrant:6333/collections/{collection}/points/delete?wait=true"
-    payload = {
-        "filter": {
-            "must": [
-                {"key": "doc_id", "match": {"value": doc_id}},
-                {"key": "source_type", "match": {"value": "workspace_temp"}},
-            ]
-        }
+def _workspace_docs_filter(doc_ids: list[str]) -> dict[str, Any]:
+    return {
+        "must": [
+            {"key": "doc_id", "match": {"any": doc_ids}},
+            {"key": "source_type", "match": {"value": "workspace_temp"}},
+        ]
     }
-    body = json.dumps(payload).encode("utf-8")
-    request = urllib.request.Request(
-        url=url,
-        data=body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
+
+
+def rag_collection_name(tenant_id: str) -> str:
+    return f"day4_rag_{tenant_id}"
+
+
+QDRANT = QdrantClient(QDRANT_URL, timeout=QDRANT_TIMEOUT_SECONDS, pool_size=QDRANT_POOL_SIZE, api_key=QDRANT_API_KEY)
+
+
+def delete_workspace_docs_from_qdrant(tenant_id: str, doc_ids: list[str]) -> tuple[bool, str]:
+    if not doc_ids:
+        return True, "noop"
     try:
-        with urllib.request.urlopen(request, timeout=20) as response:
-            raw = response.read().decode("utf-8", errors="ignore")
-            if not raw:
-                return True, "ok"
-            parsed = json.loads(raw)
-            status = str(((parsed.get("result") or {}).get("status") or "ok")).strip().lower()
-            return (status in {"acknowledged", "completed", "ok"}, status or "ok")
-    except urllib.error.HTTPError as exc:
-        if exc.code == 404:
+        status = QDRANT.delete_points(rag_collection_name(tenant_id), _workspace_docs_filter(doc_ids), wait=False)
+    except QdrantError as exc:
+        if exc.status == 404:
             return True, "collection_missing"
-        return False, f"http_{exc.code}"
+        return False, f"http_{exc.status}" if exc.status else exc.detail
     except Exception as exc:
         return False, str(exc)
+    return (status in {"acknowledged", "completed", "ok"}, status or "ok")
+
+
+def count_workspace_docs_in_qdrant(tenant_id: str, doc_ids: list[str]) -> int | None:
+    try:
+        return QDRANT.count_points(rag_collection_name(tenant_id), _workspace_docs_filter(doc_ids), exact=True)
+    except QdrantError as exc:
+        return 0 if exc.status == 404 else None
+    except Exception:
+        return None
+
+
+def _workspace_pending_deletes() -> dict[str, Any]:
+    pending = WORKSPACE_STATE.get("pending_deletes")
+    if not isinstance(pending, dict):
+        pending = {}
+        WORKSPACE_STATE["pending_deletes"] = pending
+    return pending
+
+
+def queue_workspace_qdrant_deletes(tenant_id: str, doc_ids: list[str]) -> int:
+    fresh = [doc_id for doc_id in doc_ids if doc_id]
+    if not fresh:
+        return 0
+    pending = _workspace_pending_deletes()
+    item = pending.get(tenant_id) if isinstance(pending.get(tenant_id), dict) else {}
+    merged = list(dict.fromkeys([*(item.get("doc_ids") or []), *fresh]))
+    pending[tenant_id] = {
+        "doc_ids": merged,
+        "status": "pending",
+        "attempts": int(item.get("attempts", 0) or 0),
+        "next_at": 0,
+        "last_error": str(item.get("last_error", "")),
+    }
+    return len(fresh)
+
+
+def process_workspace_qdrant_deletes(now_ts: int | None = None, tenants: set[str] | None = None) -> dict[str, int]:
+    # One wait=false filter delete per tenant collection; a later count on the same filter confirms it and
+    # re-queues leftovers, with exponential backoff on errors.
+    now_value = int(now_ts if now_ts is not None else time.time())
+    outcome = {"deleted": 0, "failed": 0, "verified": 0, "dropped": 0}
+    pending = _workspace_pending_deletes()
+    changed = False
+    for tenant_id in list(pending.keys()):
+        item = pending.get(tenant_id)
+        if not isinstance(item, dict) or not item.get("doc_ids"):
+            pending.pop(tenant_id, None)
+            changed = True
+            continue
+        if tenants is not None and tenant_id not in tenants:
+            continue
+        if int(item.get("next_at", 0) or 0) > now_value:
+            continue
+        doc_ids = [str(doc_id) for doc_id in item.get("doc_ids") or []]
+        changed = True
+
+        if item.get("status") == "verifying":
+            remaining = count_workspace_docs_in_qdrant(tenant_id, doc_ids)
+            if remaining == 0:
+                pending.pop(tenant_id, None)
+                outcome["verified"] += len(doc_ids)
+                continue
+            item["status"] = "pending"
+            item["last_error"] = "verify_unavailable" if remaining is None else f"verify_remaining_{remaining}"
+            ok, detail = False, str(item["last_error"])
+        else:
+            ok, detail = delete_workspace_docs_from_qdrant(tenant_id, doc_ids)
 
+        if ok:
+            outcome["deleted"] += len(doc_ids)
+            item["status"] = "verifying"
+            item["next_at"] = now_value + WORKSPACE_DELETE_VERIFY_SECONDS
+            continue
 
-def clear_workspace(user_id: int, reason: str) -> tuple[int, int]:
+        attempts = int(item.get("attempts", 0) or 0) + 1
+        if attempts >= WORKSPACE_DELETE_MAX_ATTEMPTS:
+            pending.pop(tenant_id, None)
+            outcome["dropped"] += len(doc_ids)
+            print(
+                f"[telegram-bridge] workspace qdrant delete abandoned tenant={tenant_id} docs={len(doc_ids)} error={detail}",
+                flush=True,
+            )
+            continue
+        outcome["failed"] += len(doc_ids)
+        item["attempts"] = attempts
+        item["last_error"] = detail
+        item["next_at"] = now_value + WORKSPACE_DELETE_RETRY_BASE_SECONDS * (2 ** min(attempts - 1, 6))
+
+    if changed:
+        save_workspace_state(WORKSPACE_STATE)
+    return outcome
+
+
+def workspace_pending_deletes_snapshot() -> dict[str, int]:
+    pending = _workspace_pending_deletes()
+    items = [item for item in pending.values() if isinstance(item, dict)]
+    return {
+        "tenants": len(items),
+        "docs": sum(len(item.get("doc_ids") or []) for item in items),
+        "verifying": sum(1 for item in items if item.get("status") == "verifying"),
+        "retrying": sum(1 for item in items if int(item.get("attempts", 0) or 0) > 0),
+    }
+
+
+def clear_workspace(user_id: int, reason: str, flush: bool = True) -> tuple[int, int]:
     active = WORKSPACE_STATE.setdefault("active", {})
     entry = active.get(str(user_id))
     if not isinstance(entry, dict):
@@ -2992,25 +3938,20 @@ def clear_workspace(user_id: int, reason: str) -> tuple[int, int]:
     tenant_id = f"u_{user_id}"
     docs_raw = entry.get("docs")
     docs = docs_raw if isinstance(docs_raw, list) else []
-    removed = 0
-    failed = 0
-    for item in docs:
-        if not isinstance(item, dict):
-            continue
-        doc_id = str(item.get("doc_id", "")).strip()
-        if not doc_id:
-            continue
-        ok, _ = delete_workspace_doc_from_qdrant(tenant_id, doc_id)
-        if ok:
-            removed += 1
-        else:
-            failed += 1
+    doc_ids = [str(item.get("doc_id", "")).strip() for item in docs if isinstance(item, dict)]
+    queued = queue_workspace_qdrant_deletes(tenant_id, doc_ids)
 
     active.pop(str(user_id), None)
     WORKSPACE_STATE["active"] = active
     save_workspace_state(WORKSPACE_STATE)
+    removed = 0
+    failed = 0
+    if flush and queued:
+        outcome = process_workspace_qdrant_deletes(tenants={tenant_id})
+        removed = outcome["deleted"]
+        failed = outcome["failed"] + outcome["dropped"]
     print(
-        f"[telegram-bridge] workspace cleared user_id={user_id} reason={reason} removed={removed} failed={failed}",
+        f"[telegram-bridge] workspace cleared user_id={user_id} reason={reason} queued={queued} removed={removed} failed={failed}",
         flush=True,
     )
     return removed, failed
@@ -3045,15 +3986,12 @@ def cleanup_expired_workspaces(now_ts: int | None = None) -> tuple[int, int, int
             except ValueError:
                 continue
 
-    workspaces_cleared = 0
-    docs_removed = 0
-    docs_failed = 0
     for user_id in expired_users:
-        removed, failed = clear_workspace(user_id, reason="expired")
-        workspaces_cleared += 1
-        docs_removed += removed
-        docs_failed += failed
-    return workspaces_cleared, docs_removed, docs_failed
+        clear_workspace(user_id, reason="expired", flush=False)
+    if not expired_users:
+        return 0, 0, 0
+    outcome = process_workspace_qdrant_deletes(now_ts=now_value)
+    return len(expired_users), outcome["deleted"], outcome["failed"] + outcome["dropped"]
 
 
 def resolve_workspace_query_context(
@@ -3104,6 +4042,125 @@ def resolve_workspace_query_context(
     }
 
 
+DIRECT_RETRIEVAL_METRICS: dict[str, float] = {
+    "queries": 0,
+    "hits": 0,
+    "fallbacks": 0,
+    "embed_ms": 0.0,
+    "search_ms": 0.0,
+}
+
+
+EMBED_CACHE = EmbeddingCache(
+    EMBED_CACHE_PATH,
+    model=RAG_EMBED_MODEL,
+    max_entries=EMBED_CACHE_MAX_ENTRIES,
+    max_bytes=EMBED_CACHE_MAX_MB * 1024 * 1024,
+)
+if EMBED_CACHE_ENABLED:
+    EMBED_CACHE.load()
+EMBED_RETRY_AFTER_TS = 0.0
+
+
+def embed_query_text(text: str) -> list[float]:
+    global EMBED_RETRY_AFTER_TS
+    cached = EMBED_CACHE.get(text) if EMBED_CACHE_ENABLED else None
+    if cached is not None:
+        return cached
+    if time.time() < EMBED_RETRY_AFTER_TS:
+        raise RuntimeError("embedding endpoint backoff active")
+    try:
+        vector = request_query_embedding(text)
+    except Exception:
+        EMBED_RETRY_AFTER_TS = time.time() + EMBED_FAILURE_BACKOFF_SECONDS
+        raise
+    if EMBED_CACHE_ENABLED:
+        EMBED_CACHE.put(text, vector)
+    return vector
+
+
+def query_embedding_for_payload(text: str) -> list[float] | None:
+    # Cache hits only: a miss is left to the workflow's Embed Query node rather than blocking the reply on an
+    # Ollama round trip here. Vectors enter the cache when direct retrieval embeds a question.
+    vector = EMBED_CACHE.get(text) if EMBED_CACHE_ENABLED else None
+    if vector is None:
+        return None
+    # float32 precision is all the cache keeps; shorter reprs keep the webhook body small.
+    return [float(f"{value:.7g}") for value in vector]
+
+
+def request_query_embedding(text: str) -> list[float]:
+    request = urllib.request.Request(
+        url=OLLAMA_EMBED_URL,
+        data=json.dumps({"model": RAG_EMBED_MODEL, "input": text}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=DIRECT_RETRIEVAL_TIMEOUT_SECONDS) as response:
+        parsed = json.loads(response.read().decode("utf-8", errors="ignore") or "{}")
+    embeddings = parsed.get("embeddings") if isinstance(parsed, dict) else None
+    vector = embeddings[0] if isinstance(embeddings, list) and embeddings else None
+    if not isinstance(vector, list) or not vector:
+        raise ValueError("embedding response missing vector")
+    return [float(item) for item in vector]
+
+
+def direct_workspace_retrieval(tenant_id: str, question: str, doc_ids: list[str]) -> list[dict[str, Any]] | None:
+    # Mirrors the rag-query workflow's workspace-mode Embed Query + Search Qdrant nodes so n8n can skip both hops.
+    # None means "fall back to the workflow's own retrieval"; an empty list is a real no-match result.
+    started = time.monotonic()
+    try:
+        vector = embed_query_text(question)
+        embedded = time.monotonic()
+        if doc_ids:
+            points_filter = _workspace_docs_filter(doc_ids)
+        else:
+            points_filter = {"must": [{"key": "source_type", "match": {"value": "workspace_temp"}}]}
+        try:
+            results = QDRANT.search_points(rag_collection_name(tenant_id), vector, DIRECT_RETRIEVAL_TOP_K, points_filter)
+        except QdrantError as exc:
+            if exc.status != 404:
+                raise
+            results = []
+    except Exception as exc:
+        DIRECT_RETRIEVAL_METRICS["fallbacks"] += 1
+        print(f"[telegram-bridge] direct retrieval fallback tenant={tenant_id}: {exc}", flush=True)
+        return None
+    finished = time.monotonic()
+    DIRECT_RETRIEVAL_METRICS["queries"] += 1
+    DIRECT_RETRIEVAL_METRICS["hits"] += len(results)
+    DIRECT_RETRIEVAL_METRICS["embed_ms"] += (embedded - started) * 1000.0
+    DIRECT_RETRIEVAL_METRICS["search_ms"] += (finished - embedded) * 1000.0
+
+    hits: list[dict[str, Any]] = []
+    for item in results:
+        point_payload = item.get("payload") if isinstance(item.get("payload"), dict) else {}
+        hits.append(
+            {
+                "id": item.get("id"),
+                "score": float(item.get("score") or 0.0),
+                "payload": {
+                    "source_name": str(point_payload.get("source_name", "")),
+                    "chunk_text": str(point_payload.get("chunk_text", "")),
+                    "doc_id": str(point_payload.get("doc_id", "")),
+                },
+            }
+        )
+    return hits
+
+
+def direct_retrieval_snapshot() -> dict[str, Any]:
+    queries = int(DIRECT_RETRIEVAL_METRICS["queries"])
+    return {
+        "enabled": DIRECT_RETRIEVAL_ENABLED,
+        "queries": queries,
+        "fallbacks": int(DIRECT_RETRIEVAL_METRICS["fallbacks"]),
+        "avg_hits": round(DIRECT_RETRIEVAL_METRICS["hits"] / queries, 2) if queries else 0.0,
+        "avg_embed_ms": int(DIRECT_RETRIEVAL_METRICS["embed_ms"] / queries) if queries else 0,
+        "avg_search_ms": int(DIRECT_RETRIEVAL_METRICS["search_ms"] / queries) if queries else 0,
+    }
+
+
 def clear_textbook_request(user_id: int) -> None:
     pending = TEXTBOOK_STATE.setdefault("pending", {})
     pending.pop(str(user_id), None)
@@ -3272,146 +4329,120 @@ def send_textbook_delivery_email(
         return False, f"smtp_error:{exc}"
 
 
-def strip_html_tags(value: str) -> str:
-    text = re.sub(r"<script[^>]*>.*?</script>", " ", value, flags=re.IGNORECASE | re.DOTALL)
-    text = re.sub(r"<style[^>]*>.*?</style>", " ", text, flags=re.IGNORECASE | re.DOTALL)
-    text = re.sub(r"<[^>]+>", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
-
-
-def extract_text_from_epub_bytes(file_bytes: bytes, max_chars: int = 12000) -> str:
-    if not file_bytes:
-        return ""
-    try:
-        with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
-            page_names = [
-                name
-                for name in archive.namelist()
-                if name.lower().endswith((".xhtml", ".html", ".htm", ".xml"))
-            ]
-            page_names.sort()
-            chunks: list[str] = []
-            total = 0
-            for name in page_names:
-                try:
-                    data = archive.read(name)
-                except Exception:
-                    continue
-                text = strip_html_tags(data.decode("utf-8", errors="ignore"))
-                if not text:
-                    continue
-                remaining = max(0, max_chars - total)
-                if remaining <= 0:
-                    break
-                if len(text) > remaining:
-                    text = text[:remaining]
-                chunks.append(text)
-                total += len(text)
-                if total >= max_chars:
-                    break
-            return "\n\n".join(chunks).strip()
-    except Exception:
-        return ""
+DOCUMENT_EXTRACTOR = DocumentExtractor(
+    workers=EXTRACT_WORKERS,
+    pages_per_task=EXTRACT_PAGES_PER_TASK,
+    timeout_seconds=EXTRACT_TIMEOUT_SECONDS,
+    cache_dir=EXTRACT_CACHE_DIR,
+    cache_max_entries=EXTRACT_CACHE_MAX_ENTRIES,
+)
 
 
-def extract_text_from_pdf_bytes(file_bytes: bytes, max_chars: int = 12000) -> str:
-    if not file_bytes:
-        return ""
+def iter_ingest_chunks(segments: Iterable[str], chunk_chars: int, overlap_chars: int) -> Iterator[str]:
+    size = max(200, int(chunk_chars))
+    overlap = min(max(0, int(overlap_chars)), size // 2)
+    buffer = ""
+    for segment in segments:
+        text = re.sub(r"\s+", " ", str(segment or "")).strip()
+        if not text:
+            continue
+        buffer = f"{buffer} {text}" if buffer else text
+        while len(buffer) >= size:
+            cut = buffer.rfind(" ", size // 2, size)
+            if cut <= overlap:
+                cut = size
+            yield buffer[:cut].strip()
+            buffer = buffer[cut - overlap :].lstrip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def post_ingest_chunks(
+    base_payload: dict[str, Any],
+    chunks: Iterable[str],
+    on_progress: Callable[[int, int], None] | None = None,
+) -> dict[str, Any]:
+    result: dict[str, Any] = {"chunks": 0, "sent": 0, "failed": 0, "truncated": False, "error": ""}
 
+    def _tally(done: set[Any]) -> None:
+        for future in done:
+            try:
+                future.result()
+                result["sent"] += 1
+            except urllib.error.HTTPError as exc:
+                result["failed"] += 1
+                result["error"] = result["error"] or f"HTTP {exc.code}"
+            except Exception as exc:
+                result["failed"] += 1
+                result["error"] = result["error"] or str(exc)
+            finished = int(result["sent"]) + int(result["failed"])
+            if on_progress is not None and finished % INGEST_PROGRESS_EVERY_CHUNKS == 0:
+                on_progress(int(result["sent"]), int(result["failed"]))
+
+    executor = ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY, thread_name_prefix="rag-ingest")
+    in_flight: set[Any] = set()
     try:
-        from pypdf import PdfReader  # type: ignore
-
-        reader = PdfReader(io.BytesIO(file_bytes))
-        chunks: list[str] = []
-        total = 0
-        for page in reader.pages:
-            page_text = str(page.extract_text() or "").strip()
-            if not page_text:
-                continue
-            remaining = max(0, max_chars - total)
-            if remaining <= 0:
-                break
-            if len(page_text) > remaining:
-                page_text = page_text[:remaining]
-            chunks.append(page_text)
-            total += len(page_text)
-            if total >= max_chars:
+        for index, chunk in enumerate(chunks):
+            if index >= INGEST_MAX_CHUNKS:
+                result["truncated"] = True
                 break
-        return "\n\n".join(chunks).strip()
-    except Exception:
-        pass
-
-    # Safe fallback when dedicated PDF parser is unavailable.
+            payload = dict(base_payload)
+            payload["text"] = chunk
+            payload["chunk_index"] = index
+            in_flight.add(executor.submit(call_n8n, RAG_INGEST_WEBHOOK, payload))
+            result["chunks"] += 1
+            if len(in_flight) >= INGEST_CONCURRENCY:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                _tally(done)
+        if in_flight:
+            done, in_flight = wait(in_flight)
+            _tally(done)
+    finally:
+        executor.shutdown(wait=True)
+    return result
+
+
+def iter_extracted_segments(path: pathlib.Path, content_type: str, file_url: str, content_sha256: str) -> Iterator[str]:
+    # Extraction is lazy, so a timeout can surface after some chunks were posted; those are kept.
     try:
-        decoded = file_bytes.decode("latin-1", errors="ignore")
-    except Exception:
-        return ""
-
-    candidates = re.findall(r"\(([^\)]{4,})\)", decoded)
-    cleaned = []
-    for item in candidates:
-        value = re.sub(r"\\[nrt]", " ", item)
-        value = re.sub(r"\\\d{1,3}", "", value)
-        value = re.sub(r"\s+", " ", value).strip()
-        if len(value) >= 4:
-            cleaned.append(value)
-    text = " ".join(cleaned)
-    text = re.sub(r"\s+", " ", text).strip()
-    if len(text) > max_chars:
-        return text[:max_chars].rstrip() + "…"
-    return text
-
-
-def extract_text_from_file_payload(file_bytes: bytes, content_type: str, file_url: str, max_chars: int = 12000) -> str:
-    if not file_bytes:
-        return ""
-
-    ctype = str(content_type or "").lower()
-    lower_url = str(file_url or "").lower()
-
-    is_pdf = "application/pdf" in ctype or lower_url.endswith(".pdf")
-    is_epub = "application/epub+zip" in ctype or lower_url.endswith(".epub")
-    if is_pdf:
-        return extract_text_from_pdf_bytes(file_bytes=file_bytes, max_chars=max_chars)
-    if is_epub:
-        return extract_text_from_epub_bytes(file_bytes=file_bytes, max_chars=max_chars)
-
-    text_like = any(token in ctype for token in {"text/", "json", "xml", "yaml", "markdown", "html"})
-    looks_text_ext = any(lower_url.endswith(ext) for ext in {".txt", ".md", ".markdown", ".json", ".html", ".htm", ".csv"})
-
-    if not text_like and not looks_text_ext:
-        return ""
-
-    decoded = file_bytes.decode("utf-8", errors="ignore")
-    if "html" in ctype or lower_url.endswith((".html", ".htm")):
-        decoded = strip_html_tags(decoded)
-    else:
-        decoded = re.sub(r"\s+", " ", decoded).strip()
-
-    if len(decoded) > max(1000, max_chars):
-        return decoded[:max_chars].rstrip() + "…"
-    return decoded
+        yield from DOCUMENT_EXTRACTOR.extract(path, content_type, file_url, content_sha256)
+    except Exception as exc:
+        print(f"[telegram-bridge] ingest file extraction failed: {exc}", flush=True)
 
 
-def fetch_ingest_text_from_file_url(file_url: str, file_mime: str, max_bytes: int = 2_500_000, max_chars: int = 12000) -> str:
+def ingest_document(
+    base_payload: dict[str, Any],
+    file_url: str = "",
+    file_mime: str = "",
+    fallback_text: str = "",
+    on_progress: Callable[[int, int], None] | None = None,
+) -> dict[str, Any]:
     url = str(file_url or "").strip()
-    if not url:
-        return ""
-    if not url.startswith(("http://", "https://")):
-        return ""
-
-    request = urllib.request.Request(
-        url=url,
-        headers={"User-Agent": "servernoots-telegram-bridge/1.0"},
-        method="GET",
-    )
-    with urllib.request.urlopen(request, timeout=30) as response:
-        raw = response.read(max_bytes + 1)
-        if len(raw) > max_bytes:
-            raw = raw[:max_bytes]
-        content_type = str(response.headers.get("Content-Type") or file_mime or "").strip()
-    return extract_text_from_file_payload(raw, content_type=content_type, file_url=url, max_chars=max_chars)
+    temp_path: pathlib.Path | None = None
+    try:
+        if url.startswith(("http://", "https://")):
+            temp_path, _size, content_sha256, content_type, reason = stream_textbook_source_to_file(
+                url,
+                max_bytes=max(1_000_000, INGEST_MAX_BYTES),
+                timeout=30,
+            )
+            if temp_path is None:
+                print(f"[telegram-bridge] ingest file fetch failed: {reason}", flush=True)
+            else:
+                segments = iter_extracted_segments(temp_path, content_type or file_mime, url, content_sha256)
+                chunks = iter_ingest_chunks(segments, INGEST_CHUNK_CHARS, INGEST_CHUNK_OVERLAP_CHARS)
+                result = post_ingest_chunks(base_payload, chunks, on_progress=on_progress)
+                if int(result["chunks"]) > 0:
+                    result["origin"] = "file"
+                    return result
+
+        chunks = iter_ingest_chunks([fallback_text], INGEST_CHUNK_CHARS, INGEST_CHUNK_OVERLAP_CHARS)
+        result = post_ingest_chunks(base_payload, chunks, on_progress=on_progress)
+        result["origin"] = "text"
+        return result
+    finally:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
 
 
 def load_rate_limit_state() -> dict[str, Any]:
@@ -3433,8 +4464,7 @@ def load_rate_limit_state() -> dict[str, Any]:
 
 
 def save_rate_limit_state(state: dict[str, Any]) -> None:
-    RATE_LIMIT_PATH.parent.mkdir(parents=True, exist_ok=True)
-    RATE_LIMIT_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(RATE_LIMIT_PATH, state)
 
 
 RATE_LIMIT_STATE = load_rate_limit_state()
@@ -3456,8 +4486,7 @@ def load_admin_command_cooldown_state() -> dict[str, Any]:
 
 
 def save_admin_command_cooldown_state(state: dict[str, Any]) -> None:
-    ADMIN_COMMAND_COOLDOWN_PATH.parent.mkdir(parents=True, exist_ok=True)
-    ADMIN_COMMAND_COOLDOWN_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(ADMIN_COMMAND_COOLDOWN_PATH, state)
 
 
 ADMIN_COMMAND_COOLDOWN_COMMANDS = parse_command_keys(ADMIN_COMMAND_COOLDOWN_COMMANDS_RAW)
@@ -3549,8 +4578,7 @@ def load_memory_state() -> dict[str, Any]:
 
 
 def save_memory_state(state: dict[str, Any]) -> None:
-    MEMORY_PATH.parent.mkdir(parents=True, exist_ok=True)
-    MEMORY_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_state(MEMORY_PATH, state)
 
 
 def append_memory_telemetry(
@@ -4920,8 +5948,7 @@ def load_offset() -> int:
 
 
 def save_offset(update_id: int) -> None:
-    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    STATE_PATH.write_text(json.dumps({"last_update_id": update_id}), encoding="utf-8")
+    write_json_state(STATE_PATH, {"last_update_id": update_id})
 
 
 def telegram_request(method: str, payload: dict[str, Any] | None = None) -> dict[str, Any]:
@@ -5972,6 +6999,320 @@ def score_textbook_candidate(candidate: dict[str, str], requested_title: str, re
     return score
 
 
+def record_textbook_provider_metric(
+    provider: str,
+    latency_ms: int,
+    results: int = 0,
+    error: str = "",
+    abandoned: bool = False,
+    late: bool = False,
+) -> None:
+    with TEXTBOOK_PROVIDER_METRICS_LOCK:
+        entry = TEXTBOOK_PROVIDER_METRICS.setdefault(
+            provider,
+            {
+                "calls": 0,
+                "errors": 0,
+                "abandoned": 0,
+                "late": 0,
+                "results": 0,
+                "total_latency_ms": 0,
+                "max_latency_ms": 0,
+                "last_latency_ms": 0,
+                "last_error": "",
+            },
+        )
+        if abandoned:
+            entry["abandoned"] += 1
+            return
+        if late:
+            # An abandoned call finishing after the deadline; already counted under `abandoned`.
+            entry["late"] += 1
+            return
+        entry["calls"] += 1
+        entry["results"] += max(0, int(results))
+        entry["total_latency_ms"] += max(0, int(latency_ms))
+        entry["max_latency_ms"] = max(int(entry["max_latency_ms"]), int(latency_ms))
+        entry["last_latency_ms"] = int(latency_ms)
+        if error:
+            entry["errors"] += 1
+            entry["last_error"] = error[:160]
+
+
+def textbook_provider_metrics_snapshot() -> dict[str, dict[str, Any]]:
+    snapshot: dict[str, dict[str, Any]] = {}
+    with TEXTBOOK_PROVIDER_METRICS_LOCK:
+        for provider, entry in TEXTBOOK_PROVIDER_METRICS.items():
+            calls = int(entry.get("calls", 0))
+            snapshot[provider] = {
+                "calls": calls,
+                "errors": int(entry.get("errors", 0)),
+                "abandoned": int(entry.get("abandoned", 0)),
+                "late": int(entry.get("late", 0)),
+                "results": int(entry.get("results", 0)),
+                "avg_latency_ms": int(entry.get("total_latency_ms", 0)) // calls if calls > 0 else 0,
+                "max_latency_ms": int(entry.get("max_latency_ms", 0)),
+                "last_latency_ms": int(entry.get("last_latency_ms", 0)),
+                "last_error": str(entry.get("last_error", "")),
+            }
+    return snapshot
+
+
+def _fetch_textbook_provider_json(url: str, timeout: float) -> Any:
+    request = urllib.request.Request(
+        url=url,
+        headers={"Accept": "application/json", "User-Agent": "servernoots-telegram-bridge/1.0"},
+        method="GET",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        raw = response.read().decode("utf-8", errors="ignore")
+    return json.loads(raw)
+
+
+def _search_textbook_googlebooks(query: str, isbn: str, limit: int, timeout: float) -> list[dict[str, str]]:
+    candidates: list[dict[str, str]] = []
+    gb_params = urllib.parse.urlencode({"q": query, "maxResults": max(6, limit * 4), "printType": "books"})
+    gb_payload = _fetch_textbook_provider_json(f"{TEXTBOOK_GOOGLEBOOKS_API_BASE}/volumes?{gb_params}", timeout)
+    gb_items = gb_payload.get("items") if isinstance(gb_payload, dict) else []
+    if not isinstance(gb_items, list):
+        return candidates
+    for item in gb_items:
+        if not isinstance(item, dict):
+            continue
+        volume_raw = item.get("volumeInfo")
+        volume: dict[str, Any] = volume_raw if isinstance(volume_raw, dict) else {}
+        found_title = str(volume.get("title") or "").strip()
+        if not found_title:
+            continue
+        authors_raw_value = volume.get("authors")
+        authors_raw: list[Any] = authors_raw_value if isinstance(authors_raw_value, list) else []
+        authors = ", ".join(str(value).strip() for value in authors_raw[:3] if str(value).strip())
+        published = str(volume.get("publishedDate") or "").strip()
+        year = published[:4] if len(published) >= 4 else ""
+        ids_value = volume.get("industryIdentifiers")
+        ids: list[Any] = ids_value if isinstance(ids_value, list) else []
+        found_isbn = ""
+        for ident in ids:
+            if not isinstance(ident, dict):
+                continue
+            value = str(ident.get("identifier") or "").strip()
+            if value:
+                found_isbn = re.sub(r"[^0-9Xx]", "", value).upper()
+                if found_isbn:
+                    break
+        source_url = str(volume.get("infoLink") or "").strip() or "https://books.google.com"
+        image_links_value = volume.get("imageLinks")
+        image_links: dict[str, Any] = image_links_value if isinstance(image_links_value, dict) else {}
+        cover_url = str(
+            image_links.get("thumbnail")
+            or image_links.get("smallThumbnail")
+            or ""
+        ).strip()
+        if cover_url.startswith("http://"):
+            cover_url = "https://" + cover_url[len("http://") :]
+        candidates.append(
+            {
+                "provider": "googlebooks",
+                "title": found_title,
+                "authors": authors,
+                "year": year,
+                "isbn": found_isbn,
+                "source_url": source_url,
+                "cover_url": cover_url,
+            }
+        )
+    return candidates
+
+
+def _search_textbook_openlibrary(query: str, isbn: str, limit: int, timeout: float) -> list[dict[str, str]]:
+    candidates: list[dict[str, str]] = []
+    ol_params = urllib.parse.urlencode({"q": query, "limit": max(6, limit * 4)})
+    ol_payload = _fetch_textbook_provider_json(f"{TEXTBOOK_OPENLIBRARY_API_BASE}/search.json?{ol_params}", timeout)
+    docs = ol_payload.get("docs") if isinstance(ol_payload, dict) else []
+    if not isinstance(docs, list):
+        return candidates
+    for item in docs:
+        if not isinstance(item, dict):
+            continue
+        found_title = str(item.get("title") or "").strip()
+        if not found_title:
+            continue
+        authors_raw_value = item.get("author_name")
+        authors_raw: list[Any] = authors_raw_value if isinstance(authors_raw_value, list) else []
+        authors = ", ".join(str(value).strip() for value in authors_raw[:3] if str(value).strip())
+        year = str(item.get("first_publish_year") or "").strip()
+        isbn_values = item.get("isbn") if isinstance(item.get("isbn"), list) else []
+        found_isbn = re.sub(r"[^0-9Xx]", "", str(isbn_values[0])).upper() if isbn_values else ""
+        key = str(item.get("key") or "").strip()
+        source_url = f"https://openlibrary.org{key}" if key.startswith("/") else "https://openlibrary.org"
+        cover_id = parse_int(str(item.get("cover_i") or "0"), 0)
+        cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-L.jpg" if cover_id > 0 else ""
+        candidates.append(
+            {
+                "provider": "openlibrary",
+                "title": found_title,
+                "authors": authors,
+                "year": year,
+                "isbn": found_isbn,
+                "source_url": source_url,
+                "cover_url": cover_url,
+            }
+        )
+    return candidates
+
+
+def _search_textbook_internetarchive(query: str, isbn: str, limit: int, timeout: float) -> list[dict[str, str]]:
+    candidates: list[dict[str, str]] = []
+    ia_query = " OR ".join(part for part in [f"isbn:{isbn}" if isbn else "", query] if part)
+    ia_params = urllib.parse.urlencode(
+        {
+            "q": ia_query,
+            "rows": max(6, limit * 4),
+            "page": 1,
+            "fl[]": ["identifier", "title", "creator", "date", "year", "isbn"],
+            "output": "json",
+        },
+        doseq=True,
+    )
+    ia_payload = _fetch_textbook_provider_json(f"{TEXTBOOK_INTERNETARCHIVE_API_BASE}/advancedsearch.php?{ia_params}", timeout)
+    ia_docs = (((ia_payload.get("response") or {}) if isinstance(ia_payload, dict) else {}).get("docs") or [])
+    if not isinstance(ia_docs, list):
+        return candidates
+    for item in ia_docs:
+        if not isinstance(item, dict):
+            continue
+        found_title = str(item.get("title") or "").strip()
+        if not found_title:
+            continue
+        creator = item.get("creator")
+        if isinstance(creator, list):
+            authors = ", ".join(str(value).strip() for value in creator[:3] if str(value).strip())
+        else:
+            authors = str(creator or "").strip()
+        year_value = str(item.get("year") or "").strip()
+        if not year_value:
+            date_value = str(item.get("date") or "").strip()
+            year_value = date_value[:4] if len(date_value) >= 4 else ""
+        isbn_field = item.get("isbn")
+        if isinstance(isbn_field, list):
+            raw_isbn = str(isbn_field[0] or "").strip() if isbn_field else ""
+        else:
+            raw_isbn = str(isbn_field or "").strip()
+        found_isbn = re.sub(r"[^0-9Xx]", "", raw_isbn).upper()
+        identifier = str(item.get("identifier") or "").strip()
+        source_url = f"https://archive.org/details/{identifier}" if identifier else "https://archive.org"
+        candidates.append(
+            {
+                "provider": "internetarchive",
+                "title": found_title,
+                "authors": authors,
+                "year": year_value,
+                "isbn": found_isbn,
+                "source_url": source_url,
+                "cover_url": "",
+            }
+        )
+    return candidates
+
+
+def _search_textbook_gutendex(query: str, isbn: str, limit: int, timeout: float) -> list[dict[str, str]]:
+    candidates: list[dict[str, str]] = []
+    gx_params = urllib.parse.urlencode({"search": query})
+    gx_payload = _fetch_textbook_provider_json(f"{TEXTBOOK_GUTENDEX_API_BASE}/books?{gx_params}", timeout)
+    gx_items = gx_payload.get("results") if isinstance(gx_payload, dict) else []
+    if not isinstance(gx_items, list):
+        return candidates
+    for item in gx_items[: max(6, limit * 4)]:
+        if not isinstance(item, dict):
+            continue
+        found_title = str(item.get("title") or "").strip()
+        if not found_title:
+            continue
+        authors_raw_value = item.get("authors")
+        authors_raw: list[Any] = authors_raw_value if isinstance(authors_raw_value, list) else []
+        authors = ", ".join(
+            str((author.get("name") if isinstance(author, dict) else author) or "").strip()
+            for author in authors_raw[:3]
+            if str((author.get("name") if isinstance(author, dict) else author) or "").strip()
+        )
+        formats_value = item.get("formats")
+        formats: dict[str, Any] = formats_value if isinstance(formats_value, dict) else {}
+        source_url = str(
+            formats.get("text/html")
+            or formats.get("application/epub+zip")
+            or formats.get("application/octet-stream")
+            or formats.get("text/plain; charset=utf-8")
+            or ""
+        ).strip()
+        book_id = parse_int(str(item.get("id") or "0"), 0)
+        if not source_url and book_id > 0:
+            source_url = f"https://www.gutenberg.org/ebooks/{book_id}"
+        cover_url = str(formats.get("image/jpeg") or "").strip()
+        candidates.append(
+            {
+                "provider": "gutendex",
+                "title": found_title,
+                "authors": authors,
+                "year": "",
+                "isbn": "",
+                "source_url": source_url or "https://www.gutenberg.org",
+                "cover_url": cover_url,
+            }
+        )
+    return candidates
+
+
+TEXTBOOK_SEARCH_PROVIDER_FUNCS = {
+    "googlebooks": _search_textbook_googlebooks,
+    "openlibrary": _search_textbook_openlibrary,
+    "internetarchive": _search_textbook_internetarchive,
+    "gutendex": _search_textbook_gutendex,
+}
+
+
+def _run_textbook_provider_search(
+    provider: str,
+    query: str,
+    isbn: str,
+    limit: int,
+    timeout: float,
+    cache_key: str = "",
+) -> tuple[list[dict[str, str]], int, str]:
+    """Run one provider search; returns (results, latency_ms, error).
+
+    Metrics are recorded by the caller, so a call abandoned at the search deadline is not also counted
+    as a completed call when its thread finishes later.
+    """
+    search_fn = TEXTBOOK_SEARCH_PROVIDER_FUNCS.get(provider)
+    if search_fn is None:
+        return [], 0, ""
+    started = time.monotonic()
+    try:
+        results = search_fn(query, isbn, limit, timeout)
+    except Exception as exc:
+        print(f"[telegram-bridge] {provider} query failed: {exc}", flush=True)
+        return [], int((time.monotonic() - started) * 1000), str(exc) or exc.__class__.__name__
+    if cache_key:
+        put_textbook_search_cache(cache_key, results)
+    return results, int((time.monotonic() - started) * 1000), ""
+
+
+def _dedupe_textbook_candidates(candidates: list[dict[str, str]]) -> list[dict[str, str]]:
+    deduped: list[dict[str, str]] = []
+    seen: set[str] = set()
+    for item in candidates:
+        dedupe_key = (
+            f"{normalize_match_text(item.get('title', ''))}|"
+            f"{normalize_match_text(item.get('authors', ''))}|"
+            f"{normalize_match_text(item.get('isbn', ''))}"
+        )
+        if dedupe_key in seen:
+            continue
+        seen.add(dedupe_key)
+        deduped.append(item)
+    return deduped
+
+
 def search_textbook_candidates(details: str, parsed_fields: dict[str, str], limit: int = 3) -> list[dict[str, str]]:
     query_parts: list[str] = []
     isbn = str(parsed_fields.get("isbn", "")).strip()
@@ -5991,247 +7332,71 @@ def search_textbook_candidates(details: str, parsed_fields: dict[str, str], limi
     if not query:
         return []
 
-    all_candidates: list[dict[str, str]] = []
-
-    if "googlebooks" in TEXTBOOK_SEARCH_PROVIDERS:
-        try:
-            gb_params = urllib.parse.urlencode({"q": query, "maxResults": max(6, limit * 4), "printType": "books"})
-            gb_url = f"https://www.googleapis.com/books/v1/volumes?{gb_params}"
-            gb_request = urllib.request.Request(
-                url=gb_url,
-                headers={"Accept": "application/json", "User-Agent": "servernoots-telegram-bridge/1.0"},
-                method="GET",
-            )
-            with urllib.request.urlopen(gb_request, timeout=20) as response:
-                gb_raw = response.read().decode("utf-8", errors="ignore")
-            gb_payload = json.loads(gb_raw)
-            gb_items = gb_payload.get("items") if isinstance(gb_payload, dict) else []
-            if isinstance(gb_items, list):
-                for item in gb_items:
-                    if not isinstance(item, dict):
-                        continue
-                    volume_raw = item.get("volumeInfo")
-                    volume: dict[str, Any] = volume_raw if isinstance(volume_raw, dict) else {}
-                    found_title = str(volume.get("title") or "").strip()
-                    if not found_title:
-                        continue
-                    authors_raw_value = volume.get("authors")
-                    authors_raw: list[Any] = authors_raw_value if isinstance(authors_raw_value, list) else []
-                    authors = ", ".join(str(value).strip() for value in authors_raw[:3] if str(value).strip())
-                    published = str(volume.get("publishedDate") or "").strip()
-                    year = published[:4] if len(published) >= 4 else ""
-                    ids_value = volume.get("industryIdentifiers")
-                    ids: list[Any] = ids_value if isinstance(ids_value, list) else []
-                    found_isbn = ""
-                    for ident in ids:
-                        if not isinstance(ident, dict):
-                            continue
-                        value = str(ident.get("identifier") or "").strip()
-                        if value:
-                            found_isbn = re.sub(r"[^0-9Xx]", "", value).upper()
-                            if found_isbn:
-                                break
-                    source_url = str(volume.get("infoLink") or "").strip() or "https://books.google.com"
-                    image_links_value = volume.get("imageLinks")
-                    image_links: dict[str, Any] = image_links_value if isinstance(image_links_value, dict) else {}
-                    cover_url = str(
-                        image_links.get("thumbnail")
-                        or image_links.get("smallThumbnail")
-                        or ""
-                    ).strip()
-                    if cover_url.startswith("http://"):
-                        cover_url = "https://" + cover_url[len("http://") :]
-                    all_candidates.append(
-                        {
-                            "provider": "googlebooks",
-                            "title": found_title,
-                            "authors": authors,
-                            "year": year,
-                            "isbn": found_isbn,
-                            "source_url": source_url,
-                            "cover_url": cover_url,
-                        }
-                    )
-        except Exception as exc:
-            print(f"[telegram-bridge] google books query failed: {exc}", flush=True)
-
-    if "openlibrary" in TEXTBOOK_SEARCH_PROVIDERS:
-        try:
-            ol_params = urllib.parse.urlencode({"q": query, "limit": max(6, limit * 4)})
-            ol_url = f"https://openlibrary.org/search.json?{ol_params}"
-            ol_request = urllib.request.Request(
-                url=ol_url,
-                headers={"Accept": "application/json", "User-Agent": "servernoots-telegram-bridge/1.0"},
-                method="GET",
-            )
-            with urllib.request.urlopen(ol_request, timeout=20) as response:
-                ol_raw = response.read().decode("utf-8", errors="ignore")
-            ol_payload = json.loads(ol_raw)
-            docs = ol_payload.get("docs") if isinstance(ol_payload, dict) else []
-            if isinstance(docs, list):
-                for item in docs:
-                    if not isinstance(item, dict):
-                        continue
-                    found_title = str(item.get("title") or "").strip()
-                    if not found_title:
-                        continue
-                    authors_raw_value = item.get("author_name")
-                    authors_raw: list[Any] = authors_raw_value if isinstance(authors_raw_value, list) else []
-                    authors = ", ".join(str(value).strip() for value in authors_raw[:3] if str(value).strip())
-                    year = str(item.get("first_publish_year") or "").strip()
-                    isbn_values = item.get("isbn") if isinstance(item.get("isbn"), list) else []
-                    found_isbn = re.sub(r"[^0-9Xx]", "", str(isbn_values[0])).upper() if isbn_values else ""
-                    key = str(item.get("key") or "").strip()
-                    source_url = f"https://openlibrary.org{key}" if key.startswith("/") else "https://openlibrary.org"
-                    cover_id = parse_int(str(item.get("cover_i") or "0"), 0)
-                    cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-L.jpg" if cover_id > 0 else ""
-                    all_candidates.append(
-                        {
-                            "provider": "openlibrary",
-                            "title": found_title,
-                            "authors": authors,
-                            "year": year,
-                            "isbn": found_isbn,
-                            "source_url": source_url,
-                            "cover_url": cover_url,
-                        }
-                    )
-        except Exception as exc:
-            print(f"[telegram-bridge] openlibrary query failed: {exc}", flush=True)
+    def _score(item: dict[str, str]) -> int:
+        return score_textbook_candidate(item, requested_title=title, requested_author=author, requested_isbn=isbn)
+
+    providers = [name for name in TEXTBOOK_SEARCH_PROVIDER_FUNCS if name in TEXTBOOK_SEARCH_PROVIDERS]
+    deadline_seconds = max(1.0, TEXTBOOK_SEARCH_DEADLINE_SECONDS)
+    provider_timeout = max(1.0, min(TEXTBOOK_SEARCH_PROVIDER_TIMEOUT_SECONDS, deadline_seconds))
+    deadline = time.monotonic() + deadline_seconds
+    results_by_provider: dict[str, list[dict[str, str]]] = {}
+
+    cache_keys = {provider: textbook_search_cache_key(provider, parsed_fields, details, limit) for provider in providers}
+    for provider in providers:
+        cached = get_textbook_search_cache(cache_keys[provider])
+        if cached is not None:
+            results_by_provider[provider] = cached
+    misses = [provider for provider in providers if provider not in results_by_provider]
+
+    def _enough_strong_candidates() -> bool:
+        if TEXTBOOK_SEARCH_EARLY_RETURN_SCORE <= 0:
+            return False
+        arrived = _dedupe_textbook_candidates(
+            [item for provider in providers for item in results_by_provider.get(provider, [])]
+        )
+        strong = sum(1 for item in arrived if _score(item) >= TEXTBOOK_SEARCH_EARLY_RETURN_SCORE)
+        return strong >= max(1, limit)
+
+    if misses and not _enough_strong_candidates():
+        executor = ThreadPoolExecutor(max_workers=len(misses), thread_name_prefix="textbook-search")
+        futures = {
+            executor.submit(
+                _run_textbook_provider_search,
+                provider,
+                query,
+                isbn,
+                limit,
+                provider_timeout,
+                cache_keys[provider],
+            ): provider
+            for provider in misses
+        }
+        pending = set(futures)
 
-    if "internetarchive" in TEXTBOOK_SEARCH_PROVIDERS:
-        try:
-            ia_query = " OR ".join(part for part in [f"isbn:{isbn}" if isbn else "", query] if part)
-            ia_params = urllib.parse.urlencode(
-                {
-                    "q": ia_query,
-                    "rows": max(6, limit * 4),
-                    "page": 1,
-                    "fl[]": ["identifier", "title", "creator", "date", "year", "isbn"],
-                    "output": "json",
-                },
-                doseq=True,
-            )
-            ia_url = f"https://archive.org/advancedsearch.php?{ia_params}"
-            ia_request = urllib.request.Request(
-                url=ia_url,
-                headers={"Accept": "application/json", "User-Agent": "servernoots-telegram-bridge/1.0"},
-                method="GET",
-            )
-            with urllib.request.urlopen(ia_request, timeout=20) as response:
-                ia_raw = response.read().decode("utf-8", errors="ignore")
-            ia_payload = json.loads(ia_raw)
-            ia_docs = (((ia_payload.get("response") or {}) if isinstance(ia_payload, dict) else {}).get("docs") or [])
-            if isinstance(ia_docs, list):
-                for item in ia_docs:
-                    if not isinstance(item, dict):
-                        continue
-                    found_title = str(item.get("title") or "").strip()
-                    if not found_title:
-                        continue
-                    creator = item.get("creator")
-                    if isinstance(creator, list):
-                        authors = ", ".join(str(value).strip() for value in creator[:3] if str(value).strip())
-                    else:
-                        authors = str(creator or "").strip()
-                    year_value = str(item.get("year") or "").strip()
-                    if not year_value:
-                        date_value = str(item.get("date") or "").strip()
-                        year_value = date_value[:4] if len(date_value) >= 4 else ""
-                    isbn_field = item.get("isbn")
-                    if isinstance(isbn_field, list):
-                        raw_isbn = str(isbn_field[0] or "").strip() if isbn_field else ""
-                    else:
-                        raw_isbn = str(isbn_field or "").strip()
-                    found_isbn = re.sub(r"[^0-9Xx]", "", raw_isbn).upper()
-                    identifier = str(item.get("identifier") or "").strip()
-                    source_url = f"https://archive.org/details/{identifier}" if identifier else "https://archive.org"
-                    all_candidates.append(
-                        {
-                            "provider": "internetarchive",
-                            "title": found_title,
-                            "authors": authors,
-                            "year": year_value,
-                            "isbn": found_isbn,
-                            "source_url": source_url,
-                            "cover_url": "",
-                        }
-                    )
-        except Exception as exc:
-            print(f"[telegram-bridge] internet archive query failed: {exc}", flush=True)
+        def _record_late_textbook_provider(late_future: Any) -> None:
+            if not late_future.cancelled():
+                record_textbook_provider_metric(futures[late_future], 0, late=True)
 
-    if "gutendex" in TEXTBOOK_SEARCH_PROVIDERS:
         try:
-            gx_params = urllib.parse.urlencode({"search": query})
-            gx_url = f"https://gutendex.com/books?{gx_params}"
-            gx_request = urllib.request.Request(
-                url=gx_url,
-                headers={"Accept": "application/json", "User-Agent": "servernoots-telegram-bridge/1.0"},
-                method="GET",
-            )
-            with urllib.request.urlopen(gx_request, timeout=20) as response:
-                gx_raw = response.read().decode("utf-8", errors="ignore")
-            gx_payload = json.loads(gx_raw)
-            gx_items = gx_payload.get("results") if isinstance(gx_payload, dict) else []
-            if isinstance(gx_items, list):
-                for item in gx_items[: max(6, limit * 4)]:
-                    if not isinstance(item, dict):
-                        continue
-                    found_title = str(item.get("title") or "").strip()
-                    if not found_title:
-                        continue
-                    authors_raw_value = item.get("authors")
-                    authors_raw: list[Any] = authors_raw_value if isinstance(authors_raw_value, list) else []
-                    authors = ", ".join(
-                        str((author.get("name") if isinstance(author, dict) else author) or "").strip()
-                        for author in authors_raw[:3]
-                        if str((author.get("name") if isinstance(author, dict) else author) or "").strip()
-                    )
-                    formats_value = item.get("formats")
-                    formats: dict[str, Any] = formats_value if isinstance(formats_value, dict) else {}
-                    source_url = str(
-                        formats.get("text/html")
-                        or formats.get("application/epub+zip")
-                        or formats.get("application/octet-stream")
-                        or formats.get("text/plain; charset=utf-8")
-                        or ""
-                    ).strip()
-                    book_id = parse_int(str(item.get("id") or "0"), 0)
-                    if not source_url and book_id > 0:
-                        source_url = f"https://www.gutenberg.org/ebooks/{book_id}"
-                    cover_url = str(formats.get("image/jpeg") or "").strip()
-                    all_candidates.append(
-                        {
-                            "provider": "gutendex",
-                            "title": found_title,
-                            "authors": authors,
-                            "year": "",
-                            "isbn": "",
-                            "source_url": source_url or "https://www.gutenberg.org",
-                            "cover_url": cover_url,
-                        }
-                    )
-        except Exception as exc:
-            print(f"[telegram-bridge] gutendex query failed: {exc}", flush=True)
-
-    deduped: list[dict[str, str]] = []
-    seen: set[str] = set()
-    for item in all_candidates:
-        dedupe_key = (
-            f"{normalize_match_text(item.get('title', ''))}|"
-            f"{normalize_match_text(item.get('authors', ''))}|"
-            f"{normalize_match_text(item.get('isbn', ''))}"
-        )
-        if dedupe_key in seen:
-            continue
-        seen.add(dedupe_key)
-        deduped.append(item)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results, latency_ms, error = future.result()
+                    record_textbook_provider_metric(futures[future], latency_ms, results=len(results), error=error)
+                    results_by_provider[futures[future]] = results
+                if pending and _enough_strong_candidates():
+                    break
+        finally:
+            for future in pending:
+                record_textbook_provider_metric(futures[future], 0, abandoned=True)
+                future.add_done_callback(_record_late_textbook_provider)
+            executor.shutdown(wait=False, cancel_futures=True)
 
-    ranked = sorted(
-        deduped,
-        key=lambda item: score_textbook_candidate(item, requested_title=title, requested_author=author, requested_isbn=isbn),
-        reverse=True,
-    )
+    all_candidates = [item for provider in providers for item in results_by_provider.get(provider, [])]
+    ranked = sorted(_dedupe_textbook_candidates(all_candidates), key=_score, reverse=True)
 
     return ranked[: max(1, limit)]
 
@@ -6273,6 +7438,417 @@ def render_textbook_candidates_compact(options: list[dict[str, str]], limit: int
     return "\n".join(lines)
 
 
+def run_ingest_job(job: dict[str, Any]) -> dict[str, Any]:
+    params = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+    ingest_payload = params.get("ingest_payload") if isinstance(params.get("ingest_payload"), dict) else {}
+    chat_id = int(job.get("chat_id", 0) or 0)
+    label = "Workspace" if job.get("kind") == "workspace_ingest" else "Textbook"
+
+    def _report_progress(sent: int, failed: int) -> None:
+        send_message(chat_id, f"⏳ {label} ingest in progress: {sent} chunk(s) sent, {failed} failed.")
+
+    return ingest_document(
+        ingest_payload,
+        file_url=str(params.get("file_url", "")),
+        file_mime=str(params.get("file_mime", "")),
+        fallback_text=str(params.get("fallback_text", "")),
+        on_progress=_report_progress,
+    )
+
+
+def finish_textbook_ingest_job(job: dict[str, Any], outcome: dict[str, Any] | None, error: str) -> None:
+    params = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+    ingest_payload = params.get("ingest_payload") if isinstance(params.get("ingest_payload"), dict) else {}
+    chat_id = int(job.get("chat_id", 0) or 0)
+    user_id = int(job.get("user_id", 0) or 0)
+    result = outcome or {}
+    if error:
+        send_message(chat_id, f"❌ RAG ingest failed: {error}")
+        return
+    if int(result.get("chunks", 0)) <= 0:
+        send_message(chat_id, "Ingest text payload is empty, so nothing was indexed.")
+        return
+    if int(result.get("sent", 0)) <= 0:
+        send_message(chat_id, f"❌ RAG ingest webhook error: {result.get('error') or 'no chunks accepted'}")
+        return
+
+    source_name = str(ingest_payload.get("source_name", "textbook-material"))
+    add_memory_note(
+        user_id,
+        f"Textbook material ingested: {source_name}",
+        source="textbook_ingest",
+        confidence=0.9,
+        provenance={"channel": "telegram", "source_name": source_name},
+        tier="session",
+    )
+    origin_note = "(from file)" if result.get("origin") == "file" else "(from summary)"
+    summary = f"✅ Textbook material queued for private RAG ingest {origin_note}: {result['sent']}/{result['chunks']} chunk(s)."
+    if int(result.get("failed", 0)) > 0:
+        summary += f"\n⚠️ {result['failed']} chunk(s) failed: {result.get('error') or 'unknown error'}"
+    if result.get("truncated"):
+        summary += f"\n⚠️ Stopped at the {INGEST_MAX_CHUNKS}-chunk limit."
+    send_message(chat_id, summary)
+
+
+BACKGROUND_JOB_HANDLERS["textbook_ingest"] = (run_ingest_job, finish_textbook_ingest_job)
+
+
+def run_textbook_fulfillment_job(job: dict[str, Any]) -> dict[str, Any]:
+    # Runs on a background worker: the n8n call, the source fetch in build_textbook_download_link and the SMTP
+    # send all happen here. The finish handler only stores the records built below and messages the user.
+    params = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+    fulfillment_payload = params.get("fulfillment_payload") if isinstance(params.get("fulfillment_payload"), dict) else {}
+    chat_id = int(job.get("chat_id", 0) or 0)
+    user_id = int(job.get("user_id", 0) or 0)
+    delivery_email = str(params.get("delivery_email", ""))
+    details = str(params.get("details", ""))
+    reply = "✅ Textbook fulfillment queued."
+    result: dict[str, Any] | str | None = None
+    try:
+        result = call_n8n(TEXTBOOK_WEBHOOK, fulfillment_payload)
+    except urllib.error.HTTPError as exc:
+        if exc.code != 404:
+            reply = f"⚠️ Textbook fulfillment webhook error: HTTP {exc.code}. Request has been queued to ops."
+        ops_note = {
+            "source": "telegram",
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "role": "admin",
+            "tenant_id": f"u_{user_id}",
+            "message": (
+                "TEXTBOOK_FULFILLMENT_REQUEST "
+                f"user_id={user_id} email={delivery_email} details={details}"
+            ),
+            "timestamp": int(time.time()),
+        }
+        try:
+            _ = call_n8n(OPS_WEBHOOK, ops_note)
+        except Exception:
+            pass
+    except Exception as exc:
+        reply = f"⚠️ Textbook fulfillment request queued locally, but downstream delivery failed: {exc}"
+
+    candidate_summary = str(params.get("candidate_summary", ""))
+    parsed_fields = params.get("parsed_fields") if isinstance(params.get("parsed_fields"), dict) else {}
+    selected_candidate = params.get("selected_candidate") if isinstance(params.get("selected_candidate"), dict) else {}
+
+    result_dict = result if isinstance(result, dict) else {}
+    nested = result_dict.get("data") if isinstance(result_dict.get("data"), dict) else {}
+    fulfillment_id = str(
+        result_dict.get("fulfillment_id")
+        or nested.get("fulfillment_id")
+        or f"textbook-{user_id}-{int(time.time())}"
+    ).strip()
+    delivery_status = str(
+        result_dict.get("delivery_status")
+        or nested.get("delivery_status")
+        or ("dispatch_ready" if result_dict.get("file_ready_for_email") else "queued")
+    ).strip()
+    delivery_mode = str(
+        result_dict.get("delivery_mode")
+        or nested.get("delivery_mode")
+        or "ops_queue"
+    ).strip()
+    status_timeline_raw = result_dict.get("status_timeline") or nested.get("status_timeline")
+    status_timeline = status_timeline_raw if isinstance(status_timeline_raw, list) else []
+    file_ready = bool(
+        result_dict.get("file_ready_for_email")
+        or result_dict.get("can_email")
+        or result_dict.get("email_ready")
+        or nested.get("file_ready_for_email")
+        or nested.get("can_email")
+        or nested.get("email_ready")
+    )
+    ingest_text = str(
+        result_dict.get("ingest_text")
+        or nested.get("ingest_text")
+        or nested.get("text_for_ingest")
+        or ""
+    ).strip()
+    source_file_url = str(
+        result_dict.get("file_url")
+        or nested.get("file_url")
+        or result_dict.get("download_url")
+        or nested.get("download_url")
+        or ""
+    ).strip()
+    file_mime = str(
+        result_dict.get("file_mime")
+        or nested.get("file_mime")
+        or result_dict.get("mime_type")
+        or nested.get("mime_type")
+        or ""
+    ).strip()
+
+    # Snapshot taken on the poll thread when the job was enqueued; TEXTBOOK_STATE is not read from here.
+    previous_entry = params.get("previous_fulfillment") if isinstance(params.get("previous_fulfillment"), dict) else {}
+    previous_fulfillment_id = str(previous_entry.get("fulfillment_id", "")).strip()
+    previous_attempt_count = parse_int(str(previous_entry.get("dispatch_attempt_count", "0")), 0)
+    preserved_attempt_count = previous_attempt_count if previous_fulfillment_id == fulfillment_id else 0
+    preserved_last_dispatch_at = str(previous_entry.get("last_dispatch_at", "")).strip() if previous_fulfillment_id == fulfillment_id else ""
+    preserved_last_error = str(previous_entry.get("last_error", "")).strip() if previous_fulfillment_id == fulfillment_id else ""
+
+    last_fulfillment = {
+        "created_at": int(time.time()),
+        "fulfillment_id": fulfillment_id,
+        "delivery_email": delivery_email,
+        "delivery_status": delivery_status,
+        "delivery_mode": delivery_mode,
+        "status_timeline": status_timeline,
+        "dispatch_attempt_count": preserved_attempt_count,
+        "last_dispatch_at": preserved_last_dispatch_at,
+        "last_error": preserved_last_error,
+        "file_url": source_file_url,
+        "source_file_url": source_file_url,
+        "request_details": details,
+        "selected_candidate": selected_candidate,
+    }
+    if not file_ready:
+        return {"reply": reply, "last_fulfillment": last_fulfillment, "ingest_offer": None}
+
+    selected_title = str(selected_candidate.get("title", "")).strip() if isinstance(selected_candidate, dict) else ""
+    source_name = selected_title or str(parsed_fields.get("title") or "textbook-material").strip() or "textbook-material"
+    if not ingest_text:
+        fallback_bits = [
+            f"Textbook request: {details}",
+            f"Candidate summary: {candidate_summary[:2000]}",
+        ]
+        if isinstance(selected_candidate, dict) and selected_candidate:
+            fallback_bits.append(f"Selected candidate: {json.dumps(selected_candidate, ensure_ascii=False)}")
+        ingest_text = "\n\n".join(bit for bit in fallback_bits if bit)
+
+    duplicate_confirm = previous_fulfillment_id == fulfillment_id and previous_attempt_count > 0
+
+    dispatch_result = ""
+    dispatch_attempt_count = previous_attempt_count
+    last_dispatch_at = preserved_last_dispatch_at
+    last_error = preserved_last_error
+    hosted_download_url = str(previous_entry.get("hosted_download_url", "")).strip()
+    hosted_download_expires_at = parse_int(str(previous_entry.get("hosted_download_expires_at", "0")), 0)
+
+    if duplicate_confirm:
+        dispatch_result = str(previous_entry.get("dispatch_result", "duplicate_confirm_noop")).strip() or "duplicate_confirm_noop"
+        delivery_status = str(previous_entry.get("delivery_status", "dispatch_duplicate_noop")).strip() or "dispatch_duplicate_noop"
+    else:
+        dispatch_attempt_count = max(0, previous_attempt_count) + 1
+        last_dispatch_at = utc_now()
+        hosted_download_url, hosted_download_expires_at, link_reason = build_textbook_download_link(
+            user_id=user_id,
+            fulfillment_id=fulfillment_id,
+            source_url=source_file_url,
+            file_mime=file_mime,
+            selected_candidate=selected_candidate,
+        )
+        if not hosted_download_url:
+            if str(link_reason).startswith("untrusted_source:"):
+                dispatch_result = f"download_link_unavailable:{link_reason}"
+                delivery_status = "dispatch_failed_untrusted_source"
+                last_error = dispatch_result
+            else:
+                hosted_download_url = source_file_url
+                hosted_download_expires_at = 0
+                dispatch_result = f"download_link_fallback_source_url:{link_reason}"
+        else:
+            dispatch_ok, dispatch_result = send_textbook_delivery_email(
+                delivery_email=delivery_email,
+                details=details,
+                file_url=hosted_download_url,
+                fulfillment_id=fulfillment_id,
+                selected_candidate=selected_candidate,
+            )
+            if dispatch_ok:
+                delivery_status = "email_dispatched"
+                last_error = ""
+            elif dispatch_result == "smtp_not_configured":
+                delivery_status = "dispatch_skipped_not_configured"
+                last_error = ""
+            else:
+                delivery_status = "dispatch_failed"
+                last_error = dispatch_result
+
+    status_timeline = append_status_timeline(status_timeline, delivery_status)
+    last_fulfillment = {
+        "created_at": int(time.time()),
+        "fulfillment_id": fulfillment_id,
+        "delivery_email": delivery_email,
+        "delivery_status": delivery_status,
+        "delivery_mode": "smtp_bridge",
+        "status_timeline": status_timeline,
+        "dispatch_result": dispatch_result,
+        "dispatch_attempt_count": dispatch_attempt_count,
+        "last_dispatch_at": last_dispatch_at,
+        "last_error": last_error,
+        "file_url": source_file_url,
+        "source_file_url": source_file_url,
+        "file_mime": file_mime,
+        "hosted_download_url": hosted_download_url,
+        "hosted_download_expires_at": hosted_download_expires_at,
+        "request_details": details,
+        "selected_candidate": selected_candidate,
+    }
+    ingest_offer = {
+        "created_at": int(time.time()),
+        "chat_id": chat_id,
+        "source_name": source_name,
+        "doc_id": f"textbook-{user_id}-{int(time.time())}",
+        "ingest_text": ingest_text[:12000],
+        "file_url": source_file_url,
+        "file_mime": file_mime,
+        "fulfillment_id": fulfillment_id,
+        "delivery_status": delivery_status,
+    }
+
+    status_text = delivery_status
+    if duplicate_confirm:
+        status_text = "duplicate_confirm_ignored"
+    elif delivery_status == "email_dispatched":
+        status_text = "email_dispatched"
+    elif delivery_status == "dispatch_skipped_not_configured":
+        status_text = "email_not_configured"
+    elif delivery_status == "dispatch_failed_untrusted_source":
+        status_text = "blocked_untrusted_source"
+    elif delivery_status.startswith("dispatch_failed"):
+        status_text = "dispatch_failed"
+    expiry_note = ""
+    if hosted_download_expires_at > int(time.time()):
+        expiry_note = f"\n⏳ link_expires_at: {datetime.fromtimestamp(hosted_download_expires_at, tz=timezone.utc).isoformat()}"
+    reply = (
+        f"✅ Textbook queued ({status_text}).\n"
+        f"🆔 fulfillment_id: {fulfillment_id}"
+        f"\n🔗 download_link: {hosted_download_url or '(unavailable)'}"
+        f"{expiry_note}"
+    )
+    return {"reply": reply, "last_fulfillment": last_fulfillment, "ingest_offer": ingest_offer}
+
+
+def finish_textbook_fulfillment_job(job: dict[str, Any], outcome: dict[str, Any] | None, error: str) -> None:
+    chat_id = int(job.get("chat_id", 0) or 0)
+    user_id = int(job.get("user_id", 0) or 0)
+    if error or outcome is None:
+        send_message(chat_id, f"⚠️ Textbook fulfillment could not be submitted: {error or 'unknown error'}. Please retry /textbook request.")
+        return
+
+    if isinstance(outcome.get("last_fulfillment"), dict):
+        set_textbook_last_fulfillment(user_id, outcome["last_fulfillment"])
+    if isinstance(outcome.get("ingest_offer"), dict):
+        set_textbook_ingest_offer(user_id, outcome["ingest_offer"])
+    send_message(chat_id, str(outcome.get("reply", "")) or "✅ Textbook fulfillment queued.")
+
+
+BACKGROUND_JOB_HANDLERS["textbook_fulfillment"] = (run_textbook_fulfillment_job, finish_textbook_fulfillment_job)
+
+
+def run_textbook_resend_job(job: dict[str, Any]) -> dict[str, Any]:
+    # Link build and SMTP send for /textbook resend, on a background worker like fulfillment.
+    params = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+    user_id = int(job.get("user_id", 0) or 0)
+    last_fulfillment = params.get("last_fulfillment") if isinstance(params.get("last_fulfillment"), dict) else {}
+
+    delivery_email = str(last_fulfillment.get("delivery_email", "")).strip()
+    source_file_url = str(last_fulfillment.get("source_file_url", "")).strip() or str(last_fulfillment.get("file_url", "")).strip()
+    fulfillment_id = str(last_fulfillment.get("fulfillment_id", "")).strip() or f"textbook-{user_id}-{int(time.time())}"
+    details = str(last_fulfillment.get("request_details", "")).strip() or "Textbook resend request"
+    selected_candidate_raw = last_fulfillment.get("selected_candidate")
+    selected_candidate = selected_candidate_raw if isinstance(selected_candidate_raw, dict) else {}
+    timeline_raw = last_fulfillment.get("status_timeline")
+    status_timeline = timeline_raw if isinstance(timeline_raw, list) else []
+    previous_attempt_count = parse_int(str(last_fulfillment.get("dispatch_attempt_count", "0")), 0)
+
+    dispatch_attempt_count = max(0, previous_attempt_count) + 1
+    dispatch_result = ""
+    delivery_status = "dispatch_failed"
+    last_error = ""
+    last_dispatch_at = utc_now()
+    file_mime = str(last_fulfillment.get("file_mime", "")).strip()
+    hosted_download_url = ""
+    hosted_download_expires_at = 0
+
+    existing_hosted_url = str(last_fulfillment.get("hosted_download_url", "")).strip()
+    existing_hosted_expires_at = parse_int(str(last_fulfillment.get("hosted_download_expires_at", "0")), 0)
+    if existing_hosted_url and existing_hosted_expires_at > int(time.time()):
+        hosted_download_url = existing_hosted_url
+        hosted_download_expires_at = existing_hosted_expires_at
+    else:
+        hosted_download_url, hosted_download_expires_at, link_reason = build_textbook_download_link(
+            user_id=user_id,
+            fulfillment_id=fulfillment_id,
+            source_url=source_file_url,
+            file_mime=file_mime,
+            selected_candidate=selected_candidate,
+        )
+        if not hosted_download_url:
+            if str(link_reason).startswith("untrusted_source:"):
+                dispatch_result = f"download_link_unavailable:{link_reason}"
+                delivery_status = "dispatch_failed_untrusted_source"
+                last_error = dispatch_result
+            else:
+                hosted_download_url = source_file_url
+                hosted_download_expires_at = 0
+                dispatch_result = f"download_link_fallback_source_url:{link_reason}"
+
+    if hosted_download_url:
+        dispatch_ok, dispatch_result = send_textbook_delivery_email(
+            delivery_email=delivery_email,
+            details=details,
+            file_url=hosted_download_url,
+            fulfillment_id=fulfillment_id,
+            selected_candidate=selected_candidate,
+        )
+        if dispatch_ok:
+            delivery_status = "email_redispatched"
+            last_error = ""
+        elif dispatch_result == "smtp_not_configured":
+            delivery_status = "dispatch_skipped_not_configured"
+            last_error = ""
+        else:
+            delivery_status = "dispatch_failed"
+            last_error = dispatch_result
+
+    status_timeline = append_status_timeline(status_timeline, delivery_status)
+    return {
+        "created_at": int(time.time()),
+        "fulfillment_id": fulfillment_id,
+        "delivery_email": delivery_email,
+        "delivery_status": delivery_status,
+        "delivery_mode": "smtp_bridge",
+        "status_timeline": status_timeline,
+        "dispatch_result": dispatch_result,
+        "dispatch_attempt_count": dispatch_attempt_count,
+        "last_dispatch_at": last_dispatch_at,
+        "last_error": last_error,
+        "file_url": source_file_url,
+        "source_file_url": source_file_url,
+        "file_mime": file_mime,
+        "hosted_download_url": hosted_download_url,
+        "hosted_download_expires_at": hosted_download_expires_at,
+        "request_details": details,
+        "selected_candidate": selected_candidate,
+    }
+
+
+def finish_textbook_resend_job(job: dict[str, Any], outcome: dict[str, Any] | None, error: str) -> None:
+    chat_id = int(job.get("chat_id", 0) or 0)
+    user_id = int(job.get("user_id", 0) or 0)
+    if error or outcome is None:
+        send_message(chat_id, f"❌ Resend failed: {error or 'unknown error'}")
+        return
+
+    set_textbook_last_fulfillment(user_id, outcome)
+    delivery_status = str(outcome.get("delivery_status", ""))
+    dispatch_result = str(outcome.get("dispatch_result", ""))
+    if delivery_status == "email_redispatched":
+        send_message(chat_id, "✅ Textbook delivery email resent successfully.")
+    elif delivery_status == "dispatch_skipped_not_configured":
+        send_message(chat_id, "⚠️ Resend skipped: SMTP not configured (set TEXTBOOK_SMTP_* envs).")
+    elif delivery_status == "dispatch_failed_untrusted_source":
+        send_message(chat_id, f"❌ Resend blocked by source allowlist: {dispatch_result}")
+    else:
+        send_message(chat_id, f"❌ Resend failed: {dispatch_result}")
+
+
+BACKGROUND_JOB_HANDLERS["textbook_resend"] = (run_textbook_resend_job, finish_textbook_resend_job)
+
+
 def handle_textbook_command(chat_id: int, user_id: int, text: str, user_record: dict[str, Any], role: str) -> bool:
     parsed = parse_textbook_command(text)
     if parsed is None:
@@ -6386,94 +7962,17 @@ def handle_textbook_command(chat_id: int, user_id: int, text: str, user_record:
             send_message(chat_id, "No file URL is recorded for last fulfillment, so resend is unavailable.")
             return True
 
-        fulfillment_id = str(last_fulfillment.get("fulfillment_id", "")).strip() or f"textbook-{user_id}-{int(time.time())}"
-        details = str(last_fulfillment.get("request_details", "")).strip() or "Textbook resend request"
-        selected_candidate_raw = last_fulfillment.get("selected_candidate")
-        selected_candidate = selected_candidate_raw if isinstance(selected_candidate_raw, dict) else {}
-        timeline_raw = last_fulfillment.get("status_timeline")
-        status_timeline = timeline_raw if isinstance(timeline_raw, list) else []
-        previous_attempt_count = parse_int(str(last_fulfillment.get("dispatch_attempt_count", "0")), 0)
-
-        dispatch_attempt_count = max(0, previous_attempt_count) + 1
-        dispatch_result = ""
-        delivery_status = "dispatch_failed"
-        last_error = ""
-        last_dispatch_at = utc_now()
-        hosted_download_url = ""
-        hosted_download_expires_at = 0
-
-        existing_hosted_url = str(last_fulfillment.get("hosted_download_url", "")).strip()
-        existing_hosted_expires_at = parse_int(str(last_fulfillment.get("hosted_download_expires_at", "0")), 0)
-        if existing_hosted_url and existing_hosted_expires_at > int(time.time()):
-            hosted_download_url = existing_hosted_url
-            hosted_download_expires_at = existing_hosted_expires_at
-        else:
-            hosted_download_url, hosted_download_expires_at, link_reason = build_textbook_download_link(
-                user_id=user_id,
-                fulfillment_id=fulfillment_id,
-                source_url=source_file_url,
-                file_mime=str(last_fulfillment.get("file_mime", "")).strip(),
-                selected_candidate=selected_candidate,
-            )
-            if not hosted_download_url:
-                if str(link_reason).startswith("untrusted_source:"):
-                    dispatch_result = f"download_link_unavailable:{link_reason}"
-                    delivery_status = "dispatch_failed_untrusted_source"
-                    last_error = dispatch_result
-                else:
-                    hosted_download_url = source_file_url
-                    hosted_download_expires_at = 0
-                    dispatch_result = f"download_link_fallback_source_url:{link_reason}"
-
-        if hosted_download_url:
-            dispatch_ok, dispatch_result = send_textbook_delivery_email(
-                delivery_email=delivery_email,
-                details=details,
-                file_url=hosted_download_url,
-                fulfillment_id=fulfillment_id,
-                selected_candidate=selected_candidate,
-            )
-            if dispatch_ok:
-                delivery_status = "email_redispatched"
-                last_error = ""
-            elif dispatch_result == "smtp_not_configured":
-                delivery_status = "dispatch_skipped_not_configured"
-                last_error = ""
-            else:
-                delivery_status = "dispatch_failed"
-                last_error = dispatch_result
+        if count_active_background_jobs("textbook_resend", user_id) > 0:
+            send_message(chat_id, "⏳ A resend is already in progress. I'll reply here when it finishes.")
+            return True
 
-        status_timeline = append_status_timeline(status_timeline, delivery_status)
-        set_textbook_last_fulfillment(
-            user_id,
-            {
-                "created_at": int(time.time()),
-                "fulfillment_id": fulfillment_id,
-                "delivery_email": delivery_email,
-                "delivery_status": delivery_status,
-                "delivery_mode": "smtp_bridge",
-                "status_timeline": status_timeline,
-                "dispatch_result": dispatch_result,
-                "dispatch_attempt_count": dispatch_attempt_count,
-                "last_dispatch_at": last_dispatch_at,
-                "last_error": last_error,
-                "file_url": source_file_url,
-                "source_file_url": source_file_url,
-                "hosted_download_url": hosted_download_url,
-                "hosted_download_expires_at": hosted_download_expires_at,
-                "request_details": details,
-                "selected_candidate": selected_candidate,
-            },
+        send_message(chat_id, "⏳ Preparing the download link and resending the delivery email. I'll reply here when it's done.")
+        enqueue_background_job(
+            "textbook_resend",
+            user_id=user_id,
+            chat_id=chat_id,
+            payload={"last_fulfillment": dict(last_fulfillment)},
         )
-
-        if delivery_status == "email_redispatched":
-            send_message(chat_id, "✅ Textbook delivery email resent successfully.")
-        elif delivery_status == "dispatch_skipped_not_configured":
-            send_message(chat_id, "⚠️ Resend skipped: SMTP not configured (set TEXTBOOK_SMTP_* envs).")
-        elif delivery_status == "dispatch_failed_untrusted_source":
-            send_message(chat_id, f"❌ Resend blocked by source allowlist: {dispatch_result}")
-        else:
-            send_message(chat_id, f"❌ Resend failed: {dispatch_result}")
         return True
 
     if command == "delivered":
@@ -6627,50 +8126,38 @@ def handle_textbook_command(chat_id: int, user_id: int, text: str, user_record:
             return True
 
         file_url = str(offer.get("file_url", "")).strip()
-        file_mime = str(offer.get("file_mime", "")).strip()
-        extracted_file_text = ""
-        if file_url:
-            try:
-                extracted_file_text = fetch_ingest_text_from_file_url(file_url=file_url, file_mime=file_mime)
-            except Exception as exc:
-                print(f"[telegram-bridge] textbook file extraction failed: {exc}", flush=True)
-
-        ingest_text = extracted_file_text or str(offer.get("ingest_text", "")).strip()
+        file_mime = str(offer.get("file_mime", "")).strip()
+        fallback_text = str(offer.get("ingest_text", "")).strip()
         ingest_payload = {
             "source": "telegram",
             "chat_id": chat_id,
             "user_id": user_id,
             "role": role,
             "tenant_id": f"u_{user_id}",
-            "text": ingest_text,
             "source_name": str(offer.get("source_name", "textbook-material")).strip() or "textbook-material",
             "source_type": "textbook",
             "doc_id": str(offer.get("doc_id", "")).strip() or f"textbook-{user_id}-{int(time.time())}",
             "timestamp": int(time.time()),
         }
 
-        if not str(ingest_payload.get("text", "")).strip():
+        if not file_url and not fallback_text:
             send_message(chat_id, "Ingest text payload is empty, so nothing was indexed.")
             clear_textbook_ingest_offer(user_id)
             return True
 
-        try:
-            _ = call_n8n(RAG_INGEST_WEBHOOK, ingest_payload)
-            add_memory_note(
-                user_id,
-                f"Textbook material ingested: {ingest_payload['source_name']}",
-                source="textbook_ingest",
-                confidence=0.9,
-                provenance={"channel": "telegram", "source_name": ingest_payload["source_name"]},
-                tier="session",
-            )
-            origin_note = "(from file)" if extracted_file_text else "(from summary)"
-            send_message(chat_id, f"✅ Textbook material queued for private RAG ingest {origin_note}.")
-            clear_textbook_ingest_offer(user_id)
-        except urllib.error.HTTPError as exc:
-            send_message(chat_id, f"❌ RAG ingest webhook error: HTTP {exc.code}")
-        except Exception as exc:
-            send_message(chat_id, f"❌ RAG ingest failed: {exc}")
+        clear_textbook_ingest_offer(user_id)
+        send_message(chat_id, "⏳ Textbook ingest started. I'll reply here when indexing finishes.")
+        enqueue_background_job(
+            "textbook_ingest",
+            user_id=user_id,
+            chat_id=chat_id,
+            payload={
+                "ingest_payload": ingest_payload,
+                "file_url": file_url,
+                "file_mime": file_mime,
+                "fallback_text": fallback_text,
+            },
+        )
         return True
 
     if command == "pick":
@@ -6891,32 +8378,6 @@ def handle_textbook_command(chat_id: int, user_id: int, text: str, user_record:
             "timestamp": int(time.time()),
         }
 
-        reply = "✅ Textbook fulfillment queued."
-        result: dict[str, Any] | str | None = None
-        try:
-            result = call_n8n(TEXTBOOK_WEBHOOK, fulfillment_payload)
-        except urllib.error.HTTPError as exc:
-            if exc.code != 404:
-                reply = f"⚠️ Textbook fulfillment webhook error: HTTP {exc.code}. Request has been queued to ops."
-            ops_note = {
-                "source": "telegram",
-                "chat_id": chat_id,
-                "user_id": user_id,
-                "role": "admin",
-                "tenant_id": f"u_{user_id}",
-                "message": (
-                    "TEXTBOOK_FULFILLMENT_REQUEST "
-                    f"user_id={user_id} email={delivery_email} details={details}"
-                ),
-                "timestamp": int(time.time()),
-            }
-            try:
-                _ = call_n8n(OPS_WEBHOOK, ops_note)
-            except Exception:
-                pass
-        except Exception as exc:
-            reply = f"⚠️ Textbook fulfillment request queued locally, but downstream delivery failed: {exc}"
-
         user_record["preferred_delivery_email"] = delivery_email
         user_record["updated_at"] = utc_now()
         USER_REGISTRY.setdefault("users", {})[str(user_id)] = user_record
@@ -6938,208 +8399,87 @@ def handle_textbook_command(chat_id: int, user_id: int, text: str, user_record:
             tier="session",
         )
 
-        result_dict = result if isinstance(result, dict) else {}
-        nested = result_dict.get("data") if isinstance(result_dict.get("data"), dict) else {}
-        fulfillment_id = str(
-            result_dict.get("fulfillment_id")
-            or nested.get("fulfillment_id")
-            or f"textbook-{user_id}-{int(time.time())}"
-        ).strip()
-        delivery_status = str(
-            result_dict.get("delivery_status")
-            or nested.get("delivery_status")
-            or ("dispatch_ready" if result_dict.get("file_ready_for_email") else "queued")
-        ).strip()
-        delivery_mode = str(
-            result_dict.get("delivery_mode")
-            or nested.get("delivery_mode")
-            or "ops_queue"
-        ).strip()
-        status_timeline_raw = result_dict.get("status_timeline") or nested.get("status_timeline")
-        status_timeline = status_timeline_raw if isinstance(status_timeline_raw, list) else []
-        file_ready = bool(
-            result_dict.get("file_ready_for_email")
-            or result_dict.get("can_email")
-            or result_dict.get("email_ready")
-            or nested.get("file_ready_for_email")
-            or nested.get("can_email")
-            or nested.get("email_ready")
-        )
-        ingest_text = str(
-            result_dict.get("ingest_text")
-            or nested.get("ingest_text")
-            or nested.get("text_for_ingest")
-            or ""
-        ).strip()
-        source_file_url = str(
-            result_dict.get("file_url")
-            or nested.get("file_url")
-            or result_dict.get("download_url")
-            or nested.get("download_url")
-            or ""
-        ).strip()
-        file_mime = str(
-            result_dict.get("file_mime")
-            or nested.get("file_mime")
-            or result_dict.get("mime_type")
-            or nested.get("mime_type")
-            or ""
-        ).strip()
-
-        previous_entry = get_textbook_last_fulfillment(user_id) or {}
-        previous_fulfillment_id = str(previous_entry.get("fulfillment_id", "")).strip()
-        previous_attempt_count = parse_int(str(previous_entry.get("dispatch_attempt_count", "0")), 0)
-        preserved_attempt_count = previous_attempt_count if previous_fulfillment_id == fulfillment_id else 0
-        preserved_last_dispatch_at = str(previous_entry.get("last_dispatch_at", "")).strip() if previous_fulfillment_id == fulfillment_id else ""
-        preserved_last_error = str(previous_entry.get("last_error", "")).strip() if previous_fulfillment_id == fulfillment_id else ""
-
-        set_textbook_last_fulfillment(
-            user_id,
-            {
-                "created_at": int(time.time()),
-                "fulfillment_id": fulfillment_id,
+        clear_textbook_request(user_id)
+        send_message(chat_id, "⏳ Textbook fulfillment submitted. I'll reply here with the delivery status and download link.")
+        enqueue_background_job(
+            "textbook_fulfillment",
+            user_id=user_id,
+            chat_id=chat_id,
+            payload={
+                "fulfillment_payload": fulfillment_payload,
                 "delivery_email": delivery_email,
-                "delivery_status": delivery_status,
-                "delivery_mode": delivery_mode,
-                "status_timeline": status_timeline,
-                "dispatch_attempt_count": preserved_attempt_count,
-                "last_dispatch_at": preserved_last_dispatch_at,
-                "last_error": preserved_last_error,
-                "file_url": source_file_url,
-                "source_file_url": source_file_url,
-                "request_details": details,
+                "details": details,
+                "candidate_summary": candidate_summary,
+                "parsed_fields": parsed_fields,
                 "selected_candidate": selected_candidate,
+                "previous_fulfillment": dict(get_textbook_last_fulfillment(user_id) or {}),
             },
         )
-
-        if file_ready:
-            selected_title = str(selected_candidate.get("title", "")).strip() if isinstance(selected_candidate, dict) else ""
-            source_name = selected_title or str(parsed_fields.get("title") or "textbook-material").strip() or "textbook-material"
-            if not ingest_text:
-                fallback_bits = [
-                    f"Textbook request: {details}",
-                    f"Candidate summary: {candidate_summary[:2000]}",
-                ]
-                if isinstance(selected_candidate, dict) and selected_candidate:
-                    fallback_bits.append(f"Selected candidate: {json.dumps(selected_candidate, ensure_ascii=False)}")
-                ingest_text = "\n\n".join(bit for bit in fallback_bits if bit)
-
-            duplicate_confirm = previous_fulfillment_id == fulfillment_id and previous_attempt_count > 0
-
-            dispatch_ok = False
-            dispatch_result = ""
-            dispatch_attempt_count = previous_attempt_count
-            last_dispatch_at = preserved_last_dispatch_at
-            last_error = preserved_last_error
-            hosted_download_url = str(previous_entry.get("hosted_download_url", "")).strip()
-            hosted_download_expires_at = parse_int(str(previous_entry.get("hosted_download_expires_at", "0")), 0)
-
-            if duplicate_confirm:
-                dispatch_result = str(previous_entry.get("dispatch_result", "duplicate_confirm_noop")).strip() or "duplicate_confirm_noop"
-                delivery_status = str(previous_entry.get("delivery_status", "dispatch_duplicate_noop")).strip() or "dispatch_duplicate_noop"
-            else:
-                dispatch_attempt_count = max(0, previous_attempt_count) + 1
-                last_dispatch_at = utc_now()
-                hosted_download_url, hosted_download_expires_at, link_reason = build_textbook_download_link(
-                    user_id=user_id,
-                    fulfillment_id=fulfillment_id,
-                    source_url=source_file_url,
-                    file_mime=file_mime,
-                    selected_candidate=selected_candidate,
-                )
-                if not hosted_download_url:
-                    if str(link_reason).startswith("untrusted_source:"):
-                        dispatch_result = f"download_link_unavailable:{link_reason}"
-                        delivery_status = "dispatch_failed_untrusted_source"
-                        last_error = dispatch_result
-                    else:
-                        hosted_download_url = source_file_url
-                        hosted_download_expires_at = 0
-                        dispatch_result = f"download_link_fallback_source_url:{link_reason}"
-                else:
-                    dispatch_ok, dispatch_result = send_textbook_delivery_email(
-                        delivery_email=delivery_email,
-                        details=details,
-                        file_url=hosted_download_url,
-                        fulfillment_id=fulfillment_id,
-                        selected_candidate=selected_candidate,
-                    )
-                    if dispatch_ok:
-                        delivery_status = "email_dispatched"
-                        last_error = ""
-                    elif dispatch_result == "smtp_not_configured":
-                        delivery_status = "dispatch_skipped_not_configured"
-                        last_error = ""
-                    else:
-                        delivery_status = "dispatch_failed"
-                        last_error = dispatch_result
-
-            status_timeline = append_status_timeline(status_timeline, delivery_status)
-            set_textbook_last_fulfillment(
-                user_id,
-                {
-                    "created_at": int(time.time()),
-                    "fulfillment_id": fulfillment_id,
-                    "delivery_email": delivery_email,
-                    "delivery_status": delivery_status,
-                    "delivery_mode": "smtp_bridge",
-                    "status_timeline": status_timeline,
-                    "dispatch_result": dispatch_result,
-                    "dispatch_attempt_count": dispatch_attempt_count,
-                    "last_dispatch_at": last_dispatch_at,
-                    "last_error": last_error,
-                    "file_url": source_file_url,
-                    "source_file_url": source_file_url,
-                    "hosted_download_url": hosted_download_url,
-                    "hosted_download_expires_at": hosted_download_expires_at,
-                    "request_details": details,
-                    "selected_candidate": selected_candidate,
-                },
-            )
-
-            set_textbook_ingest_offer(
-                user_id,
-                {
-                    "created_at": int(time.time()),
-                    "chat_id": chat_id,
-                    "source_name": source_name,
-                    "doc_id": f"textbook-{user_id}-{int(time.time())}",
-                    "ingest_text": ingest_text[:12000],
-                    "file_url": source_file_url,
-                    "file_mime": file_mime,
-                    "fulfillment_id": fulfillment_id,
-                    "delivery_status": delivery_status,
-                },
-            )
-            status_text = delivery_status
-            if duplicate_confirm:
-                status_text = "duplicate_confirm_ignored"
-            elif delivery_status == "email_dispatched":
-                status_text = "email_dispatched"
-            elif delivery_status == "dispatch_skipped_not_configured":
-                status_text = "email_not_configured"
-            elif delivery_status == "dispatch_failed_untrusted_source":
-                status_text = "blocked_untrusted_source"
-            elif delivery_status.startswith("dispatch_failed"):
-                status_text = "dispatch_failed"
-            expiry_note = ""
-            if hosted_download_expires_at > int(time.time()):
-                expiry_note = f"\n⏳ link_expires_at: {datetime.fromtimestamp(hosted_download_expires_at, tz=timezone.utc).isoformat()}"
-            reply = (
-                f"✅ Textbook queued ({status_text}).\n"
-                f"🆔 fulfillment_id: {fulfillment_id}"
-                f"\n🔗 download_link: {hosted_download_url or '(unavailable)'}"
-                f"{expiry_note}"
-            )
-
-        clear_textbook_request(user_id)
-        send_message(chat_id, reply)
         return True
 
     send_message(chat_id, "Unknown /textbook command. Use /textbook help")
     return True
 
 
+def finish_workspace_ingest_job(job: dict[str, Any], outcome: dict[str, Any] | None, error: str) -> None:
+    params = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+    ingest_payload = params.get("ingest_payload") if isinstance(params.get("ingest_payload"), dict) else {}
+    chat_id = int(job.get("chat_id", 0) or 0)
+    user_id = int(job.get("user_id", 0) or 0)
+    workspace_id = str(ingest_payload.get("workspace_id", ""))
+    doc_id = str(ingest_payload.get("doc_id", ""))
+    result = outcome or {}
+    if error:
+        send_message(chat_id, f"❌ Workspace ingest failed: {error}")
+        return
+    if int(result.get("chunks", 0)) <= 0:
+        send_message(chat_id, "Workspace ingest text is empty. Provide readable content or a valid URL.")
+        return
+    if int(result.get("sent", 0)) <= 0:
+        send_message(chat_id, f"❌ Workspace ingest webhook error: {result.get('error') or 'no chunks accepted'}")
+        return
+
+    entry = get_workspace(user_id)
+    if not entry or str(entry.get("workspace_id", "")).strip() != workspace_id:
+        tenant_id = str(ingest_payload.get("tenant_id", f"u_{user_id}"))
+        queue_workspace_qdrant_deletes(tenant_id, [doc_id])
+        process_workspace_qdrant_deletes(tenants={tenant_id})
+        send_message(chat_id, f"⚠️ Workspace {workspace_id} closed before ingest finished; the document was discarded.")
+        return
+
+    docs_raw = entry.get("docs")
+    docs = docs_raw if isinstance(docs_raw, list) else []
+    docs.append(
+        {
+            "doc_id": doc_id,
+            "source_name": str(ingest_payload.get("source_name", "")),
+            "source_kind": str(params.get("source_kind", "text")),
+            "added_at": int(ingest_payload.get("timestamp", 0) or time.time()),
+        }
+    )
+    entry["docs"] = docs
+    set_workspace(user_id, entry)
+    expires_at = parse_int(str(entry.get("expires_at", "0")), 0)
+    now_ts = int(time.time())
+    remaining = max(0, expires_at - now_ts) if expires_at > 0 else 0
+    chunk_note = f"{result['sent']}/{result['chunks']}"
+    if int(result.get("failed", 0)) > 0:
+        chunk_note += f" ({result['failed']} failed)"
+    if result.get("truncated"):
+        chunk_note += " (truncated)"
+    send_message(
+        chat_id,
+        "✅ Added to temporary workspace and queued for private RAG ingest.\n"
+        f"- workspace_id: {workspace_id}\n"
+        f"- doc_id: {doc_id}\n"
+        f"- chunks: {chunk_note}\n"
+        f"- expires_in_seconds: {remaining}",
+    )
+
+
+BACKGROUND_JOB_HANDLERS["workspace_ingest"] = (run_ingest_job, finish_workspace_ingest_job)
+
+
 def handle_workspace_command(chat_id: int, user_id: int, text: str, role: str) -> bool:
     parsed = parse_workspace_command(text)
     if parsed is None:
@@ -7290,7 +8630,7 @@ def handle_workspace_command(chat_id: int, user_id: int, text: str, role: str) -
 
         docs_raw = entry.get("docs")
         docs = docs_raw if isinstance(docs_raw, list) else []
-        if len(docs) >= max(1, WORKSPACE_MAX_DOCS):
+        if len(docs) + count_active_background_jobs("workspace_ingest", user_id) >= max(1, WORKSPACE_MAX_DOCS):
             send_message(chat_id, f"Workspace doc limit reached ({WORKSPACE_MAX_DOCS}). Close or wait for expiry.")
             return True
 
@@ -7301,28 +8641,12 @@ def handle_workspace_command(chat_id: int, user_id: int, text: str, role: str) -
         is_url = value.startswith(("http://", "https://"))
         source_name = value[:96]
         source_type = "workspace_temp"
-        ingest_text = ""
-
-        if is_url:
-            try:
-                ingest_text = fetch_ingest_text_from_file_url(file_url=value, file_mime="")
-            except Exception as exc:
-                print(f"[telegram-bridge] workspace file extraction failed: {exc}", flush=True)
-
-        if not ingest_text:
-            ingest_text = value
-
-        if not str(ingest_text).strip():
-            send_message(chat_id, "Workspace ingest text is empty. Provide readable content or a valid URL.")
-            return True
-
         ingest_payload = {
             "source": "telegram",
             "chat_id": chat_id,
             "user_id": user_id,
             "role": role,
             "tenant_id": f"u_{user_id}",
-            "text": str(ingest_text)[:16000],
             "source_name": source_name,
             "source_type": source_type,
             "doc_id": doc_id,
@@ -7331,32 +8655,18 @@ def handle_workspace_command(chat_id: int, user_id: int, text: str, role: str) -
             "timestamp": now_ts,
         }
 
-        try:
-            _ = call_n8n(RAG_INGEST_WEBHOOK, ingest_payload)
-        except urllib.error.HTTPError as exc:
-            send_message(chat_id, f"❌ Workspace ingest webhook error: HTTP {exc.code}")
-            return True
-        except Exception as exc:
-            send_message(chat_id, f"❌ Workspace ingest failed: {exc}")
-            return True
-
-        docs.append(
-            {
-                "doc_id": doc_id,
-                "source_name": source_name,
+        send_message(chat_id, "⏳ Workspace ingest started. I'll reply here when indexing finishes.")
+        enqueue_background_job(
+            "workspace_ingest",
+            user_id=user_id,
+            chat_id=chat_id,
+            payload={
+                "ingest_payload": ingest_payload,
+                "file_url": value if is_url else "",
+                "file_mime": "",
+                "fallback_text": value,
                 "source_kind": "url" if is_url else "text",
-                "added_at": now_ts,
-            }
-        )
-        entry["docs"] = docs
-        set_workspace(user_id, entry)
-        remaining = max(0, expires_at - now_ts) if expires_at > 0 else 0
-        send_message(
-            chat_id,
-            "✅ Added to temporary workspace and queued for private RAG ingest.\n"
-            f"- workspace_id: {workspace_id}\n"
-            f"- doc_id: {doc_id}\n"
-            f"- expires_in_seconds: {remaining}",
+            },
         )
         return True
 
@@ -7399,6 +8709,67 @@ def format_research_status(job: dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
+def run_research_start_job(job: dict[str, Any]) -> dict[str, Any]:
+    params = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+    user_id = int(job.get("user_id", 0) or 0)
+    payload = {
+        "source": "telegram",
+        "action": "start",
+        "run_id": str(params.get("run_id", "")),
+        "chat_id": int(job.get("chat_id", 0) or 0),
+        "user_id": user_id,
+        "role": str(params.get("role", "user")),
+        "tenant_id": f"u_{user_id}",
+        "full_name": str(params.get("full_name", "")),
+        "telegram_username": str(params.get("telegram_username", "")),
+        "query": str(params.get("query", "")),
+        "nextcloud_base_url": RESEARCH_NEXTCLOUD_BASE_URL,
+        "nextcloud_user": RESEARCH_NEXTCLOUD_USER,
+        "nextcloud_password": RESEARCH_NEXTCLOUD_PASSWORD,
+        "nextcloud_folder": RESEARCH_NEXTCLOUD_FOLDER,
+        "delivery": {
+            "channel": "telegram",
+            "mode": "nextcloud_link",
+            "link_ttl_seconds": max(60, RESEARCH_DEFAULT_LINK_TTL_SECONDS),
+        },
+        "timestamp": int(params.get("timestamp", 0) or time.time()),
+    }
+    result = call_n8n(RESEARCH_WEBHOOK, payload)
+    return {"result": result}
+
+
+def finish_research_start_job(job: dict[str, Any], outcome: dict[str, Any] | None, error: str) -> None:
+    params = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+    run_id = str(params.get("run_id", ""))
+    chat_id = int(job.get("chat_id", 0) or 0)
+    if error:
+        with RESEARCH_STATE_LOCK:
+            failed = get_research_job(run_id) or {"run_id": run_id, "user_id": int(job.get("user_id", 0) or 0)}
+            failed["status"] = "failed"
+            failed["error"] = f"http_{error[5:]}" if error.startswith("HTTP ") else error[:400]
+            failed["updated_at"] = int(time.time())
+            set_research_job(run_id, failed)
+        send_message(chat_id, f"❌ Research start failed: {error} (run_id={run_id})")
+        return
+
+    with RESEARCH_STATE_LOCK:
+        updated = apply_research_webhook_result(run_id, (outcome or {}).get("result"))
+    status = str((updated or {}).get("status", "")).lower()
+    report_url = str((updated or {}).get("report_url", "")).strip()
+    if status == "ready" and report_url:
+        send_message(chat_id, f"✅ Research report ready.\n- run_id: {run_id}\n- report_link: {report_url}")
+    elif status == "failed":
+        send_message(chat_id, f"❌ Research run failed (run_id={run_id}). Use /research status {run_id} for details.")
+    else:
+        send_message(
+            chat_id,
+            f"🧠 Research started (status={status or 'queued'}).\n- run_id: {run_id}\nUse /research report {run_id} for the Nextcloud link.",
+        )
+
+
+BACKGROUND_JOB_HANDLERS["research_start"] = (run_research_start_job, finish_research_start_job)
+
+
 def handle_research_command(chat_id: int, user_id: int, text: str, user_record: dict[str, Any], role: str) -> bool:
     parsed = parse_research_command(text)
     if parsed is None:
@@ -7437,70 +8808,28 @@ def handle_research_command(chat_id: int, user_id: int, text: str, user_record:
         with RESEARCH_STATE_LOCK:
             set_research_job(run_id, job)
 
-        payload = {
-            "source": "telegram",
-            "action": "start",
-            "run_id": run_id,
-            "chat_id": chat_id,
-            "user_id": user_id,
-            "role": role,
-            "tenant_id": f"u_{user_id}",
-            "full_name": str(user_record.get("full_name", "")),
-            "telegram_username": str(user_record.get("telegram_username", "")),
-            "query": query,
-            "nextcloud_base_url": RESEARCH_NEXTCLOUD_BASE_URL,
-            "nextcloud_user": RESEARCH_NEXTCLOUD_USER,
-            "nextcloud_password": RESEARCH_NEXTCLOUD_PASSWORD,
-            "nextcloud_folder": RESEARCH_NEXTCLOUD_FOLDER,
-            "delivery": {
-                "channel": "telegram",
-                "mode": "nextcloud_link",
-                "link_ttl_seconds": max(60, RESEARCH_DEFAULT_LINK_TTL_SECONDS),
-            },
-            "timestamp": now_ts,
-        }
-
-        try:
-            result = call_n8n(RESEARCH_WEBHOOK, payload)
-            with RESEARCH_STATE_LOCK:
-                updated = apply_research_webhook_result(run_id, result)
-            if isinstance(updated, dict) and str(updated.get("status", "")).lower() == "ready" and str(updated.get("report_url", "")).strip():
-                send_message(
-                    chat_id,
-                    (
-                        f"✅ Research report ready.\n"
-                        f"- run_id: {run_id}\n"
-                        f"- report_link: {str(updated.get('report_url', '')).strip()}"
-                    ),
-                )
-                return True
-        except urllib.error.HTTPError as exc:
-            with RESEARCH_STATE_LOCK:
-                failed = get_research_job(run_id) or job
-                failed["status"] = "failed"
-                failed["error"] = f"http_{exc.code}"
-                failed["updated_at"] = int(time.time())
-                set_research_job(run_id, failed)
-            send_message(chat_id, f"❌ Research start failed: HTTP {exc.code} (run_id={run_id})")
-            return True
-        except Exception as exc:
-            with RESEARCH_STATE_LOCK:
-                failed = get_research_job(run_id) or job
-                failed["status"] = "failed"
-                failed["error"] = str(exc)[:400]
-                failed["updated_at"] = int(time.time())
-                set_research_job(run_id, failed)
-            send_message(chat_id, f"❌ Research start failed: {exc} (run_id={run_id})")
-            return True
-
         send_message(
             chat_id,
             (
                 f"🧠 Research queued.\n"
                 f"- run_id: {run_id}\n"
-                f"Use /research status {run_id} to track progress and /research report {run_id} for the Nextcloud link."
+                f"I'll message you when it finishes. Use /research status {run_id} to track progress and "
+                f"/research report {run_id} for the Nextcloud link."
             ),
         )
+        enqueue_background_job(
+            "research_start",
+            user_id=user_id,
+            chat_id=chat_id,
+            payload={
+                "run_id": run_id,
+                "role": str(role),
+                "query": query,
+                "full_name": str(user_record.get("full_name", "")),
+                "telegram_username": str(user_record.get("telegram_username", "")),
+                "timestamp": now_ts,
+            },
+        )
         return True
 
     run_id = " ".join((rest or "").split()).strip()
@@ -9815,7 +11144,7 @@ def handle_incident_command(chat_id: int, user_id: int, text: str) -> bool:
         send_message(
             chat_id,
             "Incident commands:\n"
-            "/incident list\n"
+            "/incident list [page]\n"
             "/incident show <incident_id>\n"
             "/ack <incident_id>\n"
             "/snooze <incident_id> <minutes>\n"
@@ -9823,36 +11152,36 @@ def handle_incident_command(chat_id: int, user_id: int, text: str) -> bool:
         )
         return True
 
-    state = load_incident_state()
-    incidents = state.get("incidents")
-    if not isinstance(incidents, dict):
-        incidents = {}
-
+    store = get_incident_store()
     now_ts = int(time.time())
 
     if command == "list":
-        rows: list[tuple[int, str, dict[str, Any]]] = []
-        for incident_id, incident in incidents.items():
-            if not isinstance(incident, dict):
-                continue
+        page = 1
+        if args:
             try:
-                last_seen = int(incident.get("last_seen", 0) or 0)
-            except (TypeError, ValueError):
-                last_seen = 0
-            rows.append((last_seen, str(incident_id), incident))
-
-        if not rows:
+                page = max(1, int(args[0]))
+            except ValueError:
+                send_message(chat_id, "Usage: /incident list [page]")
+                return True
+        limit = max(1, INCIDENT_LIST_LIMIT)
+        total, records = store.page(offset=(page - 1) * limit, limit=limit, now_ts=now_ts)
+        if total <= 0:
             send_message(chat_id, "No incidents recorded yet.")
             return True
+        pages = (total + limit - 1) // limit
+        if not records:
+            send_message(chat_id, f"No incidents on page {page}; there are {pages} page(s).")
+            return True
 
-        rows.sort(key=lambda row: row[0], reverse=True)
-        limit = max(1, INCIDENT_LIST_LIMIT)
-        lines = ["Recent incidents:"]
-        for _, incident_id, incident in rows[:limit]:
+        lines = ["Recent incidents:" if pages <= 1 else f"Recent incidents (page {page}/{pages}, {total} total):"]
+        for incident in records:
+            incident_id = str(incident.get("id", "-"))
             status = incident_status(incident, now_ts=now_ts)
             topic = str(incident.get("topic", "-"))
             summary = incident_brief(incident, max_chars=72)
             lines.append(f"- {incident_id}: {status}, topic={topic}, {summary}")
+        if page < pages:
+            lines.append(f"More: /incident list {page + 1}")
         send_message(chat_id, "\n".join(lines))
         return True
 
@@ -9861,7 +11190,7 @@ def handle_incident_command(chat_id: int, user_id: int, text: str) -> bool:
             send_message(chat_id, "Usage: /incident show <incident_id>")
             return True
         incident_id = normalize_incident_id(args[0])
-        incident = incidents.get(incident_id)
+        incident = store.get(incident_id, now_ts=now_ts)
         if not isinstance(incident, dict):
             send_message(chat_id, f"Incident not found: {incident_id}")
             return True
@@ -9907,23 +11236,14 @@ def handle_incident_control_commands(chat_id: int, user_id: int, text: str) -> b
             send_message(chat_id, "Usage: /ack <incident_id>")
             return True
         incident_id = normalize_incident_id(args[0])
-        state = load_incident_state()
-        incidents = state.get("incidents")
-        if not isinstance(incidents, dict):
-            incidents = {}
-            state["incidents"] = incidents
-        incident = incidents.get(incident_id)
-        if not isinstance(incident, dict):
+        outcome = update_incident(
+            incident_id,
+            {"acked_at": int(time.time()), "acked_by": user_id, "snoozed_until": 0, "snoozed_by": 0},
+        )
+        if outcome == "not_found":
             send_message(chat_id, f"Incident not found: {incident_id}")
             return True
-
-        incident["acked_at"] = int(time.time())
-        incident["acked_by"] = user_id
-        incident["snoozed_until"] = 0
-        incident["snoozed_by"] = 0
-        incident["updated_at"] = utc_now()
-        state["updated_at"] = utc_now()
-        if not save_incident_state(state):
+        if outcome != "ok":
             send_message(chat_id, "Could not update incident state. Check bridge volume permissions.")
             return True
         send_message(chat_id, f"✅ Incident {incident_id} acknowledged for {max(60, INCIDENT_ACK_TTL_SECONDS)}s.")
@@ -9941,22 +11261,12 @@ def handle_incident_control_commands(chat_id: int, user_id: int, text: str) -> b
             return True
         minutes = min(1440, max(1, minutes))
 
-        state = load_incident_state()
-        incidents = state.get("incidents")
-        if not isinstance(incidents, dict):
-            incidents = {}
-            state["incidents"] = incidents
-        incident = incidents.get(incident_id)
-        if not isinstance(incident, dict):
+        snoozed_until = int(time.time()) + (minutes * 60)
+        outcome = update_incident(incident_id, {"snoozed_until": snoozed_until, "snoozed_by": user_id})
+        if outcome == "not_found":
             send_message(chat_id, f"Incident not found: {incident_id}")
             return True
-
-        snoozed_until = int(time.time()) + (minutes * 60)
-        incident["snoozed_until"] = snoozed_until
-        incident["snoozed_by"] = user_id
-        incident["updated_at"] = utc_now()
-        state["updated_at"] = utc_now()
-        if not save_incident_state(state):
+        if outcome != "ok":
             send_message(chat_id, "Could not update incident state. Check bridge volume permissions.")
             return True
         send_message(chat_id, f"✅ Incident {incident_id} snoozed for {minutes} minute(s).")
@@ -9966,21 +11276,11 @@ def handle_incident_control_commands(chat_id: int, user_id: int, text: str) -> b
         send_message(chat_id, "Usage: /unsnooze <incident_id>")
         return True
     incident_id = normalize_incident_id(args[0])
-    state = load_incident_state()
-    incidents = state.get("incidents")
-    if not isinstance(incidents, dict):
-        incidents = {}
-        state["incidents"] = incidents
-    incident = incidents.get(incident_id)
-    if not isinstance(incident, dict):
+    outcome = update_incident(incident_id, {"snoozed_until": 0, "snoozed_by": 0})
+    if outcome == "not_found":
         send_message(chat_id, f"Incident not found: {incident_id}")
         return True
-
-    incident["snoozed_until"] = 0
-    incident["snoozed_by"] = 0
-    incident["updated_at"] = utc_now()
-    state["updated_at"] = utc_now()
-    if not save_incident_state(state):
+    if outcome != "ok":
         send_message(chat_id, "Could not update incident state. Check bridge volume permissions.")
         return True
     send_message(chat_id, f"✅ Incident {incident_id} is no longer snoozed.")
@@ -10950,6 +12250,110 @@ def process_registration_flow(
     return False
 
 
+REPLY_CACHE: OrderedDict[str, dict[str, Any]] = OrderedDict()
+REPLY_CACHE_LOCK = threading.Lock()
+REPLY_CACHE_COUNTERS = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypassed": 0, "chars": 0}
+try:
+    REPLY_CACHE_BYPASS_RE: re.Pattern[str] | None = (
+        re.compile(REPLY_CACHE_BYPASS_PATTERN, re.IGNORECASE) if REPLY_CACHE_BYPASS_PATTERN.strip() else None
+    )
+except re.error as exc:
+    print(f"[telegram-bridge] invalid TELEGRAM_REPLY_CACHE_BYPASS_PATTERN ignored: {exc}", flush=True)
+    REPLY_CACHE_BYPASS_RE = None
+
+
+def reply_cache_route(mode: str, payload: dict[str, Any]) -> str:
+    if mode != "rag":
+        return mode
+    return "workspace" if payload.get("workspace_context_only") else "rag"
+
+
+def reply_cache_key(mode: str, payload: dict[str, Any]) -> str:
+    # Empty key means "do not cache": disabled, route not opted in, media input, or time-sensitive wording.
+    if not REPLY_CACHE_ENABLED:
+        return ""
+    route = reply_cache_route(mode, payload)
+    message = re.sub(r"\s+", " ", normalize_text(payload.get("message", ""))).rstrip("?!. ")
+    if (
+        route not in REPLY_CACHE_ROUTES
+        or not message
+        or payload.get("has_image")
+        or payload.get("has_audio")
+        or (REPLY_CACHE_BYPASS_RE is not None and REPLY_CACHE_BYPASS_RE.search(message))
+    ):
+        with REPLY_CACHE_LOCK:
+            REPLY_CACHE_COUNTERS["bypassed"] += 1
+        return ""
+    context = {
+        "role": payload.get("role"),
+        "account_class": payload.get("account_class"),
+        "child_guardrails_enabled": payload.get("child_guardrails_enabled"),
+        "memory_enabled": payload.get("memory_enabled_effective"),
+        "memory_summary": payload.get("memory_summary_effective"),
+        "workspace_mode": payload.get("workspace_mode"),
+        "workspace_doc_ids": sorted(str(item) for item in payload.get("workspace_doc_ids") or []),
+        "persona_pref_tone": payload.get("persona_pref_tone"),
+        "persona_pref_brevity": payload.get("persona_pref_brevity"),
+        "user_profile_seed": payload.get("user_profile_seed"),
+    }
+    context_hash = hashlib.sha256(json.dumps(context, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{route}|{payload.get('tenant_id', '')}|{context_hash[:16]}|{hashlib.sha256(message.encode('utf-8')).hexdigest()[:24]}"
+
+
+def get_reply_cache(key: str, now_ts: int | None = None) -> str | None:
+    if not key:
+        return None
+    ts_now = int(now_ts or time.time())
+    with REPLY_CACHE_LOCK:
+        entry = REPLY_CACHE.get(key)
+        if not isinstance(entry, dict):
+            REPLY_CACHE_COUNTERS["misses"] += 1
+            return None
+        if ts_now - int(entry.get("cached_at", 0) or 0) > REPLY_CACHE_TTL_SECONDS:
+            REPLY_CACHE.pop(key, None)
+            REPLY_CACHE_COUNTERS["chars"] -= len(str(entry.get("reply", "")))
+            REPLY_CACHE_COUNTERS["misses"] += 1
+            return None
+        REPLY_CACHE.move_to_end(key)
+        REPLY_CACHE_COUNTERS["hits"] += 1
+        return str(entry.get("reply", ""))
+
+
+def put_reply_cache(key: str, reply: str, now_ts: int | None = None) -> None:
+    text = str(reply or "").strip()
+    # Error and placeholder replies are never worth replaying.
+    if not key or not text or text.startswith("❌") or text == "✅ Received." or len(text) > REPLY_CACHE_MAX_CHARS:
+        return
+    with REPLY_CACHE_LOCK:
+        previous = REPLY_CACHE.pop(key, None)
+        if isinstance(previous, dict):
+            REPLY_CACHE_COUNTERS["chars"] -= len(str(previous.get("reply", "")))
+        REPLY_CACHE[key] = {"cached_at": int(now_ts or time.time()), "reply": text}
+        REPLY_CACHE_COUNTERS["chars"] += len(text)
+        REPLY_CACHE_COUNTERS["stores"] += 1
+        while len(REPLY_CACHE) > REPLY_CACHE_MAX_ENTRIES or REPLY_CACHE_COUNTERS["chars"] > REPLY_CACHE_MAX_CHARS:
+            _, evicted = REPLY_CACHE.popitem(last=False)
+            REPLY_CACHE_COUNTERS["chars"] -= len(str(evicted.get("reply", "")))
+            REPLY_CACHE_COUNTERS["evictions"] += 1
+
+
+def reply_cache_snapshot() -> dict[str, Any]:
+    with REPLY_CACHE_LOCK:
+        hits = int(REPLY_CACHE_COUNTERS["hits"])
+        misses = int(REPLY_CACHE_COUNTERS["misses"])
+        return {
+            "enabled": bool(REPLY_CACHE_ENABLED),
+            "entries": len(REPLY_CACHE),
+            "chars": int(REPLY_CACHE_COUNTERS["chars"]),
+            "hits": hits,
+            "misses": misses,
+            "bypassed": int(REPLY_CACHE_COUNTERS["bypassed"]),
+            "stores": int(REPLY_CACHE_COUNTERS["stores"]),
+            "evictions": int(REPLY_CACHE_COUNTERS["evictions"]),
+            "hit_rate": round(hits / (hits + misses), 3) if (hits + misses) > 0 else 0.0,
+        }
+
+
 def build_payload(
     chat_id: int,
     user_id: int,
@@ -10975,9 +12379,7 @@ def build_payload(
     tenant_id = f"u_{user_id}"
     voice_memory_opt_in = bool(memory_enabled) if POLICY_MEMORY_VOICE_OPT_IN_REQUIRED else True
     role_key = str(role or "user").strip().lower() or "user"
-    role_allowlist = sorted(list(ROLE_COMMAND_ALLOWLIST.get(role_key, set())))
-    policy_rate_limit_rpm = POLICY_TELEGRAM_SETTINGS.get("rate_limit_requests_per_minute")
-    policy_rate_limit_burst = POLICY_TELEGRAM_SETTINGS.get("rate_limit_burst")
+    policy = POLICY_PAYLOAD_PER_MESSAGE
     payload = {
         "source": "telegram",
         "chat_id": chat_id,
@@ -11018,28 +12420,63 @@ def build_payload(
         "tone_history": tone_history,
         "persona_pref_tone": str(persona_pref_tone or ""),
         "persona_pref_brevity": str(persona_pref_brevity or ""),
-        "policy_role_command_allowlist": role_allowlist,
-        "policy_rate_limit_window_seconds": int(RATE_LIMIT_WINDOW_SECONDS),
-        "policy_rate_limit_max_requests": int(RATE_LIMIT_MAX_REQUESTS),
-        "policy_rate_limit_requests_per_minute": int(policy_rate_limit_rpm) if isinstance(policy_rate_limit_rpm, int) and policy_rate_limit_rpm > 0 else None,
-        "policy_rate_limit_burst": int(policy_rate_limit_burst) if isinstance(policy_rate_limit_burst, int) and policy_rate_limit_burst >= 0 else None,
+        "policy_version": POLICY_PAYLOAD_VERSION,
+        "policy_role_command_allowlist": list(policy["role_command_allowlists"].get(role_key, [])),
+        "policy_rate_limit_window_seconds": policy["policy_rate_limit_window_seconds"],
+        "policy_rate_limit_max_requests": policy["policy_rate_limit_max_requests"],
+        "policy_rate_limit_requests_per_minute": policy["policy_rate_limit_requests_per_minute"],
+        "policy_rate_limit_burst": policy["policy_rate_limit_burst"],
         "user_profile_seed": user_profile_seed,
         "user_profile_image_url": user_profile_image_url,
         "account_age": int(account_age) if isinstance(account_age, int) else None,
         "account_class": normalize_account_class(account_class),
         "child_guardrails_enabled": bool(child_guardrails_enabled),
-        "child_media_allowed_ratings": sorted(CHILD_MEDIA_ALLOWED_RATINGS),
-        "child_media_allowed_ratings_under_13": sorted(CHILD_MEDIA_ALLOWED_RATINGS_UNDER_13),
-        "child_media_allowed_ratings_13_15": sorted(CHILD_MEDIA_ALLOWED_RATINGS_13_15),
-        "child_media_allowed_ratings_16_17": sorted(CHILD_MEDIA_ALLOWED_RATINGS_16_17),
-        "child_media_block_if_adult_flag": bool(CHILD_MEDIA_BLOCK_IF_ADULT_FLAG),
-        "child_media_blocked_genre_ids": sorted(CHILD_MEDIA_BLOCKED_GENRE_IDS),
-        "child_media_blocked_keywords": sorted(CHILD_MEDIA_BLOCKED_KEYWORDS),
         "timestamp": int(time.time()),
     }
+    if PAYLOAD_POLICY_MODE == "full":
+        payload.update(POLICY_PAYLOAD_CHILD_MEDIA)
     return payload
 
 
+def call_webhook_for_reply(webhook_path: str, mode: str, payload: dict[str, Any], cleaned_text: str) -> str:
+    if (
+        mode == "rag"
+        and DIRECT_RETRIEVAL_ENABLED
+        and payload.get("workspace_context_only")
+        and not payload.get("has_audio")
+        and cleaned_text.strip()
+    ):
+        retrieved_hits = direct_workspace_retrieval(
+            str(payload.get("tenant_id", "")),
+            cleaned_text.strip(),
+            list(payload.get("workspace_doc_ids") or []),
+        )
+        if retrieved_hits is not None:
+            payload["retrieval_source"] = "bridge"
+            payload["retrieved_hits"] = retrieved_hits
+
+    if (
+        mode == "rag"
+        and EMBED_CACHE_ENABLED
+        and payload.get("retrieval_source") != "bridge"
+        and not payload.get("has_audio")
+        and cleaned_text.strip()
+    ):
+        query_embedding = query_embedding_for_payload(cleaned_text.strip())
+        if query_embedding is not None:
+            payload["query_embedding"] = query_embedding
+            payload["query_embedding_model"] = RAG_EMBED_MODEL
+
+    try:
+        result = call_n8n(webhook_path, payload)
+        reply = extract_reply_text(result)
+    except urllib.error.HTTPError as exc:
+        reply = f"❌ n8n webhook error: HTTP {exc.code}"
+    except Exception as exc:
+        reply = f"❌ bridge error: {exc}"
+    return reply
+
+
 def process_update(update: dict[str, Any]) -> None:
     chat_id, user_id, text, photos, voice, audio, chat_type, username, first_name, last_name = parse_update(update)
 
@@ -11263,36 +12700,13 @@ def process_update(update: dict[str, Any]) -> None:
         except Exception as exc:
             checks.append(f"rag_webhook=fail({exc})")
 
-        tenant_collection = f"day4_rag_{tenant_id}"
-        try:
-            with urllib.request.urlopen(
-                f"http://qdrant:6333/collections/{tenant_collection}", timeout=8
-            ) as response:
-                data = json.loads(response.read().decode("utf-8", errors="ignore"))
-            points = int(((data.get("result") or {}).get("points_count") or 0))
-            checks.append(f"tenant_points=ok({points})")
-        except urllib.error.HTTPError as exc:
-            if exc.code == 404:
-                checks.append("tenant_points=ok(0)")
-            else:
-                checks.append(f"tenant_points=fail({exc})")
-        except Exception as exc:
-            checks.append(f"tenant_points=fail({exc})")
-
-        try:
-            with urllib.request.urlopen(
-                "http://qdrant:6333/collections/day4_rag_shared_public", timeout=8
-            ) as response:
-                shared_data = json.loads(response.read().decode("utf-8", errors="ignore"))
-            shared_points = int(((shared_data.get("result") or {}).get("points_count") or 0))
-            checks.append(f"shared_points=ok({shared_points})")
-        except urllib.error.HTTPError as exc:
-            if exc.code == 404:
-                checks.append("shared_points=ok(0)")
-            else:
-                checks.append(f"shared_points=fail({exc})")
-        except Exception as exc:
-            checks.append(f"shared_points=fail({exc})")
+        for label, collection in (("tenant_points", rag_collection_name(tenant_id)), ("shared_points", rag_collection_name("shared_public"))):
+            try:
+                info = QDRANT.get_collection(collection)
+                points = int(((info or {}).get("points_count") or 0))
+                checks.append(f"{label}=ok({points})")
+            except Exception as exc:
+                checks.append(f"{label}=fail({exc})")
 
         if role == "admin":
             ops_payload = dict(rag_payload)
@@ -11369,7 +12783,7 @@ def process_update(update: dict[str, Any]) -> None:
             "/digest": "Usage: /digest now|stats",
             "/selftest": "Usage: /selftest",
             "/notify": "Usage: /notify me [json]|list|profile|test|validate|stats|set|add|remove|emergency|quiet|quarantine|delivery",
-            "/incident": "Usage: /incident list|show <incident_id>",
+            "/incident": "Usage: /incident list [page]|show <incident_id>",
             "/ack": "Usage: /ack <incident_id>",
             "/snooze": "Usage: /snooze <incident_id> <minutes>",
             "/unsnooze": "Usage: /unsnooze <incident_id>",
@@ -11499,14 +12913,13 @@ def process_update(update: dict[str, Any]) -> None:
         return
 
     webhook_path = RAG_WEBHOOK if mode == "rag" else OPS_WEBHOOK
-
-    try:
-        result = call_n8n(webhook_path, payload)
-        reply = extract_reply_text(result)
-    except urllib.error.HTTPError as exc:
-        reply = f"❌ n8n webhook error: HTTP {exc.code}"
-    except Exception as exc:
-        reply = f"❌ bridge error: {exc}"
+    cache_key = reply_cache_key(mode, payload)
+    cached_reply = get_reply_cache(cache_key)
+    if cached_reply is not None:
+        reply = cached_reply
+    else:
+        reply = call_webhook_for_reply(webhook_path, mode, payload, cleaned_text)
+        put_reply_cache(cache_key, reply)
 
     if mode == "rag":
         update_user_tone_history(user_id, extract_tone_from_reply_text(reply))
@@ -11517,6 +12930,7 @@ def process_update(update: dict[str, Any]) -> None:
 
 def main() -> None:
     start_textbook_download_server()
+    start_background_job_workers()
     print(
         f"[telegram-bridge] started (registered_users={len(USER_REGISTRY.get('users', {}))}, default_mode={DEFAULT_MODE})",
         flush=True,
@@ -11535,6 +12949,8 @@ def main() -> None:
                         f"[telegram-bridge] workspace cleanup cleared={cleaned} docs_removed={removed_docs} docs_failed={failed_docs}",
                         flush=True,
                     )
+            if WORKSPACE_STATE.get("pending_deletes"):
+                process_workspace_qdrant_deletes(now_ts=now_ts)
 
             global TEXTBOOK_DOWNLOAD_LAST_CLEANUP_TS
             if TEXTBOOK_DOWNLOAD_LAST_CLEANUP_TS <= 0 or (
@@ -11548,11 +12964,15 @@ def main() -> None:
                         flush=True,
                     )
 
+            drain_background_job_completions()
+            EMBED_CACHE.flush(EMBED_CACHE_SAVE_INTERVAL_SECONDS)
+            flush_textbook_search_cache(TEXTBOOK_SEARCH_CACHE_SAVE_INTERVAL_SECONDS)
+
             response = telegram_request(
                 "getUpdates",
                 {
                     "offset": offset + 1,
-                    "timeout": POLL_TIMEOUT,
+                    "timeout": background_job_poll_timeout(POLL_TIMEOUT),
                     "allowed_updates": ["message", "edited_message"],
                 },
             )
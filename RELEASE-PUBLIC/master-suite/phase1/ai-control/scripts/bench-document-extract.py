@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bridge"))
+
+from document_extract import DocumentExtractor, detect_document_kind  # noqa: E402
+
+CONTENT_TYPES = {".pdf": "application/pdf", ".epub": "application/epub+zip"}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark PDF/EPUB extraction: inline vs process pool vs cache.")
+    parser.add_argument("--corpus", required=True, help="Directory of sample .pdf/.epub files (searched recursively).")
+    parser.add_argument(
+        "--workers",
+        default="0,2,4",
+        help="Comma-separated pool sizes to compare (0 = inline on the calling thread).",
+    )
+    parser.add_argument("--pages-per-task", type=int, default=16, help="Pages (or EPUB members) per pool task.")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-document extraction timeout in seconds.")
+    parser.add_argument("--repeat", type=int, default=1, help="Cold runs per document and pool size.")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable JSON report.")
+    return parser.parse_args()
+
+
+def load_corpus(path: Path) -> list[Path]:
+    if not path.is_dir():
+        raise FileNotFoundError(f"corpus directory missing: {path}")
+    files = sorted(item for item in path.rglob("*") if item.is_file() and item.suffix.lower() in CONTENT_TYPES)
+    if not files:
+        raise ValueError(f"no .pdf/.epub files under {path}")
+    return files
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def time_extract(extractor: DocumentExtractor, path: Path, sha256: str) -> tuple[float, int, int]:
+    started = time.perf_counter()
+    segments = 0
+    chars = 0
+    for segment in extractor.extract(path, CONTENT_TYPES[path.suffix.lower()], path.name, sha256):
+        segments += 1
+        chars += len(segment)
+    elapsed = time.perf_counter() - started
+    return elapsed, segments, chars
+
+
+def run_benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    files = load_corpus(Path(args.corpus))
+    worker_counts = sorted({max(0, int(item)) for item in str(args.workers).split(",") if item.strip()})
+    documents: list[dict[str, Any]] = []
+    totals: dict[int, float] = {workers: 0.0 for workers in worker_counts}
+
+    for path in files:
+        sha256 = file_sha256(path)
+        row: dict[str, Any] = {
+            "file": str(path.relative_to(args.corpus)),
+            "kind": detect_document_kind(CONTENT_TYPES[path.suffix.lower()], path.name),
+            "bytes": path.stat().st_size,
+            "runs": {},
+        }
+        for workers in worker_counts:
+            extractor = DocumentExtractor(
+                workers=workers,
+                pages_per_task=args.pages_per_task,
+                timeout_seconds=args.timeout,
+                cache_dir=None,
+                cache_max_entries=0,
+            )
+            try:
+                # Warm-up spawns the pool so process start-up is not charged to the first document.
+                time_extract(extractor, path, sha256)
+                timings = []
+                for _ in range(max(1, args.repeat)):
+                    elapsed, segments, chars = time_extract(extractor, path, sha256)
+                    timings.append(elapsed)
+            finally:
+                extractor.shutdown()
+            median = statistics.median(timings)
+            totals[workers] += median
+            row["runs"][str(workers)] = {"median_s": round(median, 4), "segments": segments, "chars": chars}
+
+        with tempfile.TemporaryDirectory(prefix="extract-cache-") as cache_dir:
+            cached = DocumentExtractor(
+                workers=0,
+                pages_per_task=args.pages_per_task,
+                timeout_seconds=args.timeout,
+                cache_dir=Path(cache_dir),
+                cache_max_entries=10,
+            )
+            time_extract(cached, path, sha256)
+            elapsed, _, _ = time_extract(cached, path, sha256)
+            row["cache_hit_s"] = round(elapsed, 4)
+        documents.append(row)
+
+    baseline = totals.get(worker_counts[0], 0.0)
+    return {
+        "corpus": str(args.corpus),
+        "documents": documents,
+        "totals": {
+            str(workers): {
+                "seconds": round(total, 4),
+                "speedup_vs_first": round(baseline / total, 2) if total > 0 else 0.0,
+            }
+            for workers, total in totals.items()
+        },
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"corpus: {report['corpus']}")
+    for row in report["documents"]:
+        runs = ", ".join(f"w{workers}={run['median_s']:.3f}s" for workers, run in row["runs"].items())
+        first = next(iter(row["runs"].values()))
+        print(
+            f"- {row['file']} ({row['kind']}, {row['bytes']} bytes, {first['segments']} segments): "
+            f"{runs}, cache_hit={row['cache_hit_s']:.4f}s"
+        )
+    print("totals:")
+    for workers, total in report["totals"].items():
+        print(f"- workers={workers}: {total['seconds']:.3f}s (speedup {total['speedup_vs_first']:.2f}x)")
+
+
+def main() -> int:
+    args = parse_args()
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bridge"))
+
+import ntfy_to_n8n as bridge  # noqa: E402
+from event_classifier import EventClassifier  # noqa: E402
+
+SERVICES = "plex jellyfin sonarr radarr overseerr qdrant n8n ollama nextcloud router backup-nas uptime-kuma".split()
+MOVIES = "Dune Arrival Heat Alien Coco Up Jaws Rocky Fargo Tron Brave Gravity Zodiac Moana Drive".split()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark fanout filter classification: legacy scans vs EventClassifier.")
+    parser.add_argument("--corpus", help="Recorded ntfy NDJSON (one event per line, e.g. a /json?poll=1 dump).")
+    parser.add_argument("--events", type=int, default=20000, help="Synthetic events when no corpus is given.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the corpus per method.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable JSON report.")
+    return parser.parse_args()
+
+
+def synth_event(rng: random.Random) -> tuple[str, str]:
+    service = rng.choice(SERVICES)
+    movie = f"{rng.choice(MOVIES)} ({rng.randint(1970, 2025)})"
+    kind = rng.random()
+    if kind < 0.35:
+        return f"[{service}] Down", f"Monitor {service} is DOWN: connection refused after {rng.randint(1, 30)} retries"
+    if kind < 0.55:
+        return f"[{service}] Up", f"Monitor {service} is back up; latency {rng.randint(5, 900)}ms (non-critical)"
+    if kind < 0.75:
+        return "Media ready", f"{movie} is now available in Plex"
+    if kind < 0.85:
+        return "Media sweep probe", f"media cursor probe cursor_probe={rng.randint(1000, 9999)} {movie}"
+    if kind < 0.92:
+        return "Smoke test", f"direct fanout log check run={rng.randint(1, 99)}"
+    return f"{service} disk usage", f"Volume /data at {rng.randint(70, 99)}% on {service}; no outage expected"
+
+
+def load_corpus(path: str) -> list[tuple[str, str]]:
+    events: list[tuple[str, str]] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        try:
+            parsed = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(parsed, dict) and parsed.get("event", "message") == "message":
+            events.append((str(parsed.get("title", "")), str(parsed.get("message", ""))))
+    return events
+
+
+def legacy_verdicts(title: str, message: str) -> dict[str, bool]:
+    # The pre-classifier checks as fanout ran them: each helper rebuilt the blob and re-scanned it, and the
+    # ready-signal test ran twice (ready gate, then first-seen key).
+    def blob() -> str:
+        return f"{title} {message}".strip().lower()
+
+    drop = any(pattern in blob() for pattern in bridge.TELEGRAM_NOTIFY_DROP_PATTERNS)
+    text = blob()
+    critical = False
+    if not any(re.search(pattern, text) for pattern in bridge.NEGATED_CRITICAL_PATTERNS):
+        critical = any(re.search(rf"\b{re.escape(keyword)}\b", text) for keyword in bridge.CRITICAL_KEYWORDS)
+    noise = any(marker in blob() for marker in bridge.TELEGRAM_MEDIA_NOISE_MARKERS)
+    ready_gate = any(re.search(pattern, blob()) for pattern in bridge.MEDIA_READY_SIGNAL_PATTERNS)
+    ready_first_seen = any(re.search(pattern, blob()) for pattern in bridge.MEDIA_READY_SIGNAL_PATTERNS)
+    return {"drop": drop, "media_noise": noise, "critical_text": critical, "ready_signal": ready_gate and ready_first_seen}
+
+
+def time_method(classify: Callable[[str, str], dict[str, bool]], events: list[tuple[str, str]], repeat: int) -> dict[str, Any]:
+    timings = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        for title, message in events:
+            classify(title, message)
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        "median_ms": round(median * 1000.0, 2),
+        "events_per_sec": int(len(events) / median) if median > 0 else 0,
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    events = load_corpus(args.corpus) if args.corpus else [synth_event(rng) for _ in range(max(1, args.events))]
+    classifier = EventClassifier(
+        drop_patterns=bridge.TELEGRAM_NOTIFY_DROP_PATTERNS,
+        noise_markers=bridge.TELEGRAM_MEDIA_NOISE_MARKERS,
+        critical_keywords=bridge.CRITICAL_KEYWORDS,
+        negated_critical_patterns=bridge.NEGATED_CRITICAL_PATTERNS,
+        ready_signal_patterns=bridge.MEDIA_READY_SIGNAL_PATTERNS,
+    )
+    mismatches = sum(1 for title, message in events if legacy_verdicts(title, message) != classifier.classify(title, message))
+    verdict_counts = {key: 0 for key in ("drop", "media_noise", "critical_text", "ready_signal")}
+    for title, message in events:
+        for key, value in classifier.classify(title, message).items():
+            verdict_counts[key] += int(value)
+    return {
+        "events": len(events),
+        "source": args.corpus or "synthetic",
+        "mismatches": mismatches,
+        "verdicts": verdict_counts,
+        "methods": {
+            "legacy_scans": time_method(legacy_verdicts, events, args.repeat),
+            "event_classifier": time_method(classifier.classify, events, args.repeat),
+        },
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"events: {report['events']} ({report['source']})")
+    print(f"verdicts: {', '.join(f'{key}={value}' for key, value in report['verdicts'].items())}")
+    print(f"verdict mismatches vs legacy: {report['mismatches']}")
+    baseline = report["methods"]["legacy_scans"]
+    for label, result in report["methods"].items():
+        speedup = baseline["median_ms"] / result["median_ms"] if result["median_ms"] > 0 else 0.0
+        print(f"- {label}: {result['median_ms']:.2f} ms, {result['events_per_sec']} events/s ({speedup:.2f}x vs legacy)")
+
+
+def main() -> int:
+    args = parse_args()
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 1 if report["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bridge"))
+
+BOT_TOKEN = "bench-token"
+SERVICES = "plex jellyfin sonarr radarr overseerr qdrant n8n ollama nextcloud router backup-nas uptime-kuma".split()
+MOVIES = "Dune Arrival Heat Alien Coco Up Jaws Rocky Fargo Tron Brave Gravity Zodiac Moana Drive".split()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Capture ntfy events to NDJSON, or replay a corpus through the ntfy bridge pipeline against local stubs."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    capture = sub.add_parser("capture", help="Record cached ntfy messages to an NDJSON corpus.")
+    capture.add_argument("--ntfy-base", default=os.getenv("NTFY_BASE", "http://localhost:8090"))
+    capture.add_argument(
+        "--topics",
+        default="ops-alerts,ops-validate,media-alerts,system-maintenance,ai-chat,ai-replies,ops-commands",
+        help="Comma-separated topics to record.",
+    )
+    capture.add_argument("--since", default="24h", help="ntfy since= value (duration, unix time or message id).")
+    capture.add_argument("--out", required=True, help="NDJSON file to write.")
+
+    replay = sub.add_parser("replay", help="Replay a corpus through the bridge pipeline and report throughput/latency.")
+    replay.add_argument("--corpus", help="Recorded ntfy NDJSON; synthetic events are generated when omitted.")
+    replay.add_argument("--events", type=int, default=500, help="Synthetic events when no corpus is given.")
+    replay.add_argument("--rate", type=float, default=50.0, help="Publish rate in events/s (0 = publish all at once).")
+    replay.add_argument("--users", type=int, default=3, help="Admin recipients in the synthetic user registry.")
+    replay.add_argument("--poll-seconds", type=int, default=1, help="POLL_SECONDS for the bridge under test.")
+    replay.add_argument("--bot-latency-ms", type=float, default=0.0, help="Delay added to each stub Bot API response.")
+    replay.add_argument("--n8n-latency-ms", type=float, default=0.0, help="Delay added to each stub n8n webhook response.")
+    replay.add_argument("--state-backend", choices=["json", "sqlite"], default="json")
+    replay.add_argument("--drain-timeout", type=float, default=120.0, help="Seconds to wait for both stages to finish.")
+    replay.add_argument("--seed", type=int, default=7)
+    replay.add_argument("--json", action="store_true", help="Emit machine-readable JSON report.")
+    return parser.parse_args()
+
+
+def capture_corpus(args: argparse.Namespace) -> int:
+    topics = ",".join(item.strip() for item in args.topics.split(",") if item.strip())
+    since = urllib.parse.quote(str(args.since), safe="")
+    url = f"{args.ntfy_base.rstrip('/')}/{topics}/json?poll=1&since={since}"
+    written = 0
+    with urllib.request.urlopen(url, timeout=60) as response, open(args.out, "w", encoding="utf-8") as out:
+        for raw in response:
+            try:
+                parsed = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(parsed, dict) and parsed.get("event") == "message":
+                out.write(json.dumps(parsed, ensure_ascii=False) + "\n")
+                written += 1
+    print(f"captured {written} events from {topics} into {args.out}")
+    return 0
+
+
+def synth_event(rng: random.Random) -> dict[str, Any]:
+    service = f"{rng.choice(SERVICES)}-{rng.randint(1, 40)}"
+    movie = f"{rng.choice(MOVIES)} ({rng.randint(1970, 2025)})"
+    kind = rng.random()
+    if kind < 0.35:
+        return {
+            "topic": "ops-alerts",
+            "title": f"[{service}] Down",
+            "message": f"Monitor {service} is DOWN: connection refused",
+            "priority": 5,
+        }
+    if kind < 0.5:
+        return {"topic": "ops-alerts", "title": f"[{service}] Up", "message": f"Monitor {service} is back up", "priority": 3}
+    if kind < 0.7:
+        return {"topic": "media-alerts", "title": "Media ready", "message": f"{movie} is now available in Plex", "priority": 3}
+    if kind < 0.8:
+        return {
+            "topic": "system-maintenance",
+            "title": f"{service} disk usage",
+            "message": f"Volume /data at {rng.randint(70, 99)}% on {service}",
+            "priority": 4,
+        }
+    return {"topic": "ai-chat", "title": "", "message": f"what is the status of {service}?", "priority": 3}
+
+
+def load_corpus(path: str) -> list[dict[str, Any]]:
+    events: list[dict[str, Any]] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        try:
+            parsed = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(parsed, dict) or parsed.get("event", "message") != "message" or not parsed.get("topic"):
+            continue
+        events.append(
+            {
+                "topic": str(parsed["topic"]),
+                "title": str(parsed.get("title", "")),
+                "message": str(parsed.get("message", "")),
+                "priority": int(parsed.get("priority", 3) or 3),
+            }
+        )
+    return events
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StubNtfy:
+    """In-memory ntfy cache answering the bridge's `/<topic>/json?poll=1&since=<id|unix>` polls."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.topics: dict[str, list[dict[str, Any]]] = {}
+        self.published_at: dict[str, float] = {}
+        self.polls = 0
+
+    def publish(self, seq: int, event: dict[str, Any]) -> None:
+        message = dict(event, id=f"bench{seq:08d}", time=int(time.time()), event="message")
+        with self.lock:
+            self.topics.setdefault(message["topic"], []).append(message)
+            self.published_at[message["id"]] = time.monotonic()
+
+    def poll(self, topic: str, since: str) -> list[dict[str, Any]]:
+        with self.lock:
+            self.polls += 1
+            messages = list(self.topics.get(topic, []))
+        if not since:
+            return messages
+        for index, message in enumerate(messages):
+            if message["id"] == since:
+                return messages[index + 1 :]
+        if since.isdigit():
+            return [message for message in messages if int(message["time"]) >= int(since)]
+        return messages
+
+
+class StubCounters:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.calls: dict[str, int] = {}
+        self.message_id = 0
+
+    def hit(self, name: str) -> int:
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.message_id += 1
+            return self.message_id
+
+    def total(self) -> int:
+        with self.lock:
+            return sum(self.calls.values())
+
+
+def start_stub(routes: Any) -> tuple[ThreadingHTTPServer, str]:
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            self._reply(*routes(self, "GET"))
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", "0") or 0)
+            self.rfile.read(length)
+            self._reply(*routes(self, "POST"))
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_stubs(args: argparse.Namespace, ntfy: StubNtfy, counters: dict[str, StubCounters]) -> dict[str, str]:
+    def ntfy_routes(handler: BaseHTTPRequestHandler, method: str) -> tuple[int, bytes, str]:
+        parsed = urllib.parse.urlsplit(handler.path)
+        topic = parsed.path.strip("/").split("/")[0]
+        since = urllib.parse.parse_qs(parsed.query).get("since", [""])[0]
+        body = "".join(json.dumps(message) + "\n" for message in ntfy.poll(topic, since))
+        return 200, body.encode("utf-8"), "application/x-ndjson"
+
+    def n8n_routes(handler: BaseHTTPRequestHandler, method: str) -> tuple[int, bytes, str]:
+        counters["n8n"].hit(urllib.parse.urlsplit(handler.path).path)
+        if args.n8n_latency_ms > 0:
+            time.sleep(args.n8n_latency_ms / 1000.0)
+        return 200, b"{}", "application/json"
+
+    def overseerr_routes(handler: BaseHTTPRequestHandler, method: str) -> tuple[int, bytes, str]:
+        counters["overseerr"].hit(urllib.parse.urlsplit(handler.path).path)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(handler.path).query).get("query", [""])[0]
+        body = {"page": 1, "totalPages": 1, "results": [{"title": query, "mediaInfo": {"status": 5}}]}
+        return 200, json.dumps(body).encode("utf-8"), "application/json"
+
+    def telegram_routes(handler: BaseHTTPRequestHandler, method: str) -> tuple[int, bytes, str]:
+        api_method = urllib.parse.urlsplit(handler.path).path.rsplit("/", 1)[-1]
+        message_id = counters["telegram"].hit(api_method)
+        if args.bot_latency_ms > 0:
+            time.sleep(args.bot_latency_ms / 1000.0)
+        body = {"ok": True, "result": {"message_id": message_id}}
+        return 200, json.dumps(body).encode("utf-8"), "application/json"
+
+    bases = {}
+    for name, routes in (
+        ("ntfy", ntfy_routes),
+        ("n8n", n8n_routes),
+        ("overseerr", overseerr_routes),
+        ("telegram", telegram_routes),
+    ):
+        _server, bases[name] = start_stub(routes)
+    return bases
+
+
+def configure_bridge_env(args: argparse.Namespace, state_dir: Path, bases: dict[str, str]) -> None:
+    registry = {
+        "users": {
+            str(900000000 + index): {
+                "status": "active",
+                "role": "admin",
+                "notify_topics": ["all"],
+                "quiet_hours_enabled": False,
+            }
+            for index in range(max(1, args.users))
+        }
+    }
+    (state_dir / "telegram_users.json").write_text(json.dumps(registry), encoding="utf-8")
+    os.environ.update(
+        {
+            "NTFY_BASE": bases["ntfy"],
+            "N8N_BASE": bases["n8n"],
+            "OVERSEERR_URL": bases["overseerr"],
+            "OVERSEERR_API_KEY": "bench",
+            "TELEGRAM_API_BASE": bases["telegram"],
+            "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+            "POLL_SECONDS": str(max(1, args.poll_seconds)),
+            "POLL_METRICS_LOG_SECONDS": "0",
+            "TELEGRAM_STATE_BACKEND": args.state_backend,
+            "STATE_FILE": str(state_dir / "bridge_state.json"),
+            "TELEGRAM_USER_REGISTRY": str(state_dir / "telegram_users.json"),
+            "TELEGRAM_MEDIA_FIRST_SEEN_STATE": str(state_dir / "telegram_media_first_seen.json"),
+            "TELEGRAM_DEDUPE_STATE": str(state_dir / "telegram_dedupe_state.json"),
+            "TELEGRAM_NOTIFY_STATS_STATE": str(state_dir / "telegram_notify_stats.json"),
+            "TELEGRAM_DELIVERY_STATE": str(state_dir / "telegram_delivery_state.json"),
+            "TELEGRAM_DIGEST_QUEUE_STATE": str(state_dir / "telegram_digest_queue.json"),
+            "TELEGRAM_INCIDENT_STATE": str(state_dir / "telegram_incidents.json"),
+            "TELEGRAM_STATE_SQLITE_PATH": str(state_dir / "telegram_state.db"),
+        }
+    )
+
+
+def instrument_bridge(bridge: Any, telegram: StubCounters) -> dict[str, Any]:
+    """Count JSON state-file and state_kv bytes written and record per-event completion times at the stage handler boundary.
+
+    The first-seen ledger, incident store and outbox keep their own SQLite files; those writes only show up in
+    the on-disk SQLite size, not in these counters.
+    """
+    stats: dict[str, Any] = {"state_bytes": 0, "state_writes": 0, "done": {}, "bot_calls": {}}
+    lock = threading.Lock()
+    write_state_file = bridge.write_state_file
+    save_sqlite_state = bridge.save_sqlite_state
+
+    def counting_write_state_file(path: Any, state: Any, **kwargs: Any) -> int:
+        written = write_state_file(path, state, **kwargs)
+        with lock:
+            stats["state_bytes"] += int(written or 0)
+            stats["state_writes"] += 1
+        return written
+
+    def counting_save_sqlite_state(key: str, state: dict) -> None:
+        save_sqlite_state(key, state)
+        with lock:
+            stats["state_bytes"] += len(bridge.dumps_state(state))
+            stats["state_writes"] += 1
+
+    bridge.write_state_file = counting_write_state_file
+    bridge.save_sqlite_state = counting_save_sqlite_state
+
+    for stage, spec in bridge.PIPELINE_STAGES.items():
+        handler = spec["handler"]
+
+        def timed_handler(event: dict[str, Any], stage: str = stage, handler: Any = handler) -> None:
+            calls_before = telegram.total()
+            handler(event)
+            with lock:
+                stats["done"][(stage, str(event["id"]))] = time.monotonic()
+                if stage == "telegram":
+                    stats["bot_calls"][str(event["id"])] = telegram.total() - calls_before
+
+        spec["handler"] = timed_handler
+    return stats
+
+
+def run_replay(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    events = load_corpus(args.corpus) if args.corpus else [synth_event(rng) for _ in range(max(1, args.events))]
+    ntfy = StubNtfy()
+    counters = {name: StubCounters() for name in ("n8n", "overseerr", "telegram")}
+    bases = start_stubs(args, ntfy, counters)
+
+    with tempfile.TemporaryDirectory(prefix="bench-ntfy-pipeline-") as tmp:
+        state_dir = Path(tmp)
+        configure_bridge_env(args, state_dir, bases)
+        import ntfy_to_n8n as bridge
+
+        stats = instrument_bridge(bridge, counters["telegram"])
+        expected = {
+            stage: sum(1 for event in events if event["topic"] in spec["topics"])
+            for stage, spec in bridge.PIPELINE_STAGES.items()
+        }
+        bridge.STATE.update(bridge.load_state())
+        with bridge.STATE_LOCK:
+            bridge.save_state(bridge.STATE)
+        for stage in bridge.PIPELINE_STAGES:
+            threading.Thread(target=bridge._run_stage_worker, args=(stage,), daemon=True).start()
+            threading.Thread(target=bridge._run_stage_poller, args=(stage,), daemon=True).start()
+
+        started = time.monotonic()
+        for seq, event in enumerate(events):
+            if args.rate > 0:
+                delay = started + seq / args.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            ntfy.publish(seq, event)
+        published = time.monotonic()
+
+        deadline = published + max(1.0, args.drain_timeout)
+        while time.monotonic() < deadline:
+            snapshot = bridge.pipeline_snapshot()
+            if all(snapshot[stage]["processed"] >= count for stage, count in expected.items()):
+                break
+            time.sleep(0.05)
+        finished = time.monotonic()
+        snapshot = bridge.pipeline_snapshot()
+        # Alerts still held in an open storm window are sent when it closes, after the report is taken.
+        coalesce_held = sum(int(window.get("total", 0)) for window in list(bridge.COALESCE_WINDOWS.values()))
+        sqlite_bytes = sum(path.stat().st_size for path in state_dir.iterdir() if path.suffix in {".db", ".db-wal"})
+
+    latencies: dict[str, list[float]] = {"n8n": [], "telegram": [], "alert": []}
+    for (stage, event_id), done_at in stats["done"].items():
+        latency_ms = (done_at - ntfy.published_at[event_id]) * 1000.0
+        latencies[stage].append(latency_ms)
+        if stage == "telegram" and stats["bot_calls"].get(event_id, 0) > 0:
+            latencies["alert"].append(latency_ms)
+
+    handled = len(stats["done"])
+    telegram_events = max(1, expected.get("telegram", 0))
+    elapsed = max(1e-9, finished - started)
+    return {
+        "events": len(events),
+        "source": args.corpus or "synthetic",
+        "rate": args.rate,
+        "state_backend": args.state_backend,
+        "drained": all(snapshot[stage]["processed"] >= count for stage, count in expected.items()),
+        "elapsed_seconds": round(elapsed, 3),
+        "events_per_sec": round(handled / elapsed, 1),
+        "stages": {
+            stage: {"expected": count, "processed": snapshot[stage]["processed"], "failed_attempts": snapshot[stage]["failed_attempts"]}
+            for stage, count in expected.items()
+        },
+        "latency_ms": {
+            name: {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 1),
+                "p95": round(percentile(values, 95), 1),
+                "p99": round(percentile(values, 99), 1),
+                "mean": round(statistics.fmean(values), 1) if values else 0.0,
+            }
+            for name, values in latencies.items()
+        },
+        "json_state_bytes_written": stats["state_bytes"],
+        "json_state_writes": stats["state_writes"],
+        "json_state_bytes_per_event": round(stats["state_bytes"] / max(1, len(events)), 1),
+        "sqlite_bytes_on_disk": sqlite_bytes,
+        "coalesce_held": coalesce_held,
+        "ntfy_polls": ntfy.polls,
+        "bot_api_calls": dict(counters["telegram"].calls),
+        "bot_api_calls_per_telegram_event": round(counters["telegram"].total() / telegram_events, 3),
+        "n8n_calls": counters["n8n"].total(),
+        "overseerr_calls": counters["overseerr"].total(),
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(
+        f"events: {report['events']} ({report['source']}), rate={report['rate']}/s, "
+        f"state_backend={report['state_backend']}, drained={report['drained']}"
+    )
+    print(f"throughput: {report['events_per_sec']} events/s over {report['elapsed_seconds']} s")
+    for stage, result in report["stages"].items():
+        print(f"- stage {stage}: processed {result['processed']}/{result['expected']}, failed_attempts={result['failed_attempts']}")
+    for name, result in report["latency_ms"].items():
+        print(
+            f"- latency {name}: n={result['count']} p50={result['p50']} ms p95={result['p95']} ms "
+            f"p99={result['p99']} ms mean={result['mean']} ms"
+        )
+    print(
+        f"json/state_kv writes: {report['json_state_bytes_written']} bytes in {report['json_state_writes']} writes "
+        f"({report['json_state_bytes_per_event']} bytes/event), sqlite on disk (all stores) {report['sqlite_bytes_on_disk']} bytes"
+    )
+    calls = ", ".join(f"{method}={count}" for method, count in sorted(report["bot_api_calls"].items())) or "none"
+    print(
+        f"bot api: {calls} ({report['bot_api_calls_per_telegram_event']} calls per telegram event), "
+        f"held in open coalesce windows: {report['coalesce_held']}"
+    )
+    print(f"n8n webhook calls: {report['n8n_calls']}, overseerr calls: {report['overseerr_calls']}, ntfy polls: {report['ntfy_polls']}")
+
+
+def main() -> int:
+    args = parse_args()
+    if args.command == "capture":
+        return capture_corpus(args)
+    # Bridge logs go to stderr so the report (and --json) stays clean on stdout.
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_replay(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0 if report["drained"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
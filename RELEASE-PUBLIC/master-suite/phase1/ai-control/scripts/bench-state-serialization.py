@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bridge"))
+
+from state_codec import STATE_CODEC_BACKEND, dumps_state, write_state_file  # noqa: E402
+
+WORDS = (
+    "plex jellyfin backup disk raid router vpn dns docker compose nextcloud kids bedtime movie rating "
+    "homework schedule server alert cpu memory quota family weekend grocery reminder calendar ticket"
+).split()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark bridge state-file writes: legacy pretty JSON vs state_codec.")
+    parser.add_argument("--users", type=int, default=500, help="Registered users to synthesize.")
+    parser.add_argument("--notes-per-user", type=int, default=40, help="Memory notes per user (MEMORY_MAX_NOTES-ish).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed writes per method.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--state", help="Benchmark a real state file instead of synthetic data.")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable JSON report.")
+    return parser.parse_args()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def synth_user_registry(rng: random.Random, users: int) -> dict[str, Any]:
+    records: dict[str, Any] = {}
+    for index in range(users):
+        user_id = str(100000000 + index * 7919)
+        records[user_id] = {
+            "role": "admin" if index == 0 else "user",
+            "status": "active",
+            "full_name": f"User {index} Example",
+            "telegram_username": f"user_{index}",
+            "registration_state": "complete",
+            "account_class": rng.choice(["adult", "child"]),
+            "account_age": rng.randint(8, 70),
+            "notify_topics": rng.sample(["ops", "media", "security", "backup", "digest"], 3),
+            "quiet_hours": {"start": "22:00", "end": "07:00"},
+            "persona_pref_tone": rng.choice(["warm", "neutral", "concise", ""]),
+            "profile_seed": sentence(rng, 30),
+            "created_at": "2026-01-01T00:00:00+00:00",
+            "updated_at": "2026-02-01T00:00:00+00:00",
+        }
+    return {"users": records}
+
+
+def synth_memory_state(rng: random.Random, users: int, notes_per_user: int) -> dict[str, Any]:
+    now = int(time.time())
+    entries: dict[str, Any] = {}
+    for index in range(users):
+        notes = []
+        for note_index in range(notes_per_user):
+            ts = now - rng.randint(0, 86400 * 90)
+            notes.append(
+                {
+                    "text": sentence(rng, rng.randint(8, 40)),
+                    "ts": ts,
+                    "captured_at": ts,
+                    "source": rng.choice(["chat", "voice", "manual"]),
+                    "tier": rng.choice(["session", "profile", "long_term"]),
+                    "confidence": round(rng.random(), 3),
+                    "write_gate": "allowed",
+                    "provenance": {"channel": "telegram", "message_id": note_index, "speaker_confidence": 0.93},
+                }
+            )
+        entries[str(100000000 + index * 7919)] = {"enabled": True, "notes": notes, "updated_at": now}
+    return {"users": entries}
+
+
+def legacy_write(path: Path, state: Any) -> int:
+    data = json.dumps(state, ensure_ascii=False, indent=2)
+    path.write_text(data, encoding="utf-8")
+    return len(data.encode("utf-8"))
+
+
+def time_method(write: Callable[[Path, Any], int], path: Path, state: Any, repeat: int) -> dict[str, Any]:
+    write(path, state)
+    timings = []
+    size = 0
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        size = write(path, state)
+        timings.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(timings) * 1000.0, 2), "bytes": size}
+
+
+def bench_state(name: str, state: Any, repeat: int, workdir: Path) -> dict[str, Any]:
+    path = workdir / f"{name}.json"
+    methods: dict[str, Callable[[Path, Any], int]] = {
+        "legacy_indent2": legacy_write,
+        f"{STATE_CODEC_BACKEND}_pretty_atomic": lambda p, s: write_state_file(p, s, pretty=True, fsync=False),
+        f"{STATE_CODEC_BACKEND}_compact_atomic": lambda p, s: write_state_file(p, s, fsync=False),
+        f"{STATE_CODEC_BACKEND}_compact_atomic_fsync": lambda p, s: write_state_file(p, s, fsync=True),
+    }
+    results = {label: time_method(write, path, state, repeat) for label, write in methods.items()}
+    started = time.perf_counter()
+    dumps_state(state)
+    results["encode_only_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+    return results
+
+
+def run_benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    if args.state:
+        states = {Path(args.state).stem: json.loads(Path(args.state).read_text(encoding="utf-8"))}
+    else:
+        states = {
+            "telegram_users": synth_user_registry(rng, args.users),
+            "telegram_memory": synth_memory_state(rng, args.users, args.notes_per_user),
+        }
+    with tempfile.TemporaryDirectory(prefix="state-bench-") as workdir:
+        return {
+            "codec": STATE_CODEC_BACKEND,
+            "states": {name: bench_state(name, state, args.repeat, Path(workdir)) for name, state in states.items()},
+        }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"codec: {report['codec']}")
+    for name, results in report["states"].items():
+        baseline = results["legacy_indent2"]
+        print(f"- {name}:")
+        for label, result in results.items():
+            if not isinstance(result, dict):
+                continue
+            speedup = baseline["median_ms"] / result["median_ms"] if result["median_ms"] > 0 else 0.0
+            ratio = result["bytes"] / baseline["bytes"] if baseline["bytes"] else 0.0
+            print(
+                f"  - {label}: {result['median_ms']:.2f} ms, {result['bytes']} bytes "
+                f"({speedup:.2f}x time, {ratio:.2f}x size vs legacy)"
+            )
+        print(f"  - encode only: {results['encode_only_ms']:.2f} ms")
+
+
+def main() -> int:
+    args = parse_args()
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
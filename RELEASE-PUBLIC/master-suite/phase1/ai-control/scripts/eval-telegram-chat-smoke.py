@@ -5,7 +5,9 @@ import json
 import os
 import re
 import tempfile
+import threading
 import time
+import types
 import urllib.error
 import urllib.request
 from pathlib import Path
@@ -15,6 +17,7 @@ from path_safety import ensure_writable_env_path
 ROOT = Path(__file__).resolve().parent.parent
 BRIDGE_PATH = ROOT / "bridge" / "telegram_to_n8n.py"
 NTFY_BRIDGE_PATH = ROOT / "bridge" / "ntfy_to_n8n.py"
+FIRST_SEEN_LEDGER_PATH = ROOT / "bridge" / "first_seen_ledger.py"
 WEBHOOK_URL = os.getenv("N8N_RAG_QUERY_URL", "http://127.0.0.1:5678/webhook/rag-query")
 RAG_INGEST_URL = os.getenv("N8N_RAG_INGEST_URL", "http://127.0.0.1:5678/webhook/rag-ingest")
 TEXTBOOK_WEBHOOK_URL = os.getenv(
@@ -2209,6 +2212,342 @@ def check_textbook_delivery_ack_retry_local() -> tuple[bool, str]:
     return True, "ok"
 
 
+def check_textbook_provider_deadline_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-textbook-deadline-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_ALLOWED_USER_IDS"] = ""
+        os.environ["TELEGRAM_BOOTSTRAP_ADMINS"] = ""
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_APPROVALS_STATE"] = str(tmp_path / "approvals.json")
+        os.environ["TELEGRAM_MEDIA_SELECTION_STATE"] = str(tmp_path / "media_selection.json")
+        os.environ["TELEGRAM_RATE_LIMIT_STATE"] = str(tmp_path / "rate_limit.json")
+        os.environ["TELEGRAM_MEMORY_STATE"] = str(tmp_path / "memory.json")
+        os.environ["TELEGRAM_BRIDGE_STATE"] = str(tmp_path / "bridge_state.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_INCIDENT_STATE"] = str(tmp_path / "incidents.json")
+        os.environ["TELEGRAM_TEXTBOOK_STATE"] = str(tmp_path / "textbook_state.json")
+        os.environ["TELEGRAM_TEXTBOOK_SEARCH_CACHE_STATE"] = str(tmp_path / "textbook_search_cache.json")
+
+        spec = importlib.util.spec_from_file_location("telegram_bridge_textbook_deadline", BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "bridge_import_spec"
+
+        bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bridge)
+        setattr(bridge, "TEXTBOOK_SEARCH_DEADLINE_SECONDS", 1.0)
+        setattr(bridge, "TEXTBOOK_SEARCH_EARLY_RETURN_SCORE", 0)
+        setattr(bridge, "TEXTBOOK_SEARCH_CACHE_ENABLED", True)
+        setattr(bridge, "TEXTBOOK_SEARCH_PROVIDERS", {"googlebooks", "openlibrary"})
+
+        calls = {"googlebooks": 0, "openlibrary": 0}
+        release_slow = threading.Event()
+
+        def fast_provider(_query: str, _isbn: str, limit: int, _timeout: float) -> list[dict[str, str]]:
+            calls["googlebooks"] += 1
+            return [
+                {
+                    "provider": "googlebooks",
+                    "title": f"Fast Book {index}",
+                    "authors": "A. Author",
+                    "source_url": "https://example.edu/fast",
+                }
+                for index in range(limit)
+            ]
+
+        def slow_provider(_query: str, _isbn: str, _limit: int, _timeout: float) -> list[dict[str, str]]:
+            calls["openlibrary"] += 1
+            release_slow.wait(10)
+            return [
+                {"provider": "openlibrary", "title": "Slow Book", "authors": "B. Author", "source_url": "https://example.edu/slow"}
+            ]
+
+        setattr(bridge, "TEXTBOOK_SEARCH_PROVIDER_FUNCS", {"googlebooks": fast_provider, "openlibrary": slow_provider})
+        fields = {"title": "Deadline Smoke", "author": "A. Author"}
+
+        started = time.monotonic()
+        first = bridge.search_textbook_candidates("Deadline Smoke", fields, limit=2)
+        elapsed = time.monotonic() - started
+        if elapsed > 3.0:
+            return False, f"textbook_deadline_not_enforced_{elapsed:.1f}s"
+        if [item["provider"] for item in first] != ["googlebooks", "googlebooks"]:
+            return False, "textbook_deadline_fast_results_missing"
+        metrics = bridge.textbook_provider_metrics_snapshot()
+        if metrics.get("openlibrary", {}).get("abandoned") != 1 or metrics.get("openlibrary", {}).get("calls") != 0:
+            return False, "textbook_deadline_abandoned_metric_mismatch"
+        if metrics.get("googlebooks", {}).get("calls") != 1:
+            return False, "textbook_deadline_completed_metric_mismatch"
+
+        # The abandoned call finishing later is counted once as late, never as a completed call, and still
+        # fills the cache for the next search.
+        release_slow.set()
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if bridge.textbook_provider_metrics_snapshot().get("openlibrary", {}).get("late") == 1:
+                break
+            time.sleep(0.05)
+        metrics = bridge.textbook_provider_metrics_snapshot()
+        if metrics["openlibrary"]["late"] != 1 or metrics["openlibrary"]["calls"] != 0:
+            return False, "textbook_deadline_late_metric_mismatch"
+
+        second = bridge.search_textbook_candidates("Deadline Smoke", fields, limit=2)
+        if calls != {"googlebooks": 1, "openlibrary": 1}:
+            return False, f"textbook_cache_not_used_{calls['googlebooks']}_{calls['openlibrary']}"
+        if len(second) != 2:
+            return False, "textbook_cache_result_count_mismatch"
+
+        # A larger limit cannot be answered from entries stored for a smaller one.
+        third = bridge.search_textbook_candidates("Deadline Smoke", fields, limit=3)
+        if calls["googlebooks"] != 2 or sum(1 for item in third if item["provider"] == "googlebooks") != 3:
+            return False, "textbook_cache_limit_not_keyed"
+
+    return True, "ok"
+
+
+def check_background_job_completion_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-background-job-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_ALLOWED_USER_IDS"] = ""
+        os.environ["TELEGRAM_BOOTSTRAP_ADMINS"] = ""
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_APPROVALS_STATE"] = str(tmp_path / "approvals.json")
+        os.environ["TELEGRAM_MEDIA_SELECTION_STATE"] = str(tmp_path / "media_selection.json")
+        os.environ["TELEGRAM_RATE_LIMIT_STATE"] = str(tmp_path / "rate_limit.json")
+        os.environ["TELEGRAM_MEMORY_STATE"] = str(tmp_path / "memory.json")
+        os.environ["TELEGRAM_BRIDGE_STATE"] = str(tmp_path / "bridge_state.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_INCIDENT_STATE"] = str(tmp_path / "incidents.json")
+        os.environ["TELEGRAM_TEXTBOOK_STATE"] = str(tmp_path / "textbook_state.json")
+        os.environ["TELEGRAM_RESEARCH_STATE"] = str(tmp_path / "research_jobs.json")
+
+        spec = importlib.util.spec_from_file_location("telegram_bridge_background_job", BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "bridge_import_spec"
+
+        bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bridge)
+        setattr(bridge, "BACKGROUND_JOB_WORKERS", 1)
+        setattr(bridge, "BACKGROUND_JOB_POLL_TIMEOUT", 5)
+
+        user_id = 9014
+        chat_id = 714
+        user_record = {
+            "role": "admin",
+            "status": "active",
+            "preferred_delivery_email": "student@example.edu",
+            "updated_at": bridge.utc_now(),
+        }
+        bridge.USER_REGISTRY.setdefault("users", {})[str(user_id)] = user_record
+        bridge.save_user_registry(bridge.USER_REGISTRY)
+        bridge.set_textbook_last_fulfillment(
+            user_id,
+            {
+                "created_at": int(time.time()),
+                "fulfillment_id": "fulfillment-background-job-test-1",
+                "delivery_email": "student@example.edu",
+                "delivery_status": "email_dispatched",
+                "dispatch_attempt_count": 0,
+                "file_url": "https://example.edu/files/testbook.pdf",
+                "request_details": "title: Example Textbook, author: Example Author",
+                "selected_candidate": {"title": "Example Textbook", "authors": "Example Author"},
+            },
+        )
+
+        worker_threads: list[str] = []
+        release_email = threading.Event()
+
+        def fake_build_link(**_kwargs):
+            worker_threads.append(threading.current_thread().name)
+            return "https://downloads.example.edu/textbook-download/token", int(time.time()) + 3600, ""
+
+        def fake_send_email(**_kwargs):
+            worker_threads.append(threading.current_thread().name)
+            release_email.wait(10)
+            return True, "email_dispatched"
+
+        sent_messages: list[str] = []
+        setattr(bridge, "send_message", lambda _chat_id, text: sent_messages.append(str(text)) or True)
+        setattr(bridge, "build_textbook_download_link", fake_build_link)
+        setattr(bridge, "send_textbook_delivery_email", fake_send_email)
+        bridge.start_background_job_workers()
+
+        # The handler only enqueues: the link build and SMTP send run on the worker while the poll thread is free.
+        started = time.monotonic()
+        if not bridge.handle_textbook_command(chat_id, user_id, "/textbook resend", user_record, "admin"):
+            return False, "background_job_resend_not_handled"
+        if time.monotonic() - started > 2.0:
+            return False, "background_job_resend_blocked_poll_thread"
+        if len(sent_messages) != 1 or "Preparing" not in sent_messages[0]:
+            return False, "background_job_resend_ack_missing"
+        if bridge.background_job_poll_timeout(30) != 5:
+            return False, "background_job_poll_timeout_not_capped_while_running"
+        bridge.handle_textbook_command(chat_id, user_id, "/textbook resend", user_record, "admin")
+        if len(sent_messages) != 2 or "already in progress" not in sent_messages[1]:
+            return False, "background_job_duplicate_resend_not_refused"
+
+        release_email.set()
+        deadline = time.time() + 5
+        while bridge.BACKGROUND_JOB_COMPLETIONS.empty() and time.time() < deadline:
+            time.sleep(0.05)
+        if bridge.background_job_poll_timeout(30) != 0:
+            return False, "background_job_poll_timeout_not_zero_with_completion"
+        if any(not name.startswith("background-job-") for name in worker_threads) or len(worker_threads) != 2:
+            return False, f"background_job_work_not_on_worker_{worker_threads}"
+        # Finish handlers run on the poll thread: nothing is posted or stored until the completion is drained.
+        pending = bridge.get_textbook_last_fulfillment(user_id) or {}
+        if len(sent_messages) != 2 or str(pending.get("delivery_status", "")) != "email_dispatched":
+            return False, "background_job_finished_off_poll_thread"
+
+        if bridge.drain_background_job_completions() != 1:
+            return False, "background_job_completion_not_drained"
+        finished = bridge.get_textbook_last_fulfillment(user_id) or {}
+        if str(finished.get("delivery_status", "")) != "email_redispatched":
+            return False, "background_job_resend_status_mismatch"
+        if len(sent_messages) != 3 or "resent successfully" not in sent_messages[2]:
+            return False, "background_job_resend_result_not_posted"
+        if bridge.background_job_poll_timeout(30) != 30:
+            return False, "background_job_poll_timeout_not_restored"
+        kinds = bridge.background_jobs_snapshot().get("kinds", {})
+        if kinds.get("textbook_resend", {}).get("done") != 1:
+            return False, "background_job_metrics_mismatch"
+
+    return True, "ok"
+
+
+def check_embedding_cache_payload_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-embed-cache-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_BRIDGE_STATE"] = str(tmp_path / "bridge_state.json")
+        os.environ["TELEGRAM_MEMORY_STATE"] = str(tmp_path / "memory.json")
+        os.environ["TELEGRAM_EMBED_CACHE_STATE"] = str(tmp_path / "embedding_cache.json")
+
+        spec = importlib.util.spec_from_file_location("telegram_bridge_embed_cache", BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "bridge_import_spec"
+
+        bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bridge)
+        setattr(bridge, "EMBED_CACHE_ENABLED", True)
+        setattr(bridge, "DIRECT_RETRIEVAL_ENABLED", False)
+
+        embed_calls: list[str] = []
+        webhook_payloads: list[dict] = []
+
+        def fake_embed(text: str) -> list[float]:
+            embed_calls.append(text)
+            return [0.125, -0.5, 0.333333333]
+
+        def fake_call_n8n(_path: str, payload: dict) -> dict:
+            webhook_payloads.append(dict(payload))
+            return {"reply": "Cached embedding smoke reply."}
+
+        setattr(bridge, "request_query_embedding", fake_embed)
+        setattr(bridge, "call_n8n", fake_call_n8n)
+        question = "What does the embedding cache smoke test cover"
+
+        # A miss never embeds on the reply path; the workflow's Embed Query node handles it.
+        bridge.call_webhook_for_reply("/webhook/rag-query", "rag", {"message": question}, question)
+        if embed_calls:
+            return False, "embed_cache_miss_embedded_on_reply_path"
+        if "query_embedding" in webhook_payloads[0] or "query_embedding_model" in webhook_payloads[0]:
+            return False, "embed_cache_miss_attached_vector"
+
+        bridge.embed_query_text(question)
+        bridge.call_webhook_for_reply("/webhook/rag-query", "rag", {"message": question}, f"  {question.lower()}  ")
+        hit_payload = webhook_payloads[1]
+        if len(embed_calls) != 1:
+            return False, f"embed_cache_hit_reembedded_{len(embed_calls)}"
+        vector = hit_payload.get("query_embedding")
+        if not isinstance(vector, list) or len(vector) != 3 or abs(float(vector[2]) - 0.333333333) > 1e-6:
+            return False, "embed_cache_hit_vector_missing"
+        if hit_payload.get("query_embedding_model") != bridge.RAG_EMBED_MODEL:
+            return False, "embed_cache_hit_model_missing"
+
+        # Persisted vectors reload for the same model only.
+        bridge.EMBED_CACHE.flush()
+        cache_path = tmp_path / "embedding_cache.json"
+        same_model = bridge.EmbeddingCache(cache_path, model=bridge.RAG_EMBED_MODEL, max_entries=10, max_bytes=1 << 20)
+        other_model = bridge.EmbeddingCache(cache_path, model="other-embed-model", max_entries=10, max_bytes=1 << 20)
+        if same_model.load() != 1 or same_model.get(question) is None:
+            return False, "embed_cache_not_reloaded"
+        if other_model.load() != 0:
+            return False, "embed_cache_reloaded_across_models"
+
+    return True, "ok"
+
+
+def check_reply_cache_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-reply-cache-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_BRIDGE_STATE"] = str(tmp_path / "bridge_state.json")
+        os.environ["TELEGRAM_MEMORY_STATE"] = str(tmp_path / "memory.json")
+
+        spec = importlib.util.spec_from_file_location("telegram_bridge_reply_cache", BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "bridge_import_spec"
+
+        bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bridge)
+        setattr(bridge, "REPLY_CACHE_ENABLED", True)
+        setattr(bridge, "REPLY_CACHE_ROUTES", {"rag", "workspace"})
+
+        # The compose default must match the bridge default so the documented bypass words apply in the stack.
+        compose_match = re.search(
+            r"TELEGRAM_REPLY_CACHE_BYPASS_PATTERN:-(.*)\}\s*$",
+            (ROOT / "docker-compose.yml").read_text(encoding="utf-8"),
+            re.MULTILINE,
+        )
+        if "TELEGRAM_REPLY_CACHE_BYPASS_PATTERN" not in os.environ:
+            if not compose_match or compose_match.group(1) != bridge.REPLY_CACHE_BYPASS_PATTERN:
+                return False, "reply_cache_compose_bypass_pattern_mismatch"
+
+        base = {"message": "Explain the reply cache smoke test", "tenant_id": "u_1", "role": "user"}
+        key = bridge.reply_cache_key("rag", base)
+        if not key.startswith("rag|"):
+            return False, "reply_cache_rag_key_missing"
+        if bridge.get_reply_cache(key) is not None:
+            return False, "reply_cache_unexpected_hit"
+        bridge.put_reply_cache(key, "The smoke test covers the reply cache.")
+        if bridge.reply_cache_key("rag", {**base, "message": "  explain the reply   cache smoke test? "}) != key:
+            return False, "reply_cache_key_not_normalized"
+        if bridge.get_reply_cache(key) != "The smoke test covers the reply cache.":
+            return False, "reply_cache_hit_missing"
+        if bridge.reply_cache_key("rag", {**base, "role": "admin"}) == key:
+            return False, "reply_cache_key_ignores_role"
+        if bridge.reply_cache_key("rag", {**base, "tenant_id": "u_2"}) == key:
+            return False, "reply_cache_key_shared_across_tenants"
+        if not bridge.reply_cache_key("rag", {**base, "workspace_context_only": True}).startswith("workspace|"):
+            return False, "reply_cache_workspace_route_missing"
+
+        bypassed = {
+            "ops_route": bridge.reply_cache_key("ops", base),
+            "time_sensitive": bridge.reply_cache_key("rag", {**base, "message": "What is the weather today"}),
+            "image": bridge.reply_cache_key("rag", {**base, "has_image": True}),
+        }
+        if any(bypassed.values()):
+            return False, f"reply_cache_not_bypassed_{[name for name, value in bypassed.items() if value]}"
+        if bridge.reply_cache_snapshot()["bypassed"] != 3:
+            return False, "reply_cache_bypass_count_mismatch"
+
+        error_key = bridge.reply_cache_key("rag", {**base, "message": "Explain an error reply"})
+        bridge.put_reply_cache(error_key, "❌ n8n webhook error: HTTP 502")
+        if bridge.get_reply_cache(error_key) is not None:
+            return False, "reply_cache_stored_error_reply"
+        if bridge.get_reply_cache(key, now_ts=int(time.time()) + bridge.REPLY_CACHE_TTL_SECONDS + 1) is not None:
+            return False, "reply_cache_ttl_not_enforced"
+
+    return True, "ok"
+
+
 def check_workspace_ttl_cleanup_local() -> tuple[bool, str]:
     with tempfile.TemporaryDirectory(prefix="tg-smoke-workspace-ttl-") as tmp:
         tmp_path = Path(tmp)
@@ -2251,14 +2590,14 @@ def check_workspace_ttl_cleanup_local() -> tuple[bool, str]:
                 return {"reply": "queued"}
             return {"reply": "ok"}
 
-        def fake_delete_doc(tenant_id: str, doc_id: str) -> tuple[bool, str]:
+        def fake_delete_docs(tenant_id: str, doc_ids: list[str]) -> tuple[bool, str]:
             if tenant_id != f"u_{user_id}":
                 return False, "tenant_mismatch"
-            deleted_docs.append(doc_id)
+            deleted_docs.extend(doc_ids)
             return True, "ok"
 
         setattr(bridge, "call_n8n", fake_call_n8n)
-        setattr(bridge, "delete_workspace_doc_from_qdrant", fake_delete_doc)
+        setattr(bridge, "delete_workspace_docs_from_qdrant", fake_delete_docs)
 
         if not bridge.handle_workspace_command(chat_id, user_id, "/workspace create vehicle-manuals", "admin"):
             return False, "workspace_create_not_handled"
@@ -3621,6 +3960,89 @@ def check_deferred_digest_cleanup_local() -> tuple[bool, str]:
     return True, "ok"
 
 
+def check_deferred_digest_due_index_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-digest-due-index-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_DIGEST_QUEUE_STATE"] = str(tmp_path / "digest_queue.json")
+        os.environ["TELEGRAM_INCIDENT_STATE"] = str(tmp_path / "incidents.json")
+        os.environ["TELEGRAM_DELIVERY_STATE"] = str(tmp_path / "delivery_state.json")
+        os.environ["TELEGRAM_DEDUPE_STATE"] = str(tmp_path / "dedupe.json")
+        os.environ["TELEGRAM_STATE_SQLITE_PATH"] = str(tmp_path / "telegram_state.db")
+        os.environ["TELEGRAM_QUIET_HOURS_UTC_OFFSET_HOURS"] = "0"
+
+        spec = importlib.util.spec_from_file_location("ntfy_bridge_digest_due_index", NTFY_BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "ntfy_bridge_import_spec"
+
+        ntfy_bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ntfy_bridge)
+
+        now = int(time.time())
+        hour = ntfy_bridge.current_local_hour(now_ts=now)
+        registry = {
+            "users": {
+                "8676528265": {
+                    "status": "active",
+                    "role": "admin",
+                    "notify_topics": ["all"],
+                    "quiet_hours_enabled": True,
+                    "quiet_hours_start_hour": hour,
+                    "quiet_hours_end_hour": (hour + 2) % 24,
+                }
+            }
+        }
+        (tmp_path / "users.json").write_text(json.dumps(registry, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        sent_texts: list[str] = []
+        queue_loads: list[int] = []
+        load_queue = ntfy_bridge.load_digest_queue_state
+        setattr(ntfy_bridge, "send_telegram_message", lambda _chat_id, text: sent_texts.append(str(text)) or (True, "sent"))
+        setattr(ntfy_bridge, "load_digest_queue_state", lambda: queue_loads.append(1) or load_queue())
+
+        ntfy_bridge.flush_due_deferred_digests(now_ts=now)
+        ntfy_bridge.queue_deferred_digest_items(
+            user_ids=[8676528265],
+            records=registry["users"],
+            topic="ops-alerts",
+            category="ops",
+            title="Disk usage high",
+            message="Volume /data at 91% on backup-nas",
+            priority=3,
+            incident_id="INC-DUE",
+        )
+        window_end = now - now % 3600 + 2 * 3600
+        if ntfy_bridge.next_digest_flush_ts() != window_end:
+            return False, f"digest_due_index_wrong_flush_ts_{ntfy_bridge.next_digest_flush_ts()}"
+
+        queue_loads.clear()
+        if ntfy_bridge.flush_due_deferred_digests(now_ts=now + 60) or queue_loads or sent_texts:
+            return False, "digest_due_index_woke_during_quiet_hours"
+
+        if not ntfy_bridge.flush_due_deferred_digests(now_ts=window_end):
+            return False, "digest_due_index_missed_window_end"
+        if len(sent_texts) != 1 or "Disk usage high" not in sent_texts[0]:
+            return False, f"digest_due_index_expected_one_digest_got_{len(sent_texts)}"
+        if ntfy_bridge.next_digest_flush_ts() is not None:
+            return False, "digest_due_index_not_cleared"
+
+        ntfy_bridge.save_digest_queue_state(
+            {
+                "users": {"8676528265": {"items": [{"ts": now, "topic": "ops-alerts", "category": "ops", "title": "Backup failed", "message": "nightly backup failed", "priority": 3, "incident_id": "INC-EXT"}]}},
+                "updated_at": "external",
+            }
+        )
+        if not ntfy_bridge.flush_due_deferred_digests(now_ts=window_end + 1):
+            return False, "digest_due_index_ignored_external_queue_write"
+        if len(sent_texts) != 2:
+            return False, "digest_due_index_external_item_not_flushed"
+
+    return True, "ok"
+
+
 def check_topic_quiet_defer_vs_critical_bypass_local() -> tuple[bool, str]:
     with tempfile.TemporaryDirectory(prefix="tg-smoke-topic-quiet-flow-") as tmp:
         tmp_path = Path(tmp)
@@ -3826,6 +4248,716 @@ def check_incident_collapse_edit_path_local() -> tuple[bool, str]:
     return True, "ok"
 
 
+def check_alert_storm_coalescing_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-alert-storm-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_DIGEST_QUEUE_STATE"] = str(tmp_path / "digest_queue.json")
+        os.environ["TELEGRAM_INCIDENT_STATE"] = str(tmp_path / "incidents.json")
+        os.environ["TELEGRAM_DELIVERY_STATE"] = str(tmp_path / "delivery_state.json")
+        os.environ["TELEGRAM_DEDUPE_STATE"] = str(tmp_path / "dedupe.json")
+        os.environ["TELEGRAM_NOTIFICATIONS_ENABLED"] = "true"
+        os.environ["TELEGRAM_NOTIFY_CRITICAL_ONLY"] = "false"
+        os.environ["TELEGRAM_MEDIA_READY_GATE_ENABLED"] = "false"
+        os.environ["TELEGRAM_MEDIA_NOISE_FILTER_ENABLED"] = "false"
+        os.environ["TELEGRAM_COALESCE_ENABLED"] = "true"
+        os.environ["TELEGRAM_COALESCE_WINDOW_SECONDS"] = "30"
+        os.environ["TELEGRAM_COALESCE_MAX_LINES"] = "3"
+
+        spec = importlib.util.spec_from_file_location("ntfy_bridge_alert_storm", NTFY_BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "ntfy_bridge_import_spec"
+
+        ntfy_bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ntfy_bridge)
+
+        registry = {
+            "users": {
+                "8676528265": {
+                    "status": "active",
+                    "role": "admin",
+                    "notify_topics": ["all"],
+                    "quiet_hours_enabled": False,
+                }
+            }
+        }
+        (tmp_path / "users.json").write_text(json.dumps(registry, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        send_calls: list[tuple[int, int | None, str]] = []
+
+        def fake_send_or_edit(chat_id: int, text: str, edit_message_id: int | None = None):
+            send_calls.append((int(chat_id), edit_message_id, str(text)))
+            return True, "sent", 900 + len(send_calls), False
+
+        setattr(ntfy_bridge, "send_or_edit_telegram_message", fake_send_or_edit)
+        clock = [float(int(time.time()))]
+        setattr(
+            ntfy_bridge,
+            "time",
+            types.SimpleNamespace(
+                time=lambda: clock[0], monotonic=time.monotonic, perf_counter=time.perf_counter, sleep=time.sleep
+            ),
+        )
+
+        def storm_event(label: str, index: int, priority: int = 4, message: str = "") -> None:
+            ntfy_bridge.fanout_to_telegram(
+                topic="ops-alerts",
+                title=f"{label} Service {index}",
+                message=message or f"WARNING: service {index} latency high",
+                priority=priority,
+                allow_coalesce=True,
+            )
+
+        def storm_incident_id() -> str:
+            opened_at = int(ntfy_bridge.COALESCE_WINDOWS["ops"]["opened_at"])
+            return ntfy_bridge.build_incident_id(
+                topic="coalesced", category="ops", title="alert storm", message=str(opened_at)
+            )
+
+        for index in range(6):
+            storm_event("Storm Smoke", index)
+        storm_event("Storm Smoke", 1)
+        if len(send_calls) != 1:
+            return False, f"alert_storm_expected_leading_send_got_{len(send_calls)}"
+
+        # A critical alert inside the open window goes out at once on its own incident.
+        storm_event("Storm Smoke Critical", 0, priority=5, message="CRITICAL: database is down")
+        if len(send_calls) != 2 or "database is down" not in send_calls[1][2]:
+            return False, "alert_storm_critical_event_held"
+        first_storm_id = storm_incident_id()
+
+        ntfy_bridge.flush_due_coalesced_fanouts(force=True)
+        if len(send_calls) != 3:
+            return False, f"alert_storm_expected_single_batch_send_got_{len(send_calls)}"
+
+        batch_text = send_calls[2][2]
+        if "6 ops alerts" not in batch_text:
+            return False, "alert_storm_batch_total_missing"
+        if "(x2)" not in batch_text:
+            return False, "alert_storm_batch_repeat_count_missing"
+        if "…and 2 more" not in batch_text:
+            return False, "alert_storm_batch_overflow_missing"
+        if "database is down" in batch_text:
+            return False, "alert_storm_batch_includes_critical_event"
+        if first_storm_id not in batch_text:
+            return False, "alert_storm_batch_incident_not_window_scoped"
+        if ntfy_bridge.COALESCE_WINDOWS:
+            return False, "alert_storm_window_not_cleared"
+
+        stats = ntfy_bridge.load_notify_stats_state()
+        events = stats.get("events") if isinstance(stats, dict) else []
+        sent_events = [event for event in events or [] if isinstance(event, dict) and event.get("result") == "sent"]
+        if len(sent_events) != 3:
+            return False, f"alert_storm_expected_3_sent_stats_got_{len(sent_events)}"
+
+        # A second storm inside the incident collapse window gets its own incident and a new message.
+        clock[0] += 60
+        for index in range(3):
+            storm_event("Second Storm", index)
+        second_storm_id = storm_incident_id()
+        ntfy_bridge.flush_due_coalesced_fanouts(force=True)
+        if second_storm_id == first_storm_id:
+            return False, "alert_storm_incident_reused_across_windows"
+        if len(send_calls) != 5 or send_calls[4][1] is not None:
+            return False, "alert_storm_second_storm_edited_previous_message"
+        if second_storm_id not in send_calls[4][2]:
+            return False, "alert_storm_second_storm_incident_missing"
+
+        # /ack on the second storm must not quiet the next storm or a critical alert.
+        store = ntfy_bridge.get_incident_store()
+        store.mutate(second_storm_id, lambda record: {**record, "acked_at": int(clock[0])} if record else None)
+        clock[0] += 60
+        for index in range(3):
+            storm_event("Third Storm", index)
+        storm_event("Third Storm Critical", 0, priority=5, message="CRITICAL: backup target is down")
+        ntfy_bridge.flush_due_coalesced_fanouts(force=True)
+        if len(send_calls) != 8:
+            return False, f"alert_storm_after_ack_suppressed_{len(send_calls)}"
+        if "backup target is down" not in send_calls[6][2]:
+            return False, "alert_storm_after_ack_critical_missing"
+        if "2 ops alerts" not in send_calls[7][2] or send_calls[7][1] is not None:
+            return False, "alert_storm_after_ack_batch_missing"
+
+        # Held alerts are past the telegram cursor: a restarted bridge reloads the open window and the
+        # worker's shutdown hook sends it. Held events are persisted on the save debounce, not one write each.
+        clock[0] += 60
+        for index in range(3):
+            storm_event("Restart Storm", index)
+        if int(ntfy_bridge.load_coalesce_state().get("ops", {}).get("total", -1)) != 0:
+            return False, "alert_storm_held_event_saved_without_debounce"
+        clock[0] += ntfy_bridge.TELEGRAM_COALESCE_SAVE_INTERVAL_SECONDS
+        ntfy_bridge.flush_due_coalesced_fanouts()
+        if len(send_calls) != 9:
+            return False, "alert_storm_window_flushed_by_save_debounce"
+        restarted = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(restarted)
+        restarted.COALESCE_WINDOWS.update(restarted.load_coalesce_state())
+        if int(restarted.COALESCE_WINDOWS.get("ops", {}).get("total", 0)) != 2:
+            return False, "alert_storm_window_not_restored_after_restart"
+        setattr(restarted, "send_or_edit_telegram_message", fake_send_or_edit)
+        restarted.PIPELINE_STOP.set()
+        restarted._run_stage_worker("telegram")
+        if len(send_calls) != 10 or "2 ops alerts" not in send_calls[9][2]:
+            return False, "alert_storm_restored_window_not_flushed_on_shutdown"
+        if restarted.COALESCE_WINDOWS or restarted.load_coalesce_state():
+            return False, "alert_storm_flushed_window_still_persisted"
+
+    return True, "ok"
+
+
+def check_first_seen_ledger_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-first-seen-ledger-") as tmp:
+        tmp_path = Path(tmp)
+
+        spec = importlib.util.spec_from_file_location("first_seen_ledger_smoke", FIRST_SEEN_LEDGER_PATH)
+        if spec is None or spec.loader is None:
+            return False, "first_seen_ledger_import_spec"
+
+        ledger_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ledger_module)
+
+        now = int(time.time())
+        # An 8-bit, single-hash bloom saturates after a few keys, so unseen keys hit the false-positive path.
+        ledger = ledger_module.FirstSeenLedger(
+            str(tmp_path / "first_seen.db"),
+            retention_seconds=100,
+            bloom_bits=8,
+            bloom_hashes=1,
+            purge_interval_seconds=3600,
+        )
+        try:
+            for index in range(32):
+                ledger.observe(f"sonarr:series:{index}", now_ts=now)
+            saturated = ledger.snapshot()
+            if saturated["new"] != 32 or saturated["bloom_new"] >= 32:
+                return False, f"first_seen_ledger_bloom_not_saturated_{saturated['bloom_new']}"
+
+            is_new, record = ledger.observe("sonarr:series:unseen", now_ts=now)
+            after = ledger.snapshot()
+            if not is_new or record.get("event_count") != 1:
+                return False, "first_seen_ledger_false_positive_not_new"
+            if after["bloom_new"] != saturated["bloom_new"]:
+                return False, "first_seen_ledger_false_positive_skipped_point_lookup"
+
+            is_new, record = ledger.observe("sonarr:series:1", now_ts=now + 60)
+            if is_new or record.get("event_count") != 2 or record.get("first_seen") != now:
+                return False, "first_seen_ledger_repeat_not_detected"
+
+            is_new, record = ledger.observe("sonarr:series:2", now_ts=now + 150)
+            if not is_new or record.get("first_seen") != now + 150 or record.get("event_count") != 1:
+                return False, "first_seen_ledger_expired_row_not_restarted"
+
+            purged = ledger.purge_expired(now_ts=now + 150)
+            if purged != 31 or ledger.count() != 2:
+                return False, f"first_seen_ledger_purge_wrong_{purged}_{ledger.count()}"
+            if sorted(ledger.keys()) != ["sonarr:series:1", "sonarr:series:2"]:
+                return False, "first_seen_ledger_purge_removed_live_rows"
+
+            is_new, _record = ledger.observe("sonarr:series:5", now_ts=now + 160)
+            if not is_new:
+                return False, "first_seen_ledger_purged_key_not_new"
+        finally:
+            ledger.close()
+
+    return True, "ok"
+
+
+def check_media_ready_cache_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-media-ready-cache-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_STATE_SQLITE_PATH"] = str(tmp_path / "telegram_state.db")
+        os.environ["TELEGRAM_MEDIA_READY_CACHE_TTL_SECONDS"] = "600"
+        os.environ["TELEGRAM_MEDIA_READY_CACHE_NEGATIVE_TTL_SECONDS"] = "90"
+        os.environ["TELEGRAM_MEDIA_READY_CACHE_MAX_ENTRIES"] = "16"
+
+        spec = importlib.util.spec_from_file_location("ntfy_bridge_media_ready_cache", NTFY_BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "ntfy_bridge_import_spec"
+
+        ntfy_bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ntfy_bridge)
+
+        clock = [1000.0]
+        setattr(ntfy_bridge, "time", types.SimpleNamespace(monotonic=lambda: clock[0], time=time.time, sleep=time.sleep))
+        lookups: list[str] = []
+        ready_titles = {"severance"}
+        release = threading.Event()
+        release.set()
+
+        def fake_ready_match(query_title: str) -> tuple[bool, str]:
+            lookups.append(query_title)
+            release.wait(timeout=10)
+            if ntfy_bridge.normalize_media_name(query_title) in ready_titles:
+                return True, f"ready_verified:{query_title}:status=5"
+            return False, f"ready_not_confirmed:{query_title}:status=2"
+
+        setattr(ntfy_bridge, "overseerr_ready_match", fake_ready_match)
+
+        for _ in range(3):
+            allowed, _reason = ntfy_bridge.cached_overseerr_ready_match("Severance")
+            if not allowed:
+                return False, "media_ready_cache_positive_not_allowed"
+        if len(lookups) != 1:
+            return False, f"media_ready_cache_positive_not_cached_{len(lookups)}"
+        clock[0] += 599
+        ntfy_bridge.cached_overseerr_ready_match("severance")
+        clock[0] += 2
+        ntfy_bridge.cached_overseerr_ready_match("Severance")
+        if len(lookups) != 2:
+            return False, f"media_ready_cache_positive_ttl_wrong_{len(lookups)}"
+
+        lookups.clear()
+        for _ in range(2):
+            allowed, _reason = ntfy_bridge.cached_overseerr_ready_match("Andor")
+            if allowed:
+                return False, "media_ready_cache_negative_allowed"
+        clock[0] += 91
+        ready_titles.add("andor")
+        allowed, _reason = ntfy_bridge.cached_overseerr_ready_match("Andor")
+        if len(lookups) != 2 or not allowed:
+            return False, f"media_ready_cache_negative_ttl_wrong_{len(lookups)}"
+
+        lookups.clear()
+        release.clear()
+        results: list[tuple[bool, str]] = []
+        threads = [
+            threading.Thread(target=lambda: results.append(ntfy_bridge.cached_overseerr_ready_match("Shogun")))
+            for _ in range(4)
+        ]
+        threads[0].start()
+        deadline = time.time() + 5
+        while not lookups and time.time() < deadline:
+            time.sleep(0.01)
+        for thread in threads[1:]:
+            thread.start()
+        while ntfy_bridge.media_ready_cache_snapshot()["coalesced"] < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        if len(lookups) != 1:
+            return False, f"media_ready_cache_inflight_not_coalesced_{len(lookups)}"
+        if len(results) != 4 or len(set(results)) != 1:
+            return False, "media_ready_cache_inflight_results_differ"
+
+        snapshot = ntfy_bridge.media_ready_cache_snapshot()
+        if snapshot["coalesced"] != 3 or snapshot["hits"] != 3 or snapshot["negative_hits"] != 1:
+            return False, f"media_ready_cache_metrics_wrong_{snapshot}"
+
+    return True, "ok"
+
+
+def check_incident_store_page_and_controls_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-incident-store-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_ALLOWED_USER_IDS"] = ""
+        os.environ["TELEGRAM_BOOTSTRAP_ADMINS"] = ""
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_APPROVALS_STATE"] = str(tmp_path / "approvals.json")
+        os.environ["TELEGRAM_MEDIA_SELECTION_STATE"] = str(tmp_path / "media_selection.json")
+        os.environ["TELEGRAM_RATE_LIMIT_STATE"] = str(tmp_path / "rate_limit.json")
+        os.environ["TELEGRAM_MEMORY_STATE"] = str(tmp_path / "memory.json")
+        os.environ["TELEGRAM_BRIDGE_STATE"] = str(tmp_path / "bridge_state.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_DIGEST_QUEUE_STATE"] = str(tmp_path / "digest_queue.json")
+        os.environ["TELEGRAM_DELIVERY_STATE"] = str(tmp_path / "delivery_state.json")
+        os.environ["TELEGRAM_DEDUPE_STATE"] = str(tmp_path / "dedupe.json")
+        # Both bridges derive the shared incident store path from this file.
+        os.environ["TELEGRAM_INCIDENT_STATE"] = str(tmp_path / "incidents.json")
+
+        spec = importlib.util.spec_from_file_location("telegram_bridge_incident_store", BRIDGE_PATH)
+        ntfy_spec = importlib.util.spec_from_file_location("ntfy_bridge_incident_store", NTFY_BRIDGE_PATH)
+        if spec is None or spec.loader is None or ntfy_spec is None or ntfy_spec.loader is None:
+            return False, "bridge_import_spec"
+
+        bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bridge)
+        ntfy_bridge = importlib.util.module_from_spec(ntfy_spec)
+        ntfy_spec.loader.exec_module(ntfy_bridge)
+
+        chat_id = 700
+        user_id = 9011
+        bridge.set_user_record(bridge.USER_REGISTRY, user_id, "admin", status="active")
+        bridge.save_user_registry(bridge.USER_REGISTRY)
+        replies: list[str] = []
+        setattr(bridge, "send_message", lambda _cid, txt: replies.append(str(txt)))
+
+        limit = max(1, bridge.INCIDENT_LIST_LIMIT)
+        total_incidents = limit + 2
+        incident_ids = []
+        for index in range(total_incidents):
+            incident_id = ntfy_bridge.build_incident_id("ops-alerts", "ops", f"Store Smoke {index}", "disk full")
+            ntfy_bridge.upsert_incident(incident_id, "ops-alerts", "ops", f"Store Smoke {index}", "disk full", 4, False)
+            incident_ids.append(incident_id)
+
+        store = bridge.get_incident_store()
+        now = int(time.time())
+        total, first_page = store.page(offset=0, limit=limit, now_ts=now)
+        _total, second_page = store.page(offset=limit, limit=limit, now_ts=now)
+        paged_ids = [str(record.get("id")) for record in first_page + second_page]
+        if total != total_incidents or len(first_page) != limit or len(second_page) != 2:
+            return False, f"incident_store_page_sizes_wrong_{total}_{len(first_page)}_{len(second_page)}"
+        if sorted(paged_ids) != sorted(incident_ids):
+            return False, "incident_store_pages_overlap_or_miss_rows"
+
+        if not bridge.handle_incident_command(chat_id, user_id, "/incident list"):
+            return False, "incident_list_not_handled"
+        if f"(page 1/2, {total_incidents} total)" not in replies[-1] or "More: /incident list 2" not in replies[-1]:
+            return False, "incident_list_page_header_missing"
+        bridge.handle_incident_command(chat_id, user_id, "/incident list 2")
+        if replies[-1].count("\n- INC-") != 2:
+            return False, "incident_list_second_page_wrong"
+
+        acked_id = incident_ids[0]
+        stale_copy = ntfy_bridge.get_incident_store().get(acked_id) or {}
+        bridge.handle_incident_control_commands(chat_id, user_id, f"/ack {acked_id}")
+        if "acknowledged" not in replies[-1]:
+            return False, "incident_ack_not_confirmed"
+        # Fanout writes back only its own fields, so a stale pre-ack copy must not clear the ack.
+        stale_copy["message_targets"] = {str(chat_id): {"message_id": 42}}
+        ntfy_bridge.save_incident_delivery(stale_copy)
+        ntfy_bridge.upsert_incident(acked_id, "ops-alerts", "ops", "Store Smoke 0", "disk full", 4, False)
+        acked = ntfy_bridge.get_incident_store().get(acked_id) or {}
+        if ntfy_bridge.incident_suppression_reason(acked, int(time.time())) != "incident_acked":
+            return False, "incident_ack_lost_after_fanout_write"
+        if int(acked.get("event_count", 0)) != 2 or not acked.get("message_targets"):
+            return False, "incident_fanout_fields_not_updated"
+
+        snoozed_id = incident_ids[1]
+        bridge.handle_incident_control_commands(chat_id, user_id, f"/snooze {snoozed_id} 5")
+        snoozed = ntfy_bridge.get_incident_store().get(snoozed_id) or {}
+        if ntfy_bridge.incident_suppression_reason(snoozed, int(time.time())) != "incident_snoozed":
+            return False, "incident_snooze_not_applied"
+        bridge.handle_incident_control_commands(chat_id, user_id, f"/unsnooze {snoozed_id}")
+        unsnoozed = ntfy_bridge.get_incident_store().get(snoozed_id) or {}
+        if ntfy_bridge.incident_suppression_reason(unsnoozed, int(time.time())) != "":
+            return False, "incident_unsnooze_not_applied"
+
+        bridge.handle_incident_control_commands(chat_id, user_id, "/ack INC-0000000000")
+        if "Incident not found" not in replies[-1]:
+            return False, "incident_ack_missing_not_reported"
+        if store.get("INC-0000000000") is not None:
+            return False, "incident_ack_missing_created_row"
+
+        expired_total, _rows = store.page(offset=0, limit=limit, now_ts=now + max(3600, bridge.INCIDENT_RETENTION_SECONDS) + 60)
+        if expired_total != 0:
+            return False, "incident_store_page_includes_expired"
+
+    return True, "ok"
+
+
+def check_pipeline_stage_independence_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-pipeline-stages-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_DIGEST_QUEUE_STATE"] = str(tmp_path / "digest_queue.json")
+        os.environ["TELEGRAM_INCIDENT_STATE"] = str(tmp_path / "incidents.json")
+        os.environ["TELEGRAM_DELIVERY_STATE"] = str(tmp_path / "delivery_state.json")
+        os.environ["TELEGRAM_DEDUPE_STATE"] = str(tmp_path / "dedupe.json")
+        os.environ["STATE_FILE"] = str(tmp_path / "bridge_state.json")
+        os.environ["POLL_SECONDS"] = "1"
+
+        # ops-audit feeds both stages; a pre-pipeline state file kept one shared cursor per topic.
+        topic = "ops-audit"
+        start_time = int(time.time()) - 600
+        (tmp_path / "bridge_state.json").write_text(
+            json.dumps({topic: {"last_time": start_time, "last_id": "legacy"}}), encoding="utf-8"
+        )
+
+        spec = importlib.util.spec_from_file_location("ntfy_bridge_pipeline_stages", NTFY_BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "ntfy_bridge_import_spec"
+
+        ntfy_bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ntfy_bridge)
+        ntfy_bridge.STATE.update(ntfy_bridge.load_state())
+        for stage in ("n8n", "telegram"):
+            if ntfy_bridge.stage_cursor(stage, topic) != {"last_time": start_time, "last_id": "legacy"}:
+                return False, f"pipeline_{stage}_cursor_not_migrated"
+
+        delivered: list[str] = []
+
+        def failing_n8n(_event: dict) -> None:
+            raise RuntimeError("n8n webhook unavailable")
+
+        stages = ntfy_bridge.PIPELINE_STAGES
+        stages["n8n"]["handler"] = failing_n8n
+        stages["telegram"]["handler"] = lambda event: delivered.append(str(event["id"]))
+        for stage in ("n8n", "telegram"):
+            stages[stage]["idle"] = None
+            stages[stage]["shutdown"] = None
+
+        events = [
+            {"topic": topic, "id": f"ev{index}", "time": start_time + index, "title": "Audit", "message": "m", "priority": 3}
+            for index in range(1, 4)
+        ]
+        workers = [
+            threading.Thread(target=ntfy_bridge._run_stage_worker, args=(stage,), daemon=True)
+            for stage in ("n8n", "telegram")
+        ]
+        for worker in workers:
+            worker.start()
+        for event in events:
+            stages["n8n"]["queue"].put(dict(event))
+            stages["telegram"]["queue"].put(dict(event))
+
+        deadline = time.time() + 10
+        while len(delivered) < 3 and time.time() < deadline:
+            time.sleep(0.05)
+        n8n_metrics = dict(stages["n8n"]["metrics"])
+        ntfy_bridge.PIPELINE_STOP.set()
+        for worker in workers:
+            worker.join(timeout=5)
+
+        if delivered != ["ev1", "ev2", "ev3"]:
+            return False, f"pipeline_telegram_stalled_by_n8n_{delivered}"
+        if n8n_metrics["processed"] != 0 or n8n_metrics["failed_attempts"] < 1:
+            return False, "pipeline_n8n_failure_not_retried"
+
+        reloaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(reloaded)
+        reloaded.STATE.update(reloaded.load_state())
+        if reloaded.stage_cursor("telegram", topic) != {"last_time": start_time + 3, "last_id": "ev3"}:
+            return False, "pipeline_telegram_cursor_not_resumed"
+        if reloaded.stage_cursor("n8n", topic) != {"last_time": start_time, "last_id": "legacy"}:
+            return False, "pipeline_n8n_cursor_advanced_past_failed_event"
+
+        forwarded: list[str] = []
+        reloaded.PIPELINE_STAGES["n8n"]["handler"] = lambda event: forwarded.append(str(event["id"]))
+        if not reloaded.process_stage_event("n8n", dict(events[0])):
+            return False, "pipeline_n8n_recovery_failed"
+        if forwarded != ["ev1"] or reloaded.stage_cursor("n8n", topic) != {"last_time": start_time + 1, "last_id": "ev1"}:
+            return False, "pipeline_n8n_cursor_not_advanced_after_recovery"
+        if reloaded.stage_cursor("telegram", topic) != {"last_time": start_time + 3, "last_id": "ev3"}:
+            return False, "pipeline_n8n_recovery_moved_telegram_cursor"
+
+    return True, "ok"
+
+
+def check_telegram_outbox_retry_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-outbox-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+        os.environ["TELEGRAM_DELIVERY_STATE"] = str(tmp_path / "delivery_state.json")
+        os.environ["TELEGRAM_STATE_SQLITE_PATH"] = str(tmp_path / "telegram_state.db")
+        os.environ["TELEGRAM_OUTBOX_PATH"] = str(tmp_path / "telegram_outbox.db")
+        os.environ["TELEGRAM_DEDUPE_STATE"] = str(tmp_path / "dedupe.json")
+        os.environ["TELEGRAM_INCIDENT_STATE"] = str(tmp_path / "incidents.json")
+        (tmp_path / "users.json").write_text(
+            json.dumps({"users": {"105": {"status": "active", "role": "admin", "notify_topics": ["all"]}}}),
+            encoding="utf-8",
+        )
+
+        spec = importlib.util.spec_from_file_location("ntfy_bridge_outbox", NTFY_BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "ntfy_bridge_import_spec"
+
+        ntfy_bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ntfy_bridge)
+        setattr(ntfy_bridge, "TELEGRAM_OUTBOX_ENABLED", True)
+        setattr(ntfy_bridge, "TELEGRAM_OUTBOX_MAX_ATTEMPTS", 3)
+        setattr(ntfy_bridge, "TELEGRAM_OUTBOX_BACKOFF_SECONDS", 30.0)
+        setattr(ntfy_bridge, "TELEGRAM_OUTBOX_MAX_AGE_SECONDS", 3600)
+
+        if not ntfy_bridge.is_retryable_send_reason("rate_limited") or ntfy_bridge.is_retryable_send_reason("send_error"):
+            return False, "outbox_retryable_reason_mismatch"
+
+        sends: list[tuple[int, str]] = []
+        scripted: dict[int, list[str]] = {
+            101: ["rate_limited", ""],
+            102: ["network_error", "timeout"],
+            103: [""],
+            105: ["rate_limited", ""],
+        }
+
+        def fake_send(chat_id: int, text: str, edit_message_id: int | None = None) -> tuple[bool, str, int | None, bool]:
+            sends.append((int(chat_id), str(text)))
+            outcomes = scripted.get(int(chat_id)) or ["send_error"]
+            reason = outcomes.pop(0)
+            return (not reason), reason, None, False
+
+        setattr(ntfy_bridge, "send_or_edit_telegram_message", fake_send)
+
+        outbox = ntfy_bridge.get_telegram_outbox()
+        now = int(time.time())
+        common = {"topic": "ops-alerts", "priority": 4, "critical": False}
+        first_id = outbox.enqueue(chat_id=101, text="alert a", incident_id="inc-a", reason="rate_limited", now_ts=now, **common)
+        outbox.enqueue(chat_id=102, text="alert b", incident_id="inc-b", reason="network_error", now_ts=now, **common)
+        replaced_id = outbox.enqueue(chat_id=103, text="first", incident_id="inc-c", reason="timeout", now_ts=now, **common)
+        if outbox.enqueue(chat_id=103, text="second", incident_id="inc-c", reason="timeout", now_ts=now, **common) != replaced_id:
+            return False, "outbox_pending_text_not_replaced_per_incident"
+        other_id = outbox.enqueue(chat_id=103, text="other", incident_id="inc-d", reason="timeout", now_ts=now, **common)
+        if other_id == replaced_id:
+            return False, "outbox_distinct_incidents_merged"
+        outbox.mark_sent(other_id, now_ts=now)
+        outbox.enqueue(chat_id=104, text="stale", incident_id="inc-e", reason="timeout", now_ts=now - 4000, **common)
+
+        if outbox.snapshot(now_ts=now)["pending"] != 4:
+            return False, "outbox_pending_count_mismatch"
+
+        # v1 of an incident is rate limited and queued; v2 then goes out inline, so v1 must never be retried.
+        def fanout(text: str) -> None:
+            ntfy_bridge.deliver_telegram_fanout(
+                topic="ops-alerts",
+                category="ops",
+                title="Disk",
+                message=text,
+                priority=4,
+                critical=False,
+                incident={"id": "inc-f"},
+                alert_text=text,
+                update_alert_text=text,
+                dedupe_key=f"outbox-smoke-{text}",
+                target_user_ids={105},
+            )
+
+        fanout("disk v1")
+        if outbox.snapshot(now_ts=now)["pending"] != 5:
+            return False, "outbox_fanout_failure_not_queued"
+        fanout("disk v2")
+        if outbox.snapshot(now_ts=now)["pending"] != 4 or sends[-1] != (105, "disk v2"):
+            return False, "outbox_inline_send_did_not_supersede"
+        sends.clear()
+
+        delivered = ntfy_bridge.drain_telegram_outbox(now_ts=now)
+        if delivered != 0 or sends:
+            return False, f"outbox_sent_before_backoff_{sends}"
+        if outbox.snapshot(now_ts=now)["dead"] != 2:
+            return False, "outbox_expired_not_dead"
+
+        delivered = ntfy_bridge.drain_telegram_outbox(now_ts=now + 30)
+        if delivered != 1 or sorted(sends) != [(101, "alert a"), (102, "alert b"), (103, "second")]:
+            return False, f"outbox_first_retry_mismatch_{sends}"
+        retry_item = next((item for item in outbox.due(now_ts=now + 90) if int(item["id"]) == first_id), None)
+        if retry_item is None or int(retry_item["attempts"]) != 2:
+            return False, "outbox_retry_attempts_not_recorded"
+
+        sends.clear()
+        if ntfy_bridge.drain_telegram_outbox(now_ts=now + 89) != 0 or sends:
+            return False, "outbox_backoff_not_doubled"
+
+        delivered = ntfy_bridge.drain_telegram_outbox(now_ts=now + 90)
+        if delivered != 1 or sorted(sends) != [(101, "alert a"), (102, "alert b")]:
+            return False, f"outbox_second_retry_mismatch_{sends}"
+
+        snapshot = outbox.snapshot(now_ts=now + 90)
+        if snapshot != {"pending": 0, "sent": 3, "dead": 3, "oldest_pending_seconds": 0}:
+            return False, f"outbox_snapshot_mismatch_{snapshot}"
+
+        stats = ntfy_bridge.load_notify_stats_state()
+        reasons = [
+            str(event.get("reason", ""))
+            for event in stats.get("events", [])
+            if isinstance(event, dict) and str(event.get("reason", "")).startswith("outbox_")
+        ]
+        if sorted(reasons) != ["outbox_exhausted", "outbox_expired", "outbox_retry", "outbox_retry"]:
+            return False, f"outbox_stats_reasons_mismatch_{reasons}"
+        if stats.get("telegram_outbox", {}).get("dead") != 3 or stats.get("telegram_outbox", {}).get("sent") != 3:
+            return False, "outbox_stats_snapshot_stale"
+        outbox.close()
+
+    return True, "ok"
+
+
+def check_event_classifier_parity_local() -> tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix="tg-smoke-event-classifier-") as tmp:
+        tmp_path = Path(tmp)
+
+        os.environ["TELEGRAM_BOT_TOKEN"] = os.getenv("TELEGRAM_BOT_TOKEN", "dummy") or "dummy"
+        os.environ["TELEGRAM_USER_REGISTRY"] = str(tmp_path / "users.json")
+        os.environ["TELEGRAM_NOTIFY_STATS_STATE"] = str(tmp_path / "notify_stats.json")
+
+        spec = importlib.util.spec_from_file_location("ntfy_bridge_event_classifier", NTFY_BRIDGE_PATH)
+        if spec is None or spec.loader is None:
+            return False, "ntfy_bridge_import_spec"
+
+        ntfy_bridge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ntfy_bridge)
+
+        def legacy_verdicts(title: str, message: str) -> dict[str, bool]:
+            # The per-helper scans fanout ran before the precompiled classifier.
+            blob = f"{title} {message}".strip().lower()
+            critical = False
+            if not any(re.search(pattern, blob) for pattern in ntfy_bridge.NEGATED_CRITICAL_PATTERNS):
+                critical = any(re.search(rf"\b{re.escape(keyword)}\b", blob) for keyword in ntfy_bridge.CRITICAL_KEYWORDS)
+            return {
+                "drop": any(pattern in blob for pattern in ntfy_bridge.TELEGRAM_NOTIFY_DROP_PATTERNS),
+                "media_noise": bool(blob) and any(marker in blob for marker in ntfy_bridge.TELEGRAM_MEDIA_NOISE_MARKERS),
+                "critical_text": critical,
+                "ready_signal": any(re.search(pattern, blob) for pattern in ntfy_bridge.MEDIA_READY_SIGNAL_PATTERNS),
+            }
+
+        samples = [
+            ("", ""),
+            ("[plex] Down", "Monitor plex is DOWN: connection refused"),
+            ("[plex] Up", "Monitor plex is back up (non-critical)"),
+            ("Disk usage", "Volume /data at 91%; no outage expected"),
+            ("Disk usage", "Volume /data at 91%; NOT critical yet, but outage likely"),
+            ("SEV1", "Severity 1 incident declared"),
+            ("Sev10 drill", "severity 12 is not a keyword; downtime and downloads are not either"),
+            ("Router", "router non-responsive since 02:00"),
+            ("Router", "router non responsive; emergency fallback active"),
+            ("Noncritical", "noncritical warning"),
+            ("Smoke Test", "direct fanout log check run=4"),
+            ("Smoke", "testing smoke-test spacing"),
+            ("Media sweep probe", "media cursor probe cursor_probe=1234 Dune (2021)"),
+            ("Media ready", "Dune (2021) is now available in Plex"),
+            ("Ready: Arrival", "Arrival is available in plex"),
+            ("Heat", "ready in Plex soon"),
+            ("Alien", "Alien now available on Jellyfin"),
+            ("Fargo", "synthetic_id=77 media ready verification"),
+            ("Regex chars", "pattern a.b (x) [y] and +z+ should be literal"),
+        ]
+
+        def compare(stage: str) -> str:
+            for title, message in samples:
+                expected = legacy_verdicts(title, message)
+                actual = dict(ntfy_bridge.classify_event(title, message))
+                if actual != expected:
+                    return f"event_classifier_{stage}_mismatch_{title!r}_{actual}_{expected}"
+            return ""
+
+        mismatch = compare("defaults")
+        if mismatch:
+            return False, mismatch
+        if not ntfy_bridge.classify_event("Smoke Test", "direct fanout log check run=4")["drop"]:
+            return False, "event_classifier_default_drop_missed"
+
+        # Overlapping and regex-special literals must still match as plain substrings after a rebuild.
+        setattr(ntfy_bridge, "TELEGRAM_NOTIFY_DROP_PATTERNS", ["log", "log check", "a.b", "(x)"])
+        setattr(ntfy_bridge, "TELEGRAM_MEDIA_NOISE_MARKERS", ["[y]", "+z+", "cursor_probe="])
+        ntfy_bridge.build_event_classifier()
+        mismatch = compare("rebuilt")
+        if mismatch:
+            return False, mismatch
+        if ntfy_bridge.classify_event("Smoke Test", "direct fanout run=4")["drop"]:
+            return False, "event_classifier_stale_after_rebuild"
+
+        setattr(ntfy_bridge, "TELEGRAM_NOTIFY_DROP_PATTERNS", [])
+        setattr(ntfy_bridge, "TELEGRAM_MEDIA_NOISE_MARKERS", [])
+        ntfy_bridge.build_event_classifier()
+        mismatch = compare("empty")
+        if mismatch:
+            return False, mismatch
+
+    return True, "ok"
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Evaluate Telegram/chat smoke checks.")
     parser.add_argument(
@@ -3866,6 +4998,10 @@ def main() -> int:
         ("textbook_untrusted_source_local", "local", check_textbook_untrusted_source_local),
         ("textbook_pick_alias_local", "local", check_textbook_pick_alias_local),
         ("textbook_delivery_ack_retry_local", "local", check_textbook_delivery_ack_retry_local),
+        ("textbook_provider_deadline_local", "local", check_textbook_provider_deadline_local),
+        ("background_job_completion_local", "local", check_background_job_completion_local),
+        ("embedding_cache_payload_local", "local", check_embedding_cache_payload_local),
+        ("reply_cache_local", "local", check_reply_cache_local),
         ("workspace_ttl_cleanup_local", "local", check_workspace_ttl_cleanup_local),
         ("workspace_mode_payload_local", "local", check_workspace_mode_payload_local),
         ("profile_commands_local", "local", check_profile_commands_local),
@@ -3894,9 +5030,17 @@ def main() -> int:
         ("rate_limit_debounce_local", "local", check_rate_limit_debounce_local),
         ("admin_command_cooldown_local", "local", check_admin_command_cooldown_local),
         ("media_first_seen_only_local", "local", check_media_first_seen_only_local),
+        ("first_seen_ledger_local", "local", check_first_seen_ledger_local),
+        ("media_ready_cache_local", "local", check_media_ready_cache_local),
         ("deferred_digest_cleanup_local", "local", check_deferred_digest_cleanup_local),
+        ("deferred_digest_due_index_local", "local", check_deferred_digest_due_index_local),
         ("topic_quiet_defer_vs_critical_bypass_local", "local", check_topic_quiet_defer_vs_critical_bypass_local),
         ("incident_collapse_edit_path_local", "local", check_incident_collapse_edit_path_local),
+        ("incident_store_page_and_controls_local", "local", check_incident_store_page_and_controls_local),
+        ("alert_storm_coalescing_local", "local", check_alert_storm_coalescing_local),
+        ("pipeline_stage_independence_local", "local", check_pipeline_stage_independence_local),
+        ("telegram_outbox_retry_local", "local", check_telegram_outbox_retry_local),
+        ("event_classifier_parity_local", "local", check_event_classifier_parity_local),
     ]
 
     args = parse_args()